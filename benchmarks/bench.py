@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+Compile-time scaling benchmark: generates programs of growing size and times
+each pipeline stage separately, reporting throughput in ops/second and how
+each stage scales, and appending the results to a history file so runs on
+different commits can be compared.
+"""
+
+import io, os, sys, json, math, time, argparse, subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# generate.py sits next to this script, which is on sys.path
+from generate import *
+from src.driver import *
+
+# a stage whose time grows faster than ops^SUPERLINEAR over the size range is flagged
+SUPERLINEAR = 1.25
+
+
+def time_once(context: Context, source: str, mlir_text: str, fused_walk: bool) -> tuple[dict, int]:
+    """
+    Run every stage once. Returns ({stage: (seconds, ops processed)}, ops in the module),
+    the front-ends first, then every pass the pass manager timed, in pipeline order.
+    """
+    results = dict()
+
+    start = time.perf_counter()
+    module = parse_picoc(source)
+    results["frontend"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    module = parse_mlir(context, io.StringIO(mlir_text))
+    results["parse-mlir"] = time.perf_counter() - start
+    num_ops = count_ops(module)
+
+    pass_manager = PassManager(collect=True)
+    pass_manager.run(module, fused_passes() if fused_walk else optimization_passes() + lowering_passes())
+    with pass_manager.stage("print-asm", module):
+        print_asm(module, out_file=io.StringIO())
+
+    stats = {"frontend": (results["frontend"], num_ops), "parse-mlir": (results["parse-mlir"], num_ops)}
+    for name, seconds, ops_before, ops_after in pass_manager.timings:
+        stats[name] = (seconds, max(ops_before, ops_after))
+    return stats, num_ops
+
+def run_size(context: Context, shape: Shape, seed: int, repeat: int, fused_walk: bool) -> tuple[dict, int]:
+    source = generate_picoc(shape, seed)
+    mlir_text = generate_mlir(source)
+
+    # best of repeat runs, to filter out noise
+    best = dict()
+    for _ in range(repeat):
+        stats, num_ops = time_once(context, source, mlir_text, fused_walk)
+        for name, (seconds, ops) in stats.items():
+            if name not in best or seconds < best[name][0]:
+                best[name] = (seconds, ops)
+    return best, num_ops
+
+def scaling_exponent(small: tuple[float, int], large: tuple[float, int]) -> float | None:
+    # t ~ ops^k between the smallest and the largest program
+    (t1, n1), (t2, n2) = small, large
+    if t1 <= 0 or t2 <= 0 or n1 <= 0 or n2 <= n1:
+        return None
+    return math.log(t2 / t1) / math.log(n2 / n1)
+
+def git_commit() -> str:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                                capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "diff", "--quiet", "HEAD"], cwd=ROOT).returncode != 0
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+    return commit + ("-dirty" if dirty else "")
+
+def previous_run(history_file: str, config: dict) -> dict | None:
+    # latest recorded run with the same configuration
+    if not os.path.exists(history_file):
+        return None
+    previous = None
+    with open(history_file, "r") as f:
+        for line in f:
+            entry = json.loads(line)
+            if entry["config"] == config:
+                previous = entry
+    return previous
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="pcc compile-time scaling benchmark")
+    arg_parser.add_argument("--sizes", default="4,8,16,32,64",
+                            help="comma-separated numbers of functions (default: %(default)s)")
+    arg_parser.add_argument("--statements", type=int, default=32)
+    arg_parser.add_argument("--depth", type=int, default=3)
+    arg_parser.add_argument("--constants", type=float, default=0.3)
+    arg_parser.add_argument("--live", type=int, default=8)
+    arg_parser.add_argument("--params", type=int, default=4)
+    arg_parser.add_argument("--seed", type=int, default=0)
+    arg_parser.add_argument("--repeat", type=int, default=3, help="runs per size, best one counts")
+    arg_parser.add_argument("--fused-walk", action="store_true",
+                            help="time the single-walk pipeline instead of the staged one")
+    arg_parser.add_argument("--history", default=os.path.join(ROOT, "benchmarks", "history.jsonl"),
+                            help="results file appended to on every run (default: %(default)s)")
+    arg_parser.add_argument("--no-record", action="store_true", help="do not append to the history")
+    args = arg_parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(",")]
+    config = {**Shape(0, args.statements, args.depth, args.constants, args.live, args.params).describe(),
+              "sizes": sizes, "seed": args.seed}
+    del config["functions"]
+    if args.fused_walk:
+        config["fused_walk"] = True
+    context = make_context()
+
+    # warm up (imports, caches) so the first size is not penalized; the stages
+    # reported are all those it timed
+    warm_up, _ = run_size(context, Shape(sizes[0], args.statements, args.depth, args.constants, args.live,
+                                         args.params), args.seed, 1, args.fused_walk)
+    stages = list(warm_up)
+
+    # time every stage for every size
+    results = dict()
+    print(f"{'functions':>9} {'ops':>8}  " + "  ".join(f"{stage:>14}" for stage in stages))
+    for size in sizes:
+        shape = Shape(size, args.statements, args.depth, args.constants, args.live, args.params)
+        stats, num_ops = run_size(context, shape, args.seed, args.repeat, args.fused_walk)
+        results[size] = {"ops": num_ops, "stages": stats}
+        cells = [f"{stats[stage][1] / stats[stage][0] / 1000:9.1f} kop/s" for stage in stages]
+        print(f"{size:9} {num_ops:8}  " + "  ".join(cells))
+
+    # flag stages that grow faster than the program
+    print()
+    print("scaling exponent (time ~ ops^k):")
+    small, large = results[sizes[0]]["stages"], results[sizes[-1]]["stages"]
+    for stage in stages:
+        k = scaling_exponent(small[stage], large[stage])
+        if k is None:
+            continue
+        flag = "  <-- super-linear" if k > SUPERLINEAR else ""
+        print(f"  {stage:>14}: {k:5.2f}{flag}")
+
+    # compare with the last run of the same configuration
+    entry = {
+        "commit": git_commit(),
+        "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": config,
+        "results": {str(size): {"ops": result["ops"],
+                                "seconds": {stage: result["stages"][stage][0] for stage in stages}}
+                    for size, result in results.items()},
+    }
+    previous = previous_run(args.history, config)
+    if previous is not None:
+        print()
+        print(f"vs {previous['commit']} ({previous['date']}), {sizes[-1]} functions:")
+        old = previous["results"][str(sizes[-1])]["seconds"]
+        new = entry["results"][str(sizes[-1])]["seconds"]
+        for stage in stages:
+            if old.get(stage) and stage in new:
+                print(f"  {stage:>14}: {new[stage] / old[stage]:5.2f}x time")
+
+    if not args.no_record:
+        with open(args.history, "a") as f:
+            f.write(json.dumps(entry) + "\n")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Run-time benchmark: compiles generated programs for every core, runs each
+function in the simulator (checked against the reference interpreter) and
+reports the measured cycles and code size, compared with the last run with the
+same settings so every optimization change shows its speedup.
+"""
+
+import io, os, sys, json, time, argparse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# generate.py and bench.py sit next to this script, which is on sys.path
+from generate import *
+from bench import git_commit, previous_run
+from src.driver import *
+
+
+def measure(source: str, target: str, runs: int, seed: int) -> dict:
+    """
+    Compile source for target and simulate it. Returns the total of the
+    functions' average cycles, their code size and the number of runs.
+    """
+    module = parse_picoc(source)
+    optimized = module.clone()
+    PassManager().run(optimized, optimization_passes(target))
+    lowered = optimized.clone()
+    PassManager().run(lowered, lowering_passes(target))
+    buffer = io.StringIO()
+    print_asm(lowered, out_file=buffer, target=target)
+
+    checks = check_module(module, optimized, buffer.getvalue(), target, runs, seed)
+    return {
+        "cycles": sum(sum(check.cycles) / len(check.cycles) for check in checks if check.cycles),
+        "bytes": sum(function.size for function in estimate_asm(buffer.getvalue(), target)),
+        "runs": sum(check.runs for check in checks),
+    }
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="pcc simulated run-time benchmark")
+    arg_parser.add_argument("--targets", default=",".join(TARGETS),
+                            help="comma-separated cores (default: %(default)s)")
+    arg_parser.add_argument("--functions", type=int, default=16)
+    arg_parser.add_argument("--statements", type=int, default=32)
+    arg_parser.add_argument("--depth", type=int, default=3)
+    arg_parser.add_argument("--constants", type=float, default=0.3)
+    arg_parser.add_argument("--live", type=int, default=8)
+    arg_parser.add_argument("--params", type=int, default=4)
+    arg_parser.add_argument("--seed", type=int, default=0)
+    arg_parser.add_argument("--runs", type=int, default=20, help="argument sets per function")
+    arg_parser.add_argument("--history", default=os.path.join(ROOT, "benchmarks", "cycles-history.jsonl"),
+                            help="results file appended to on every run (default: %(default)s)")
+    arg_parser.add_argument("--no-record", action="store_true", help="do not append to the history")
+    args = arg_parser.parse_args()
+
+    targets = args.targets.split(",")
+    shape = Shape(args.functions, args.statements, args.depth, args.constants, args.live, args.params)
+    config = {**shape.describe(), "seed": args.seed, "runs": args.runs}
+
+    # the same program for every core (all of them divide by constants)
+    source = generate_picoc(shape, args.seed)
+    results = dict()
+    print(f"{'target':<24} {'cycles':>10} {'bytes':>8}")
+    for target in targets:
+        results[target] = measure(source, target, args.runs, args.seed)
+        print(f"{target:<24} {results[target]['cycles']:10.1f} {results[target]['bytes']:8}")
+
+    # compare with the last run of the same configuration
+    entry = {
+        "commit": git_commit(),
+        "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": config,
+        "results": results,
+    }
+    previous = previous_run(args.history, config)
+    if previous is not None:
+        print()
+        print(f"vs {previous['commit']} ({previous['date']}):")
+        for target in targets:
+            if target in previous["results"]:
+                old, new = previous["results"][target], results[target]
+                print(f"  {target:<24} {old['cycles'] / new['cycles']:5.2f}x speedup, "
+                      f"{new['bytes'] / old['bytes']:5.2f}x size")
+
+    if not args.no_record:
+        with open(args.history, "a") as f:
+            f.write(json.dumps(entry) + "\n")
+
+if __name__ == "__main__":
+    main()
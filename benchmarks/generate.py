@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Synthetic picoC program generator for the scaling benchmarks
+"""
+
+import os, sys, random, argparse
+
+
+class Shape:
+    """
+    Size knobs of a generated program.
+    """
+
+    def __init__(self, functions: int = 16, statements: int = 32, depth: int = 3,
+                 constants: float = 0.3, live: int = 8, params: int = 4):
+        self.functions = functions      # number of functions in the file
+        self.statements = statements    # assignments per function
+        self.depth = depth              # maximum expression tree depth
+        self.constants = constants      # fraction of expression leaves that are constants
+        self.live = live                # locals kept live across the whole function
+        self.params = params            # parameters per function (up to 4 go in registers)
+
+    def describe(self) -> dict:
+        return dict(vars(self))
+
+
+# operators with any right-hand side, and those given a constant one (shift
+# amounts and divisors, so generated code never shifts out of range or divides by 0)
+BINARY_OPS = ["+", "-", "*", "&", "|", "^"]
+CONST_RHS_OPS = ["<<", ">>", "/", "%"]
+ASSIGN_OPS = ["=", "+=", "-=", "*=", "^=", "|="]
+
+# constant divisors: powers of two, and ones needing a multiply by a magic number
+DIVISORS = [2, 3, 7, 10, 16, 100, 1000]
+
+def gen_constant(rng: random.Random) -> str:
+    # mostly small immediates, some that need movw/movt or are awkward divisors
+    kind = rng.random()
+    if kind < 0.6:
+        return str(rng.randint(0, 255))
+    if kind < 0.85:
+        return str(rng.randint(256, 0xFFFF))
+    return str(rng.randint(0x10000, 0x7FFFFFFF))
+
+def gen_expr(rng: random.Random, names: list[str], depth: int, shape: Shape,
+             divisors: list[int] = DIVISORS) -> str:
+    if depth == 0 or rng.random() < 0.2:
+        if rng.random() < shape.constants:
+            return gen_constant(rng)
+        return rng.choice(names)
+
+    if rng.random() < 0.2:
+        op = rng.choice(CONST_RHS_OPS)
+        if op in ("<<", ">>"):
+            rhs = str(rng.randint(1, 31))
+        else:
+            rhs = str(rng.choice(divisors))
+        return f"({gen_expr(rng, names, depth - 1, shape, divisors)} {op} {rhs})"
+
+    op = rng.choice(BINARY_OPS)
+    lhs = gen_expr(rng, names, depth - 1, shape, divisors)
+    rhs = gen_expr(rng, names, depth - 1, shape, divisors)
+    return f"({lhs} {op} {rhs})"
+
+def gen_function(rng: random.Random, name: str, shape: Shape, divisors: list[int] = DIVISORS) -> str:
+    params = [f"p{i}" for i in range(shape.params)]
+    local_vars = [f"v{i}" for i in range(shape.live)]
+
+    lines = [f"int {name}({', '.join('int ' + p for p in params) or 'void'}) {{"]
+    names = list(params)
+    for var in local_vars:
+        lines.append(f"    int {var} = {gen_expr(rng, names, shape.depth, shape, divisors)};")
+        names.append(var)
+    for _ in range(shape.statements):
+        var = rng.choice(local_vars) if local_vars else None
+        if var is None:
+            break
+        lines.append(f"    {var} {rng.choice(ASSIGN_OPS)} {gen_expr(rng, names, shape.depth, shape, divisors)};")
+
+    # combine everything so all locals stay live until the end
+    result = " ^ ".join(local_vars + params) or "0"
+    lines.append(f"    return {result};")
+    lines.append("}")
+    return "\n".join(lines)
+
+def generate_picoc(shape: Shape, seed: int = 0, divisors: list[int] = DIVISORS) -> str:
+    """
+    Deterministic (for a given seed) picoC source of the given shape, dividing
+    only by the given constants.
+    """
+    rng = random.Random(seed)
+    functions = [gen_function(rng, f"f{i}", shape, divisors) for i in range(shape.functions)]
+    return "\n\n".join(functions) + "\n"
+
+def generate_mlir(source: str) -> str:
+    """
+    High-level MLIR for source (built by the native front-end, so cgeist is not needed).
+    """
+    from src.frontend_picoc import parse_picoc
+    return str(parse_picoc(source)) + "\n"
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="generate a synthetic picoC benchmark program")
+    arg_parser.add_argument("output", help="output .c file (a .mlir file is written next to it with --mlir)")
+    arg_parser.add_argument("--functions", type=int, default=16)
+    arg_parser.add_argument("--statements", type=int, default=32)
+    arg_parser.add_argument("--depth", type=int, default=3)
+    arg_parser.add_argument("--constants", type=float, default=0.3)
+    arg_parser.add_argument("--live", type=int, default=8)
+    arg_parser.add_argument("--params", type=int, default=4)
+    arg_parser.add_argument("--seed", type=int, default=0)
+    arg_parser.add_argument("--mlir", action="store_true", help="also write the high-level MLIR")
+    args = arg_parser.parse_args()
+
+    shape = Shape(args.functions, args.statements, args.depth, args.constants, args.live, args.params)
+    source = generate_picoc(shape, args.seed)
+    with open(args.output, "w") as f:
+        f.write(source)
+    if args.mlir:
+        with open(os.path.splitext(args.output)[0] + ".mlir", "w") as f:
+            f.write(generate_mlir(source))
+
+if __name__ == "__main__":
+    # make the src package importable when run as a script
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    main()
@@ -1,81 +1,159 @@
 #!/usr/bin/env python3
 
-import sys, subprocess, os, re
-from xdsl.context import Context
-from xdsl.parser import Parser
-from xdsl.dialects import builtin, func, arith, memref, scf
-from xdsl.transforms.common_subexpression_elimination import cse
-from xdsl.transforms.dead_code_elimination import dce
+import sys, os, argparse
 
-from src.backend_optimization import *
-from src.backend_arm_dialect import *
-from src.backend_printer import *
+# the compiler itself (xDSL) is only imported when compiling in this process,
+# so a client of the compile server starts quickly
+from src.backend_cost import *
+from src.cache import *
+from src.jobs import *
+from src.server import *
+from src.stats import *
 
 # Important: this environment variable must be set to find cgeist!
 # export CGEIST_PATH=~/Documents/Polygeist/build/bin
 
-# look for CGEIST_PATH env variable
-if "CGEIST_PATH" not in os.environ:
-    sys.exit("Error: CGEIST_PATH environment variable must be set.")
-cgeist_path = os.environ.get('CGEIST_PATH')
-
-if len(sys.argv) < 2:
-    sys.exit("Error: no filename provided. Usage: ./pcc.py [--emit-all] <filename>")
-
-emit_all = False
-if (sys.argv[1] == "--emit-all"):
-    emit_all = True
-    in_file = sys.argv[2]
-else:
-    in_file = sys.argv[1]
-in_filename = in_file[:len(in_file) - 2] # assume .c
-
-# initialize xDSL Context and load all dialects
-context = Context()
-context.load_dialect(builtin.Builtin)
-context.load_dialect(func.Func)
-context.load_dialect(arith.Arith)
-context.load_dialect(memref.MemRef)
-context.load_dialect(scf.Scf)
-context.load_dialect(ArmDialect)
-
-# convert C to high-level MLIR with a subprocess for Polygeist
-mlir_filepath = f"{in_filename}.mlir"
-ret = subprocess.call([cgeist_path + "/cgeist", 
-                       in_file, "-S", "-O0",
-                       "-o", mlir_filepath])
-if ret != 0:
-    print("Error: cgeist failed to compile file " + in_file + " with exit code " + str(ret))
-
-# read MLIR file produced by Polygeist
-with open(mlir_filepath, "r") as f:
-    mlir_text = f.read()
-
-# filter produced MLIR using regex magic
-mlir_text = re.sub(r"module attributes \{.*?\} \{", "builtin.module {", mlir_text)
-mlir_text = re.sub(r"attributes \{.*?\}", "", mlir_text)
-
-# parse filtered text into ModuleOp 
-parser = Parser(context, mlir_text)
-module = parser.parse_module()
-
-# apply optimizations
-apply_all_optimizations(module)   # canonicalizations
-cse(module)                       # common subexpression elimination
-dce(module)                       # dead code elimination
-if (emit_all):
-    filename = f"{in_filename}-optimized.mlir"
-    with open(filename, "w+") as f:
-        print(module, file=f)
-
-# lower MLIR to ARM dialect
-lower(module)
-if (emit_all):
-    filename = f"{in_filename}-arm.mlir"
-    with open(filename, "w+") as f:
-        print(module, file=f)
-
-# print ARM assembly
-filename = f"{in_filename}.s"
-with open(filename, "w+") as f:
-    print_asm(module, out_file=f)
\ No newline at end of file
+def parse_args():
+    arg_parser = argparse.ArgumentParser(
+        prog="pcc.py",
+        description="picoC compiler targetting ARM (Thumb) assembly")
+    arg_parser.add_argument("inputs", nargs="*", metavar="input",
+                            help=".c file, directory of .c files, or @manifest listing inputs")
+    arg_parser.add_argument("--emit-all", action="store_true",
+                            help="also write the optimized and ARM-dialect MLIR")
+    arg_parser.add_argument("-j", "--jobs", type=int, default=1,
+                            help="number of files compiled in parallel (0 = all cores)")
+    arg_parser.add_argument("-o", "--out-dir", default=None,
+                            help="write outputs here instead of next to each input")
+    arg_parser.add_argument("--frontend", choices=["auto", "native", "cgeist"], default="auto",
+                            help="C front-end: the built-in picoC parser, Polygeist's cgeist, "
+                                 "or native with a cgeist fallback (default: %(default)s)")
+    arg_parser.add_argument("--target", choices=list(TARGETS), default=DEFAULT_TARGET,
+                            help="core to generate code for (default: %(default)s)")
+    arg_parser.add_argument("--fused-walk", action="store_true",
+                            help="optimize and lower each block in a single rewrite walk instead "
+                                 "of one pass at a time (same code, faster; ignored with --emit-all)")
+    arg_parser.add_argument("--emit-obj", action="store_true",
+                            help="also write an ELF object (.o) with the machine code, "
+                                 "encoded directly without an assembler")
+    arg_parser.add_argument("--no-cache", action="store_true",
+                            help="always run cgeist and the whole pipeline")
+    arg_parser.add_argument("--cache-dir", default=default_cache_dir(),
+                            help="location of the compilation cache (default: %(default)s)")
+    arg_parser.add_argument("--cache-size", type=int, default=DEFAULT_MAX_BYTES // (1024 * 1024),
+                            help="cache size limit in MiB (default: %(default)s)")
+    arg_parser.add_argument("--report", action="store_true",
+                            help="print the instruction count, code size and estimated cycles "
+                                 "of each generated function")
+    arg_parser.add_argument("--simulate", type=int, default=None, metavar="RUNS",
+                            help="run every generated function on RUNS sets of arguments in the "
+                                 "built-in simulator, check the results against the reference "
+                                 "interpreter and print the measured cycles")
+    arg_parser.add_argument("--time-passes", action="store_true",
+                            help="print the time spent in each pass, summed over all files")
+    arg_parser.add_argument("--stats", action="store_true",
+                            help="print how often each rewrite pattern fired")
+    arg_parser.add_argument("--stats-file", default=None, metavar="FILE",
+                            help="write pass timings and pattern statistics to FILE as JSON")
+    arg_parser.add_argument("--server", action="store_true",
+                            help="run a compile server in the foreground")
+    arg_parser.add_argument("--stop-server", action="store_true",
+                            help="ask a running compile server to exit")
+    arg_parser.add_argument("--use-server", action="store_true",
+                            default=use_server_default(),
+                            help="compile through a running compile server if there is one "
+                                 "(default when PCC_USE_SERVER is set, other than to 0 or false)")
+    arg_parser.add_argument("--socket", default=default_socket_path(),
+                            help="compile server socket (default: %(default)s)")
+    args = arg_parser.parse_args()
+    if not args.inputs and not (args.server or args.stop_server):
+        arg_parser.error("no input files provided")
+    return args
+
+def main():
+    args = parse_args()
+
+    if args.server:
+        serve(args.socket)
+        return
+    if args.stop_server:
+        if not stop_server(args.socket):
+            sys.exit(f"Error: no pcc server listening on {args.socket}")
+        return
+
+    # look for CGEIST_PATH env variable (only cgeist-only builds need it up front)
+    if args.frontend == "cgeist" and "CGEIST_PATH" not in os.environ:
+        sys.exit("Error: CGEIST_PATH environment variable must be set.")
+
+    inputs = collect_inputs(args.inputs)
+    if not inputs:
+        sys.exit("Error: no input files found.")
+
+    options = Options(emit_all=args.emit_all,
+                      cache_dir=None if args.no_cache else os.path.abspath(args.cache_dir),
+                      cache_max_bytes=args.cache_size * 1024 * 1024,
+                      cgeist_path=os.environ.get("CGEIST_PATH"),
+                      frontend=args.frontend,
+                      collect_stats=args.time_passes or args.stats or args.stats_file is not None,
+                      target=args.target,
+                      fused_walk=args.fused_walk,
+                      emit_obj=args.emit_obj)
+    jobs = [(in_file, output_stem(in_file, rel_stem, args.out_dir), options)
+            for in_file, rel_stem in inputs]
+    num_workers = args.jobs if args.jobs > 0 else os.cpu_count()
+
+    # compile through the server when asked to, falling back to this process
+    results = None
+    if args.use_server:
+        results = remote_compile(args.socket, jobs, num_workers)
+    if results is None:
+        from src.driver import compile_batch
+        results = compile_batch(jobs, num_workers)
+
+        # trim the cache once per run rather than once per file
+        if options.cache_dir is not None:
+            Cache(options.cache_dir, options.cache_max_bytes).evict()
+
+    if options.collect_stats:
+        report = merge_reports([report for _, _, report in results])
+        if args.time_passes:
+            print(format_time_passes(report), file=sys.stderr)
+        if args.stats:
+            print(format_stats(report), file=sys.stderr)
+        if args.stats_file is not None:
+            write_report(args.stats_file, report)
+
+    # static estimate of the generated code, read back from the .s outputs
+    if args.report:
+        for (_, out_filename, _), (_, error, _) in zip(jobs, results):
+            if error is None:
+                with open(f"{out_filename}.s", "r") as f:
+                    functions = estimate_asm(f.read(), options.target)
+                print(format_estimate(f"{out_filename}.s", functions, options.target))
+
+    # measured cycles, and a check of the generated code against the IR
+    if args.simulate is not None:
+        from src.driver import make_context, simulate_file, format_simulation, SimulationError, InterpreterError
+        context = make_context()
+        for idx, ((in_file, out_filename, _), (_, error, report)) in enumerate(zip(jobs, results)):
+            if error is not None:
+                continue
+            try:
+                checks = simulate_file(context, in_file, out_filename, options, args.simulate)
+            except (SimulationError, InterpreterError) as e:
+                results[idx] = (in_file, f"simulation: {e}", report)
+                continue
+            print(format_simulation(f"{out_filename}.s", checks, options.target))
+
+    # report failures per file, in input order
+    failed = 0
+    for in_file, error, _ in results:
+        if error is not None:
+            print(f"Error: {in_file}: {error}", file=sys.stderr)
+            failed += 1
+
+    if failed:
+        sys.exit(f"{failed} of {len(jobs)} file(s) failed to compile.")
+
+if __name__ == "__main__":
+    main()
@@ -2,15 +2,29 @@
 High-level MLIR to ARM MLIR converter
 """
 
-from xdsl.dialects import arith, builtin, func
-from xdsl.ir import Dialect
-from xdsl.irdl import irdl_op_definition, IRDLOperation, operand_def, result_def, attr_def
+from xdsl.dialects import arith, builtin, func, scf
+from xdsl.ir import Block, Dialect
+from xdsl.irdl import (
+    base,
+    irdl_op_definition,
+    IRDLOperation,
+    operand_def,
+    result_def,
+    attr_def,
+    successor_def,
+    traits_def,
+    var_operand_def
+)
 from xdsl.ir import SSAValue
+from xdsl.traits import IsTerminator
 from xdsl.pattern_rewriter import (
-    GreedyRewritePatternApplier,
     PatternRewriteWalker,
     RewritePattern
 )
+from xdsl.rewriter import InsertPoint
+
+from src.backend_cost import *
+from src.passes import *
 
 
 #
@@ -64,6 +78,73 @@ class ArmMulOp(IRDLOperation):
             result_types=[lhs.type]
         )
 
+@irdl_op_definition
+class ArmSdivOp(IRDLOperation):
+    
+    name = "arm.sdiv"
+
+    # operands and result type 
+    lhs = operand_def(builtin.IntegerType)
+    rhs = operand_def(builtin.IntegerType)
+    res = result_def(builtin.IntegerType)
+
+    def __init__(self, lhs: SSAValue, rhs: SSAValue):
+        super().__init__(
+            operands=[lhs, rhs],
+            result_types=[lhs.type]
+        )
+
+@irdl_op_definition
+class ArmUdivOp(IRDLOperation):
+    
+    name = "arm.udiv"
+
+    # operands and result type 
+    lhs = operand_def(builtin.IntegerType)
+    rhs = operand_def(builtin.IntegerType)
+    res = result_def(builtin.IntegerType)
+
+    def __init__(self, lhs: SSAValue, rhs: SSAValue):
+        super().__init__(
+            operands=[lhs, rhs],
+            result_types=[lhs.type]
+        )
+
+# 32x32 -> 64-bit multiplies, with the product split over two registers
+@irdl_op_definition
+class ArmSmullOp(IRDLOperation):
+    
+    name = "arm.smull"
+
+    # operands and result types
+    lhs = operand_def(builtin.IntegerType)
+    rhs = operand_def(builtin.IntegerType)
+    lo = result_def(builtin.IntegerType)
+    hi = result_def(builtin.IntegerType)
+
+    def __init__(self, lhs: SSAValue, rhs: SSAValue):
+        super().__init__(
+            operands=[lhs, rhs],
+            result_types=[lhs.type, lhs.type]
+        )
+
+@irdl_op_definition
+class ArmUmullOp(IRDLOperation):
+    
+    name = "arm.umull"
+
+    # operands and result types
+    lhs = operand_def(builtin.IntegerType)
+    rhs = operand_def(builtin.IntegerType)
+    lo = result_def(builtin.IntegerType)
+    hi = result_def(builtin.IntegerType)
+
+    def __init__(self, lhs: SSAValue, rhs: SSAValue):
+        super().__init__(
+            operands=[lhs, rhs],
+            result_types=[lhs.type, lhs.type]
+        )
+
 @irdl_op_definition
 class ArmAndOp(IRDLOperation):
     
@@ -112,6 +193,201 @@ class ArmOrOp(IRDLOperation):
             result_types=[lhs.type]
         )
 
+# multiply-accumulate: acc + lhs * rhs
+@irdl_op_definition
+class ArmMlaOp(IRDLOperation):
+    
+    name = "arm.mla"
+
+    # operands and result type 
+    lhs = operand_def(builtin.IntegerType)
+    rhs = operand_def(builtin.IntegerType)
+    acc = operand_def(builtin.IntegerType)
+    res = result_def(builtin.IntegerType)
+
+    def __init__(self, lhs: SSAValue, rhs: SSAValue, acc: SSAValue):
+        super().__init__(
+            operands=[lhs, rhs, acc],
+            result_types=[lhs.type]
+        )
+
+# multiply-subtract: acc - lhs * rhs
+@irdl_op_definition
+class ArmMlsOp(IRDLOperation):
+    
+    name = "arm.mls"
+
+    # operands and result type 
+    lhs = operand_def(builtin.IntegerType)
+    rhs = operand_def(builtin.IntegerType)
+    acc = operand_def(builtin.IntegerType)
+    res = result_def(builtin.IntegerType)
+
+    def __init__(self, lhs: SSAValue, rhs: SSAValue, acc: SSAValue):
+        super().__init__(
+            operands=[lhs, rhs, acc],
+            result_types=[lhs.type]
+        )
+
+# bit clear: lhs & ~rhs
+@irdl_op_definition
+class ArmBicOp(IRDLOperation):
+    
+    name = "arm.bic"
+
+    # operands and result type 
+    lhs = operand_def(builtin.IntegerType)
+    rhs = operand_def(builtin.IntegerType)
+    res = result_def(builtin.IntegerType)
+
+    def __init__(self, lhs: SSAValue, rhs: SSAValue):
+        super().__init__(
+            operands=[lhs, rhs],
+            result_types=[lhs.type]
+        )
+
+# data processing with a shifted second operand: lhs op (rhs shift imm)
+@irdl_op_definition
+class ArmAddShiftOp(IRDLOperation):
+    
+    name = "arm.addshift"
+
+    # operands, shift of rhs (lsl/lsr/asr and amount) and result type 
+    lhs = operand_def(builtin.IntegerType)
+    rhs = operand_def(builtin.IntegerType)
+    shift = attr_def(builtin.StringAttr)
+    imm = attr_def(builtin.IntegerAttr)
+    res = result_def(builtin.IntegerType)
+
+    def __init__(self, lhs: SSAValue, rhs: SSAValue, shift: str, imm_val: int):
+        imm_attr = builtin.IntegerAttr.from_int_and_width(imm_val, 32)
+        super().__init__(
+            operands=[lhs, rhs],
+            attributes={"shift": builtin.StringAttr(shift), "imm": imm_attr},
+            result_types=[lhs.type]
+        )
+
+@irdl_op_definition
+class ArmSubShiftOp(IRDLOperation):
+    
+    name = "arm.subshift"
+
+    # operands, shift of rhs (lsl/lsr/asr and amount) and result type 
+    lhs = operand_def(builtin.IntegerType)
+    rhs = operand_def(builtin.IntegerType)
+    shift = attr_def(builtin.StringAttr)
+    imm = attr_def(builtin.IntegerAttr)
+    res = result_def(builtin.IntegerType)
+
+    def __init__(self, lhs: SSAValue, rhs: SSAValue, shift: str, imm_val: int):
+        imm_attr = builtin.IntegerAttr.from_int_and_width(imm_val, 32)
+        super().__init__(
+            operands=[lhs, rhs],
+            attributes={"shift": builtin.StringAttr(shift), "imm": imm_attr},
+            result_types=[lhs.type]
+        )
+
+# (rhs shift imm) - lhs
+@irdl_op_definition
+class ArmRsbShiftOp(IRDLOperation):
+    
+    name = "arm.rsbshift"
+
+    # operands, shift of rhs (lsl/lsr/asr and amount) and result type 
+    lhs = operand_def(builtin.IntegerType)
+    rhs = operand_def(builtin.IntegerType)
+    shift = attr_def(builtin.StringAttr)
+    imm = attr_def(builtin.IntegerAttr)
+    res = result_def(builtin.IntegerType)
+
+    def __init__(self, lhs: SSAValue, rhs: SSAValue, shift: str, imm_val: int):
+        imm_attr = builtin.IntegerAttr.from_int_and_width(imm_val, 32)
+        super().__init__(
+            operands=[lhs, rhs],
+            attributes={"shift": builtin.StringAttr(shift), "imm": imm_attr},
+            result_types=[lhs.type]
+        )
+
+@irdl_op_definition
+class ArmAndShiftOp(IRDLOperation):
+    
+    name = "arm.andshift"
+
+    # operands, shift of rhs (lsl/lsr/asr and amount) and result type 
+    lhs = operand_def(builtin.IntegerType)
+    rhs = operand_def(builtin.IntegerType)
+    shift = attr_def(builtin.StringAttr)
+    imm = attr_def(builtin.IntegerAttr)
+    res = result_def(builtin.IntegerType)
+
+    def __init__(self, lhs: SSAValue, rhs: SSAValue, shift: str, imm_val: int):
+        imm_attr = builtin.IntegerAttr.from_int_and_width(imm_val, 32)
+        super().__init__(
+            operands=[lhs, rhs],
+            attributes={"shift": builtin.StringAttr(shift), "imm": imm_attr},
+            result_types=[lhs.type]
+        )
+
+@irdl_op_definition
+class ArmOrShiftOp(IRDLOperation):
+    
+    name = "arm.orshift"
+
+    # operands, shift of rhs (lsl/lsr/asr and amount) and result type 
+    lhs = operand_def(builtin.IntegerType)
+    rhs = operand_def(builtin.IntegerType)
+    shift = attr_def(builtin.StringAttr)
+    imm = attr_def(builtin.IntegerAttr)
+    res = result_def(builtin.IntegerType)
+
+    def __init__(self, lhs: SSAValue, rhs: SSAValue, shift: str, imm_val: int):
+        imm_attr = builtin.IntegerAttr.from_int_and_width(imm_val, 32)
+        super().__init__(
+            operands=[lhs, rhs],
+            attributes={"shift": builtin.StringAttr(shift), "imm": imm_attr},
+            result_types=[lhs.type]
+        )
+
+@irdl_op_definition
+class ArmEorShiftOp(IRDLOperation):
+    
+    name = "arm.eorshift"
+
+    # operands, shift of rhs (lsl/lsr/asr and amount) and result type 
+    lhs = operand_def(builtin.IntegerType)
+    rhs = operand_def(builtin.IntegerType)
+    shift = attr_def(builtin.StringAttr)
+    imm = attr_def(builtin.IntegerAttr)
+    res = result_def(builtin.IntegerType)
+
+    def __init__(self, lhs: SSAValue, rhs: SSAValue, shift: str, imm_val: int):
+        imm_attr = builtin.IntegerAttr.from_int_and_width(imm_val, 32)
+        super().__init__(
+            operands=[lhs, rhs],
+            attributes={"shift": builtin.StringAttr(shift), "imm": imm_attr},
+            result_types=[lhs.type]
+        )
+
+@irdl_op_definition
+class ArmBicShiftOp(IRDLOperation):
+    
+    name = "arm.bicshift"
+
+    # operands, shift of rhs (lsl/lsr/asr and amount) and result type 
+    lhs = operand_def(builtin.IntegerType)
+    rhs = operand_def(builtin.IntegerType)
+    shift = attr_def(builtin.StringAttr)
+    imm = attr_def(builtin.IntegerAttr)
+    res = result_def(builtin.IntegerType)
+
+    def __init__(self, lhs: SSAValue, rhs: SSAValue, shift: str, imm_val: int):
+        imm_attr = builtin.IntegerAttr.from_int_and_width(imm_val, 32)
+        super().__init__(
+            operands=[lhs, rhs],
+            attributes={"shift": builtin.StringAttr(shift), "imm": imm_attr},
+            result_types=[lhs.type]
+        )
+
 @irdl_op_definition
 class ArmLslOp(IRDLOperation):
     
@@ -145,101 +421,989 @@ class ArmLsrOp(IRDLOperation):
         )
 
 @irdl_op_definition
-class ArmAsrOp(IRDLOperation):
-    
-    name = "arm.asr"
+class ArmAsrOp(IRDLOperation):
+    
+    name = "arm.asr"
+
+    # operands and result type 
+    lhs = operand_def(builtin.IntegerType)
+    rhs = operand_def(builtin.IntegerType)
+    res = result_def(builtin.IntegerType)
+
+    def __init__(self, lhs: SSAValue, rhs: SSAValue):
+        super().__init__(
+            operands=[lhs, rhs],
+            result_types=[lhs.type]
+        )
+
+@irdl_op_definition
+class ArmAddImmOp(IRDLOperation):
+    
+    name = "arm.addimm"
+
+    # register operand, imm32 argument and result type 
+    lhs = operand_def(builtin.IntegerType)
+    imm = attr_def(builtin.IntegerAttr)
+    res = result_def(builtin.IntegerType)
+
+    def __init__(self, lhs: SSAValue, imm_val: int):
+        imm_attr = builtin.IntegerAttr.from_int_and_width(imm_val, 32)
+        super().__init__(
+            operands=[lhs],
+            attributes={"imm": imm_attr},
+            result_types=[lhs.type]
+        )
+
+@irdl_op_definition
+class ArmSubImmOp(IRDLOperation):
+    
+    name = "arm.subimm"
+
+    # register operand, imm32 argument and result type 
+    lhs = operand_def(builtin.IntegerType)
+    imm = attr_def(builtin.IntegerAttr)
+    res = result_def(builtin.IntegerType)
+
+    def __init__(self, lhs: SSAValue, imm_val: int):
+        imm_attr = builtin.IntegerAttr.from_int_and_width(imm_val, 32)
+        super().__init__(
+            operands=[lhs],
+            attributes={"imm": imm_attr},
+            result_types=[lhs.type]
+        )
+
+@irdl_op_definition
+class ArmAndImmOp(IRDLOperation):
+    
+    name = "arm.andimm"
+
+    # register operand, imm32 argument and result type 
+    lhs = operand_def(builtin.IntegerType)
+    imm = attr_def(builtin.IntegerAttr)
+    res = result_def(builtin.IntegerType)
+
+    def __init__(self, lhs: SSAValue, imm_val: int):
+        imm_attr = builtin.IntegerAttr.from_int_and_width(imm_val, 32)
+        super().__init__(
+            operands=[lhs],
+            attributes={"imm": imm_attr},
+            result_types=[lhs.type]
+        )
+
+@irdl_op_definition
+class ArmOrImmOp(IRDLOperation):
+    
+    name = "arm.orimm"
+
+    # register operand, imm32 argument and result type 
+    lhs = operand_def(builtin.IntegerType)
+    imm = attr_def(builtin.IntegerAttr)
+    res = result_def(builtin.IntegerType)
+
+    def __init__(self, lhs: SSAValue, imm_val: int):
+        imm_attr = builtin.IntegerAttr.from_int_and_width(imm_val, 32)
+        super().__init__(
+            operands=[lhs],
+            attributes={"imm": imm_attr},
+            result_types=[lhs.type]
+        )
+
+@irdl_op_definition
+class ArmEorImmOp(IRDLOperation):
+    
+    name = "arm.eorimm"
+
+    # register operand, imm32 argument and result type 
+    lhs = operand_def(builtin.IntegerType)
+    imm = attr_def(builtin.IntegerAttr)
+    res = result_def(builtin.IntegerType)
+
+    def __init__(self, lhs: SSAValue, imm_val: int):
+        imm_attr = builtin.IntegerAttr.from_int_and_width(imm_val, 32)
+        super().__init__(
+            operands=[lhs],
+            attributes={"imm": imm_attr},
+            result_types=[lhs.type]
+        )
+
+@irdl_op_definition
+class ArmLslImmOp(IRDLOperation):
+    
+    name = "arm.lslimm"
+
+    # register operand, imm32 argument and result type 
+    lhs = operand_def(builtin.IntegerType)
+    imm = attr_def(builtin.IntegerAttr)
+    res = result_def(builtin.IntegerType)
+
+    def __init__(self, lhs: SSAValue, imm_val: int):
+        imm_attr = builtin.IntegerAttr.from_int_and_width(imm_val, 32)
+        super().__init__(
+            operands=[lhs],
+            attributes={"imm": imm_attr},
+            result_types=[lhs.type]
+        )
+
+@irdl_op_definition
+class ArmLsrImmOp(IRDLOperation):
+    
+    name = "arm.lsrimm"
+
+    # register operand, imm32 argument and result type 
+    lhs = operand_def(builtin.IntegerType)
+    imm = attr_def(builtin.IntegerAttr)
+    res = result_def(builtin.IntegerType)
+
+    def __init__(self, lhs: SSAValue, imm_val: int):
+        imm_attr = builtin.IntegerAttr.from_int_and_width(imm_val, 32)
+        super().__init__(
+            operands=[lhs],
+            attributes={"imm": imm_attr},
+            result_types=[lhs.type]
+        )
+
+@irdl_op_definition
+class ArmAsrImmOp(IRDLOperation):
+    
+    name = "arm.asrimm"
+
+    # register operand, imm32 argument and result type 
+    lhs = operand_def(builtin.IntegerType)
+    imm = attr_def(builtin.IntegerAttr)
+    res = result_def(builtin.IntegerType)
+
+    def __init__(self, lhs: SSAValue, imm_val: int):
+        imm_attr = builtin.IntegerAttr.from_int_and_width(imm_val, 32)
+        super().__init__(
+            operands=[lhs],
+            attributes={"imm": imm_attr},
+            result_types=[lhs.type]
+        )
+
+# move not: ~reg
+@irdl_op_definition
+class ArmMvnOp(IRDLOperation):
+    name = "arm.mvn"
+
+    reg = operand_def(builtin.IntegerType)
+    res = result_def(builtin.IntegerType)
+
+    def __init__(self, reg: SSAValue):
+        super().__init__(
+            operands=[reg],
+            result_types=[reg.type]
+        )
+
+# bit clear with an immediate: lhs & ~imm
+@irdl_op_definition
+class ArmBicImmOp(IRDLOperation):
+    
+    name = "arm.bicimm"
+
+    # register operand, imm32 argument and result type 
+    lhs = operand_def(builtin.IntegerType)
+    imm = attr_def(builtin.IntegerAttr)
+    res = result_def(builtin.IntegerType)
+
+    def __init__(self, lhs: SSAValue, imm_val: int):
+        imm_attr = builtin.IntegerAttr.from_int_and_width(imm_val, 32)
+        super().__init__(
+            operands=[lhs],
+            attributes={"imm": imm_attr},
+            result_types=[lhs.type]
+        )
+
+# reverse subtract: imm - lhs
+@irdl_op_definition
+class ArmRsbImmOp(IRDLOperation):
+    
+    name = "arm.rsbimm"
+
+    # register operand, imm32 argument and result type 
+    lhs = operand_def(builtin.IntegerType)
+    imm = attr_def(builtin.IntegerAttr)
+    res = result_def(builtin.IntegerType)
+
+    def __init__(self, lhs: SSAValue, imm_val: int, result_type=None):
+        imm_attr = builtin.IntegerAttr.from_int_and_width(imm_val, 32)
+        super().__init__(
+            operands=[lhs],
+            attributes={"imm": imm_attr},
+            result_types=[result_type or lhs.type]
+        )
+
+@irdl_op_definition
+class ArmMovOp(IRDLOperation):
+    name = "arm.mov"
+
+    # imm32 argument
+    imm = attr_def(builtin.IntegerAttr)
+    res = result_def(builtin.IntegerType)
+
+    def __init__(self, imm_val: int):
+        imm_attr = builtin.IntegerAttr.from_int_and_width(imm_val, 32)
+        super().__init__(
+            operands=[],
+            attributes={"imm": imm_attr},
+            result_types=[builtin.IntegerType(32)]
+        )
+
+# mvn with an immediate: ~imm
+@irdl_op_definition
+class ArmMvnImmOp(IRDLOperation):
+    name = "arm.mvnimm"
+
+    # imm32 argument
+    imm = attr_def(builtin.IntegerAttr)
+    res = result_def(builtin.IntegerType)
+
+    def __init__(self, imm_val: int):
+        imm_attr = builtin.IntegerAttr.from_int_and_width(imm_val, 32)
+        super().__init__(
+            operands=[],
+            attributes={"imm": imm_attr},
+            result_types=[builtin.IntegerType(32)]
+        )
+
+# load of a constant from the function's literal pool
+@irdl_op_definition
+class ArmLdrLitOp(IRDLOperation):
+    name = "arm.ldrlit"
+
+    # imm32 argument
+    imm = attr_def(builtin.IntegerAttr)
+    res = result_def(builtin.IntegerType)
+
+    def __init__(self, imm_val: int):
+        imm_attr = builtin.IntegerAttr.from_int_and_width(imm_val, 32)
+        super().__init__(
+            operands=[],
+            attributes={"imm": imm_attr},
+            result_types=[builtin.IntegerType(32)]
+        )
+
+@irdl_op_definition
+class ArmMovwOp(IRDLOperation):
+    name = "arm.movw"
+
+    # imm32 argument
+    imm = attr_def(builtin.IntegerAttr)
+    res = result_def(builtin.IntegerType)
+
+    def __init__(self, imm_val: int):
+        imm_attr = builtin.IntegerAttr.from_int_and_width(imm_val, 32)
+        super().__init__(
+            operands=[],
+            attributes={"imm": imm_attr},
+            result_types=[builtin.IntegerType(32)]
+        )
+
+@irdl_op_definition
+class ArmMovtOp(IRDLOperation):
+    name = "arm.movt"
+
+    # reg, imm32 argument
+    reg = operand_def(builtin.IntegerType)
+    imm = attr_def(builtin.IntegerAttr)
+    res = result_def(builtin.IntegerType)
+
+    def __init__(self, reg: SSAValue, imm_val: int):
+        imm_attr = builtin.IntegerAttr.from_int_and_width(imm_val, 32)
+        super().__init__(
+            operands=[reg],
+            attributes={"imm": imm_attr},
+            result_types=[builtin.IntegerType(32)]
+        )
+
+@irdl_op_definition
+class ArmMovRegOp(IRDLOperation):
+    name = "arm.movreg"
+
+    # imm32 argument
+    reg = operand_def(builtin.IntegerType)
+    res = result_def(builtin.IntegerType)
+
+    def __init__(self, reg: SSAValue):
+        super().__init__(
+            operands=[reg],
+            result_types=[builtin.IntegerType(32)]
+        )
+
+# a register read as another type (a truncation, a 0 / 1 widened, or an index,
+# which is 32 bits wide): no instruction, the result shares the location of reg
+@irdl_op_definition
+class ArmCastOp(IRDLOperation):
+    name = "arm.cast"
+
+    reg = operand_def(base(builtin.IntegerType) | base(builtin.IndexType))
+    res = result_def(builtin.IntegerType)
+
+    def __init__(self, reg: SSAValue, result_type: builtin.IntegerType):
+        super().__init__(
+            operands=[reg],
+            result_types=[result_type]
+        )
+
+# sign / zero extension of the low byte or halfword: sxtb, sxth, uxtb, uxth
+@irdl_op_definition
+class ArmSxtbOp(IRDLOperation):
+    name = "arm.sxtb"
+
+    reg = operand_def(builtin.IntegerType)
+    res = result_def(builtin.IntegerType)
+
+    def __init__(self, reg: SSAValue):
+        super().__init__(
+            operands=[reg],
+            result_types=[builtin.IntegerType(32)]
+        )
+
+@irdl_op_definition
+class ArmSxthOp(IRDLOperation):
+    name = "arm.sxth"
+
+    reg = operand_def(builtin.IntegerType)
+    res = result_def(builtin.IntegerType)
+
+    def __init__(self, reg: SSAValue):
+        super().__init__(
+            operands=[reg],
+            result_types=[builtin.IntegerType(32)]
+        )
+
+@irdl_op_definition
+class ArmUxtbOp(IRDLOperation):
+    name = "arm.uxtb"
+
+    reg = operand_def(builtin.IntegerType)
+    res = result_def(builtin.IntegerType)
+
+    def __init__(self, reg: SSAValue):
+        super().__init__(
+            operands=[reg],
+            result_types=[builtin.IntegerType(32)]
+        )
+
+@irdl_op_definition
+class ArmUxthOp(IRDLOperation):
+    name = "arm.uxth"
+
+    reg = operand_def(builtin.IntegerType)
+    res = result_def(builtin.IntegerType)
+
+    def __init__(self, reg: SSAValue):
+        super().__init__(
+            operands=[reg],
+            result_types=[builtin.IntegerType(32)]
+        )
+
+@irdl_op_definition
+class ArmRetOp(IRDLOperation):
+    name = "arm.ret"
+
+    def __init__(self):
+        super().__init__(
+            operands=[],
+            result_types=[]
+        )
+
+# Stack frame accesses. Locals live at the bottom of the frame, offset bytes
+# above sp. Loads move as many bytes as their result type holds, stores width
+# bits (their value may already sit in a register of a wider type).
+
+# function attribute holding the size of its locals, in bytes
+LOCALS_ATTR = "arm.locals"
+
+# address of a local: sp + offset
+@irdl_op_definition
+class ArmFrameAddrOp(IRDLOperation):
+    name = "arm.frameaddr"
+
+    # imm32 argument
+    offset = attr_def(builtin.IntegerAttr)
+    res = result_def(builtin.IntegerType)
+
+    def __init__(self, offset: int):
+        offset_attr = builtin.IntegerAttr.from_int_and_width(offset, 32)
+        super().__init__(
+            operands=[],
+            attributes={"offset": offset_attr},
+            result_types=[builtin.IntegerType(32)]
+        )
+
+# load from [sp, #offset]
+@irdl_op_definition
+class ArmFrameLoadOp(IRDLOperation):
+    name = "arm.frameload"
+
+    # imm32 argument
+    offset = attr_def(builtin.IntegerAttr)
+    res = result_def(builtin.IntegerType)
+
+    def __init__(self, offset: int, result_type: builtin.IntegerType):
+        offset_attr = builtin.IntegerAttr.from_int_and_width(offset, 32)
+        super().__init__(
+            operands=[],
+            attributes={"offset": offset_attr},
+            result_types=[result_type]
+        )
+
+# store to [sp, #offset]
+@irdl_op_definition
+class ArmFrameStoreOp(IRDLOperation):
+    name = "arm.framestore"
+
+    # value, imm32 arguments
+    value = operand_def(builtin.IntegerType)
+    offset = attr_def(builtin.IntegerAttr)
+    width = attr_def(builtin.IntegerAttr)
+
+    def __init__(self, value: SSAValue, offset: int, width: int):
+        offset_attr = builtin.IntegerAttr.from_int_and_width(offset, 32)
+        width_attr = builtin.IntegerAttr.from_int_and_width(width, 32)
+        super().__init__(
+            operands=[value],
+            attributes={"offset": offset_attr, "width": width_attr},
+            result_types=[]
+        )
+
+# load from [base, #offset]
+@irdl_op_definition
+class ArmLoadOp(IRDLOperation):
+    name = "arm.load"
+
+    # base, imm32 argument
+    base = operand_def(builtin.IntegerType)
+    offset = attr_def(builtin.IntegerAttr)
+    res = result_def(builtin.IntegerType)
+
+    def __init__(self, base: SSAValue, offset: int, result_type: builtin.IntegerType):
+        offset_attr = builtin.IntegerAttr.from_int_and_width(offset, 32)
+        super().__init__(
+            operands=[base],
+            attributes={"offset": offset_attr},
+            result_types=[result_type]
+        )
+
+# store to [base, #offset]
+@irdl_op_definition
+class ArmStoreOp(IRDLOperation):
+    name = "arm.store"
+
+    # value, base, imm32 arguments
+    value = operand_def(builtin.IntegerType)
+    base = operand_def(builtin.IntegerType)
+    offset = attr_def(builtin.IntegerAttr)
+    width = attr_def(builtin.IntegerAttr)
+
+    def __init__(self, value: SSAValue, base: SSAValue, offset: int, width: int):
+        offset_attr = builtin.IntegerAttr.from_int_and_width(offset, 32)
+        width_attr = builtin.IntegerAttr.from_int_and_width(width, 32)
+        super().__init__(
+            operands=[value, base],
+            attributes={"offset": offset_attr, "width": width_attr},
+            result_types=[]
+        )
+
+# load from [base, index, lsl #shift]
+@irdl_op_definition
+class ArmLoadRegOp(IRDLOperation):
+    name = "arm.loadreg"
+
+    # base, index, imm32 argument
+    base = operand_def(builtin.IntegerType)
+    index = operand_def(builtin.IntegerType)
+    shift = attr_def(builtin.IntegerAttr)
+    res = result_def(builtin.IntegerType)
+
+    def __init__(self, base: SSAValue, index: SSAValue, shift: int, result_type: builtin.IntegerType):
+        shift_attr = builtin.IntegerAttr.from_int_and_width(shift, 32)
+        super().__init__(
+            operands=[base, index],
+            attributes={"shift": shift_attr},
+            result_types=[result_type]
+        )
+
+# store to [base, index, lsl #shift]
+@irdl_op_definition
+class ArmStoreRegOp(IRDLOperation):
+    name = "arm.storereg"
+
+    # value, base, index, imm32 arguments
+    value = operand_def(builtin.IntegerType)
+    base = operand_def(builtin.IntegerType)
+    index = operand_def(builtin.IntegerType)
+    shift = attr_def(builtin.IntegerAttr)
+    width = attr_def(builtin.IntegerAttr)
+
+    def __init__(self, value: SSAValue, base: SSAValue, index: SSAValue, shift: int, width: int):
+        shift_attr = builtin.IntegerAttr.from_int_and_width(shift, 32)
+        width_attr = builtin.IntegerAttr.from_int_and_width(width, 32)
+        super().__init__(
+            operands=[value, base, index],
+            attributes={"shift": shift_attr, "width": width_attr},
+            result_types=[]
+        )
+
+# Compares and branches. A compare is always fused with the op consuming its
+# flags: a conditional branch or select, printed as cmp followed by b<cond> or
+# an IT block. cond is the ARM condition code under which lhs compared with rhs
+# (or imm) takes the then successor / the true value.
+
+# unconditional branch, passing args to the block arguments of dest
+@irdl_op_definition
+class ArmBranchOp(IRDLOperation):
+    name = "arm.b"
+
+    args = var_operand_def(builtin.IntegerType)
+    dest = successor_def()
+
+    traits = traits_def(IsTerminator())
+
+    def __init__(self, dest: Block, args: list[SSAValue] = ()):
+        super().__init__(
+            operands=[list(args)],
+            successors=[dest]
+        )
+
+@irdl_op_definition
+class ArmCmpBranchOp(IRDLOperation):
+    name = "arm.cmpbr"
 
-    # operands and result type 
+    # operands, condition code and successors (neither takes arguments)
     lhs = operand_def(builtin.IntegerType)
     rhs = operand_def(builtin.IntegerType)
-    res = result_def(builtin.IntegerType)
+    cond = attr_def(builtin.StringAttr)
+    then_block = successor_def()
+    else_block = successor_def()
 
-    def __init__(self, lhs: SSAValue, rhs: SSAValue):
+    traits = traits_def(IsTerminator())
+
+    def __init__(self, lhs: SSAValue, rhs: SSAValue, cond: str, then_block: Block, else_block: Block):
         super().__init__(
             operands=[lhs, rhs],
-            result_types=[lhs.type]
+            attributes={"cond": builtin.StringAttr(cond)},
+            successors=[then_block, else_block]
         )
 
 @irdl_op_definition
-class ArmMovOp(IRDLOperation):
-    name = "arm.mov"
+class ArmCmpImmBranchOp(IRDLOperation):
+    name = "arm.cmpimmbr"
 
-    # imm32 argument
+    # register operand, imm32 argument, condition code and successors
+    lhs = operand_def(builtin.IntegerType)
     imm = attr_def(builtin.IntegerAttr)
-    res = result_def(builtin.IntegerType)
+    cond = attr_def(builtin.StringAttr)
+    then_block = successor_def()
+    else_block = successor_def()
 
-    def __init__(self, imm_val: int):
+    traits = traits_def(IsTerminator())
+
+    def __init__(self, lhs: SSAValue, imm_val: int, cond: str, then_block: Block, else_block: Block):
         imm_attr = builtin.IntegerAttr.from_int_and_width(imm_val, 32)
         super().__init__(
-            operands=[],
-            attributes={"imm": imm_attr},
-            result_types=[builtin.IntegerType(32)]
+            operands=[lhs],
+            attributes={"imm": imm_attr, "cond": builtin.StringAttr(cond)},
+            successors=[then_block, else_block]
         )
 
+# conditional select: cond(lhs, rhs) ? true_value : false_value
 @irdl_op_definition
-class ArmMovwOp(IRDLOperation):
-    name = "arm.movw"
+class ArmSelectOp(IRDLOperation):
+    name = "arm.select"
 
-    # imm32 argument
-    imm = attr_def(builtin.IntegerAttr)
+    lhs = operand_def(builtin.IntegerType)
+    rhs = operand_def(builtin.IntegerType)
+    true_value = operand_def(builtin.IntegerType)
+    false_value = operand_def(builtin.IntegerType)
+    cond = attr_def(builtin.StringAttr)
     res = result_def(builtin.IntegerType)
 
-    def __init__(self, imm_val: int):
-        imm_attr = builtin.IntegerAttr.from_int_and_width(imm_val, 32)
+    def __init__(self, lhs: SSAValue, rhs: SSAValue, cond: str, true_value: SSAValue, false_value: SSAValue,
+                 result_type=None):
         super().__init__(
-            operands=[],
-            attributes={"imm": imm_attr},
-            result_types=[builtin.IntegerType(32)]
+            operands=[lhs, rhs, true_value, false_value],
+            attributes={"cond": builtin.StringAttr(cond)},
+            result_types=[result_type or true_value.type]
         )
 
 @irdl_op_definition
-class ArmMovtOp(IRDLOperation):
-    name = "arm.movt"
+class ArmSelectImmOp(IRDLOperation):
+    name = "arm.selectimm"
 
-    # reg, imm32 argument
-    reg = operand_def(builtin.IntegerType)
+    lhs = operand_def(builtin.IntegerType)
+    true_value = operand_def(builtin.IntegerType)
+    false_value = operand_def(builtin.IntegerType)
     imm = attr_def(builtin.IntegerAttr)
+    cond = attr_def(builtin.StringAttr)
     res = result_def(builtin.IntegerType)
 
-    def __init__(self, reg: SSAValue, imm_val: int):
+    def __init__(self, lhs: SSAValue, imm_val: int, cond: str, true_value: SSAValue, false_value: SSAValue,
+                 result_type=None):
         imm_attr = builtin.IntegerAttr.from_int_and_width(imm_val, 32)
         super().__init__(
-            operands=[reg],
-            attributes={"imm": imm_attr},
-            result_types=[builtin.IntegerType(32)]
+            operands=[lhs, true_value, false_value],
+            attributes={"imm": imm_attr, "cond": builtin.StringAttr(cond)},
+            result_types=[result_type or true_value.type]
         )
 
-@irdl_op_definition
-class ArmMovRegOp(IRDLOperation):
-    name = "arm.movreg"
+BRANCH_OPS = (ArmBranchOp, ArmCmpBranchOp, ArmCmpImmBranchOp)
+SELECT_OPS = (ArmSelectOp, ArmSelectImmOp)
 
-    # imm32 argument
-    reg = operand_def(builtin.IntegerType)
-    res = result_def(builtin.IntegerType)
+# condition code of each cmpi predicate (by number)
+CMPI_CONDS = {0: "eq", 1: "ne", 2: "lt", 3: "le", 4: "gt", 5: "ge", 6: "lo", 7: "ls", 8: "hi", 9: "hs"}
 
-    def __init__(self, reg: SSAValue):
-        super().__init__(
-            operands=[reg],
-            result_types=[builtin.IntegerType(32)]
-        )
+# condition of the opposite outcome, and of the same compare with swapped operands
+INVERSE_CONDS = {"eq": "ne", "ne": "eq", "lt": "ge", "ge": "lt", "le": "gt", "gt": "le",
+                 "lo": "hs", "hs": "lo", "ls": "hi", "hi": "ls"}
+SWAPPED_CONDS = {"eq": "eq", "ne": "ne", "lt": "gt", "gt": "lt", "le": "ge", "ge": "le",
+                 "lo": "hi", "hi": "lo", "ls": "hs", "hs": "ls"}
 
-@irdl_op_definition
-class ArmRetOp(IRDLOperation):
-    name = "arm.ret"
+#
+#   Pattern rewriters for lowering
+#
 
-    def __init__(self):
-        super().__init__(
-            operands=[],
-            result_types=[]
-        )
+# value of a constant operand (before or after arith.constant has been lowered)
+def get_const(ssa: SSAValue) -> int | None:
+    op = ssa.owner
+    if isinstance(op, arith.ConstantOp) and isinstance(op.value, builtin.IntegerAttr):
+        # registers hold i1 values as 0 / 1 (true is stored as -1)
+        if op.value.type == builtin.i1:
+            return op.value.value.data & 1
+        return op.value.value.data
+    if isinstance(op, ArmMovOp):
+        return op.imm.value.data
+    if isinstance(op, ArmMovtOp) and isinstance(op.reg.owner, ArmMovwOp):
+        return op.reg.owner.imm.value.data | (op.imm.value.data << 16)
+    if isinstance(op, ArmMvnImmOp):
+        return ~op.imm.value.data & 0xFFFFFFFF
+    if isinstance(op, ArmLdrLitOp):
+        return op.imm.value.data & 0xFFFFFFFF
+
+    # Thumb-1 two-instruction sequences starting with movs
+    if isinstance(op, (ArmLslImmOp, ArmAddImmOp, ArmMvnOp)) and isinstance(op.operands[0].owner, ArmMovOp):
+        base = op.operands[0].owner.imm.value.data
+        if isinstance(op, ArmLslImmOp):
+            return (base << op.imm.value.data) & 0xFFFFFFFF
+        if isinstance(op, ArmAddImmOp):
+            return (base + op.imm.value.data) & 0xFFFFFFFF
+        return ~base & 0xFFFFFFFF
+    return None
+
+# ops that only materialize constants, and may be erased once unused
+CONST_OPS = (ArmMovOp, ArmMovwOp, ArmMovtOp, ArmMvnImmOp, ArmLdrLitOp)
+
+# largest add/sub immediate on cores without Thumb-2 modified immediates
+THUMB1_MAX_IMM = 0xFF
+
+# signed 32-bit view of a constant
+def to_signed32(imm_val: int) -> int:
+    imm_val &= 0xFFFFFFFF
+    return imm_val - (1 << 32) if imm_val & 0x80000000 else imm_val
+
+# index values are 32 bits wide on these cores: lowered, they are i32 values
+def register_type(value_type: builtin.IntegerType | builtin.IndexType) -> builtin.IntegerType:
+    return builtin.i32 if isinstance(value_type, builtin.IndexType) else value_type
+
+def register_width(value_type: builtin.IntegerType | builtin.IndexType) -> int:
+    return register_type(value_type).width.data
+
+# whether add/sub take imm_val (>= 0) as an immediate
+def is_add_imm(target: str, imm_val: int) -> bool:
+    if is_thumb2(target):
+        return is_thumb2_imm(imm_val)
+    return imm_val <= THUMB1_MAX_IMM
+
+# add/sub with an encodable immediate (x + -c becomes x - c and vice versa)
+class ArmAddSubImmLowerPattern(RewritePattern):
+
+    op_types = (arith.AddiOp, arith.SubiOp)
+
+    def __init__(self, target: str = DEFAULT_TARGET):
+        self.target = target
+
+    def match_and_rewrite(self, op, rewriter):
+
+        # match arith.addi / arith.subi
+        if not isinstance(op, (arith.AddiOp, arith.SubiOp)):
+            return
+        x, imm_val = op.lhs, get_const(op.rhs)
+
+        # constant on the left of an addition
+        if imm_val is None and isinstance(op, arith.AddiOp):
+            x, imm_val = op.rhs, get_const(op.lhs)
+        if imm_val is None:
+            return
+
+        imm_val = to_signed32(imm_val)
+        negate = imm_val < 0
+        if negate:
+            imm_val = -imm_val
+        if not is_add_imm(self.target, imm_val):
+            return
+
+        is_add = isinstance(op, arith.AddiOp) != negate
+        imm_op = ArmAddImmOp(x, imm_val) if is_add else ArmSubImmOp(x, imm_val)
+        rewriter.replace_op(op, [imm_op])
+
+# and/or/xor with an encodable immediate
+class ArmLogicImmLowerPattern(RewritePattern):
+
+    imm_ops = {
+        arith.AndIOp: ArmAndImmOp,
+        arith.OrIOp:  ArmOrImmOp,
+        arith.XOrIOp: ArmEorImmOp
+    }
+    op_types = tuple(imm_ops)
+
+    def match_and_rewrite(self, op, rewriter):
+
+        # match arith.andi / arith.ori / arith.xori
+        if type(op) not in self.imm_ops:
+            return
+
+        # all three are commutative
+        x, imm_val = op.lhs, get_const(op.rhs)
+        if imm_val is None:
+            x, imm_val = op.rhs, get_const(op.lhs)
+        if imm_val is None or not is_thumb2_imm(imm_val):
+            return
+
+        rewriter.replace_op(op, [self.imm_ops[type(op)](x, imm_val & 0xFFFFFFFF)])
+
+# shifts by a constant amount
+class ArmShiftImmLowerPattern(RewritePattern):
+
+    imm_ops = {
+        arith.ShLIOp:  ArmLslImmOp,
+        arith.ShRUIOp: ArmLsrImmOp,
+        arith.ShRSIOp: ArmAsrImmOp
+    }
+    op_types = tuple(imm_ops)
+
+    def match_and_rewrite(self, op, rewriter):
+
+        # match arith.shli / arith.shrui / arith.shrsi
+        if type(op) not in self.imm_ops:
+            return
+        if (imm_val := get_const(op.rhs)) is None:
+            return
+
+        # lsl takes 0-31; lsr/asr encode 1-32 (shifting by >= 32 is poison in arith)
+        if not (0 <= imm_val <= 31) or (imm_val == 0 and not isinstance(op, arith.ShLIOp)):
+            return
+
+        rewriter.replace_op(op, [self.imm_ops[type(op)](op.lhs, imm_val)])
 
 #
-#   Pattern rewriters for lowering
+#   Fused instructions, matched on arith DAGs before the plain lowering
 #
+# the op defining ssa if it has type op_type and ssa has no other use, so
+# folding it into its user removes it
+def single_use_def(ssa: SSAValue, op_type):
+    op = ssa.owner
+    if not isinstance(op, op_type) or not ssa.has_one_use():
+        return None
+
+    # an op hoisted out of a loop is not folded back into its user in the loop
+    parent = next(iter(ssa.uses)).operation.parent_op()
+    while parent is not None and not parent.is_ancestor(op):
+        if isinstance(parent, (scf.ForOp, scf.WhileOp)):
+            return None
+        parent = parent.parent_op()
+    return op
+
+# acc + x * y -> mla, acc - x * y -> mls (Thumb-2 only)
+class ArmMulAccLowerPattern(RewritePattern):
+
+    op_types = (arith.AddiOp, arith.SubiOp)
+
+    def match_and_rewrite(self, op, rewriter):
+
+        # match arith.addi / arith.subi
+        if not isinstance(op, (arith.AddiOp, arith.SubiOp)):
+            return
+
+        # the product is either addend, but only the subtrahend of a subtraction
+        pairs = [(op.rhs, op.lhs)]
+        if isinstance(op, arith.AddiOp):
+            pairs.append((op.lhs, op.rhs))
+        for product, acc in pairs:
+            mul_op = single_use_def(product, arith.MuliOp)
+
+            # a constant accumulator is better as an immediate add/sub
+            if mul_op is None or get_const(acc) is not None:
+                continue
+            mac_type = ArmMlaOp if isinstance(op, arith.AddiOp) else ArmMlsOp
+            rewriter.replace_op(op, [mac_type(mul_op.lhs, mul_op.rhs, acc)])
+            rewriter.erase_op(mul_op)
+            return
+
+# x op (y shift #n) -> one instruction with a shifted register operand (Thumb-2 only)
+class ArmShiftedOperandLowerPattern(RewritePattern):
+
+    shift_kinds = {
+        arith.ShLIOp:  "lsl",
+        arith.ShRUIOp: "lsr",
+        arith.ShRSIOp: "asr"
+    }
+
+    shifted_ops = {
+        arith.AddiOp: ArmAddShiftOp,
+        arith.SubiOp: ArmSubShiftOp,
+        arith.AndIOp: ArmAndShiftOp,
+        arith.OrIOp:  ArmOrShiftOp,
+        arith.XOrIOp: ArmEorShiftOp
+    }
+    op_types = tuple(shifted_ops)
+
+    def match_shift(self, ssa: SSAValue):
+        shift_op = single_use_def(ssa, tuple(self.shift_kinds))
+        if shift_op is None:
+            return None
+        amount = get_const(shift_op.rhs)
+        if amount is None or not (1 <= amount <= 31):
+            return None
+        return shift_op, self.shift_kinds[type(shift_op)], amount
+
+    def match_and_rewrite(self, op, rewriter):
+
+        # match arith.addi / subi / andi / ori / xori
+        if type(op) not in self.shifted_ops:
+            return
+
+        # the shifted value is the second operand; all but sub are commutative,
+        # and (y shift #n) - x is a reverse subtract
+        candidates = [(op.lhs, op.rhs, self.shifted_ops[type(op)])]
+        if isinstance(op, arith.SubiOp):
+            candidates.append((op.rhs, op.lhs, ArmRsbShiftOp))
+        else:
+            candidates.append((op.rhs, op.lhs, self.shifted_ops[type(op)]))
+
+        for x, shifted, new_type in candidates:
+            if (match := self.match_shift(shifted)) is None or get_const(x) is not None:
+                continue
+            shift_op, kind, amount = match
+            rewriter.replace_op(op, [new_type(x, shift_op.lhs, kind, amount)])
+            rewriter.erase_op(shift_op)
+            return
+
+# ~x, as C writes it
+def match_not(ssa: SSAValue) -> SSAValue | None:
+    op = single_use_def(ssa, arith.XOrIOp)
+    if op is None:
+        return None
+    for x, ones in ((op.lhs, op.rhs), (op.rhs, op.lhs)):
+        if (imm_val := get_const(ones)) is not None and imm_val & 0xFFFFFFFF == 0xFFFFFFFF:
+            return x
+    return None
+
+# x & ~y -> bic x, y (and bic x, y, shift #n on Thumb-2)
+class ArmBicLowerPattern(RewritePattern):
+
+    op_types = (arith.AndIOp,)
+
+    def __init__(self, target: str = DEFAULT_TARGET):
+        self.target = target
+
+    def match_and_rewrite(self, op, rewriter):
+
+        # match arith.andi with a negated operand
+        if not isinstance(op, arith.AndIOp):
+            return
+        for x, inverted in ((op.lhs, op.rhs), (op.rhs, op.lhs)):
+            if (y := match_not(inverted)) is None:
+                continue
+            not_op = inverted.owner
+
+            shifted = None
+            if is_thumb2(self.target):
+                shifted = ArmShiftedOperandLowerPattern().match_shift(y)
+            if shifted is not None:
+                shift_op, kind, amount = shifted
+                rewriter.replace_op(op, [ArmBicShiftOp(x, shift_op.lhs, kind, amount)])
+                rewriter.erase_op(not_op)
+                rewriter.erase_op(shift_op)
+            else:
+                rewriter.replace_op(op, [ArmBicOp(x, y)])
+                rewriter.erase_op(not_op)
+            return
+
+# ~x -> mvn x
+class ArmMvnLowerPattern(RewritePattern):
+
+    op_types = (arith.XOrIOp,)
+
+    def match_and_rewrite(self, op, rewriter):
+
+        # match arith.xori with all ones
+        if not isinstance(op, arith.XOrIOp):
+            return
+        for x, ones in ((op.lhs, op.rhs), (op.rhs, op.lhs)):
+            if (imm_val := get_const(ones)) is not None and imm_val & 0xFFFFFFFF == 0xFFFFFFFF:
+                rewriter.replace_op(op, [ArmMvnOp(x)])
+                return
+
+# x & c -> bic x, #~c when only ~c is encodable
+class ArmBicImmLowerPattern(RewritePattern):
+
+    op_types = (arith.AndIOp,)
+
+    def match_and_rewrite(self, op, rewriter):
+
+        # match arith.andi with a constant
+        if not isinstance(op, arith.AndIOp):
+            return
+        x, imm_val = op.lhs, get_const(op.rhs)
+        if imm_val is None:
+            x, imm_val = op.rhs, get_const(op.lhs)
+        if imm_val is None:
+            return
+        inverted = ~imm_val & 0xFFFFFFFF
+        if not is_thumb2_imm(inverted):
+            return
+
+        rewriter.replace_op(op, [ArmBicImmOp(x, inverted)])
+
+# x & 0xFF / x & 0xFFFF -> uxtb / uxth, which need no mask in a register
+class ArmAndMaskLowerPattern(RewritePattern):
+
+    mask_ops = {
+        0xFF:   ArmUxtbOp,
+        0xFFFF: ArmUxthOp
+    }
+    op_types = (arith.AndIOp,)
+
+    def match_and_rewrite(self, op, rewriter):
+
+        # match 32-bit arith.andi with the low byte or halfword mask
+        if not isinstance(op, arith.AndIOp) or op.result.type != builtin.i32:
+            return
+        for x, mask in ((op.lhs, op.rhs), (op.rhs, op.lhs)):
+            if (imm_val := get_const(mask)) is not None and imm_val & 0xFFFFFFFF in self.mask_ops:
+                rewriter.replace_op(op, [self.mask_ops[imm_val & 0xFFFFFFFF](x)])
+                return
+
+# constants whose only users were folded into immediates
+class ArmDeadConstPattern(RewritePattern):
+
+    op_types = CONST_OPS + (ArmLslImmOp, ArmAddImmOp, ArmMvnOp)
+
+    def match_and_rewrite(self, op, rewriter):
+
+        # match constant materialization, including the tails of movs sequences
+        if not isinstance(op, CONST_OPS + (ArmLslImmOp, ArmAddImmOp, ArmMvnOp)):
+            return
+        if get_const(op.res) is None or op.res.uses:
+            return
+
+        rewriter.erase_op(op)
 
 # arm.add
 class ArmAddLowerPattern(RewritePattern):
 
+    op_types = (arith.AddiOp,)
+
     def match_and_rewrite(self, op, rewriter):
         
         # match arith.addi
@@ -256,6 +1420,8 @@ class ArmAddLowerPattern(RewritePattern):
 # arm.sub
 class ArmSubLowerPattern(RewritePattern):
 
+    op_types = (arith.SubiOp,)
+
     def match_and_rewrite(self, op, rewriter):
         
         # match arith.subi
@@ -272,6 +1438,8 @@ class ArmSubLowerPattern(RewritePattern):
 # arm.mul
 class ArmMulLowerPattern(RewritePattern):
 
+    op_types = (arith.MuliOp,)
+
     def match_and_rewrite(self, op, rewriter):
         
         # match arith.muli
@@ -285,9 +1453,70 @@ class ArmMulLowerPattern(RewritePattern):
         mul_op = ArmMulOp(lhs, rhs)
         rewriter.replace_op(op, [mul_op])       
 
+# arm.sdiv / arm.udiv (Thumb-2 only)
+class ArmDivLowerPattern(RewritePattern):
+
+    op_types = (arith.DivSIOp, arith.DivUIOp)
+
+    def match_and_rewrite(self, op, rewriter):
+        
+        # match arith.divsi / arith.divui
+        if not isinstance(op, (arith.DivSIOp, arith.DivUIOp)):
+            return
+        
+        lhs = op.lhs
+        rhs = op.rhs
+
+        # replace with arm.sdiv / arm.udiv
+        div_type = ArmSdivOp if isinstance(op, arith.DivSIOp) else ArmUdivOp
+        div_op = div_type(lhs, rhs)
+        rewriter.replace_op(op, [div_op])
+
+# x % y -> x - (x / y) * y (Thumb-2 only)
+class ArmRemLowerPattern(RewritePattern):
+
+    op_types = (arith.RemSIOp, arith.RemUIOp)
+
+    def match_and_rewrite(self, op, rewriter):
+        
+        # match arith.remsi / arith.remui
+        if not isinstance(op, (arith.RemSIOp, arith.RemUIOp)):
+            return
+        
+        lhs = op.lhs
+        rhs = op.rhs
+
+        # replace with a division, a multiply and a subtraction
+        div_type = ArmSdivOp if isinstance(op, arith.RemSIOp) else ArmUdivOp
+        div_op = div_type(lhs, rhs)
+        mul_op = ArmMulOp(div_op.res, rhs)
+        sub_op = ArmSubOp(lhs, mul_op.res)
+        rewriter.replace_op(op, [div_op, mul_op, sub_op])
+
+# arm.smull / arm.umull
+class ArmMulExtendedLowerPattern(RewritePattern):
+
+    op_types = (arith.MulSIExtendedOp, arith.MulUIExtendedOp)
+
+    def match_and_rewrite(self, op, rewriter):
+        
+        # match arith.mulsi_extended / arith.mului_extended
+        if not isinstance(op, (arith.MulSIExtendedOp, arith.MulUIExtendedOp)):
+            return
+        
+        lhs = op.lhs
+        rhs = op.rhs
+
+        # replace with arm.smull / arm.umull
+        mull_type = ArmSmullOp if isinstance(op, arith.MulSIExtendedOp) else ArmUmullOp
+        mull_op = mull_type(lhs, rhs)
+        rewriter.replace_op(op, [mull_op])
+
 # arm.and
 class ArmAndLowerPattern(RewritePattern):
 
+    op_types = (arith.AndIOp,)
+
     def match_and_rewrite(self, op, rewriter):
         
         # match arith.andi
@@ -304,6 +1533,8 @@ class ArmAndLowerPattern(RewritePattern):
 # arm.or
 class ArmOrLowerPattern(RewritePattern):
 
+    op_types = (arith.OrIOp,)
+
     def match_and_rewrite(self, op, rewriter):
         
         # match arith.ori
@@ -320,6 +1551,8 @@ class ArmOrLowerPattern(RewritePattern):
 # arm.eor
 class ArmEorLowerPattern(RewritePattern):
 
+    op_types = (arith.XOrIOp,)
+
     def match_and_rewrite(self, op, rewriter):
         
         # match arith.xori
@@ -336,6 +1569,8 @@ class ArmEorLowerPattern(RewritePattern):
 # arm.lsl
 class ArmLslLowerPattern(RewritePattern):
 
+    op_types = (arith.ShLIOp,)
+
     def match_and_rewrite(self, op, rewriter):
         
         # match arith.shli
@@ -352,6 +1587,8 @@ class ArmLslLowerPattern(RewritePattern):
 # arm.lsr
 class ArmLsrLowerPattern(RewritePattern):
 
+    op_types = (arith.ShRUIOp,)
+
     def match_and_rewrite(self, op, rewriter):
         
         # match arith.shrui
@@ -368,6 +1605,8 @@ class ArmLsrLowerPattern(RewritePattern):
 # arm.asr
 class ArmAsrLowerPattern(RewritePattern):
 
+    op_types = (arith.ShRSIOp,)
+
     def match_and_rewrite(self, op, rewriter):
         
         # match arith.shrsi
@@ -381,29 +1620,124 @@ class ArmAsrLowerPattern(RewritePattern):
         lsr_op = ArmAsrOp(lhs, rhs)
         rewriter.replace_op(op, [lsr_op])
 
-# arm.mov*
+# extension op of each (arith op, source width)
+EXTEND_OPS = {
+    (arith.ExtSIOp, 8):     ArmSxtbOp,
+    (arith.ExtSIOp, 16):    ArmSxthOp,
+    (arith.ExtUIOp, 8):     ArmUxtbOp,
+    (arith.ExtUIOp, 16):    ArmUxthOp,
+}
+
+# extsi / extui from i8 or i16 -> sxtb / sxth / uxtb / uxth
+class ArmExtendLowerPattern(RewritePattern):
+
+    op_types = (arith.ExtSIOp, arith.ExtUIOp)
+
+    def match_and_rewrite(self, op, rewriter):
+
+        # match arith.extsi, arith.extui
+        if not isinstance(op, (arith.ExtSIOp, arith.ExtUIOp)):
+            return
+        ext_op_type = EXTEND_OPS.get((type(op), op.input.type.width.data))
+        if ext_op_type is None:
+            return
+
+        rewriter.replace_op(op, [ext_op_type(op.input)])
+
+# trunci -> the same register read as the narrower type: only its low bits
+# are read afterwards
+class ArmTruncLowerPattern(RewritePattern):
+
+    op_types = (arith.TruncIOp,)
+
+    def match_and_rewrite(self, op, rewriter):
+
+        # match arith.trunci
+        if not isinstance(op, arith.TruncIOp):
+            return
+
+        rewriter.replace_op(op, [ArmCastOp(op.input, op.result.type)])
+
+# index_cast -> the same register read as an i32: index values are 32 bits
+# wide, and the ones lowered are treated as i32
+class ArmIndexCastLowerPattern(RewritePattern):
+
+    op_types = (arith.IndexCastOp,)
+
+    def match_and_rewrite(self, op, rewriter):
+
+        # match arith.index_cast
+        if not isinstance(op, arith.IndexCastOp):
+            return
+
+        rewriter.replace_op(op, [ArmCastOp(op.input, register_type(op.result.type))])
+
+# extui / extsi / trunci of i1 values, which registers hold as 0 or 1
+class ArmBoolCastLowerPattern(RewritePattern):
+
+    op_types = (arith.ExtUIOp, arith.ExtSIOp, arith.TruncIOp)
+
+    def match_and_rewrite(self, op, rewriter):
+
+        # match a cast from or to i1
+        if not isinstance(op, (arith.ExtUIOp, arith.ExtSIOp, arith.TruncIOp)):
+            return
+        if builtin.i1 not in (op.input.type, op.result.type):
+            return
+
+        # 0 / 1 is already zero-extended, -b sign-extends it, and the low bit
+        # is isolated by shifting the others out; the result has the type of
+        # the cast either way, as the patterns lowering its users read it
+        if isinstance(op, arith.ExtUIOp):
+            rewriter.replace_op(op, [ArmCastOp(op.input, op.result.type)])
+        elif isinstance(op, arith.ExtSIOp):
+            rewriter.replace_op(op, [ArmRsbImmOp(op.input, 0, op.result.type)])
+        else:
+            lsl_op = ArmLslImmOp(op.input, 31)
+            lsr_op = ArmLsrImmOp(lsl_op.res, 31)
+            rewriter.replace_op(op, [lsl_op, lsr_op, ArmCastOp(lsr_op.res, op.result.type)])
+
+# arm.mov*: the cheapest legal sequence for the target (backend_cost.const_plan)
 class ArmMovLowerPattern(RewritePattern):
 
+    op_types = (arith.ConstantOp,)
+
+    def __init__(self, target: str = DEFAULT_TARGET):
+        self.target = target
+
     def match_and_rewrite(self, op, rewriter):
         
         # match arith.constant
         if not isinstance(op, arith.ConstantOp):
             return
-        imm_val = op.value.value.data
-
-        # small value (< 16 bits) -> mov
-        if (imm_val <= 0xFFFF):
-            mov_op = ArmMovOp(imm_val)
-            rewriter.replace_op(op, [mov_op])
-
-        # otherwise use movw, movt
-        else:
-            movw_op = ArmMovwOp(imm_val & 0xFFFF)
-            movt_op = ArmMovtOp(movw_op.res, (imm_val >> 16) & 0xFFFF)
-            rewriter.replace_op(op, [movw_op, movt_op])
+        # negative constants are materialized as their 32-bit pattern
+        imm_val = get_const(op.result) & 0xFFFFFFFF
+
+        new_ops = []
+        for mnemonic, step_imm in const_plan(self.target, imm_val):
+            # single instruction moves are all arm.mov, printed as movs/mov/movw
+            if mnemonic in ("movs", "mov") or mnemonic == "movw" and step_imm == imm_val:
+                new_ops.append(ArmMovOp(step_imm))
+            elif mnemonic == "movw":
+                new_ops.append(ArmMovwOp(step_imm))
+            elif mnemonic == "movt":
+                new_ops.append(ArmMovtOp(new_ops[-1].res, step_imm))
+            elif mnemonic == "mvn":
+                new_ops.append(ArmMvnImmOp(step_imm))
+            elif mnemonic == "mvns":
+                new_ops.append(ArmMvnOp(new_ops[-1].res))
+            elif mnemonic == "lsls":
+                new_ops.append(ArmLslImmOp(new_ops[-1].res, step_imm))
+            elif mnemonic == "adds":
+                new_ops.append(ArmAddImmOp(new_ops[-1].res, step_imm))
+            elif mnemonic == "ldr":
+                new_ops.append(ArmLdrLitOp(step_imm))
+        rewriter.replace_op(op, new_ops)
 
 # arm.ret
 class ArmRetPattern(RewritePattern):
+
+    op_types = (func.ReturnOp,)
     
     def match_and_rewrite(self, op, rewriter):
         
@@ -411,24 +1745,222 @@ class ArmRetPattern(RewritePattern):
         if not isinstance(op, func.ReturnOp):
             return
         
+        # void functions return nothing in r0
+        if not op.operands:
+            rewriter.replace_op(op, [ArmRetOp()])
+            return
+
         movreg_op = ArmMovRegOp(op.operands[0])
         ret_op = ArmRetOp()
         rewriter.replace_op(op, [movreg_op, ret_op])
 
-def lower(module: builtin.ModuleOp):
-    merged_pattern = GreedyRewritePatternApplier([ArmAddLowerPattern(),
-                                                  ArmSubLowerPattern(),
-                                                  ArmMulLowerPattern(),
-                                                  ArmAndLowerPattern(),
-                                                  ArmEorLowerPattern(),
-                                                  ArmLslLowerPattern(),
-                                                  ArmLsrLowerPattern(),
-                                                  ArmAsrLowerPattern(),
-                                                  ArmMovLowerPattern(),
-                                                  ArmRetPattern()
-                                                  ])
-    walker = PatternRewriteWalker(merged_pattern)
-    walker.rewrite_module(module)
+class LoweringError(Exception):
+    pass
+
+#
+#   Compares
+#
+# largest compare immediate on cores without Thumb-2 modified immediates
+THUMB1_MAX_CMP_IMM = 0xFF
+
+# signed compare predicates of i1 values (true is -1) as unsigned compares of 0 / 1
+BOOL_SIGNED_PREDICATES = {2: 8, 3: 9, 4: 6, 5: 7}
+
+def is_cmp_imm(target: str, imm_val: int) -> bool:
+    # on Thumb-2, a constant whose negation is encodable is compared by cmn
+    if is_thumb2(target):
+        return is_thumb2_imm(imm_val) or is_thumb2_imm(-imm_val)
+    return 0 <= imm_val <= THUMB1_MAX_CMP_IMM
+
+def lower_compare(cmp_op: arith.CmpiOp, target: str) -> tuple[SSAValue, SSAValue | None, int | None, str]:
+    """
+    arith.cmpi of 32-bit registers (ArmCompareWidthPattern has rewritten the
+    others) as an ARM compare: (lhs, rhs, imm, cond), with rhs None when an
+    encodable constant is compared as imm.
+    """
+    cond = CMPI_CONDS[cmp_op.predicate.value.data]
+    lhs, rhs = cmp_op.lhs, cmp_op.rhs
+
+    # the constant goes second
+    imm_val = get_const(rhs)
+    if imm_val is None and (imm_val := get_const(lhs)) is not None:
+        lhs, rhs, cond = rhs, lhs, SWAPPED_CONDS[cond]
+
+    if imm_val is not None and is_cmp_imm(target, imm_val & 0xFFFFFFFF):
+        return lhs, None, imm_val & 0xFFFFFFFF, cond
+    return lhs, rhs, None, cond
+
+def lower_select(cond: SSAValue, true_value: SSAValue, false_value: SSAValue, target: str,
+                 result_type=None) -> list:
+    """
+    Ops computing cond ? true_value : false_value, the last one being the
+    select (of result_type, by default that of the values). A compare
+    producing cond is fused into it, any other i1 is tested against 0.
+    """
+    if not isinstance(cmp_op := cond.owner, arith.CmpiOp):
+        return [ArmSelectImmOp(cond, 0, "ne", true_value, false_value, result_type)]
+    lhs, rhs, imm_val, cc = lower_compare(cmp_op, target)
+    if rhs is None:
+        return [ArmSelectImmOp(lhs, imm_val, cc, true_value, false_value, result_type)]
+    return [ArmSelectOp(lhs, rhs, cc, true_value, false_value, result_type)]
+
+# uses of an i1 that consume it as a condition, so that a compare producing it
+# becomes flags tested by the user rather than a value
+def is_condition_use(use) -> bool:
+    return use.index == 0 and isinstance(use.operation, (scf.IfOp, scf.ConditionOp, arith.SelectOp))
+
+# cmpi of i8 / i16 values -> cmpi of their extensions, as only the low bits of
+# a narrow value are defined, and signed cmpi of i1 values -> unsigned cmpi.
+# Done as soon as the compare is reached, so that lowering it with its users
+# (branches are lowered with control flow) only ever sees 32-bit compares
+class ArmCompareWidthPattern(RewritePattern):
+
+    op_types = (arith.CmpiOp,)
+
+    def match_and_rewrite(self, op, rewriter):
+
+        # match arith.cmpi of values narrower than a register (a lowered
+        # constant operand is an i32, so the narrower type is the compared one)
+        if not isinstance(op, arith.CmpiOp):
+            return
+        width = min(register_width(op.lhs.type), register_width(op.rhs.type))
+        predicate = op.predicate.value.data
+        is_signed = predicate in (2, 3, 4, 5)
+
+        if width == 1 and is_signed:
+            rewriter.replace_op(op, [arith.CmpiOp(op.lhs, op.rhs, BOOL_SIGNED_PREDICATES[predicate])])
+            return
+        if width not in (8, 16):
+            return
+
+        # constants are extended here, the other operands by an instruction
+        ext_op_type = EXTEND_OPS[(arith.ExtSIOp if is_signed else arith.ExtUIOp, width)]
+        new_ops = []
+        operands = []
+        for operand in (op.lhs, op.rhs):
+            if (imm_val := get_const(operand)) is not None:
+                imm_val &= (1 << width) - 1
+                if is_signed and imm_val >> (width - 1):
+                    imm_val -= 1 << width
+                new_ops.append(arith.ConstantOp.from_int_and_width(imm_val, 32))
+            else:
+                new_ops.append(ext_op_type(operand))
+            operands.append(new_ops[-1].results[0])
+        rewriter.replace_op(op, new_ops + [arith.CmpiOp(operands[0], operands[1], predicate)])
+
+# arith.select -> arm.select, with the compare of the condition fused in
+class ArmSelectLowerPattern(RewritePattern):
+
+    op_types = (arith.SelectOp,)
+
+    def __init__(self, target: str = DEFAULT_TARGET):
+        self.target = target
+
+    def match_and_rewrite(self, op, rewriter):
+
+        # match arith.select
+        if not isinstance(op, arith.SelectOp):
+            return
+
+        rewriter.replace_op(op, lower_select(op.cond, op.lhs, op.rhs, self.target))
+
+# compare results used as values (stored in variables, added, returned, ...)
+# -> 1 or 0 in a register; branches and selects on them compare themselves
+class ArmCompareLowerPattern(RewritePattern):
+
+    op_types = (arith.CmpiOp,)
+
+    def __init__(self, target: str = DEFAULT_TARGET):
+        self.target = target
+
+    def match_and_rewrite(self, op, rewriter):
+
+        # match arith.cmpi with a use that is not a condition
+        if not isinstance(op, arith.CmpiOp):
+            return
+        if all(is_condition_use(use) for use in op.result.uses):
+            return
+
+        # the select is still an i1, for the casts of it
+        one, zero = ArmMovOp(1), ArmMovOp(0)
+        new_ops = [one, zero] + lower_select(op.result, one.res, zero.res, self.target, op.result.type)
+        rewriter.insert_op(new_ops, InsertPoint.before(op))
+        rewriter.replace_uses_with_if(op.result, new_ops[-1].res, lambda use: not is_condition_use(use))
+
+# ops the target has no instructions for (and that were not rewritten away)
+class ArmUnsupportedPattern(RewritePattern):
+
+    def __init__(self, target: str = DEFAULT_TARGET):
+        self.target = target
+        self.unsupported = dict()
+        if not has(target, "div"):
+            self.unsupported.update({arith.DivSIOp: "division", arith.DivUIOp: "division",
+                                     arith.RemSIOp: "remainder", arith.RemUIOp: "remainder"})
+            # (by a power of two, the optimizer already made them shifts)
+        if not has(target, "mull"):
+            self.unsupported.update({arith.MulSIExtendedOp: "long multiply",
+                                     arith.MulUIExtendedOp: "long multiply"})
+        self.op_types = tuple(self.unsupported)
+
+    def match_and_rewrite(self, op, rewriter):
+
+        # match an op with no lowering on this core
+        if type(op) not in self.unsupported:
+            return
+
+        raise LoweringError(f"{self.unsupported[type(op)]} is not supported on {self.target}")
+
+def lowering_patterns(target: str = DEFAULT_TARGET) -> list[RewritePattern]:
+    # division and long multiplies only exist on Thumb-2 cores (on Thumb-1
+    # cores, the optimizer turned divisions by constants into multiplies;
+    # division by a variable is not supported)
+    target_patterns = []
+    if has(target, "div"):
+        target_patterns += [ArmDivLowerPattern(), ArmRemLowerPattern()]
+    if has(target, "mull"):
+        target_patterns += [ArmMulExtendedLowerPattern()]
+    if not (has(target, "div") and has(target, "mull")):
+        target_patterns += [ArmUnsupportedPattern(target)]
+
+    # logic ops only take immediates on Thumb-2
+    if is_thumb2(target):
+        target_patterns += [ArmLogicImmLowerPattern(), ArmBicImmLowerPattern()]
+
+    return [ArmAddSubImmLowerPattern(target), ArmMvnLowerPattern(), ArmAndMaskLowerPattern()] + target_patterns + [
+        ArmShiftImmLowerPattern(),
+        ArmAddLowerPattern(),
+        ArmSubLowerPattern(),
+        ArmMulLowerPattern(),
+        ArmAndLowerPattern(),
+        ArmOrLowerPattern(),
+        ArmEorLowerPattern(),
+        ArmLslLowerPattern(),
+        ArmLsrLowerPattern(),
+        ArmAsrLowerPattern(),
+        ArmBoolCastLowerPattern(),
+        ArmExtendLowerPattern(),
+        ArmTruncLowerPattern(),
+        ArmIndexCastLowerPattern(),
+        ArmCompareWidthPattern(),
+        ArmCompareLowerPattern(target),
+        ArmSelectLowerPattern(target),
+        ArmMovLowerPattern(target),
+        ArmRetPattern(),
+        ArmDeadConstPattern(),
+    ]
+
+# matched first, while the ops they fuse are still arith ops
+def fused_lowering_patterns(target: str = DEFAULT_TARGET) -> list[RewritePattern]:
+    patterns = [ArmBicLowerPattern(target)]
+    if is_thumb2(target):
+        patterns += [ArmMulAccLowerPattern(), ArmShiftedOperandLowerPattern()]
+    return patterns
+
+def lower(module: builtin.ModuleOp, target: str = DEFAULT_TARGET):
+    for patterns in (fused_lowering_patterns(target), lowering_patterns(target)):
+        merged_pattern = TypedPatternApplier(patterns)
+        walker = PatternRewriteWalker(merged_pattern)
+        walker.rewrite_module(module)
 
 ArmDialect = Dialect(
     "arm", # The namespace used in the MLIR text (e.g., %0 = "arm.add"...)
@@ -447,5 +1979,49 @@ ArmDialect = Dialect(
         ArmMovwOp,
         ArmMovtOp,
         ArmMovRegOp,
+        ArmCastOp,
+        ArmSxtbOp,
+        ArmSxthOp,
+        ArmUxtbOp,
+        ArmUxthOp,
+        ArmMvnImmOp,
+        ArmLdrLitOp,
+        ArmAddImmOp,
+        ArmSubImmOp,
+        ArmAndImmOp,
+        ArmOrImmOp,
+        ArmEorImmOp,
+        ArmLslImmOp,
+        ArmLsrImmOp,
+        ArmAsrImmOp,
+        ArmRsbImmOp,
+        ArmBicImmOp,
+        ArmMvnOp,
+        ArmMlaOp,
+        ArmMlsOp,
+        ArmBicOp,
+        ArmAddShiftOp,
+        ArmSubShiftOp,
+        ArmRsbShiftOp,
+        ArmAndShiftOp,
+        ArmOrShiftOp,
+        ArmEorShiftOp,
+        ArmBicShiftOp,
+        ArmSdivOp,
+        ArmUdivOp,
+        ArmSmullOp,
+        ArmUmullOp,
+        ArmBranchOp,
+        ArmCmpBranchOp,
+        ArmCmpImmBranchOp,
+        ArmSelectOp,
+        ArmSelectImmOp,
+        ArmFrameAddrOp,
+        ArmFrameLoadOp,
+        ArmFrameStoreOp,
+        ArmLoadOp,
+        ArmStoreOp,
+        ArmLoadRegOp,
+        ArmStoreRegOp,
     ]
 )
\ No newline at end of file
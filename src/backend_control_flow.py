@@ -0,0 +1,289 @@
+"""
+Control-flow lowering: scf.if / scf.for / scf.while to ARM blocks and branches
+"""
+
+from xdsl.dialects import arith, builtin, func, scf
+from xdsl.ir import Block, Operation, SSAValue
+from xdsl.pattern_rewriter import PatternRewriteWalker
+from xdsl.rewriter import InsertPoint, Rewriter
+
+from src.backend_arm_dialect import *
+
+
+#
+#   If-conversion
+#
+# an scf.if runs both of its sides and selects their results when the ops of
+# both together cost at most this many cycles (about what the compare, the
+# taken branch and the jump over the other side cost) ...
+IF_CONVERSION_CYCLES = 4
+
+# ... and it has at most this many results, each a select (with its own compare)
+IF_CONVERSION_RESULTS = 2
+
+def speculation_cost(op: Operation, target: str) -> int | None:
+    """
+    Cycles op adds when it runs whether or not its side is taken, or None when
+    it must not (or is too slow to) run speculatively.
+    """
+    if isinstance(op, (ArmSdivOp, ArmUdivOp, ArmSmullOp, ArmUmullOp)):
+        return None
+    # the side not taken may index past its local, or read what was never written
+    if isinstance(op, (ArmFrameLoadOp, ArmLoadOp, ArmLoadRegOp)):
+        return None
+    if isinstance(op, (ArmMulOp, ArmMlaOp, ArmMlsOp)):
+        return cost(target, "mul")
+    if isinstance(op, SELECT_OPS):
+        return 2
+    if isinstance(op, ArmCastOp):
+        return 0
+    if op.name.startswith("arm.") and op.results:
+        return cost(target, "alu")
+    return None
+
+def side_ops(region) -> list[Operation]:
+    # the ops of one side of an scf.if, without its yield
+    if not region.blocks:
+        return []
+    return list(region.blocks[0].ops)[:-1]
+
+def can_if_convert(op: scf.IfOp, target: str) -> bool:
+    if not op.results or len(op.results) > IF_CONVERSION_RESULTS:
+        return False
+    total = 0
+    for inner in side_ops(op.true_region) + side_ops(op.false_region):
+        if (cycles := speculation_cost(inner, target)) is None:
+            return False
+        total += cycles
+    return total <= IF_CONVERSION_CYCLES
+
+def if_convert(op: scf.IfOp, target: str):
+    """
+    Hoist the ops of both sides in front of op and replace its results by
+    selects between the values the sides yield.
+    """
+    then_values = op.true_region.blocks[0].last_op.operands
+    else_values = op.false_region.blocks[0].last_op.operands
+    for inner in side_ops(op.true_region) + side_ops(op.false_region):
+        inner.detach()
+        Rewriter.insert_op(inner, InsertPoint.before(op))
+
+    results = []
+    for then_value, else_value in zip(then_values, else_values):
+        if then_value == else_value:
+            results.append(then_value)
+            continue
+        new_ops = lower_select(op.cond, then_value, else_value, target)
+        Rewriter.insert_op(new_ops, InsertPoint.before(op))
+        results.append(new_ops[-1].res)
+    Rewriter.replace_op(op, [], results)
+
+
+#
+#   Blocks
+#
+def condition_branch(cond: SSAValue, then_block: Block, else_block: Block, target: str) -> list[Operation]:
+    """
+    Ops branching to then_block when the i1 cond holds and to else_block
+    otherwise: the compare producing cond fused with the branch, or a test of
+    cond against 0.
+    """
+    if not isinstance(cmp_op := cond.owner, arith.CmpiOp):
+        return [ArmCmpImmBranchOp(cond, 0, "ne", then_block, else_block)]
+    lhs, rhs, imm_val, cc = lower_compare(cmp_op, target)
+    if rhs is None:
+        return [ArmCmpImmBranchOp(lhs, imm_val, cc, then_block, else_block)]
+    return [ArmCmpBranchOp(lhs, rhs, cc, then_block, else_block)]
+
+def is_unlikely(branch: Operation) -> bool:
+    """
+    Static guess that a conditional branch is not taken: values are rarely
+    equal to what they are compared with, and rarely negative.
+    """
+    cc = branch.cond.data
+    if cc == "eq":
+        return True
+    return cc == "lt" and isinstance(branch, ArmCmpImmBranchOp) and branch.imm.value.data == 0
+
+def split_after(op: Operation, arg_types=()) -> Block:
+    # the ops following op move to a new block, placed right after op's
+    return op.parent_block().split_before(op.next_op, arg_types=[register_type(t) for t in arg_types])
+
+def take_block(region) -> Block:
+    # the single block of an scf region, detached from it, with index
+    # arguments (induction variables) as the i32 values they are lowered to
+    block = region.detach_block(region.blocks[0])
+    for arg in block.args:
+        if isinstance(arg.type, builtin.IndexType):
+            Rewriter.replace_value_with_new_type(arg, builtin.i32)
+    return block
+
+def replace_terminator(block: Block, new_op: Operation) -> list[SSAValue]:
+    """
+    Replace the scf.yield / scf.condition ending block by new_op and return
+    the values it passed on.
+    """
+    terminator = block.last_op
+    values = list(terminator.operands)
+    Rewriter.erase_op(terminator)
+    block.add_op(new_op)
+    return values
+
+def drop_args(block: Block, values: list[SSAValue]):
+    # the block arguments become the values block is always entered with
+    for arg, value in zip(list(block.args), values):
+        arg.replace_by(value)
+        block.erase_arg(arg)
+
+class ControlFlowLowering:
+    """
+    Turns the scf ops of one function into blocks of its body, outermost
+    first, placed so that the likely path falls through from one block to the
+    next: a side of an if that is unlikely taken goes after the rest of the
+    function, loops are entered at their test, placed after the body, so each
+    iteration ends with the one conditional branch back.
+    """
+
+    def __init__(self, func_op: func.FuncOp, target: str):
+        self.region = func_op.body
+        self.target = target
+
+    def place_after(self, blocks: list[Block], block: Block):
+        if blocks:
+            self.region.insert_block_after(blocks, block)
+
+    def place_cold(self, block: Block):
+        self.region.add_block(block)
+
+    def lower_if(self, op: scf.IfOp):
+        block = op.parent_block()
+        merge = split_after(op, [res.type for res in op.results])
+        then_block = take_block(op.true_region)
+        else_block = take_block(op.false_region) if op.false_region.blocks else None
+
+        for side in (then_block, else_block):
+            if side is not None:
+                replace_terminator(side, ArmBranchOp(merge, side.last_op.operands))
+        for res, arg in zip(op.results, merge.args):
+            res.replace_by(arg)
+
+        new_ops = condition_branch(op.cond, then_block, else_block or merge, self.target)
+        Rewriter.insert_op(new_ops, InsertPoint.at_end(block))
+        Rewriter.erase_op(op)
+
+        # the likely side falls through from the branch and into the merge
+        if is_unlikely(new_ops[-1]):
+            self.place_after([else_block] if else_block is not None else [], block)
+            self.place_cold(then_block)
+        else:
+            self.place_after([then_block] + ([else_block] if else_block is not None else []), block)
+
+    def lower_for(self, op: scf.ForOp):
+        block = op.parent_block()
+        exit_block = split_after(op)
+        body = take_block(op.body)
+
+        # with at least one iteration, the test moves to the end of the body,
+        # which is entered with the initial values and then from a latch
+        lb_val, ub_val = get_const(op.lb), get_const(op.ub)
+        if lb_val is not None and ub_val is not None and to_signed32(lb_val) < to_signed32(ub_val):
+            latch = Block()
+            next_iv = self.increment(body.args[0], op.step)
+            Rewriter.insert_op(next_iv, InsertPoint.before(body.last_op))
+            results = replace_terminator(body, self.loop_test(next_iv.res, op.ub, latch, exit_block))
+            latch.add_op(ArmBranchOp(body, [next_iv.res] + results))
+            block.add_op(ArmBranchOp(body, [op.lb] + list(op.iter_args)))
+            self.place_after([body, latch], block)
+
+        # otherwise the loop is entered at the test, which follows the body
+        else:
+            test = Block(arg_types=[arg.type for arg in body.args])
+            drop_args(body, test.args)
+            next_iv = self.increment(test.args[0], op.step)
+            Rewriter.insert_op(next_iv, InsertPoint.before(body.last_op))
+            replace_terminator(body, ArmBranchOp(test, [next_iv.res] + list(body.last_op.operands)))
+            test.add_op(self.loop_test(test.args[0], op.ub, body, exit_block))
+            block.add_op(ArmBranchOp(test, [op.lb] + list(op.iter_args)))
+            results = test.args[1:]
+            self.place_after([body, test], block)
+
+        for res, value in zip(op.results, results):
+            res.replace_by(value)
+        Rewriter.erase_op(op)
+
+    def increment(self, iv: SSAValue, step: SSAValue) -> Operation:
+        if (step_val := get_const(step)) is not None and is_add_imm(self.target, step_val):
+            return ArmAddImmOp(iv, step_val)
+        return ArmAddOp(iv, step)
+
+    def loop_test(self, iv: SSAValue, ub: SSAValue, body: Block, exit_block: Block) -> Operation:
+        # scf.for iterates while iv < ub (signed)
+        if (ub_val := get_const(ub)) is not None and is_cmp_imm(self.target, ub_val & 0xFFFFFFFF):
+            return ArmCmpImmBranchOp(iv, ub_val & 0xFFFFFFFF, "lt", body, exit_block)
+        return ArmCmpBranchOp(iv, ub, "lt", body, exit_block)
+
+    def lower_while(self, op: scf.WhileOp):
+        block = op.parent_block()
+        exit_block = split_after(op)
+        before = take_block(op.before_region)
+        after = take_block(op.after_region)
+
+        # the after block is entered with the values scf.condition forwards
+        cond_op = before.last_op
+        cond, forwarded = cond_op.condition, list(cond_op.args)
+        drop_args(after, forwarded)
+        replace_terminator(after, ArmBranchOp(before, after.last_op.operands))
+        Rewriter.erase_op(cond_op)
+        before.add_ops(condition_branch(cond, after, exit_block, self.target))
+
+        block.add_op(ArmBranchOp(before, op.arguments))
+        for res, value in zip(op.results, forwarded):
+            res.replace_by(value)
+        Rewriter.erase_op(op)
+        self.place_after([after, before], block)
+
+    LOWERINGS = {
+        scf.IfOp:       lower_if,
+        scf.ForOp:      lower_for,
+        scf.WhileOp:    lower_while,
+    }
+
+    def run(self):
+        # lowering an op splits its block: the rest is looked at again with the
+        # blocks that follow, nested ops included
+        idx = 0
+        while idx < len(self.region.blocks):
+            block = self.region.blocks[idx]
+            op = next((op for op in block.ops if type(op) in self.LOWERINGS), None)
+            if op is None:
+                idx += 1
+                continue
+            self.LOWERINGS[type(op)](self, op)
+
+
+#
+#   Pass
+#
+def lower_control_flow(module: builtin.ModuleOp, target: str = DEFAULT_TARGET):
+    """
+    Lower the scf ops left by the lowering into blocks and branches: small
+    ifs become selects first (inner ones before the ifs holding them), then
+    every remaining if and loop becomes blocks of the function body.
+    """
+    for op in reversed(list(module.walk())):
+        if isinstance(op, scf.IfOp) and can_if_convert(op, target):
+            if_convert(op, target)
+
+    for func_op in list(module.ops):
+        if isinstance(func_op, func.FuncOp):
+            ControlFlowLowering(func_op, target).run()
+
+    # compares were all fused into the branches and selects using them
+    for op in reversed(list(module.walk())):
+        if isinstance(op, arith.CmpiOp) and not op.result.uses:
+            Rewriter.erase_op(op)
+    PatternRewriteWalker(TypedPatternApplier([ArmDeadConstPattern()])).rewrite_module(module)
+
+    for op in module.walk():
+        if op.dialect_name() in ("arith", "scf"):
+            raise LoweringError(f"{op.name} could not be lowered")
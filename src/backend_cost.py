@@ -0,0 +1,358 @@
+"""
+Per-core cost tables for the ARM targets
+"""
+
+from functools import lru_cache
+
+#
+#   Cycle costs (Cortex-M0+ and Cortex-M33 technical reference manuals);
+#   None marks instructions the core does not have
+#
+TARGETS = {
+    # RP2040: Thumb-1 only, configured with the single-cycle multiplier
+    "cortex-m0plus": {
+        "alu": 1,
+        "mov": 1,
+        "mul": 1,
+        "mull": None,   # no smull/umull
+        "div": None,    # no sdiv/udiv
+        "load": 2,
+        "store": 2,
+        "branch": 2,    # taken branch, including the pipeline refill
+    },
+    # Cortex-M0+ built with the small (iterative) multiplier
+    "cortex-m0plus-smallmul": {
+        "alu": 1,
+        "mov": 1,
+        "mul": 32,
+        "mull": None,
+        "div": None,
+        "load": 2,
+        "store": 2,
+        "branch": 2,
+    },
+    # RP2350 (Pico 2): Thumb-2
+    "cortex-m33": {
+        "alu": 1,
+        "mov": 1,
+        "mul": 1,
+        "mull": 1,      # smull/umull
+        "div": 11,      # sdiv/udiv take 2-11 cycles, depending on the operands
+        "load": 2,
+        "store": 1,
+        "branch": 2,
+    },
+}
+
+DEFAULT_TARGET = "cortex-m33"
+
+# instruction set of each core
+ISA = {
+    "cortex-m0plus": "thumb1",
+    "cortex-m0plus-smallmul": "thumb1",
+    "cortex-m33": "thumb2",
+}
+
+# name of each core for the assembler's .cpu directive
+CPU_NAMES = {
+    "cortex-m0plus": "cortex-m0plus",
+    "cortex-m0plus-smallmul": "cortex-m0plus",
+    "cortex-m33": "cortex-m33",
+}
+
+def is_thumb2(target: str) -> bool:
+    return ISA[target] == "thumb2"
+
+def cost(target: str, kind: str) -> int:
+    return TARGETS[target][kind]
+
+def has(target: str, kind: str) -> bool:
+    return TARGETS[target][kind] is not None
+
+#
+#   Constant materialization
+#
+# Thumb-2 modified immediate: an 8-bit value, one of the byte-replicated
+# patterns 0x00XY00XY / 0xXY00XY00 / 0xXYXYXYXY, or 1bcdefgh rotated right
+def is_thumb2_imm(imm_val: int) -> bool:
+    imm_val &= 0xFFFFFFFF
+    byte0 = imm_val & 0xFF
+    byte1 = (imm_val >> 8) & 0xFF
+    if imm_val <= 0xFF:
+        return True
+    if imm_val in (byte0 * 0x00010001, (byte1 << 8) * 0x00010001, byte0 * 0x01010101):
+        return True
+    for rot in range(8, 32):
+        rotated = ((imm_val << rot) | (imm_val >> (32 - rot))) & 0xFFFFFFFF
+        if rotated <= 0xFF and rotated & 0x80:
+            return True
+    return False
+
+def const_plans(target: str, imm_val: int) -> list[list[tuple]]:
+    """
+    Legal instruction sequences putting imm_val in a (low) register on target,
+    as lists of (mnemonic, immediate) steps.
+    """
+    imm_val &= 0xFFFFFFFF
+    inverted = ~imm_val & 0xFFFFFFFF
+    plans = []
+
+    if imm_val <= 0xFF:
+        plans.append([("movs", imm_val)])
+
+    if is_thumb2(target):
+        if is_thumb2_imm(imm_val):
+            plans.append([("mov", imm_val)])
+        if is_thumb2_imm(inverted):
+            plans.append([("mvn", inverted)])
+        if imm_val <= 0xFFFF:
+            plans.append([("movw", imm_val)])
+        plans.append([("movw", imm_val & 0xFFFF), ("movt", imm_val >> 16)])
+        return plans
+
+    # Thumb-1: 8-bit movs, optionally shifted, inverted or incremented
+    shift = (imm_val & -imm_val).bit_length() - 1 if imm_val else 0
+    if imm_val >> shift <= 0xFF and shift > 0:
+        plans.append([("movs", imm_val >> shift), ("lsls", shift)])
+    if inverted <= 0xFF:
+        plans.append([("movs", inverted), ("mvns", None)])
+    if 0xFF < imm_val <= 2 * 0xFF:
+        plans.append([("movs", 0xFF), ("adds", imm_val - 0xFF)])
+    plans.append([("ldr", imm_val)])   # literal pool
+    return plans
+
+def plan_cost(target: str, plan: list[tuple]) -> tuple[int, int]:
+    # (cycles, bytes), bytes including the literal pool word
+    cycles, size = 0, 0
+    for mnemonic, imm_val in plan:
+        if mnemonic == "ldr":
+            cycles += cost(target, "load")
+            size += 2 + 4
+        elif mnemonic in ("mov", "mvn", "movw", "movt"):
+            cycles += cost(target, "mov")
+            size += 4
+        else:
+            cycles += cost(target, "alu") if mnemonic != "movs" else cost(target, "mov")
+            size += 2
+    return cycles, size
+
+@lru_cache(maxsize=None)
+def const_plan(target: str, imm_val: int) -> tuple[tuple, ...]:
+    """
+    Cheapest way to materialize imm_val on target: fewest cycles, then fewest bytes.
+    """
+    plans = const_plans(target, imm_val)
+    return tuple(min(plans, key=lambda plan: plan_cost(target, plan)))
+
+def const_cost(target: str, imm_val: int) -> int:
+    """
+    Cycles to materialize a 32-bit constant in a register.
+    """
+    return plan_cost(target, const_plan(target, imm_val))[0]
+
+
+#
+#   Static estimator for emitted Thumb assembly
+#
+# cost class of each mnemonic (flag-setting and plain forms alike)
+MNEMONIC_KINDS = {
+    "add": "alu", "adds": "alu", "sub": "alu", "subs": "alu", "rsb": "alu", "rsbs": "alu",
+    "and": "alu", "ands": "alu", "orr": "alu", "orrs": "alu", "eor": "alu", "eors": "alu",
+    "bic": "alu", "bics": "alu", "mvn": "alu", "mvns": "alu", "orn": "alu",
+    "lsl": "alu", "lsls": "alu", "lsr": "alu", "lsrs": "alu", "asr": "alu", "asrs": "alu",
+    "cmp": "alu", "cmn": "alu", "tst": "alu",
+    "sxtb": "alu", "sxth": "alu", "uxtb": "alu", "uxth": "alu",
+    "mov": "mov", "movs": "mov", "movw": "mov", "movt": "mov",
+    "mul": "mul", "muls": "mul", "mla": "mul", "mls": "mul",
+    "smull": "mull", "umull": "mull",
+    "sdiv": "div", "udiv": "div",
+    "ldr": "load", "ldrb": "load", "ldrh": "load", "str": "store", "strb": "store", "strh": "store",
+    "b": "branch", "bx": "branch", "bl": "branch", "cbz": "branch", "cbnz": "branch",
+}
+
+# condition suffixes of b<cond> and of instructions in an IT block
+CONDITIONS = ("eq", "ne", "hs", "lo", "mi", "pl", "vs", "vc", "hi", "ls", "ge", "lt", "gt", "le")
+
+# instructions that always have a 32-bit encoding
+WIDE_MNEMONICS = {"movw", "movt", "mul", "mla", "mls", "smull", "umull", "sdiv", "udiv", "bl", "orn"}
+
+# 16-bit two-address data processing forms: op rd, rd, rm (or op rd, rm)
+TWO_ADDRESS_MNEMONICS = {"ands", "orrs", "eors", "bics", "lsls", "lsrs", "asrs", "muls", "mvns"}
+
+def is_low_reg(operand: str) -> bool:
+    return operand in ("r0", "r1", "r2", "r3", "r4", "r5", "r6", "r7")
+
+def parse_imm(operand: str) -> int | None:
+    if not operand.startswith("#"):
+        return None
+    try:
+        return int(operand[1:], 0)
+    except ValueError:
+        return None
+
+def split_operands(text: str) -> list[str]:
+    # commas inside {register lists} and [memory operands] do not separate operands
+    operands, depth, current = [], 0, ""
+    for ch in text:
+        if ch in "{[":
+            depth += 1
+        elif ch in "}]":
+            depth -= 1
+        if ch == "," and depth == 0:
+            operands.append(current.strip())
+            current = ""
+        else:
+            current += ch
+    if current.strip():
+        operands.append(current.strip())
+    return operands
+
+def register_list(operand: str) -> list[str]:
+    return [reg.strip() for reg in operand.strip("{}").split(",") if reg.strip()]
+
+def instruction_size(mnemonic: str, operands: list[str]) -> int:
+    """
+    Encoded size in bytes of a Thumb instruction (the 16-bit form when one
+    applies, as the assembler picks it).
+    """
+    if mnemonic in WIDE_MNEMONICS or mnemonic.endswith(".w"):
+        return 4
+    if mnemonic in ("bx", "b", "cbz", "cbnz") or mnemonic.startswith("it"):
+        return 2
+    if mnemonic.startswith("b") and mnemonic[1:] in CONDITIONS:
+        return 2
+
+    # mov (or, in an IT block, mov<cond>) and cmp between any two registers
+    if mnemonic in ("mov", "cmp") or mnemonic.startswith("mov") and mnemonic[3:] in CONDITIONS:
+        if not operands[1].startswith("#"):
+            return 2
+    if mnemonic in ("push", "pop"):
+        extra = "lr" if mnemonic == "push" else "pc"
+        regs = register_list(operands[0])
+        return 2 if all(is_low_reg(reg) or reg == extra for reg in regs) else 4
+
+    # literal pool loads (pc-relative, within 1020 bytes), word loads / stores
+    # relative to sp (imm8 * 4), and loads / stores relative to a low register
+    # by imm5 * size or by another low register
+    if mnemonic == "ldr" and len(operands) == 2 and not operands[1].startswith("["):
+        return 2 if is_low_reg(operands[0]) else 4
+    if mnemonic[:3] in ("ldr", "str") and mnemonic[3:] in ("", "b", "h"):
+        size = {"": 4, "b": 1, "h": 2}[mnemonic[3:]]
+        if len(operands) == 2 and operands[1].startswith("["):
+            address = split_operands(operands[1].strip("[]"))
+            if len(address) == 2 and is_low_reg(address[1]):
+                return 2 if is_low_reg(operands[0]) and is_low_reg(address[0]) else 4
+            offset = parse_imm(address[1]) if len(address) > 1 else 0
+            if is_low_reg(operands[0]) and offset is not None and 0 <= offset and offset % size == 0:
+                if address[0] == "sp" and size == 4 and offset <= 1020:
+                    return 2
+                if is_low_reg(address[0]) and offset < 32 * size:
+                    return 2
+        return 4
+
+    # add / sub sp, sp, #imm7 * 4 and add rd, sp, #imm8 * 4
+    if mnemonic in ("add", "sub") and operands[0] == "sp":
+        imm = parse_imm(operands[-1])
+        return 2 if imm is not None and 0 <= imm <= 508 and imm % 4 == 0 else 4
+    if mnemonic == "add" and operands[1] == "sp":
+        imm = parse_imm(operands[-1])
+        return 2 if is_low_reg(operands[0]) and imm is not None and 0 <= imm <= 1020 and imm % 4 == 0 else 4
+
+    if not all(is_low_reg(op) or op.startswith("#") for op in operands):
+        # mov between any two registers has a 16-bit form
+        return 2 if mnemonic == "mov" and len(operands) == 2 and not operands[1].startswith("#") else 4
+    imm = parse_imm(operands[-1])
+
+    if mnemonic in ("movs", "cmp"):
+        return 2 if imm is None or 0 <= imm <= 255 else 4
+    if mnemonic in ("adds", "subs"):
+        if imm is None:
+            return 2 if len(operands) == 3 else 4
+        if len(operands) == 3 and 0 <= imm <= 7:
+            return 2
+        return 2 if (len(operands) == 2 or operands[0] == operands[1]) and 0 <= imm <= 255 else 4
+    if mnemonic in ("lsls", "lsrs", "asrs") and imm is not None:
+        return 2
+    if mnemonic == "rsbs":
+        return 2 if imm == 0 else 4
+    if mnemonic in TWO_ADDRESS_MNEMONICS and imm is None:
+        if len(operands) == 2 or operands[0] == operands[1]:
+            return 2
+        # muls rd, rn, rd is also two-address
+        return 2 if mnemonic == "muls" and operands[0] == operands[2] else 4
+    if mnemonic in ("tst", "cmn", "mvns", "sxtb", "sxth", "uxtb", "uxth") and imm is None:
+        return 2
+    return 4
+
+def instruction_cycles(target: str, mnemonic: str, operands: list[str]) -> int:
+    """
+    Estimated cycles of one instruction on target (no stalls, branches taken).
+    """
+    if mnemonic in ("push", "pop"):
+        regs = register_list(operands[0])
+        cycles = 1 + len(regs)
+        if mnemonic == "pop" and "pc" in regs:
+            cycles += cost(target, "branch")
+        return cycles
+
+    # conditional branches (b<cond>) cost the same as b here
+    mnemonic = mnemonic.removesuffix(".w")
+    kind = MNEMONIC_KINDS.get(mnemonic)
+    if kind is None and mnemonic.startswith("b") and mnemonic[1:] in CONDITIONS:
+        kind = "branch"
+    if kind is None or not has(target, kind):
+        kind = "alu"
+    cycles = cost(target, kind)
+
+    # writing pc is a branch
+    if operands and operands[0] == "pc" and kind != "branch":
+        cycles += cost(target, "branch")
+    return cycles
+
+class FunctionCost:
+
+    def __init__(self, name: str):
+        self.name = name
+        self.instructions = 0
+        self.size = 0           # bytes, including literal data
+        self.cycles = 0
+
+def estimate_asm(asm_text: str, target: str = DEFAULT_TARGET) -> list[FunctionCost]:
+    """
+    Per-function instruction count, code size and cycle estimate of Thumb
+    assembly as printed by backend_printer. The cycles are those of running
+    every instruction once, which is exact for straight-line code.
+    """
+    functions = []
+    for line in asm_text.splitlines():
+        line = line.split("@")[0].split("//")[0].strip()
+        if not line:
+            continue
+
+        # global labels start functions; local (.L) labels and directives do not
+        if line.endswith(":"):
+            if not line.startswith("."):
+                functions.append(FunctionCost(line[:-1]))
+            continue
+        if not functions:
+            continue
+        if line.startswith("."):
+            if line.startswith(".word"):
+                functions[-1].size += 4 * len(split_operands(line[len(".word"):]))
+            continue
+
+        mnemonic, _, rest = line.partition(" ")
+        operands = split_operands(rest)
+        functions[-1].instructions += 1
+        functions[-1].size += instruction_size(mnemonic, operands)
+        functions[-1].cycles += instruction_cycles(target, mnemonic, operands)
+    return functions
+
+def format_estimate(filename: str, functions: list[FunctionCost], target: str) -> str:
+    lines = [f"{filename} ({target}):",
+             f"  {'function':<24} {'instrs':>7} {'bytes':>7} {'cycles':>7}"]
+    for function in functions:
+        lines.append(f"  {function.name:<24} {function.instructions:7} {function.size:7} {function.cycles:7}")
+    lines.append(f"  {'total':<24} {sum(f.instructions for f in functions):7} "
+                 f"{sum(f.size for f in functions):7} {sum(f.cycles for f in functions):7}")
+    return "\n".join(lines)
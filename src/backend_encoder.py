@@ -0,0 +1,484 @@
+"""
+Thumb / Thumb-2 machine code encoder for the instructions the printer emits
+"""
+
+from src.backend_printer import *
+
+
+class EncodingError(Exception):
+    pass
+
+
+REG_NUMBERS = {"sp": 13, "lr": 14, "pc": 15, **{f"r{reg}": reg for reg in range(13)}}
+
+# alignment padding: ARMv6-M assemblers pad with mov r8, r8, Thumb-2 ones with nop
+THUMB1_NOP = 0x46C0
+THUMB2_NOP = 0xBF00
+
+# op field of the 32-bit data processing encodings (modified immediate and
+# shifted register share them), with S set for the flag-setting mnemonics
+DATA_OPS = {
+    "ands": 0b0000,
+    "bics": 0b0001,
+    "orrs": 0b0010,
+    "eors": 0b0100,
+    "adds": 0b1000,
+    "subs": 0b1101,
+    "rsbs": 0b1110,
+}
+
+# opcode of the 16-bit two-address data processing encodings (op rdn, rm)
+THUMB1_DATA_OPS = {
+    "ands": 0b0000,
+    "eors": 0b0001,
+    "lsls": 0b0010,
+    "lsrs": 0b0011,
+    "asrs": 0b0100,
+    "orrs": 0b1100,
+    "muls": 0b1101,
+    "bics": 0b1110,
+    "mvns": 0b1111,
+}
+
+# Thumb-2 three-register forms that narrow to op rdn, rm with either source as rdn
+COMMUTATIVE_OPS = ("ands", "eors", "orrs")
+
+SHIFT_TYPES = {"lsl": 0b00, "lsr": 0b01, "asr": 0b10}
+
+# condition field of b<cond> and it
+COND_CODES = {
+    "eq": 0b0000, "ne": 0b0001, "hs": 0b0010, "lo": 0b0011,
+    "mi": 0b0100, "pl": 0b0101, "vs": 0b0110, "vc": 0b0111,
+    "hi": 0b1000, "ls": 0b1001, "ge": 0b1010, "lt": 0b1011,
+    "gt": 0b1100, "le": 0b1101,
+}
+
+
+#
+#   Fields
+#
+def reg(operand: str) -> int:
+    return REG_NUMBERS[operand]
+
+def is_low(*operands: str) -> bool:
+    return all(reg(operand) < 8 for operand in operands)
+
+def thumb2_imm12(value: int) -> int | None:
+    """
+    i:imm3:imm8 field of a Thumb-2 modified immediate (ThumbExpandImm inverse),
+    or None when value has none.
+    """
+    value &= 0xFFFFFFFF
+    byte = value & 0xFF
+    if value == byte:
+        return byte
+    if value == byte * 0x00010001:
+        return 0x100 | byte
+    if value == (value & 0xFF00) * 0x00010001 and value:
+        return 0x200 | (value >> 8) & 0xFF
+    if value == byte * 0x01010101:
+        return 0x300 | byte
+
+    # an 8-bit value with its top bit set, rotated right by 8 to 31
+    for rotation in range(8, 32):
+        unrotated = (value << rotation | value >> (32 - rotation)) & 0xFFFFFFFF
+        if unrotated & ~0xFF == 0 and unrotated & 0x80:
+            return rotation << 7 | unrotated & 0x7F
+    return None
+
+def split_imm12(imm12: int) -> tuple[int, int]:
+    # (first halfword bits, second halfword bits) of i:imm3:imm8
+    return (imm12 >> 11) << 10, ((imm12 >> 8) & 0b111) << 12 | imm12 & 0xFF
+
+def narrow(halfword: int) -> bytes:
+    return halfword.to_bytes(2, "little")
+
+def wide(first: int, second: int) -> bytes:
+    return first.to_bytes(2, "little") + second.to_bytes(2, "little")
+
+def wide_imm(op: int, s: int, rn: int, rd: int, value: int) -> bytes:
+    # 32-bit data processing with a modified immediate
+    if (imm12 := thumb2_imm12(value)) is None:
+        raise EncodingError(f"#{value} is not a Thumb-2 modified immediate")
+    first, second = split_imm12(imm12)
+    return wide(0xF000 | first | op << 5 | s << 4 | rn, second | rd << 8)
+
+def wide_reg(op: int, s: int, rn: int, rd: int, rm: int, shift: Shift | None = None) -> bytes:
+    # 32-bit data processing with a (shifted) register
+    kind, amount = (shift.kind, shift.amount) if shift is not None else ("lsl", 0)
+    amount &= 0x1F    # lsr/asr #32 are encoded as #0
+    return wide(0xEA00 | op << 5 | s << 4 | rn,
+                (amount >> 2) << 12 | rd << 8 | (amount & 0b11) << 6 | SHIFT_TYPES[kind] << 4 | rm)
+
+def split_imm16(value: int) -> tuple[int, int]:
+    # (first halfword bits, second halfword bits) of imm4:i:imm3:imm8
+    return (value >> 12) | ((value >> 11) & 1) << 10, ((value >> 8) & 0b111) << 12 | value & 0xFF
+
+
+#
+#   Instructions
+#
+def encode_add_sub(mnemonic: str, operands: list, thumb2: bool) -> bytes:
+    rd, rn, *rest = operands if len(operands) > 2 else (operands[0], operands[0], operands[1])
+    rhs = rest[0]
+    shift = rest[1] if len(rest) > 1 else None
+    sub = mnemonic == "subs"
+
+    if isinstance(rhs, int):
+        if is_low(rd, rn) and rhs <= 7 and len(operands) == 3:
+            return narrow((0x1E00 if sub else 0x1C00) | rhs << 6 | reg(rn) << 3 | reg(rd))
+        if is_low(rd) and rd == rn and rhs <= 0xFF:
+            return narrow((0x3800 if sub else 0x3000) | reg(rd) << 8 | rhs)
+        if thumb2:
+            return wide_imm(DATA_OPS[mnemonic], 1, reg(rn), reg(rd), rhs)
+
+    elif len(operands) == 3 and is_low(rd, rn, rhs):
+        return narrow((0x1A00 if sub else 0x1800) | reg(rhs) << 6 | reg(rn) << 3 | reg(rd))
+    elif thumb2:
+        return wide_reg(DATA_OPS[mnemonic], 1, reg(rn), reg(rd), reg(rhs), shift)
+    raise EncodingError(f"no Thumb-1 encoding for {mnemonic}")
+
+def encode_data(mnemonic: str, operands: list, thumb2: bool) -> bytes:
+    """
+    ands, orrs, eors, bics, rsbs: register, shifted register or immediate operand.
+    """
+    rd, rn, *rest = operands if len(operands) > 2 else (operands[0], operands[0], operands[1])
+    rhs = rest[0]
+    shift = rest[1] if len(rest) > 1 else None
+
+    if isinstance(rhs, int):
+        # negation is the only 16-bit form with an immediate
+        if mnemonic == "rsbs" and rhs == 0 and is_low(rd, rn):
+            return narrow(0x4240 | reg(rn) << 3 | reg(rd))
+        if thumb2:
+            return wide_imm(DATA_OPS[mnemonic], 1, reg(rn), reg(rd), rhs)
+        raise EncodingError(f"no Thumb-1 encoding for {mnemonic} with an immediate")
+
+    # the 16-bit form is op rdn, rm
+    if shift is None and mnemonic in THUMB1_DATA_OPS and is_low(rd, rn, rhs):
+        if rd == rn:
+            return narrow(0x4000 | THUMB1_DATA_OPS[mnemonic] << 6 | reg(rhs) << 3 | reg(rd))
+        if rd == rhs and mnemonic in COMMUTATIVE_OPS:
+            return narrow(0x4000 | THUMB1_DATA_OPS[mnemonic] << 6 | reg(rn) << 3 | reg(rd))
+    if thumb2:
+        return wide_reg(DATA_OPS[mnemonic], 1, reg(rn), reg(rd), reg(rhs), shift)
+    raise EncodingError(f"no Thumb-1 encoding for {mnemonic} {', '.join(map(format_operand, operands))}")
+
+def encode_shift(mnemonic: str, operands: list, thumb2: bool) -> bytes:
+    rd, rn, rhs = operands if len(operands) == 3 else (operands[0], operands[0], operands[1])
+    kind = SHIFT_TYPES[mnemonic[:3]]
+
+    # by an immediate: lsls/lsrs/asrs rd, rm, #n, or movs.w rd, rm, shift #n
+    if isinstance(rhs, int):
+        if is_low(rd, rn):
+            return narrow(kind << 11 | (rhs & 0x1F) << 6 | reg(rn) << 3 | reg(rd))
+        if thumb2:
+            return wide_reg(0b0010, 1, 0xF, reg(rd), reg(rn), Shift(mnemonic[:3], rhs))
+
+    # by a register
+    elif is_low(rd, rn, rhs) and rd == rn:
+        return narrow(0x4000 | THUMB1_DATA_OPS[mnemonic] << 6 | reg(rhs) << 3 | reg(rd))
+    elif thumb2:
+        return wide(0xFA00 | kind << 5 | 1 << 4 | reg(rn), 0xF000 | reg(rd) << 8 | reg(rhs))
+    raise EncodingError(f"no Thumb-1 encoding for {mnemonic} {', '.join(map(format_operand, operands))}")
+
+def encode_movs(mnemonic: str, operands: list, thumb2: bool) -> bytes:
+    rd, src = operands
+    if isinstance(src, int):
+        if is_low(rd) and src <= 0xFF:
+            return narrow(0x2000 | reg(rd) << 8 | src)
+        if thumb2:
+            return wide_imm(0b0010, 1, 0xF, reg(rd), src)
+    elif is_low(rd, src):
+        return narrow(reg(src) << 3 | reg(rd))
+    elif thumb2:
+        return wide_reg(0b0010, 1, 0xF, reg(rd), reg(src))
+    raise EncodingError(f"no Thumb-1 encoding for movs {', '.join(map(format_operand, operands))}")
+
+def encode_mvns(mnemonic: str, operands: list, thumb2: bool) -> bytes:
+    rd, rm = operands
+    if is_low(rd, rm):
+        return narrow(0x43C0 | reg(rm) << 3 | reg(rd))
+    if thumb2:
+        return wide_reg(0b0011, 1, 0xF, reg(rd), reg(rm))
+    raise EncodingError("no Thumb-1 encoding for mvns with high registers")
+
+# 16-bit and 32-bit opcodes of sxtb rd, rm and friends
+EXTEND_OPCODES = {
+    "sxth": (0xB200, 0xFA0F),
+    "sxtb": (0xB240, 0xFA4F),
+    "uxth": (0xB280, 0xFA1F),
+    "uxtb": (0xB2C0, 0xFA5F),
+}
+
+def encode_extend(mnemonic: str, operands: list, thumb2: bool) -> bytes:
+    rd, rm = operands
+    short, long = EXTEND_OPCODES[mnemonic]
+    if is_low(rd, rm):
+        return narrow(short | reg(rm) << 3 | reg(rd))
+    if thumb2:
+        return wide(long, 0xF080 | reg(rd) << 8 | reg(rm))
+    raise EncodingError(f"no Thumb-1 encoding for {mnemonic} with high registers")
+
+def encode_muls(mnemonic: str, operands: list, thumb2: bool) -> bytes:
+    # muls rdm, rn, rdm
+    rd, rn, rm = operands
+    if rd != rm or not is_low(rd, rn):
+        raise EncodingError("muls is only encodable as muls rdm, rn, rdm with low registers")
+    return narrow(0x4340 | reg(rn) << 3 | reg(rd))
+
+def encode_mov_imm(mnemonic: str, operands: list, thumb2: bool) -> bytes:
+    # mov / mvn rd, #modified immediate (flags untouched, so always 32-bit);
+    # mov rd, rm (conditional inside an IT block) is 16-bit for any registers
+    rd, value = operands
+    if not isinstance(value, int):
+        return narrow(0x4600 | (reg(rd) >> 3) << 7 | reg(value) << 3 | reg(rd) & 7)
+    return wide_imm(0b0010 if mnemonic == "mov" else 0b0011, 0, 0xF, reg(rd), value)
+
+def encode_cmp(mnemonic: str, operands: list, thumb2: bool) -> bytes:
+    # cmp / cmn rn, #imm or rm: subs / adds without a destination
+    rn, rhs = operands
+    if isinstance(rhs, int):
+        if mnemonic == "cmp" and is_low(rn) and 0 <= rhs <= 0xFF:
+            return narrow(0x2800 | reg(rn) << 8 | rhs)
+        if thumb2:
+            return wide_imm(0b1101 if mnemonic == "cmp" else 0b1000, 1, reg(rn), 0xF, rhs)
+        raise EncodingError(f"no Thumb-1 encoding for {mnemonic} {rn}, #{rhs}")
+    if mnemonic == "cmn":
+        if not is_low(rn, rhs):
+            raise EncodingError("cmn is only encodable with low registers")
+        return narrow(0x42C0 | reg(rhs) << 3 | reg(rn))
+    if is_low(rn, rhs):
+        return narrow(0x4280 | reg(rhs) << 3 | reg(rn))
+    return narrow(0x4500 | (reg(rn) >> 3) << 7 | reg(rhs) << 3 | reg(rn) & 7)
+
+def encode_it(mnemonic: str, operands: list, thumb2: bool) -> bytes:
+    # it[t|e]*: each further instruction runs under the first condition or its inverse
+    first = COND_CODES[operands[0]]
+    suffix = mnemonic[2:]
+    mask = 1 << (3 - len(suffix))
+    for idx, kind in enumerate(suffix):
+        mask |= (first & 1 if kind == "t" else ~first & 1) << (3 - idx)
+    return narrow(0xBF00 | first << 4 | mask)
+
+def encode_movw_movt(mnemonic: str, operands: list, thumb2: bool) -> bytes:
+    rd, value = operands
+    first, second = split_imm16(value & 0xFFFF)
+    return wide((0xF240 if mnemonic == "movw" else 0xF2C0) | first, second | reg(rd) << 8)
+
+def encode_multiply(mnemonic: str, operands: list, thumb2: bool) -> bytes:
+    """
+    mul, mla, mls, sdiv, udiv, smull, umull (Thumb-2 only).
+    """
+    regs = [reg(operand) for operand in operands]
+    if mnemonic == "mul":
+        rd, rn, rm = regs
+        return wide(0xFB00 | rn, 0xF000 | rd << 8 | rm)
+    if mnemonic in ("mla", "mls"):
+        rd, rn, rm, ra = regs
+        return wide(0xFB00 | rn, ra << 12 | rd << 8 | (0x10 if mnemonic == "mls" else 0) | rm)
+    if mnemonic in ("sdiv", "udiv"):
+        rd, rn, rm = regs
+        return wide((0xFB90 if mnemonic == "sdiv" else 0xFBB0) | rn, 0xF0F0 | rd << 8 | rm)
+    lo, hi, rn, rm = regs
+    return wide((0xFB80 if mnemonic == "smull" else 0xFBA0) | rn, lo << 12 | hi << 8 | rm)
+
+# mnemonic -> (16-bit opcode of [rn, #imm5 * scale], scale, 32-bit opcode of [rn, #imm12])
+LOAD_STORE_FORMS = {
+    "ldr":  (0x6800, 4, 0xF8D0),
+    "str":  (0x6000, 4, 0xF8C0),
+    "ldrb": (0x7800, 1, 0xF890),
+    "strb": (0x7000, 1, 0xF880),
+    "ldrh": (0x8800, 2, 0xF8B0),
+    "strh": (0x8000, 2, 0xF8A0),
+}
+
+# mnemonic -> (16-bit opcode of [rn, rm], 32-bit opcode of [rn, rm, lsl #imm2])
+LOAD_STORE_REG_FORMS = {
+    "ldr":  (0x5800, 0xF850),
+    "str":  (0x5000, 0xF840),
+    "ldrb": (0x5C00, 0xF810),
+    "strb": (0x5400, 0xF800),
+    "ldrh": (0x5A00, 0xF830),
+    "strh": (0x5200, 0xF820),
+}
+
+def encode_load_store(mnemonic: str, operands: list, thumb2: bool) -> bytes:
+    # ldr / str{b,h} rt, [rn, #offset] or [rn, rm, lsl #shift]
+    rt, mem = operands
+    if mem.index is not None:
+        narrow_op, wide_op = LOAD_STORE_REG_FORMS[mnemonic]
+        if is_low(rt, mem.base, mem.index) and mem.shift == 0:
+            return narrow(narrow_op | reg(mem.index) << 6 | reg(mem.base) << 3 | reg(rt))
+        if thumb2 and mem.shift <= 3:
+            return wide(wide_op | reg(mem.base), reg(rt) << 12 | mem.shift << 4 | reg(mem.index))
+        raise EncodingError(f"no encoding for {mnemonic} {rt}, {format_operand(mem)}")
+    offset = mem.offset
+    narrow_op, scale, wide_op = LOAD_STORE_FORMS[mnemonic]
+    if mem.base == "sp":
+        if mnemonic in ("ldr", "str") and is_low(rt) and offset % 4 == 0 and 0 <= offset <= 1020:
+            return narrow((0x9800 if mnemonic == "ldr" else 0x9000) | reg(rt) << 8 | offset >> 2)
+    elif is_low(rt) and is_low(mem.base) and offset % scale == 0 and 0 <= offset < 32 * scale:
+        return narrow(narrow_op | offset // scale << 6 | reg(mem.base) << 3 | reg(rt))
+    if thumb2 and 0 <= offset <= 0xFFF:
+        return wide(wide_op | reg(mem.base), reg(rt) << 12 | offset)
+    raise EncodingError(f"{mnemonic} {rt}, [{mem.base}, #{offset}] has no encoding")
+
+def encode_sp_adjust(mnemonic: str, operands: list, thumb2: bool) -> bytes:
+    # add / sub sp, sp, #imm, and add rd, sp, #imm (the address of a local)
+    rd, imm = operands[0], operands[2]
+    sub = mnemonic == "sub"
+    if rd == "sp" and imm % 4 == 0 and 0 <= imm <= 508:
+        return narrow((0xB080 if sub else 0xB000) | imm >> 2)
+    if rd != "sp" and not sub and is_low(rd) and imm % 4 == 0 and 0 <= imm <= 1020:
+        return narrow(0xA800 | reg(rd) << 8 | imm >> 2)
+    if thumb2:
+        # sub.w / add.w with a modified immediate, else subw / addw with 12 bits
+        if (imm12 := thumb2_imm12(imm)) is not None:
+            first, second = split_imm12(imm12)
+            return wide((0xF1AD if sub else 0xF10D) | first, second | reg(rd) << 8)
+        if imm <= 0xFFF:
+            first, second = split_imm12(imm)
+            return wide((0xF2AD if sub else 0xF20D) | first, second | reg(rd) << 8)
+    raise EncodingError(f"{mnemonic} {rd}, sp, #{imm} out of range")
+
+def encode_push_pop(mnemonic: str, operands: list, thumb2: bool) -> bytes:
+    regs = [reg(operand) for operand in operands[0]]
+    mask = sum(1 << r for r in regs)
+    extra = 14 if mnemonic == "push" else 15    # the one high register of the 16-bit forms
+    if all(r < 8 or r == extra for r in regs):
+        return narrow((0xB400 if mnemonic == "push" else 0xBC00) | (mask >> extra & 1) << 8 | mask & 0xFF)
+    if thumb2:
+        return wide(0xE92D if mnemonic == "push" else 0xE8BD, mask)
+    raise EncodingError(f"no Thumb-1 encoding for {mnemonic} {format_operand(operands[0])}")
+
+def encode_bx(mnemonic: str, operands: list, thumb2: bool) -> bytes:
+    return narrow(0x4700 | reg(operands[0]) << 3)
+
+
+# mnemonic -> encoder(mnemonic, operands, thumb2) of the instructions without labels
+ENCODERS = {
+    "adds":     encode_add_sub,
+    "subs":     encode_add_sub,
+    "ands":     encode_data,
+    "orrs":     encode_data,
+    "eors":     encode_data,
+    "bics":     encode_data,
+    "rsbs":     encode_data,
+    "lsls":     encode_shift,
+    "lsrs":     encode_shift,
+    "asrs":     encode_shift,
+    "movs":     encode_movs,
+    "mvns":     encode_mvns,
+    "muls":     encode_muls,
+    "sxtb":     encode_extend,
+    "sxth":     encode_extend,
+    "uxtb":     encode_extend,
+    "uxth":     encode_extend,
+    "mov":      encode_mov_imm,
+    "mvn":      encode_mov_imm,
+    "movw":     encode_movw_movt,
+    "movt":     encode_movw_movt,
+    "mul":      encode_multiply,
+    "mla":      encode_multiply,
+    "mls":      encode_multiply,
+    "sdiv":     encode_multiply,
+    "udiv":     encode_multiply,
+    "smull":    encode_multiply,
+    "umull":    encode_multiply,
+    "ldr":      encode_load_store,
+    "str":      encode_load_store,
+    "ldrb":     encode_load_store,
+    "strb":     encode_load_store,
+    "ldrh":     encode_load_store,
+    "strh":     encode_load_store,
+    "add":      encode_sp_adjust,
+    "sub":      encode_sp_adjust,
+    "push":     encode_push_pop,
+    "pop":      encode_push_pop,
+    "bx":       encode_bx,
+    "cmp":      encode_cmp,
+    "cmn":      encode_cmp,
+    "it":       encode_it,
+    "itt":      encode_it,
+    "ite":      encode_it,
+    **{"mov" + cond: encode_mov_imm for cond in COND_CODES},
+}
+
+def encode(mnemonic: str, operands: list, thumb2: bool) -> bytes:
+    """
+    Machine code of an instruction without label operands, in the encoding an
+    assembler picks for it: the 16-bit one whenever there is one.
+    """
+    if (encoder := ENCODERS.get(mnemonic)) is None:
+        raise EncodingError(f"cannot encode {mnemonic}")
+    return encoder(mnemonic, list(operands), thumb2)
+
+
+#
+#   PC-relative instructions
+#
+def label_size(mnemonic: str, operands: list) -> int:
+    """
+    Size of an instruction referring to a label, which does not depend on where
+    the label ends up: the printer gives a branch that does not reach its
+    label the .w form, and ldr into a low register is 16-bit.
+    """
+    if mnemonic.endswith(".w") or mnemonic == "bl" or mnemonic == "ldr" and not is_low(operands[0]):
+        return 4
+    return 2
+
+def branch_range(mnemonic: str) -> tuple[int, int]:
+    # offsets from the branch's address + 4 that b, b<cond>, their .w forms, cbz and cbnz reach
+    if mnemonic in ("cbz", "cbnz"):
+        return CBZ_RANGE
+    if mnemonic == "b":
+        return BRANCH_RANGE
+    if mnemonic in ("b.w", "bl"):
+        return -(1 << 24), (1 << 24) - 2
+    if mnemonic.endswith(".w"):
+        return -(1 << 20), (1 << 20) - 2
+    return COND_BRANCH_RANGE
+
+def encode_branch(mnemonic: str, operands: list, offset: int) -> bytes:
+    low, high = branch_range(mnemonic)
+    if not low <= offset <= high:
+        raise EncodingError(f"branch to {operands[-1].name} out of range")
+
+    sign = (offset >> 31) & 1
+    if mnemonic in ("cbz", "cbnz"):
+        return narrow((0xB100 if mnemonic == "cbz" else 0xB900)
+                      | (offset >> 6) << 9 | ((offset >> 1) & 0x1F) << 3 | reg(operands[0]))
+    if mnemonic == "b":
+        return narrow(0xE000 | (offset >> 1) & 0x7FF)
+    if mnemonic in ("b.w", "bl"):
+        j1 = ~((offset >> 23) & 1 ^ sign) & 1
+        j2 = ~((offset >> 22) & 1 ^ sign) & 1
+        return wide(0xF000 | sign << 10 | (offset >> 12) & 0x3FF,
+                    (0x9000 if mnemonic == "b.w" else 0xD000) | j1 << 13 | j2 << 11 | (offset >> 1) & 0x7FF)
+    cond = COND_CODES[mnemonic.removesuffix(".w")[1:]]
+    if mnemonic.endswith(".w"):
+        j1, j2 = (offset >> 18) & 1, (offset >> 19) & 1
+        return wide(0xF000 | sign << 10 | cond << 6 | (offset >> 12) & 0x3F,
+                    0x8000 | j1 << 13 | j2 << 11 | (offset >> 1) & 0x7FF)
+    return narrow(0xD000 | cond << 8 | (offset >> 1) & 0xFF)
+
+def encode_pc_relative(mnemonic: str, operands: list, address: int, target: int, thumb2: bool) -> bytes:
+    """
+    Branch to a label / ldr rt, label at address, with label at target.
+    """
+    if mnemonic != "ldr":
+        return encode_branch(mnemonic, operands, target - (address + 4))
+
+    # ldr literal: relative to the word-aligned pc
+    rt = reg(operands[0])
+    offset = target - ((address + 4) & ~3)
+    if offset % 4 != 0 or offset < 0:
+        raise EncodingError(f"literal {operands[1].name} not word-aligned after its load")
+    if rt < 8:
+        if offset > 1020:
+            raise EncodingError(f"literal {operands[1].name} out of range")
+        return narrow(0x4800 | rt << 8 | offset >> 2)
+    if not thumb2 or offset > 0xFFF:
+        raise EncodingError(f"literal {operands[1].name} out of range")
+    return wide(0xF8DF, rt << 12 | offset)
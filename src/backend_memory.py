@@ -0,0 +1,473 @@
+"""
+Memref locals: promotion to SSA values, store-to-load forwarding and the stack
+frame of the locals that stay in memory
+"""
+
+from xdsl.dialects import arith, builtin, func, memref, scf
+from xdsl.ir import Block, BlockArgument, Operation, SSAValue
+from xdsl.pattern_rewriter import RewritePattern
+from xdsl.rewriter import InsertPoint, Rewriter
+
+from src.backend_arm_dialect import *
+
+
+#
+#   Locals
+#
+# scf ops whose regions promotion threads values through
+STRUCTURED_OPS = (scf.IfOp, scf.ForOp, scf.WhileOp)
+
+def element_type(alloca: memref.AllocaOp):
+    return alloca.memref.type.element_type
+
+def element_count(alloca: memref.AllocaOp) -> int:
+    count = 1
+    for size in alloca.memref.type.get_shape():
+        count *= size
+    return count
+
+def is_static(alloca: memref.AllocaOp) -> bool:
+    return not alloca.dynamic_sizes and all(size >= 0 for size in alloca.memref.type.get_shape())
+
+def is_access(use) -> bool:
+    # a load from or a store into the memref (a store of the memref itself is not)
+    return isinstance(use.operation, memref.LoadOp) or isinstance(use.operation, memref.StoreOp) and use.index == 1
+
+def is_local(alloca: memref.AllocaOp) -> bool:
+    """
+    Whether the memory of alloca is only reached through its loads and stores,
+    which are in the function body or in scf ops: nothing else can read or
+    write it, so its accesses may be rewritten freely.
+    """
+    for use in alloca.memref.uses:
+        if not is_access(use):
+            return False
+        parent = use.operation.parent_op()
+        while not isinstance(parent, func.FuncOp):
+            if not isinstance(parent, STRUCTURED_OPS):
+                return False
+            parent = parent.parent_op()
+    return True
+
+def index_const(index: SSAValue) -> int | None:
+    # value of a constant index, also one cast from a constant integer
+    if isinstance(index.owner, arith.IndexCastOp):
+        index = index.owner.input
+    return get_const(index)
+
+def locals_of(func_op: func.FuncOp) -> list[memref.AllocaOp]:
+    return [op for op in func_op.walk() if isinstance(op, memref.AllocaOp)]
+
+
+#
+#   Promotion
+#
+class Promotion:
+    """
+    Turns scalar locals of one function into SSA values: a load reads the
+    value the last store wrote, and the scf ops storing a local pass its
+    value on as an extra result (and, for loops, an extra carried value).
+    """
+
+    def __init__(self, func_op: func.FuncOp, promoted: list[memref.AllocaOp]):
+        self.entry = func_op.body.blocks[0]
+        self.promoted = promoted
+        self.undefined = dict()     # element type -> value of a local read before any store
+
+    def value(self, values: dict, alloca: memref.AllocaOp) -> SSAValue:
+        # a read before any store is undefined, so any value will do
+        if values[alloca] is not None:
+            return values[alloca]
+        elem_type = element_type(alloca)
+        if elem_type not in self.undefined:
+            const_op = arith.ConstantOp.from_int_and_width(0, elem_type)
+            Rewriter.insert_op(const_op, InsertPoint.at_start(self.entry))
+            self.undefined[elem_type] = const_op.result
+        return self.undefined[elem_type]
+
+    def stored_in(self, op: Operation) -> list[memref.AllocaOp]:
+        # the promoted locals op stores into, in a fixed order
+        stored = {inner.memref.owner for inner in op.walk() if isinstance(inner, memref.StoreOp)}
+        return [alloca for alloca in self.promoted if alloca in stored]
+
+    def run(self):
+        self.promote_block(self.entry, {alloca: None for alloca in self.promoted})
+        for alloca in self.promoted:
+            Rewriter.erase_op(alloca)
+
+    def promote_block(self, block: Block, values: dict):
+        for op in list(block.ops):
+            if isinstance(op, memref.LoadOp) and op.memref.owner in values:
+                Rewriter.replace_op(op, [], [self.value(values, op.memref.owner)])
+            elif isinstance(op, memref.StoreOp) and op.memref.owner in values:
+                values[op.memref.owner] = op.value
+                Rewriter.erase_op(op)
+            elif isinstance(op, STRUCTURED_OPS) and (stored := self.stored_in(op)):
+                self.PROMOTIONS[type(op)](self, op, values, stored)
+            else:
+                for region in op.regions:
+                    for inner in region.blocks:
+                        self.promote_block(inner, dict(values))
+
+    def extend_terminator(self, block: Block, values: dict, stored: list[memref.AllocaOp]):
+        # the values of the stored locals at the end of block are passed on too
+        terminator = block.last_op
+        extra = [self.value(values, alloca) for alloca in stored]
+        if isinstance(terminator, scf.ConditionOp):
+            new_op = scf.ConditionOp(terminator.condition, *terminator.args, *extra)
+        else:
+            new_op = scf.YieldOp(*terminator.operands, *extra)
+        Rewriter.replace_op(terminator, new_op)
+
+    def add_args(self, block: Block, values: dict, stored: list[memref.AllocaOp]) -> dict:
+        # block is entered with the values of the stored locals as arguments
+        inner = dict(values)
+        for alloca in stored:
+            inner[alloca] = block.insert_arg(element_type(alloca), len(block.args))
+        return inner
+
+    def replace(self, op: Operation, new_op: Operation, values: dict, stored: list[memref.AllocaOp]):
+        count = len(op.results)
+        Rewriter.replace_op(op, new_op, new_op.results[:count])
+        values.update(zip(stored, new_op.results[count:]))
+
+    def promote_if(self, op: scf.IfOp, values: dict, stored: list[memref.AllocaOp]):
+        if not op.false_region.blocks:
+            op.false_region.add_block(Block([scf.YieldOp()]))
+        for region in (op.true_region, op.false_region):
+            inner = dict(values)
+            self.promote_block(region.blocks[0], inner)
+            self.extend_terminator(region.blocks[0], inner, stored)
+
+        result_types = [*op.result_types, *(element_type(alloca) for alloca in stored)]
+        true_region, false_region = op.true_region, op.false_region
+        new_op = scf.IfOp(op.cond, result_types, op.detach_region(true_region), op.detach_region(false_region))
+        self.replace(op, new_op, values, stored)
+
+    def promote_for(self, op: scf.ForOp, values: dict, stored: list[memref.AllocaOp]):
+        body = op.body.blocks[0]
+        inner = self.add_args(body, values, stored)
+        self.promote_block(body, inner)
+        self.extend_terminator(body, inner, stored)
+
+        iter_args = [*op.iter_args, *(self.value(values, alloca) for alloca in stored)]
+        new_op = scf.ForOp(op.lb, op.ub, op.step, iter_args, op.detach_region(op.body))
+        self.replace(op, new_op, values, stored)
+
+    def promote_while(self, op: scf.WhileOp, values: dict, stored: list[memref.AllocaOp]):
+        # the condition forwards the values to the body and out of the loop
+        before, after = op.before_region.blocks[0], op.after_region.blocks[0]
+        inner = self.add_args(before, values, stored)
+        self.promote_block(before, inner)
+        self.extend_terminator(before, inner, stored)
+        inner = self.add_args(after, values, stored)
+        self.promote_block(after, inner)
+        self.extend_terminator(after, inner, stored)
+
+        arguments = [*op.arguments, *(self.value(values, alloca) for alloca in stored)]
+        result_types = [*op.result_types, *(element_type(alloca) for alloca in stored)]
+        before_region, after_region = op.before_region, op.after_region
+        new_op = scf.WhileOp(arguments, result_types, op.detach_region(before_region),
+                             op.detach_region(after_region))
+        self.replace(op, new_op, values, stored)
+
+    PROMOTIONS = {
+        scf.IfOp:       promote_if,
+        scf.ForOp:      promote_for,
+        scf.WhileOp:    promote_while,
+    }
+
+
+#
+#   Forwarding
+#
+def access_key(op: memref.LoadOp | memref.StoreOp) -> tuple:
+    # the element accessed: constant indices by value, others by SSA value
+    indices = tuple(index if (value := index_const(index)) is None else value for index in op.indices)
+    return op.memref, indices
+
+def may_alias(key: tuple, other: tuple) -> bool:
+    # elements of the same local alias unless some constant index differs
+    if key[0] != other[0]:
+        return False
+    return not any(isinstance(a, int) and isinstance(b, int) and a != b for a, b in zip(key[1], other[1]))
+
+def forward_block(block: Block, forwarded: set):
+    """
+    Replace the loads from the locals in forwarded by the value last stored
+    into (or loaded from) the same element earlier in block. Nested blocks
+    start afresh, and an op holding them forgets what it may store into.
+    """
+    known = dict()      # access key -> value of the element
+    for op in list(block.ops):
+        if isinstance(op, (memref.LoadOp, memref.StoreOp)) and op.memref.owner in forwarded:
+            key = access_key(op)
+            if isinstance(op, memref.LoadOp):
+                if key in known:
+                    Rewriter.replace_op(op, [], [known[key]])
+                else:
+                    known[key] = op.res
+                continue
+            known = {other: value for other, value in known.items() if not may_alias(key, other)}
+            known[key] = op.value
+            continue
+
+        for region in op.regions:
+            for inner in region.blocks:
+                forward_block(inner, forwarded)
+        for inner in op.walk():
+            if isinstance(inner, memref.StoreOp) and inner is not op:
+                key = access_key(inner)
+                known = {other: value for other, value in known.items() if not may_alias(key, other)}
+
+def drop_dead_stores(block: Block, forwarded: set, exits: bool):
+    """
+    Erase the stores into the locals in forwarded that nothing reads: the ones
+    overwritten later in block before any load that may read them, and, when
+    the end of block leaves the function (exits), the ones into a local that is
+    not loaded again. Nested blocks may run again, so only the first applies.
+    """
+    stored = set()      # access keys stored further down, and not read in between
+    loaded = set()      # locals loaded further down
+    for op in reversed(list(block.ops)):
+        if isinstance(op, memref.StoreOp) and op.memref.owner in forwarded:
+            key = access_key(op)
+            if key in stored or exits and op.memref.owner not in loaded:
+                Rewriter.erase_op(op)
+            else:
+                stored.add(key)
+            continue
+
+        for region in op.regions:
+            for inner in region.blocks:
+                drop_dead_stores(inner, forwarded, False)
+        for inner in op.walk():
+            if isinstance(inner, memref.LoadOp) and inner.memref.owner in forwarded:
+                key = access_key(inner)
+                stored = set(other for other in stored if not may_alias(key, other))
+                loaded.add(inner.memref.owner)
+
+
+#
+#   Pass
+#
+def drop_unread(allocas: list[memref.AllocaOp]):
+    # locals never loaded, with their stores (removed from allocas)
+    for alloca in [alloca for alloca in allocas
+                   if not any(isinstance(use.operation, memref.LoadOp) for use in alloca.memref.uses)]:
+        for use in list(alloca.memref.uses):
+            Rewriter.erase_op(use.operation)
+        Rewriter.erase_op(alloca)
+        allocas.remove(alloca)
+
+def promote_locals(module: builtin.ModuleOp):
+    """
+    mem2reg for the memref locals cgeist emits: locals never loaded are
+    dropped with their stores, scalar ones become SSA values, and the loads of
+    the others (arrays) reuse values stored or loaded before in the same block,
+    which drops the stores no load is left to read. Locals whose memref escapes (is used by anything but loads and stores) are
+    left alone.
+    """
+    for func_op in list(module.ops):
+        if not isinstance(func_op, func.FuncOp):
+            continue
+        allocas = [alloca for alloca in locals_of(func_op) if is_static(alloca) and is_local(alloca)]
+
+        drop_unread(allocas)
+        promoted = [alloca for alloca in allocas
+                    if element_count(alloca) == 1 and isinstance(element_type(alloca), builtin.IntegerType)]
+        Promotion(func_op, promoted).run()
+
+        # the loads forwarded may leave stores, or whole locals, unread
+        forwarded = set(alloca for alloca in allocas if alloca not in promoted)
+        if forwarded:
+            for block in func_op.body.blocks:
+                forward_block(block, forwarded)
+                drop_dead_stores(block, forwarded, True)
+            drop_unread([alloca for alloca in allocas if alloca in forwarded])
+
+
+#
+#   Frame
+#
+# bytes of locals a frame may hold, so that they and the spill slots above them
+# stay within reach of ldr/str [sp, #imm] and add rd, sp, #imm
+THUMB1_MAX_LOCALS = 512
+THUMB2_MAX_LOCALS = 2048
+
+# alloca attribute holding the offset of the local from sp
+OFFSET_ATTR = "arm.offset"
+
+def element_bytes(alloca: memref.AllocaOp) -> int:
+    elem_type = element_type(alloca)
+    if not isinstance(elem_type, builtin.IntegerType) or elem_type.width.data not in (1, 8, 16, 32):
+        raise LoweringError(f"locals of {elem_type} are not supported")
+    return max(1, elem_type.width.data // 8)
+
+def check_locals(func_op: func.FuncOp):
+    # memory the frame lowering has no place for
+    for op in func_op.walk():
+        if op.dialect_name() == "memref" and not isinstance(op, (memref.AllocaOp, memref.LoadOp, memref.StoreOp)):
+            raise LoweringError(f"{op.name} is not supported")
+        if isinstance(op, (memref.LoadOp, memref.StoreOp)) and not isinstance(op.memref.owner, memref.AllocaOp):
+            raise LoweringError("memrefs other than locals (memref.alloca) are not supported")
+        if isinstance(op, memref.AllocaOp) and not is_static(op):
+            raise LoweringError("locals of variable size are not supported")
+        if isinstance(op, memref.AllocaOp) and not all(is_access(use) for use in op.memref.uses):
+            raise LoweringError("locals whose address is taken are not supported")
+
+def layout_frame(module: builtin.ModuleOp, target: str = DEFAULT_TARGET):
+    """
+    Give each memref local left a place at the bottom of the stack frame,
+    recorded on its alloca, and the bytes they take on the function, for the
+    register allocator to put the spill slots above them. Each local starts at
+    a multiple of its element size; placing the most aligned first leaves no
+    padding between them.
+    """
+    max_size = THUMB2_MAX_LOCALS if is_thumb2(target) else THUMB1_MAX_LOCALS
+    for func_op in list(module.ops):
+        if not isinstance(func_op, func.FuncOp):
+            continue
+        check_locals(func_op)
+        if not (allocas := locals_of(func_op)):
+            continue
+
+        size = 0
+        for alloca in sorted(allocas, key=lambda alloca: -element_bytes(alloca)):
+            align = element_bytes(alloca)
+            size = (size + align - 1) // align * align
+            alloca.attributes[OFFSET_ATTR] = builtin.IntegerAttr.from_int_and_width(size, 32)
+            size += align * element_count(alloca)
+        size = (size + 3) // 4 * 4
+        if size > max_size:
+            raise LoweringError(f"{size} bytes of locals exceed the {max_size} supported on {target}")
+        func_op.attributes[LOCALS_ATTR] = builtin.IntegerAttr.from_int_and_width(size, 32)
+
+def as_i32(index: SSAValue, new_ops: list) -> SSAValue:
+    # an index as an i32, for the address arithmetic (index is 32 bits wide)
+    op = index.owner
+    if (value := get_const(index)) is not None:
+        new_ops.append(arith.ConstantOp.from_int_and_width(value, 32))
+    elif isinstance(op, arith.IndexCastOp) and isinstance(op.input.type, builtin.IntegerType):
+        if op.input.type.width.data == 32:
+            return op.input
+        new_ops.append(arith.ExtSIOp(op.input, builtin.i32))
+    elif isinstance(op, (arith.AddiOp, arith.SubiOp, arith.MuliOp)):
+        lhs, rhs = as_i32(op.lhs, new_ops), as_i32(op.rhs, new_ops)
+        new_ops.append(type(op)(lhs, rhs))
+    elif isinstance(index, BlockArgument) and isinstance(index.type, builtin.IndexType):
+        # a loop induction variable, lowered to an i32 along with the loop
+        new_ops.append(arith.IndexCastOp(index, builtin.i32))
+    else:
+        raise LoweringError(f"memref index {index} is not a constant, an index_cast, a loop induction "
+                            "variable, or a sum, difference or product of those")
+    return new_ops[-1].results[0]
+
+def frame_address(op: memref.LoadOp | memref.StoreOp, new_ops: list) -> tuple[int, list[tuple]]:
+    """
+    Address of the element op accesses, from sp: a constant offset (that of
+    the local plus its constant indices, scaled row-major) and the dynamic
+    indices as (i32 value, bytes per step) terms to add to it.
+    """
+    alloca = op.memref.owner
+    offset, terms = alloca.attributes[OFFSET_ATTR].value.data, []
+    stride = element_bytes(alloca) * element_count(alloca)
+    for index, size in zip(op.indices, alloca.memref.type.get_shape()):
+        stride //= size
+        if (value := index_const(index)) is not None:
+            offset += value * stride
+        else:
+            terms.append((as_i32(index, new_ops), stride))
+    return offset, terms
+
+def scaled(term: tuple, new_ops: list) -> SSAValue:
+    value, stride = term
+    if stride == 1:
+        return value
+    if stride & (stride - 1) == 0:
+        new_ops += [arith.ConstantOp.from_int_and_width(stride.bit_length() - 1, 32)]
+        new_ops += [arith.ShLIOp(value, new_ops[-1].result)]
+    else:
+        new_ops += [arith.ConstantOp.from_int_and_width(stride, 32)]
+        new_ops += [arith.MuliOp(value, new_ops[-1].result)]
+    return new_ops[-1].result
+
+def frame_access(op: memref.LoadOp | memref.StoreOp, target: str, new_ops: list) -> tuple:
+    """
+    How op reaches its element: ("sp", offset) for [sp, #offset], ("reg",
+    base, offset) for [base, #offset] and ("index", base, index, shift) for
+    [base, index, lsl #shift], with the ops computing base and index appended
+    to new_ops.
+    """
+    offset, terms = frame_address(op, new_ops)
+    elem_bytes = element_bytes(op.memref.owner)
+
+    # ldr/str [sp, #imm] only move words on Thumb-1, and add rd, sp, #imm only
+    # takes multiples of 4: the others go through the address of their word
+    if not terms:
+        if is_thumb2(target) or elem_bytes == 4:
+            return "sp", offset
+        new_ops.append(ArmFrameAddrOp(offset & ~3))
+        return "reg", new_ops[-1].res, offset & 3
+
+    # Thumb-2 scales a register offset by up to 8 itself
+    stride = terms[0][1]
+    if is_thumb2(target) and len(terms) == 1 and stride & (stride - 1) == 0 and stride <= 8:
+        index, shift = terms[0][0], stride.bit_length() - 1
+    else:
+        index, shift = scaled(terms[0], new_ops), 0
+        for term in terms[1:]:
+            new_ops.append(arith.AddiOp(index, scaled(term, new_ops)))
+            index = new_ops[-1].result
+
+    if is_thumb2(target) or offset % 4 == 0:
+        new_ops.append(ArmFrameAddrOp(offset))
+        return "index", new_ops[-1].res, index, shift
+    new_ops.append(ArmFrameAddrOp(offset & ~3))
+    new_ops.append(arith.AddiOp(new_ops[-1].res, index))
+    return "reg", new_ops[-1].result, offset & 3
+
+# memref.load / memref.store of a local -> ldr/str relative to sp
+class ArmFrameLowerPattern(RewritePattern):
+
+    op_types = (memref.LoadOp, memref.StoreOp)
+
+    def __init__(self, target: str = DEFAULT_TARGET):
+        self.target = target
+
+    def match_and_rewrite(self, op, rewriter):
+
+        # match memref.load or memref.store of a local laid out in the frame
+        if not isinstance(op, (memref.LoadOp, memref.StoreOp)) or OFFSET_ATTR not in op.memref.owner.attributes:
+            return
+
+        new_ops = []
+        kind, *access = frame_access(op, self.target, new_ops)
+        if isinstance(op, memref.LoadOp):
+            load_type = {"sp": ArmFrameLoadOp, "reg": ArmLoadOp, "index": ArmLoadRegOp}[kind]
+            new_ops.append(load_type(*access, op.res.type))
+            rewriter.replace_op(op, new_ops, [new_ops[-1].res])
+            return
+
+        store_type = {"sp": ArmFrameStoreOp, "reg": ArmStoreOp, "index": ArmStoreRegOp}[kind]
+        new_ops.append(store_type(op.value, *access, op.value.type.width.data))
+        rewriter.replace_op(op, new_ops)
+
+# locals whose accesses are all lowered, and the index computations they used
+# (index values have no lowering of their own)
+class ArmDeadLocalPattern(RewritePattern):
+
+    op_types = (memref.AllocaOp, arith.ConstantOp, arith.IndexCastOp, arith.AddiOp, arith.SubiOp, arith.MuliOp)
+
+    def match_and_rewrite(self, op, rewriter):
+
+        # match an unused alloca, or an unused op computing an index
+        if isinstance(op, memref.AllocaOp):
+            if not op.memref.uses:
+                rewriter.erase_op(op)
+            return
+        if len(op.results) == 1 and isinstance(op.results[0].type, builtin.IndexType) and not op.results[0].uses:
+            rewriter.erase_op(op)
+
+def frame_lowering_patterns(target: str = DEFAULT_TARGET) -> list[RewritePattern]:
+    return [ArmFrameLowerPattern(target), ArmDeadLocalPattern()]
@@ -0,0 +1,222 @@
+"""
+ARM MLIR to ELF relocatable object (Thumb machine code, no assembler needed)
+"""
+
+import struct
+
+from src.backend_encoder import *
+
+
+#
+#   Function code
+#
+class FunctionCode:
+    """
+    Machine code of one function, laid out from offset 0 (functions start
+    word-aligned, so it is the same wherever the function is placed), with the
+    offsets where instructions ("t") and literal pool data ("d") begin.
+    """
+
+    def __init__(self, name: str, code: bytes, mapping: list[tuple[int, str]]):
+        self.name = name
+        self.code = code
+        self.mapping = mapping
+
+    def dumps(self) -> str:
+        # one line: name, mapping and code, for the text-only cache
+        mapping = ",".join(f"{kind}{offset}" for offset, kind in self.mapping)
+        return f"{self.name} {mapping} {self.code.hex()}"
+
+    @staticmethod
+    def loads(line: str) -> "FunctionCode":
+        name, mapping, code = line.split(" ")
+        return FunctionCode(name, bytes.fromhex(code),
+                            [(int(entry[1:]), entry[0]) for entry in mapping.split(",")])
+
+def dump_code(functions: list[FunctionCode]) -> str:
+    return "".join(function.dumps() + "\n" for function in functions)
+
+def load_code(text: str) -> list[FunctionCode]:
+    return [FunctionCode.loads(line) for line in text.splitlines()]
+
+def nop(thumb2: bool) -> bytes:
+    return narrow(THUMB2_NOP if thumb2 else THUMB1_NOP)
+
+def encode_function(name: str, items: list[tuple], thumb2: bool) -> FunctionCode:
+    """
+    Encode the instructions, labels, words and alignments emitted for one
+    function. Every instruction has a known size before labels are placed (see
+    label_size), so a single layout pass fixes all addresses.
+    """
+    encoded = []    # bytes of each instruction without labels, None otherwise
+    labels = dict()
+    address = 0
+    for item in items:
+        kind = item[0]
+        encoded.append(None)
+        if kind == "label":
+            labels[item[1]] = address
+        elif kind == "align":
+            address = -(-address // (1 << item[1])) * (1 << item[1])
+        elif kind == "word":
+            address += 4
+        elif any(isinstance(operand, Label) for operand in item[2]):
+            address += label_size(item[1], item[2])
+        else:
+            encoded[-1] = encode(item[1], item[2], thumb2)
+            address += len(encoded[-1])
+
+    code = bytearray()
+    mapping = [(0, "t")]
+    for item, instruction in zip(items, encoded):
+        kind = item[0]
+        if kind == "align":
+            while len(code) % (1 << item[1]):
+                code += nop(thumb2)
+        elif kind == "word":
+            if mapping[-1][1] != "d":
+                mapping.append((len(code), "d"))
+            code += (item[1] & 0xFFFFFFFF).to_bytes(4, "little")
+        elif kind == "instr":
+            if mapping[-1][1] != "t":
+                mapping.append((len(code), "t"))
+            if instruction is None:
+                label = next(operand for operand in item[2] if isinstance(operand, Label))
+                instruction = encode_pc_relative(item[1], item[2], len(code), labels[label.name], thumb2)
+            code += instruction
+    return FunctionCode(name, bytes(code), mapping)
+
+
+#
+#   Emitter
+#
+class ObjectEmitter(AsmEmitter):
+    """
+    AsmEmitter that also encodes what it prints, so one pass over a module gives
+    both the assembly text and byte-identical machine code for it.
+    """
+
+    def __init__(self, target: str = DEFAULT_TARGET, header: bool = True):
+        super().__init__(target, header)
+        self.functions = []     # FunctionCode of every finished function
+        self.item_func = None   # name of the function being emitted
+
+    def emit_symbol(self, name: str):
+        super().emit_symbol(name)
+        self.item_func = name
+
+    def finish_function(self):
+        # encoded once its branches have their final form
+        start = self.func_start
+        super().finish_function()
+        if start is not None:
+            items = [item for item in self.items[start:] if item[0] != "line"]
+            self.functions.append(encode_function(self.item_func, items, self.thumb2))
+
+    def elf(self) -> bytes:
+        return elf_object(self.functions, self.target)
+
+
+#
+#   ELF
+#
+# Tag_CPU_arch of each core: v6S-M and v8-M.mainline
+CPU_ARCH = {"cortex-m0plus": 12, "cortex-m33": 17}
+
+SHT_PROGBITS = 1
+SHT_SYMTAB = 2
+SHT_STRTAB = 3
+SHT_ARM_ATTRIBUTES = 0x70000003
+SHF_ALLOC = 0x2
+SHF_EXECINSTR = 0x4
+EM_ARM = 40
+EF_ARM_EABI_VER5 = 0x05000000
+
+def arm_attributes(target: str) -> bytes:
+    """
+    .ARM.attributes: the aeabi build attributes linkers check objects against.
+    """
+    cpu = CPU_NAMES[target]
+    attributes = bytes([5]) + cpu.encode() + b"\0"          # Tag_CPU_name
+    attributes += bytes([6, CPU_ARCH[cpu]])                 # Tag_CPU_arch
+    attributes += bytes([7, ord("M")])                      # Tag_CPU_arch_profile
+    attributes += bytes([9, 3 if is_thumb2(target) else 1]) # Tag_THUMB_ISA_use
+    file_tag = bytes([1]) + struct.pack("<I", 5 + len(attributes)) + attributes
+    vendor = b"aeabi\0"
+    return b"A" + struct.pack("<I", 4 + len(vendor) + len(file_tag)) + vendor + file_tag
+
+class StringTable:
+    def __init__(self):
+        self.data = bytearray(b"\0")
+
+    def add(self, name: str) -> int:
+        offset = len(self.data)
+        self.data += name.encode() + b"\0"
+        return offset
+
+def elf_object(functions: list[FunctionCode], target: str = DEFAULT_TARGET) -> bytes:
+    """
+    Relocatable ELF object with the functions in .text, one after the other
+    starting word-aligned, each a global Thumb function symbol. Every reference
+    is resolved within its function, so there are no relocations.
+    """
+    thumb2 = is_thumb2(target)
+    strtab = StringTable()
+    text = bytearray()
+    local_symbols = []
+    global_symbols = []
+    for function in functions:
+        while len(text) % 4:
+            text += nop(thumb2)
+        start = len(text)
+        for offset, kind in function.mapping:
+            local_symbols.append((strtab.add(f"${kind}"), start + offset, 0, 0))
+        global_symbols.append((strtab.add(function.name), start | 1, len(function.code), 0x12))
+        text += function.code
+
+    # null symbol, then the mapping symbols (local, no type), then the functions (global, STT_FUNC)
+    symtab = bytearray(16)
+    for name, value, size, info in local_symbols + global_symbols:
+        symtab += struct.pack("<IIIBBH", name, value, size, info, 0, 1)
+
+    shstrtab = StringTable()
+    attributes = arm_attributes(target)
+    sections = [
+        # name, type, flags, data, link, info, alignment, entry size
+        (".text", SHT_PROGBITS, SHF_ALLOC | SHF_EXECINSTR, bytes(text), 0, 0, 4, 0),
+        (".ARM.attributes", SHT_ARM_ATTRIBUTES, 0, attributes, 0, 0, 1, 0),
+        (".symtab", SHT_SYMTAB, 0, bytes(symtab), 4, 1 + len(local_symbols), 4, 16),
+        (".strtab", SHT_STRTAB, 0, bytes(strtab.data), 0, 0, 1, 0),
+        (".shstrtab", SHT_STRTAB, 0, None, 0, 0, 1, 0),
+    ]
+    names = [shstrtab.add(section[0]) for section in sections]
+    sections[-1] = sections[-1][:3] + (bytes(shstrtab.data),) + sections[-1][4:]
+
+    # ELF header, section contents, section header table
+    body = bytearray()
+    headers = bytearray(40)
+    offset = 52
+    for name, (_, sh_type, flags, data, link, info, alignment, entry_size) in zip(names, sections):
+        padding = -offset % alignment
+        body += bytes(padding)
+        offset += padding
+        headers += struct.pack("<IIIIIIIIII", name, sh_type, flags, 0, offset, len(data),
+                               link, info, alignment, entry_size)
+        body += data
+        offset += len(data)
+    padding = -offset % 4
+    body += bytes(padding)
+    offset += padding
+
+    ident = b"\x7fELF" + bytes([1, 1, 1]) + bytes(9)    # 32-bit, little endian, version 1
+    header = ident + struct.pack("<HHIIIIIHHHHHH", 1, EM_ARM, 1, 0, 0, offset, EF_ARM_EABI_VER5,
+                                 52, 0, 0, 40, len(sections) + 1, len(sections))
+    return header + bytes(body) + bytes(headers)
+
+def write_object(module: builtin.ModuleOp, out_file, target: str = DEFAULT_TARGET):
+    """
+    Write module as an ELF object for target to out_file (opened in binary mode).
+    """
+    emitter = ObjectEmitter(target)
+    emitter.emit_module(module)
+    out_file.write(emitter.elf())
@@ -2,13 +2,229 @@
 Basic optimizer for high-level MLIR
 """
 
-from xdsl.dialects import arith, builtin
+from functools import lru_cache
+from xdsl.dialects import arith, builtin, scf
+from xdsl.ir import Block, Operation, SSAValue
 from xdsl.pattern_rewriter import (
-    GreedyRewritePatternApplier,
     PatternRewriteWalker,
     RewritePattern
 )
+from xdsl.rewriter import InsertPoint
+from xdsl.traits import is_side_effect_free
 
+from src.backend_cost import *
+from src.passes import *
+
+
+#
+# Constant helpers
+#
+
+# integer value of a constant SSA value, or None
+def get_const_int(ssa):
+    if not isinstance(cst := ssa.owner, arith.ConstantOp):
+        return None
+    if not isinstance(cst.value, builtin.IntegerAttr):
+        return None
+    return cst.value.value.data
+
+# wrap value to width bits, in the signed range (how arith.constant stores it)
+def wrap_signed(value: int, width: int) -> int:
+    value &= (1 << width) - 1
+    if value >= 1 << (width - 1):
+        value -= 1 << width
+    return value
+
+# evaluate a binary arith op on constants with two's complement semantics;
+# None when the result is undefined (division by zero, signed overflow, oversized shifts)
+def fold_binary(op_type, lhs: int, rhs: int, width: int) -> int | None:
+    mask = (1 << width) - 1
+    s_lhs, s_rhs = wrap_signed(lhs, width), wrap_signed(rhs, width)
+    u_lhs, u_rhs = lhs & mask, rhs & mask
+
+    if op_type is arith.AddiOp:
+        return wrap_signed(lhs + rhs, width)
+    if op_type is arith.SubiOp:
+        return wrap_signed(lhs - rhs, width)
+    if op_type is arith.MuliOp:
+        return wrap_signed(lhs * rhs, width)
+    if op_type is arith.AndIOp:
+        return wrap_signed(lhs & rhs, width)
+    if op_type is arith.OrIOp:
+        return wrap_signed(lhs | rhs, width)
+    if op_type is arith.XOrIOp:
+        return wrap_signed(lhs ^ rhs, width)
+
+    if op_type in (arith.ShLIOp, arith.ShRUIOp, arith.ShRSIOp):
+        if u_rhs >= width:
+            return None
+        if op_type is arith.ShLIOp:
+            return wrap_signed(u_lhs << u_rhs, width)
+        if op_type is arith.ShRUIOp:
+            return wrap_signed(u_lhs >> u_rhs, width)
+        return wrap_signed(s_lhs >> u_rhs, width)
+
+    if op_type in (arith.DivUIOp, arith.RemUIOp):
+        if u_rhs == 0:
+            return None
+        if op_type is arith.DivUIOp:
+            return wrap_signed(u_lhs // u_rhs, width)
+        return wrap_signed(u_lhs % u_rhs, width)
+
+    if op_type in (arith.DivSIOp, arith.RemSIOp):
+        if s_rhs == 0 or (s_lhs == -(1 << (width - 1)) and s_rhs == -1):
+            return None
+        # C semantics: the quotient is truncated toward zero
+        quot = abs(s_lhs) // abs(s_rhs)
+        if (s_lhs < 0) != (s_rhs < 0):
+            quot = -quot
+        if op_type is arith.DivSIOp:
+            return wrap_signed(quot, width)
+        return wrap_signed(s_lhs - quot * s_rhs, width)
+
+    return None
+
+FOLDABLE_OPS = (arith.AddiOp, arith.SubiOp, arith.MuliOp, arith.AndIOp, arith.OrIOp,
+                arith.XOrIOp, arith.ShLIOp, arith.ShRUIOp, arith.ShRSIOp,
+                arith.DivUIOp, arith.RemUIOp, arith.DivSIOp, arith.RemSIOp)
+
+COMMUTATIVE_OPS = (arith.AddiOp, arith.MuliOp, arith.AndIOp, arith.OrIOp, arith.XOrIOp)
+
+#
+# Folding and canonicalization patterns
+#
+
+# c1 op c2 -> c
+class ConstantFoldPattern(RewritePattern):
+
+    op_types = FOLDABLE_OPS
+
+    def match_and_rewrite(self, op, rewriter):
+
+        # match binary arith ops on integers
+        if not isinstance(op, FOLDABLE_OPS):
+            return
+        if not isinstance(op.result.type, builtin.IntegerType):
+            return
+
+        # check if both operands are constants
+        lhs, rhs = get_const_int(op.lhs), get_const_int(op.rhs)
+        if lhs is None or rhs is None:
+            return
+
+        width = op.result.type.width.data
+        if (value := fold_binary(type(op), lhs, rhs, width)) is None:
+            return
+
+        # replace c1 op c2 with its value
+        cst = arith.ConstantOp.from_int_and_width(value, width)
+        rewriter.replace_op(op, [cst])
+
+# extsi/extui/trunci of a constant -> constant
+class ConstantCastFoldPattern(RewritePattern):
+
+    op_types = (arith.ExtSIOp, arith.ExtUIOp, arith.TruncIOp)
+
+    def match_and_rewrite(self, op, rewriter):
+
+        # match arith.extsi, arith.extui, arith.trunci
+        if not isinstance(op, (arith.ExtSIOp, arith.ExtUIOp, arith.TruncIOp)):
+            return
+        if (value := get_const_int(op.input)) is None:
+            return
+
+        in_width = op.input.type.width.data
+        out_width = op.result.type.width.data
+        if isinstance(op, arith.ExtUIOp):
+            value &= (1 << in_width) - 1
+        else:
+            value = wrap_signed(value, in_width)
+
+        cst = arith.ConstantOp.from_int_and_width(wrap_signed(value, out_width), out_width)
+        rewriter.replace_op(op, [cst])
+
+# mulsi_extended/mului_extended of constants -> the low and high halves
+class ConstantMulExtendedFoldPattern(RewritePattern):
+
+    op_types = (arith.MulSIExtendedOp, arith.MulUIExtendedOp)
+
+    def match_and_rewrite(self, op, rewriter):
+
+        # match a multiply-high left by division by a constant whose dividend became one
+        if not isinstance(op, (arith.MulSIExtendedOp, arith.MulUIExtendedOp)):
+            return
+        if not isinstance(op.low.type, builtin.IntegerType):
+            return
+        lhs, rhs = get_const_int(op.lhs), get_const_int(op.rhs)
+        if lhs is None or rhs is None:
+            return
+
+        width = op.low.type.width.data
+        mask = (1 << width) - 1
+        if isinstance(op, arith.MulSIExtendedOp):
+            product = wrap_signed(lhs, width) * wrap_signed(rhs, width)
+        else:
+            product = (lhs & mask) * (rhs & mask)
+        low = arith.ConstantOp.from_int_and_width(wrap_signed(product & mask, width), width)
+        high = arith.ConstantOp.from_int_and_width(wrap_signed((product >> width) & mask, width), width)
+        rewriter.replace_op(op, [low, high], new_results=[low.result, high.result])
+
+# c op x -> x op c for commutative ops, so the patterns below only look at rhs
+class CommuteConstantPattern(RewritePattern):
+
+    op_types = COMMUTATIVE_OPS
+
+    def match_and_rewrite(self, op, rewriter):
+
+        # match commutative arith ops
+        if not isinstance(op, COMMUTATIVE_OPS):
+            return
+
+        # check if only the lhs is a constant
+        if get_const_int(op.lhs) is None or get_const_int(op.rhs) is not None:
+            return
+
+        # replace c op x with x op c
+        rewriter.replace_op(op, [type(op)(op.rhs, op.lhs)])
+
+# (x op c1) op c2 -> x op (c1 op c2), including mixed additions and subtractions
+class ReassociateConstantPattern(RewritePattern):
+
+    op_types = COMMUTATIVE_OPS + (arith.SubiOp,)
+
+    def match_and_rewrite(self, op, rewriter):
+
+        # match an op with a constant rhs whose lhs is an op with a constant rhs
+        if not isinstance(op, COMMUTATIVE_OPS + (arith.SubiOp,)):
+            return
+        if (c2 := get_const_int(op.rhs)) is None:
+            return
+        inner = op.lhs.owner
+        if not isinstance(inner, COMMUTATIVE_OPS + (arith.SubiOp,)):
+            return
+        if (c1 := get_const_int(inner.rhs)) is None:
+            return
+        x = inner.lhs
+        width = op.result.type.width.data
+
+        # additive chains: x +- c1 +- c2 -> x + c
+        additive = (arith.AddiOp, arith.SubiOp)
+        if isinstance(op, additive) and isinstance(inner, additive):
+            c1 = c1 if isinstance(inner, arith.AddiOp) else -c1
+            c2 = c2 if isinstance(op, arith.AddiOp) else -c2
+            new_type = arith.AddiOp
+            value = wrap_signed(c1 + c2, width)
+
+        # associative chains of the same op
+        elif type(op) is type(inner) and not isinstance(op, arith.SubiOp):
+            new_type = type(op)
+            value = fold_binary(new_type, c1, c2, width)
+
+        else:
+            return
+
+        cst = arith.ConstantOp.from_int_and_width(value, width)
+        rewriter.replace_op(op, [cst, new_type(x, cst.result)])
 
 #
 # Optimization patterns
@@ -17,6 +233,8 @@ from xdsl.pattern_rewriter import (
 # x + 0 -> x
 class AddZeroPattern(RewritePattern):
 
+    op_types = (arith.AddiOp,)
+
     def match_and_rewrite(self, op, rewriter):
         
         # match arith.addi
@@ -34,9 +252,53 @@ class AddZeroPattern(RewritePattern):
         # replace x + 0 with x
         rewriter.replace_op(op, [], new_results=[op.lhs])
 
+# x * 0 -> 0
+class MulZeroPattern(RewritePattern):
+
+    op_types = (arith.MuliOp,)
+
+    def match_and_rewrite(self, op, rewriter):
+
+        # match arith.muli
+        if not isinstance(op, arith.MuliOp):
+            return
+
+        # check if rhs is the constant 0
+        if get_const_int(op.rhs) != 0:
+            return
+
+        # replace x * 0 with 0
+        rewriter.replace_op(op, [], new_results=[op.rhs])
+
+# x * 1 -> x, x * -1 -> 0 - x
+class MulOnePattern(RewritePattern):
+
+    op_types = (arith.MuliOp,)
+
+    def match_and_rewrite(self, op, rewriter):
+
+        # match arith.muli
+        if not isinstance(op, arith.MuliOp):
+            return
+
+        # check if rhs is the constant 1 or -1
+        if (c := get_const_int(op.rhs)) is None:
+            return
+        width = op.result.type.width.data
+        c = wrap_signed(c, width)
+
+        # replace x * 1 with x and x * -1 with 0 - x
+        if c == 1:
+            rewriter.replace_op(op, [], new_results=[op.lhs])
+        elif c == -1:
+            zero = arith.ConstantOp.from_int_and_width(0, width)
+            rewriter.replace_op(op, [zero, arith.SubiOp(zero.result, op.lhs)])
+
 # x * 2^n -> x << n
 class MulPowTwoPattern(RewritePattern):
 
+    op_types = (arith.MuliOp,)
+
     def match_and_rewrite(self, op, rewriter):
         
         # match arith.muli
@@ -62,37 +324,408 @@ class MulPowTwoPattern(RewritePattern):
         shl = arith.ShLIOp(x, shift_val)
         rewriter.replace_op(op, [pow_two_op, shl])
 
-# x / 2^n -> x >> n
+# Shift/add/sub plans for x * c. A plan is a tree of ("x",), ("shl", plan, n),
+# ("add", plan, plan) and ("sub", plan, plan); a subplan used twice is only
+# computed once. Returns (number of ops, plan) for the cheapest plan found, or
+# (limit, None) when it would take limit ops or more: the search is bounded by
+# the best plan so far, so hopeless branches are cut without changing the result.
+@lru_cache(maxsize=4096)
+def mul_plan(c: int, limit: int = 64) -> tuple[int, tuple | None]:
+    if c == 1:
+        return 0, ("x",)
+    if limit <= 1:
+        return limit, None
+
+    # c = d << n
+    if c % 2 == 0:
+        n = (c & -c).bit_length() - 1
+        ops, plan = mul_plan(c >> n, limit - 1)
+        if plan is None:
+            return limit, None
+        return ops + 1, ("shl", plan, n)
+
+    # c = (c - 1) + 1 or (c + 1) - 1
+    best = (limit, None)
+    ops, plan = mul_plan(c - 1, limit - 1)
+    if plan is not None:
+        best = (ops + 1, ("add", plan, ("x",)))
+    n = (c + 1).bit_length() - 1
+    if c + 1 == 1 << n:
+        if 2 < best[0]:
+            best = (2, ("sub", ("shl", ("x",), n), ("x",)))
+    else:
+        ops, plan = mul_plan(c + 1, best[0] - 1)
+        if plan is not None:
+            best = (ops + 1, ("sub", plan, ("x",)))
+
+    # c = d * (2^n + 1) or d * (2^n - 1): y + (y << n), (y << n) - y
+    for n in range(2, c.bit_length()):
+        for factor, kind in (((1 << n) + 1, "add"), ((1 << n) - 1, "sub")):
+            if c % factor != 0 or c == factor:
+                continue
+            ops, plan = mul_plan(c // factor, best[0] - 2)
+            if plan is None:
+                continue
+            if kind == "add":
+                best = (ops + 2, ("add", plan, ("shl", plan, n)))
+            else:
+                best = (ops + 2, ("sub", ("shl", plan, n), plan))
+    return best
+
+def plan_ops(plan: tuple, thumb2: bool) -> int:
+    """
+    Instructions a plan lowers to: one per distinct subplan, except that on
+    Thumb-2 a shift used only by an add or sub becomes its shifted operand.
+    """
+    uses = dict()   # subplan -> times it is used
+
+    def visit(plan):
+        if plan[0] == "x":
+            return
+        uses[plan] = uses.get(plan, 0) + 1
+        if uses[plan] == 1:
+            for operand in plan[1:]:
+                if isinstance(operand, tuple):
+                    visit(operand)
+
+    visit(plan)
+    ops = len(uses)
+    if thumb2:
+        ops -= sum(1 for node in uses if node[0] in ("add", "sub")
+                   and any(operand[0] == "shl" and uses[operand] == 1 for operand in node[1:]))
+    return ops
+
+# x * c -> shifts and adds/subs, when cheaper than materializing c and multiplying
+class MulConstPattern(RewritePattern):
+
+    op_types = (arith.MuliOp,)
+
+    def __init__(self, target: str = DEFAULT_TARGET):
+        self.target = target
+
+    def match_and_rewrite(self, op, rewriter):
+
+        # match arith.muli
+        if not isinstance(op, arith.MuliOp):
+            return
+        x = op.lhs
+
+        # check if rhs is a constant (other than 0, 1 and -1, which fold)
+        if (c := get_const_int(op.rhs)) is None or c in (0, 1, -1):
+            return
+        width = op.result.type.width.data
+        c = wrap_signed(c, width)
+        negate = c < 0
+
+        # only plans cheaper than mov + mul are worth searching for; on Thumb-2
+        # a shift feeding an add or sub is free, so plans may take twice the ops
+        thumb2 = is_thumb2(self.target)
+        mul_cost = const_cost(self.target, c) + cost(self.target, "mul")
+        limit = -(-mul_cost // cost(self.target, "alu"))
+        _, plan = mul_plan(abs(c), 2 * limit if thumb2 else limit)
+        if plan is None:
+            return
+
+        # -(a - b) is just b - a; other negative constants need a negation
+        if negate and plan[0] == "sub":
+            plan = ("sub", plan[2], plan[1])
+            negate = False
+        plan_cost = (plan_ops(plan, thumb2) + negate) * cost(self.target, "alu")
+        if plan_cost >= mul_cost:
+            return
+
+        # emit the plan, computing shared subplans once
+        new_ops = []
+        values = dict()
+
+        def emit(plan):
+            if plan[0] == "x":
+                return x
+            if plan in values:
+                return values[plan]
+            if plan[0] == "shl":
+                amount = arith.ConstantOp.from_int_and_width(plan[2], width)
+                new_ops.append(amount)
+                new_ops.append(arith.ShLIOp(emit(plan[1]), amount.result))
+            else:
+                lhs, rhs = emit(plan[1]), emit(plan[2])
+                op_type = arith.AddiOp if plan[0] == "add" else arith.SubiOp
+                new_ops.append(op_type(lhs, rhs))
+            values[plan] = new_ops[-1].results[0]
+            return values[plan]
+
+        result = emit(plan)
+        if negate:
+            zero = arith.ConstantOp.from_int_and_width(0, width)
+            new_ops += [zero, arith.SubiOp(zero.result, result)]
+
+        rewriter.replace_op(op, new_ops)
+
+# x / 2^n -> (x + bias) >> n, where the bias (2^n - 1 for negative x, else 0)
+# makes the shift round toward zero like C division
 class DivPowTwoPattern(RewritePattern):
 
+    op_types = (arith.DivSIOp, arith.DivUIOp)
+
     def match_and_rewrite(self, op, rewriter):
         
-        # match arith.divsi
-        if not isinstance(op, arith.DivSIOp):
+        # match arith.divsi / arith.divui
+        if not isinstance(op, (arith.DivSIOp, arith.DivUIOp)):
             return
         x = op.lhs
+        width = op.result.type.width.data
+        signed = isinstance(op, arith.DivSIOp)
         
         # check if rhs is a constant
-        if not isinstance(cst := op.rhs.owner, arith.ConstantOp):
+        if (rhs := get_const_int(op.rhs)) is None:
             return
+        rhs = wrap_signed(rhs, width) if signed else rhs & ((1 << width) - 1)
+        negate = rhs < 0
+        rhs = abs(rhs)
         
         # check if constant is power of 2
-        rhs = cst.value.value.data
         if (not( rhs > 0 and ((rhs & (rhs - 1)) == 0))):
             return
-        
-        # replace x / 2^n with x >> n and convert to SSA for ShLIOp
         pow_two = (rhs & -rhs).bit_length() - 1     # ctz bithack
-        pow_two_op = arith.ConstantOp.from_int_and_width(pow_two, 32)
+        if signed and pow_two == width - 1:
+            return      # |INT_MIN| is not representable
+        
+        new_ops = []
+        def const(value):
+            new_ops.append(arith.ConstantOp.from_int_and_width(value, width))
+            return new_ops[-1].result
 
-        # get result (shift amount) and replace 
-        shift_val = pow_two_op.result 
-        shl = arith.ShRSIOp(x, shift_val)
-        rewriter.replace_op(op, [pow_two_op, shl])
+        if pow_two == 0:
+            q = x
+        elif not signed:
+            new_ops.append(arith.ShRUIOp(x, const(pow_two)))
+            q = new_ops[-1].result
+        else:
+            q = arith_shift_div(x, pow_two, width, new_ops, const)
+
+        if negate:
+            new_ops.append(arith.SubiOp(const(0), q))
+            q = new_ops[-1].result
+
+        # x / 1 folds away entirely
+        if not new_ops:
+            rewriter.replace_op(op, [], new_results=[x])
+            return
+        rewriter.replace_op(op, new_ops)
+
+# signed x / 2^n as ((x + ((x >> (w-1)) >>> (w-n))) >> n), appending ops to new_ops
+def arith_shift_div(x, pow_two: int, width: int, new_ops: list, const) -> SSAValue:
+    biased = arith_bias(x, pow_two, width, new_ops, const)
+    new_ops.append(arith.ShRSIOp(biased, const(pow_two)))
+    return new_ops[-1].result
+
+def arith_bias(x, pow_two: int, width: int, new_ops: list, const) -> SSAValue:
+    # bias = 2^n - 1 if x < 0 else 0; for n == 1 that is just the sign bit
+    if pow_two == 1:
+        new_ops.append(arith.ShRUIOp(x, const(width - 1)))
+    else:
+        new_ops.append(arith.ShRSIOp(x, const(width - 1)))
+        new_ops.append(arith.ShRUIOp(new_ops[-1].result, const(width - pow_two)))
+    new_ops.append(arith.AddiOp(x, new_ops[-1].result))
+    return new_ops[-1].result
+
+# x % 2^n -> x & (2^n - 1) (unsigned) or x - ((x + bias) & -2^n) (signed)
+class RemPowTwoPattern(RewritePattern):
+
+    op_types = (arith.RemSIOp, arith.RemUIOp)
+
+    def match_and_rewrite(self, op, rewriter):
+
+        # match arith.remsi / arith.remui
+        if not isinstance(op, (arith.RemSIOp, arith.RemUIOp)):
+            return
+        x = op.lhs
+        width = op.result.type.width.data
+        signed = isinstance(op, arith.RemSIOp)
+
+        # check if rhs is a constant power of 2 (the sign of a signed divisor does not matter)
+        if (rhs := get_const_int(op.rhs)) is None:
+            return
+        rhs = abs(wrap_signed(rhs, width)) if signed else rhs & ((1 << width) - 1)
+        if (not( rhs > 0 and ((rhs & (rhs - 1)) == 0))):
+            return
+        pow_two = (rhs & -rhs).bit_length() - 1
+        if signed and pow_two == width - 1:
+            return
+
+        new_ops = []
+        def const(value):
+            new_ops.append(arith.ConstantOp.from_int_and_width(wrap_signed(value, width), width))
+            return new_ops[-1].result
+
+        if pow_two == 0:
+            const(0)
+        elif not signed:
+            new_ops.append(arith.AndIOp(x, const(rhs - 1)))
+        else:
+            biased = arith_bias(x, pow_two, width, new_ops, const)
+            new_ops.append(arith.AndIOp(biased, const(-rhs)))
+            new_ops.append(arith.SubiOp(x, new_ops[-1].result))
+        rewriter.replace_op(op, new_ops)
+
+# Magic numbers (Hacker's Delight, chapter 10) for 32-bit division by a
+# constant: x / d == mulhi(x, M) (plus fixups) >> s
+def signed_magic(d: int) -> tuple[int, int]:
+    two31 = 1 << 31
+    ad = abs(d)
+    t = two31 + (1 if d < 0 else 0)
+    anc = t - 1 - t % ad
+    p = 31
+    q1, r1 = divmod(two31, anc)
+    q2, r2 = divmod(two31, ad)
+    while True:
+        p += 1
+        q1, r1 = 2 * q1, 2 * r1
+        if r1 >= anc:
+            q1, r1 = q1 + 1, r1 - anc
+        q2, r2 = 2 * q2, 2 * r2
+        if r2 >= ad:
+            q2, r2 = q2 + 1, r2 - ad
+        delta = ad - r2
+        if not (q1 < delta or (q1 == delta and r1 == 0)):
+            break
+    magic = q2 + 1
+    return wrap_signed(-magic if d < 0 else magic, 32), p - 32
+
+def unsigned_magic(d: int) -> tuple[int, int]:
+    # smallest p with ceil(2^p / d) * d - 2^p <= 2^(p - 32); the magic may need 33 bits
+    for p in range(32, 65):
+        magic = -(-(1 << p) // d)
+        if magic * d - (1 << p) <= 1 << (p - 32):
+            return magic, p - 32
+
+def mul_high(x: SSAValue, magic: int, signed: bool, long_multiply: bool, emit, const) -> SSAValue:
+    """
+    High word of the 64-bit product of x and the constant magic, emitting the
+    ops with emit and const: a smull / umull on cores with a long multiply,
+    else four 16x16-bit partial products, which a 32-bit muls computes exactly
+    (Hacker's Delight, 8-2).
+    """
+    if long_multiply:
+        mul_op = (arith.MulSIExtendedOp if signed else arith.MulUIExtendedOp)(x, const(magic))
+        emit(mul_op)
+        return mul_op.high
+
+    # x = x1 * 2^16 + x0 and magic = m1 * 2^16 + m0, the high halves signed
+    # for a signed product; the partial products are summed so no carry is lost
+    shr = arith.ShRSIOp if signed else arith.ShRUIOp
+    m0 = magic & 0xFFFF
+    m1 = wrap_signed(magic, 32) >> 16 if signed else (magic >> 16) & 0xFFFF
+    x0 = emit(arith.AndIOp(x, const(0xFFFF)))
+    x1 = emit(shr(x, const(16)))
+    low = emit(arith.MuliOp(x0, const(m0)))
+    t = emit(arith.AddiOp(emit(arith.MuliOp(x1, const(m0))), emit(arith.ShRUIOp(low, const(16)))))
+    w1 = emit(arith.AndIOp(t, const(0xFFFF)))
+    w2 = emit(shr(t, const(16)))
+    w1 = emit(arith.AddiOp(emit(arith.MuliOp(x0, const(m1))), w1))
+    high = emit(arith.AddiOp(emit(arith.MuliOp(x1, const(m1))), w2))
+    return emit(arith.AddiOp(high, emit(shr(w1, const(16)))))
+
+# x / c -> multiply-high by a magic number and shifts; the multiply-high is a
+# long multiply where there is one, and is built from 16-bit halves elsewhere
+class DivConstPattern(RewritePattern):
+
+    op_types = (arith.DivSIOp, arith.DivUIOp)
+
+    def __init__(self, target: str = DEFAULT_TARGET):
+        self.target = target
+
+    def match_and_rewrite(self, op, rewriter):
+
+        # match 32-bit arith.divsi / arith.divui
+        if not isinstance(op, (arith.DivSIOp, arith.DivUIOp)):
+            return
+        if op.result.type.width.data != 32:
+            return
+        x = op.lhs
+        signed = isinstance(op, arith.DivSIOp)
+
+        # check if rhs is a constant that is not a power of 2 (handled above)
+        if (d := get_const_int(op.rhs)) is None:
+            return
+        d = wrap_signed(d, 32) if signed else d & 0xFFFFFFFF
+        if d == 0 or (abs(d) & (abs(d) - 1)) == 0:
+            return
+
+        new_ops = []
+        def const(value):
+            new_ops.append(arith.ConstantOp.from_int_and_width(wrap_signed(value, 32), 32))
+            return new_ops[-1].result
+        def emit(new_op):
+            new_ops.append(new_op)
+            return new_op.results[0]
+
+        long_multiply = has(self.target, "mull")
+        if signed:
+            magic, shift = signed_magic(d)
+            q = mul_high(x, magic, True, long_multiply, emit, const)
+            if d > 0 and magic < 0:
+                q = emit(arith.AddiOp(q, x))
+            if d < 0 and magic > 0:
+                q = emit(arith.SubiOp(q, x))
+            if shift > 0:
+                q = emit(arith.ShRSIOp(q, const(shift)))
+            # add 1 to negative quotients to round toward zero
+            sign = emit(arith.ShRUIOp(q, const(31)))
+            q = emit(arith.AddiOp(q, sign))
+        else:
+            magic, shift = unsigned_magic(d)
+            if magic < 1 << 32:
+                q = mul_high(x, magic, False, long_multiply, emit, const)
+                if shift > 0:
+                    q = emit(arith.ShRUIOp(q, const(shift)))
+            else:
+                # 33-bit magic: q = (((x - hi) >> 1) + hi) >> (s - 1)
+                hi = mul_high(x, magic - (1 << 32), False, long_multiply, emit, const)
+                t = emit(arith.SubiOp(x, hi))
+                t = emit(arith.ShRUIOp(t, const(1)))
+                t = emit(arith.AddiOp(t, hi))
+                q = emit(arith.ShRUIOp(t, const(shift - 1))) if shift > 1 else t
+
+        # only worth it if cheaper than materializing d and dividing in hardware
+        # (cores with a divider all have a long multiply)
+        if has(self.target, "div"):
+            magic_cost = const_cost(self.target, magic) + cost(self.target, "mull") \
+                         + (len(new_ops) - 3) * cost(self.target, "alu")
+            if magic_cost >= const_cost(self.target, d) + cost(self.target, "div"):
+                return
+
+        rewriter.replace_op(op, new_ops, new_results=[q])
+
+# x % c -> x - (x / c) * c, so the division gets the constant-divisor treatment
+class RemConstPattern(RewritePattern):
+
+    op_types = (arith.RemSIOp, arith.RemUIOp)
+
+    def __init__(self, target: str = DEFAULT_TARGET):
+        self.target = target
+
+    def match_and_rewrite(self, op, rewriter):
+
+        # match arith.remsi / arith.remui by a constant (powers of 2 are handled above)
+        if not isinstance(op, (arith.RemSIOp, arith.RemUIOp)):
+            return
+        if op.result.type.width.data != 32:
+            return
+        if (d := get_const_int(op.rhs)) is None or wrap_signed(d, 32) == 0:
+            return
+
+        div_type = arith.DivSIOp if isinstance(op, arith.RemSIOp) else arith.DivUIOp
+        div_op = div_type(op.lhs, op.rhs)
+        mul_op = arith.MuliOp(div_op.result, op.rhs)
+        sub_op = arith.SubiOp(op.lhs, mul_op.result)
+        rewriter.replace_op(op, [div_op, mul_op, sub_op])
 
 # x & 0 -> 0
 class AndZeroPattern(RewritePattern):
 
+    op_types = (arith.AndIOp,)
+
     def match_and_rewrite(self, op, rewriter):
 
         # match arith.andi
@@ -113,6 +746,8 @@ class AndZeroPattern(RewritePattern):
 # x ^ x -> 0
 class XorSelfPattern(RewritePattern):
 
+    op_types = (arith.XOrIOp,)
+
     def match_and_rewrite(self, op, rewriter):
         
         # match arith.xori
@@ -129,11 +764,383 @@ class XorSelfPattern(RewritePattern):
         zero_op = arith.ConstantOp.from_int_and_width(0, 32)
         rewriter.replace_op(op, [zero_op])
 
-def apply_all_optimizations(module: builtin.ModuleOp):
-    merged_pattern = GreedyRewritePatternApplier([AddZeroPattern(),
-                                                  MulPowTwoPattern(),
-                                                  DivPowTwoPattern(),
-                                                  AndZeroPattern(),
-                                                  XorSelfPattern()])
+# x - x -> 0
+class SubSelfPattern(RewritePattern):
+
+    op_types = (arith.SubiOp,)
+
+    def match_and_rewrite(self, op, rewriter):
+
+        # match arith.subi of a value from itself
+        if not isinstance(op, arith.SubiOp) or op.lhs != op.rhs:
+            return
+        if not isinstance(op.result.type, builtin.IntegerType):
+            return
+
+        # replace x - x with 0
+        zero_op = arith.ConstantOp.from_int_and_width(0, op.result.type.width.data)
+        rewriter.replace_op(op, [zero_op])
+
+#
+# Comparisons and control flow
+#
+
+# cmpi predicate number -> (signed, comparison)
+CMPI_PREDICATES = {
+    0: (False, lambda a, b: a == b),
+    1: (False, lambda a, b: a != b),
+    2: (True,  lambda a, b: a < b),
+    3: (True,  lambda a, b: a <= b),
+    4: (True,  lambda a, b: a > b),
+    5: (True,  lambda a, b: a >= b),
+    6: (False, lambda a, b: a < b),
+    7: (False, lambda a, b: a <= b),
+    8: (False, lambda a, b: a > b),
+    9: (False, lambda a, b: a >= b),
+}
+
+# cmpi predicate number -> the predicate of the negated comparison
+INVERSE_PREDICATES = {0: 1, 1: 0, 2: 5, 3: 4, 4: 3, 5: 2, 6: 9, 7: 8, 8: 7, 9: 6}
+
+def bool_constant(value: bool) -> arith.ConstantOp:
+    return arith.ConstantOp.from_int_and_width(-1 if value else 0, 1)
+
+# cmpi c1, c2 -> true / false, cmpi x, x -> true / false
+class CompareFoldPattern(RewritePattern):
+
+    op_types = (arith.CmpiOp,)
+
+    def match_and_rewrite(self, op, rewriter):
+
+        # match arith.cmpi on constants or on the same value twice
+        if not isinstance(op, arith.CmpiOp):
+            return
+        is_signed, compare = CMPI_PREDICATES[op.predicate.value.data]
+        if op.lhs == op.rhs:
+            lhs = rhs = 0
+        else:
+            lhs, rhs = get_const_int(op.lhs), get_const_int(op.rhs)
+            if lhs is None or rhs is None:
+                return
+            width = op.lhs.type.width.data
+            mask = (1 << width) - 1
+            if is_signed:
+                lhs, rhs = wrap_signed(lhs, width), wrap_signed(rhs, width)
+            else:
+                lhs, rhs = lhs & mask, rhs & mask
+
+        rewriter.replace_op(op, [bool_constant(compare(lhs, rhs))])
+
+# (extui b) != 0 -> b, (extui b) == 0 -> !b: a C truth value tested again
+class CompareBoolPattern(RewritePattern):
+
+    op_types = (arith.CmpiOp,)
+
+    def match_and_rewrite(self, op, rewriter):
+
+        # match arith.cmpi eq / ne of a widened i1 with 0
+        if not isinstance(op, arith.CmpiOp) or op.predicate.value.data not in (0, 1):
+            return
+        if get_const_int(op.rhs) != 0 or not isinstance(ext := op.lhs.owner, arith.ExtUIOp):
+            return
+        if ext.input.type != builtin.i1:
+            return
+
+        if op.predicate.value.data == 1:
+            rewriter.replace_op(op, [], new_results=[ext.input])
+        elif isinstance(cmp_op := ext.input.owner, arith.CmpiOp):
+            inverse = INVERSE_PREDICATES[cmp_op.predicate.value.data]
+            rewriter.replace_op(op, [arith.CmpiOp(cmp_op.lhs, cmp_op.rhs, inverse)])
+        else:
+            true = bool_constant(True)
+            rewriter.replace_op(op, [true, arith.XOrIOp(ext.input, true.result)])
+
+# select true, x, y -> x, select c, x, x -> x
+class SelectFoldPattern(RewritePattern):
+
+    op_types = (arith.SelectOp,)
+
+    def match_and_rewrite(self, op, rewriter):
+
+        # match arith.select with a known outcome
+        if not isinstance(op, arith.SelectOp):
+            return
+        if op.lhs == op.rhs:
+            rewriter.replace_op(op, [], new_results=[op.lhs])
+        elif (cond := get_const_int(op.cond)) is not None:
+            rewriter.replace_op(op, [], new_results=[op.lhs if cond else op.rhs])
+
+# scf.if on a constant -> the ops of the region taken
+class IfFoldPattern(RewritePattern):
+
+    op_types = (scf.IfOp,)
+
+    def match_and_rewrite(self, op, rewriter):
+
+        # match scf.if with a constant condition
+        if not isinstance(op, scf.IfOp) or (cond := get_const_int(op.cond)) is None:
+            return
+        region = op.true_region if cond else op.false_region
+        if not region.blocks:
+            rewriter.erase_op(op)
+            return
+
+        block = region.blocks[0]
+        yield_op = block.last_op
+        for inner in list(block.ops)[:-1]:
+            inner.detach()
+            rewriter.insert_op(inner, InsertPoint.before(op))
+        rewriter.replace_op(op, [], new_results=list(yield_op.operands))
+
+#
+# Loops
+#
+
+# ops (nested ones included) a fully unrolled loop may have, and the body of a
+# partially unrolled one
+FULL_UNROLL_OPS = 48
+PARTIAL_UNROLL_OPS = 24
+
+# copies of the body a partially unrolled loop gets, the preferred first
+UNROLL_FACTORS = (4, 2)
+
+DIVISION_OPS = (arith.DivSIOp, arith.DivUIOp, arith.RemSIOp, arith.RemUIOp)
+SHIFT_OPS = (arith.ShLIOp, arith.ShRUIOp, arith.ShRSIOp)
+
+def defined_in(value: SSAValue, op: Operation) -> bool:
+    # value is a result or block argument of op or of something nested in it
+    return op.is_ancestor(value.owner)
+
+def is_speculatable(op: Operation) -> bool:
+    """
+    Whether op may run where the program would not have run it: it has no side
+    effects, and no operand values make it undefined (division by zero or
+    INT_MIN / -1, shifts by the width or more).
+    """
+    if op.regions or not is_side_effect_free(op):
+        return False
+    if isinstance(op, DIVISION_OPS + SHIFT_OPS) and not isinstance(op.result.type, builtin.IntegerType):
+        return False
+    if isinstance(op, DIVISION_OPS):
+        divisor = get_const_int(op.rhs)
+        if divisor is None or divisor == 0:
+            return False
+        width = op.result.type.width.data
+        return isinstance(op, (arith.DivUIOp, arith.RemUIOp)) or wrap_signed(divisor, width) != -1
+    if isinstance(op, SHIFT_OPS):
+        amount = get_const_int(op.rhs)
+        return amount is not None and 0 <= amount < op.result.type.width.data
+    return True
+
+def trip_count(op: scf.ForOp) -> int | None:
+    # iterations of a loop with constant bounds, if the induction variable does not wrap
+    lb, ub, step = (get_const_int(value) for value in (op.lb, op.ub, op.step))
+    if lb is None or ub is None or step is None or not isinstance(op.lb.type, builtin.IntegerType):
+        return None
+    width = op.lb.type.width.data
+    lb, ub, step = (wrap_signed(value, width) for value in (lb, ub, step))
+    if lb >= ub:
+        return 0
+    if step <= 0:
+        return None
+    trips = -(-(ub - lb) // step)
+    if lb + trips * step >= 1 << (width - 1):
+        return None
+    return trips
+
+def body_size(op: scf.ForOp) -> int:
+    # ops one iteration runs at most, the yield excluded
+    return sum(1 for inner in op.body.blocks[0].ops for _ in inner.walk()) - 1
+
+def clone_body(op: scf.ForOp, args: list[SSAValue]) -> tuple[list[Operation], list[SSAValue]]:
+    """
+    Copies of the ops of an iteration of op taking args as the induction
+    variable and carried values, and the values the iteration yields.
+    """
+    body = op.body.blocks[0]
+    mapping = dict(zip(body.args, args))
+    new_ops = [inner.clone(mapping) for inner in list(body.ops)[:-1]]
+    return new_ops, [mapping.get(value, value) for value in body.last_op.operands]
+
+# ops of a loop body that only use values from outside the loop -> before the loop
+class LoopInvariantPattern(RewritePattern):
+
+    op_types = (scf.ForOp, scf.WhileOp)
+
+    def match_and_rewrite(self, op, rewriter):
+
+        # match a loop with invariant ops that may run even if the loop does not
+        if not isinstance(op, (scf.ForOp, scf.WhileOp)):
+            return
+
+        # an op whose operands were hoisted is looked at after them; constants
+        # stay (they are cheaper to rebuild than to keep in a register) and are
+        # copied for the ops hoisted with them
+        for region in op.regions:
+            for inner in list(region.blocks[0].ops)[:-1]:
+                if isinstance(inner, arith.ConstantOp) or not is_speculatable(inner):
+                    continue
+                if any(defined_in(operand, op) and not isinstance(operand.owner, arith.ConstantOp)
+                       for operand in inner.operands):
+                    continue
+                for idx, operand in enumerate(inner.operands):
+                    if defined_in(operand, op):
+                        const_op = operand.owner.clone()
+                        rewriter.insert_op(const_op, InsertPoint.before(op))
+                        inner.operands[idx] = const_op.result
+                inner.detach()
+                rewriter.insert_op(inner, InsertPoint.before(op))
+
+        # a smaller loop may now be unrolled
+        if rewriter.has_done_action:
+            rewriter.notify_op_modified(op)
+
+# scf.for with a constant trip count -> the iterations one after another
+class FullUnrollPattern(RewritePattern):
+
+    op_types = (scf.ForOp,)
+
+    def match_and_rewrite(self, op, rewriter):
+
+        # match an scf.for whose iterations together fit the budget
+        if not isinstance(op, scf.ForOp) or (trips := trip_count(op)) is None:
+            return
+        if trips * body_size(op) > FULL_UNROLL_OPS:
+            return
+
+        lb, step = get_const_int(op.lb), get_const_int(op.step)
+        width = op.lb.type.width.data
+        values = list(op.iter_args)
+        for idx in range(trips):
+            iv = arith.ConstantOp.from_int_and_width(wrap_signed(lb + idx * step, width), width)
+            new_ops, values = clone_body(op, [iv.result] + values)
+            rewriter.insert_op([iv] + new_ops, InsertPoint.before(op))
+        rewriter.replace_op(op, [], new_results=values)
+
+# iv * c in an scf.for -> a value carried along with iv, starting at lb * c and
+# growing by step * c each iteration, when that add is cheaper than the multiply
+class StrengthReducePattern(RewritePattern):
+
+    op_types = (scf.ForOp,)
+
+    def __init__(self, target: str = DEFAULT_TARGET):
+        self.target = target
+
+    def mul_cost(self, factor: SSAValue) -> int:
+        # cycles of x * factor in the loop (a constant factor is built outside it)
+        mul_cost = cost(self.target, "mul")
+        if (c := get_const_int(factor)) is None:
+            return mul_cost
+        if c in (0, 1, -1):
+            return 0
+        _, plan = mul_plan(abs(wrap_signed(c, factor.type.width.data)))
+        if plan is None:
+            return mul_cost
+        return min(mul_cost, plan_ops(plan, is_thumb2(self.target)) * cost(self.target, "alu"))
+
+    def match_and_rewrite(self, op, rewriter):
+
+        # match an scf.for multiplying its induction variable by an invariant
+        if not isinstance(op, scf.ForOp) or not isinstance(op.lb.type, builtin.IntegerType):
+            return
+        body = op.body.blocks[0]
+        iv = body.args[0]
+        for use in iv.uses:
+            mul_op = use.operation
+            if not isinstance(mul_op, arith.MuliOp):
+                continue
+            factor = mul_op.rhs if mul_op.lhs == iv else mul_op.lhs
+            if factor == iv or defined_in(factor, op) and not isinstance(factor.owner, arith.ConstantOp):
+                continue
+            if self.mul_cost(factor) > cost(self.target, "alu"):
+                break
+        else:
+            return
+
+        # a constant factor in the body is copied in front of the loop
+        if defined_in(factor, op):
+            const_op = factor.owner.clone()
+            rewriter.insert_op(const_op, InsertPoint.before(op))
+            factor = const_op.result
+        init = arith.MuliOp(op.lb, factor)
+        delta = arith.MuliOp(op.step, factor)
+        rewriter.insert_op([init, delta], InsertPoint.before(op))
+
+        # the product is carried as an extra value of the loop
+        product = body.insert_arg(iv.type, len(body.args))
+        yield_op = body.last_op
+        next_product = arith.AddiOp(product, delta.result)
+        rewriter.insert_op(next_product, InsertPoint.before(yield_op))
+        rewriter.replace_op(yield_op, scf.YieldOp(*yield_op.operands, next_product.result))
+        rewriter.replace_op(mul_op, [], new_results=[product])
+
+        new_op = scf.ForOp(op.lb, op.ub, op.step, [*op.iter_args, init.result], op.detach_region(op.body))
+        rewriter.replace_op(op, new_op, new_results=new_op.results[:-1])
+
+# scf.for with a constant trip count -> one iteration per factor of them
+class PartialUnrollPattern(RewritePattern):
+
+    op_types = (scf.ForOp,)
+
+    def match_and_rewrite(self, op, rewriter):
+
+        # match an scf.for whose trip count a factor divides, with a small enough body
+        if not isinstance(op, scf.ForOp) or (trips := trip_count(op)) is None:
+            return
+        size = body_size(op)
+        factor = next((factor for factor in UNROLL_FACTORS
+                       if trips % factor == 0 and trips > factor and factor * size <= PARTIAL_UNROLL_OPS), None)
+        if factor is None:
+            return
+
+        # copy k runs with iv + k * step
+        step = get_const_int(op.step)
+        width = op.lb.type.width.data
+        body = op.body.blocks[0]
+        new_body = Block(arg_types=[arg.type for arg in body.args])
+        iv, values = new_body.args[0], list(new_body.args[1:])
+        for idx in range(factor):
+            if idx:
+                offset = arith.ConstantOp.from_int_and_width(idx * step, width)
+                next_iv = arith.AddiOp(new_body.args[0], offset.result)
+                new_body.add_ops([offset, next_iv])
+                iv = next_iv.result
+            new_ops, values = clone_body(op, [iv] + values)
+            new_body.add_ops(new_ops)
+        new_body.add_op(scf.YieldOp(*values))
+
+        new_step = arith.ConstantOp.from_int_and_width(step * factor, width)
+        rewriter.insert_op(new_step, InsertPoint.before(op))
+        rewriter.replace_op(op, scf.ForOp(op.lb, op.ub, new_step.result, op.iter_args, new_body))
+
+def optimization_patterns(target: str = DEFAULT_TARGET) -> list[RewritePattern]:
+    return [ConstantFoldPattern(),
+            ConstantCastFoldPattern(),
+            ConstantMulExtendedFoldPattern(),
+            CommuteConstantPattern(),
+            ReassociateConstantPattern(),
+            AddZeroPattern(),
+            MulZeroPattern(),
+            MulOnePattern(),
+            MulPowTwoPattern(),
+            MulConstPattern(target),
+            DivPowTwoPattern(),
+            RemPowTwoPattern(),
+            DivConstPattern(target),
+            RemConstPattern(target),
+            AndZeroPattern(),
+            XorSelfPattern(),
+            SubSelfPattern(),
+            CompareFoldPattern(),
+            CompareBoolPattern(),
+            SelectFoldPattern(),
+            IfFoldPattern(),
+            LoopInvariantPattern(),
+            FullUnrollPattern(),
+            StrengthReducePattern(target),
+            PartialUnrollPattern()]
+
+def apply_all_optimizations(module: builtin.ModuleOp, target: str = DEFAULT_TARGET):
+    merged_pattern = TypedPatternApplier(optimization_patterns(target))
     walker = PatternRewriteWalker(merged_pattern)
-    walker.rewrite_module(module)
\ No newline at end of file
+    walker.rewrite_module(module)
@@ -0,0 +1,186 @@
+"""
+Peephole optimizations on the ARM dialect, run after lowering
+"""
+
+from xdsl.dialects import builtin, func
+from xdsl.pattern_rewriter import (
+    PatternRewriteWalker,
+    RewritePattern
+)
+
+from src.backend_arm_dialect import *
+from src.passes import *
+
+
+#
+#   Algebraic cleanups
+#
+# x - x -> 0, x ^ x -> 0
+class ArmSelfCancelPattern(RewritePattern):
+
+    op_types = (ArmSubOp, ArmEorOp)
+
+    def match_and_rewrite(self, op, rewriter):
+
+        # match arm.sub / arm.eor with identical operands
+        if not isinstance(op, (ArmSubOp, ArmEorOp)):
+            return
+        if op.lhs != op.rhs:
+            return
+
+        rewriter.replace_op(op, [ArmMovOp(0)])
+
+# x & x -> x, x | x -> x
+class ArmIdempotentPattern(RewritePattern):
+
+    op_types = (ArmAndOp, ArmOrOp)
+
+    def match_and_rewrite(self, op, rewriter):
+
+        # match arm.and / arm.or with identical operands
+        if not isinstance(op, (ArmAndOp, ArmOrOp)):
+            return
+        if op.lhs != op.rhs:
+            return
+
+        rewriter.replace_op(op, [], new_results=[op.lhs])
+
+# x + 0, x - 0, x | 0, x ^ 0, x << 0, x >> 0, x & 0xFFFFFFFF -> x
+class ArmImmIdentityPattern(RewritePattern):
+
+    identities = {
+        ArmAddImmOp: 0,
+        ArmSubImmOp: 0,
+        ArmOrImmOp:  0,
+        ArmEorImmOp: 0,
+        ArmLslImmOp: 0,
+        ArmLsrImmOp: 0,
+        ArmAsrImmOp: 0,
+        ArmAndImmOp: 0xFFFFFFFF,
+    }
+    op_types = tuple(identities)
+
+    def match_and_rewrite(self, op, rewriter):
+
+        # match an immediate op with its identity element
+        if type(op) not in self.identities:
+            return
+        if op.imm.value.data & 0xFFFFFFFF != self.identities[type(op)]:
+            return
+
+        rewriter.replace_op(op, [], new_results=[op.lhs])
+
+# x & 0 -> 0
+class ArmAndZeroPattern(RewritePattern):
+
+    op_types = (ArmAndImmOp,)
+
+    def match_and_rewrite(self, op, rewriter):
+
+        # match arm.andimm #0
+        if not isinstance(op, ArmAndImmOp) or op.imm.value.data != 0:
+            return
+
+        rewriter.replace_op(op, [ArmMovOp(0)])
+
+# c - x -> rsbs x, #c (negation is rsbs x, #0), saving the mov of c
+class ArmRsbPattern(RewritePattern):
+
+    op_types = (ArmSubOp,)
+
+    def __init__(self, target: str = DEFAULT_TARGET):
+        self.target = target
+
+    def match_and_rewrite(self, op, rewriter):
+
+        # match arm.sub with a constant lhs
+        if not isinstance(op, ArmSubOp):
+            return
+        if (imm_val := get_const(op.lhs)) is None:
+            return
+        imm_val &= 0xFFFFFFFF
+
+        # Thumb-1 only has rsbs #0
+        if not (is_thumb2_imm(imm_val) if is_thumb2(self.target) else imm_val == 0):
+            return
+
+        rewriter.replace_op(op, [ArmRsbImmOp(op.rhs, imm_val)])
+
+# rsbs (rsbs x, #0), #0 -> x
+class ArmDoubleNegPattern(RewritePattern):
+
+    op_types = (ArmRsbImmOp,)
+
+    def match_and_rewrite(self, op, rewriter):
+
+        # match a negation of a negation
+        if not isinstance(op, ArmRsbImmOp) or op.imm.value.data != 0:
+            return
+        inner = op.lhs.owner
+        if not isinstance(inner, ArmRsbImmOp) or inner.imm.value.data != 0:
+            return
+
+        rewriter.replace_op(op, [], new_results=[inner.lhs])
+
+# ops without side effects whose result is unused
+class ArmDeadOpPattern(RewritePattern):
+
+    def match_and_rewrite(self, op, rewriter):
+
+        # match any arm op with results but the return sequence
+        if not op.name.startswith("arm.") or isinstance(op, ArmMovRegOp) or not op.results:
+            return
+        if any(res.uses for res in op.results):
+            return
+
+        rewriter.erase_op(op)
+
+
+#
+#   Constant reuse
+#
+def reuse_constants(module: builtin.ModuleOp, target: str = DEFAULT_TARGET):
+    """
+    Replace a constant materialized earlier in the same block with the register
+    already holding it. On Thumb-1 cores, where registers are scarcer, only
+    constants that take more than one cycle to rebuild are kept live.
+    """
+    for func_op in module.walk():
+        if not isinstance(func_op, func.FuncOp):
+            continue
+        for block in func_op.body.blocks:
+            seen = dict()   # constant -> SSAValue holding it
+            for op in list(block.ops):
+                if not op.results or (imm_val := get_const(op.results[0])) is None:
+                    continue
+                if not is_thumb2(target) and const_cost(target, imm_val) <= 1:
+                    continue
+                if imm_val not in seen:
+                    seen[imm_val] = op.results[0]
+                    continue
+
+                # erase the sequence that built it again (e.g. movw of movw/movt)
+                op.results[0].replace_by(seen[imm_val])
+                feeders = [operand.owner for operand in op.operands]
+                op.detach()
+                op.erase()
+                for feeder in feeders:
+                    if isinstance(feeder, CONST_OPS) and not feeder.results[0].uses:
+                        feeder.detach()
+                        feeder.erase()
+
+
+def peephole_patterns(target: str = DEFAULT_TARGET) -> list[RewritePattern]:
+    return [ArmSelfCancelPattern(),
+            ArmIdempotentPattern(),
+            ArmImmIdentityPattern(),
+            ArmAndZeroPattern(),
+            ArmRsbPattern(target),
+            ArmDoubleNegPattern(),
+            ArmDeadOpPattern()]
+
+def peephole(module: builtin.ModuleOp, target: str = DEFAULT_TARGET):
+    merged_pattern = TypedPatternApplier(peephole_patterns(target))
+    walker = PatternRewriteWalker(merged_pattern)
+    walker.rewrite_module(module)
+    reuse_constants(module, target)
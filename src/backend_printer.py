@@ -2,102 +2,815 @@
 ARM MLIR to ARM assembly converter (printer)
 """
 
-import sys
-from xdsl.dialects import builtin
-from xdsl.ir import SSAValue
+from xdsl.dialects import builtin, func
+from xdsl.ir import Operation, SSAValue
 
 from src.backend_arm_dialect import *
+from src.backend_regalloc import *
 
-ssa_ids = dict()
-id = 0
-funcidx = 0
-
-def get_ssa_id(ssa: SSAValue):
-    global ssa_ids, id
-
-    if (ssa in ssa_ids):
-        return ssa_ids[ssa]
-    
-    else:
-        ssa_ids[ssa] = id
-        ret = id
-        id += 1
-        return ret
-    
-def add_ssa_id(ssa: SSAValue, dst: int):
-    global ssa_ids
-    ssa_ids[ssa] = dst
-
-def print_asm(module: builtin.ModuleOp, out_file):
-    
-    # redirect stdout
-    sys.stdout = out_file
-
-    binary_ops = {
-        ArmAddOp:   "adds",
-        ArmSubOp:   "subs",
-        ArmMulOp:   "mul",
-        ArmAndOp:   "ands",
-        ArmOrOp:    "orrs",
-        ArmEorOp:   "eors",
-        ArmLslOp:   "lsls",
-        ArmLsrOp:   "lsrs",
-        ArmAsrOp:   "asrs"
-    }
-
-    # match type for each operation
-    for op in module.walk():
-
-        if type(op) in binary_ops:
-            dst = get_ssa_id(op.results[0])
-            lhs = get_ssa_id(op.operands[0])
-            rhs = get_ssa_id(op.operands[1])
-            print(f"    {binary_ops[type(op)]} r{dst}, r{lhs}, r{rhs}")
-
-        elif isinstance(op, ArmMovOp):
-            dst = get_ssa_id(op.results[0])
-            imm = op.attributes["imm"].value.data
-            print(f"    mov r{dst}, #{imm}")
-
-        elif isinstance(op, ArmMovwOp):
-            dst = get_ssa_id(op.results[0])
-            imm = op.attributes["imm"].value.data
-            print(f"    movw r{dst}, #{imm}")
-
-        elif isinstance(op, ArmMovtOp):
-            dst = get_ssa_id(op.operands[0])
-            imm = op.attributes["imm"].value.data
-            add_ssa_id(op.results[0], dst)
-            print(f"    movt r{dst}, #{imm}")
-
-        elif isinstance(op, ArmMovRegOp):
-            dst = 0
-            src = get_ssa_id(op.operands[0])
-            print(f"    movs r{dst}, r{src}")
-
-        elif isinstance(op, ArmRetOp):
-            print("    bx lr")
-
-        elif isinstance(op, func.FuncOp):
-            
-            global id, ssa_ids, funcidx
-            id = 0
-            ssa_ids = {}
-
-            name = str(op.sym_name).replace("\"", "")
-
-            # declare these once
-            if funcidx == 0:
-                print(".syntax unified")
-                print(".thumb")
-                funcidx += 1
-            
-            # header for each function
-            print(f"\n.global {name}")
-            print(f".type {name}, %function")
-            print(f"{name}:")
-
-            # map function args to r0, r1, ... according to ARM calling convention
-            for arg in op.body.blocks[0].args:
-                add_ssa_id(arg, id)
-                id += 1
\ No newline at end of file
+
+#
+#   Mnemonics
+#
+BINARY_OPS = {
+    ArmAddOp:   "adds",
+    ArmSubOp:   "subs",
+    ArmMulOp:   "mul",
+    ArmSdivOp:  "sdiv",
+    ArmUdivOp:  "udiv",
+    ArmBicOp:   "bics",
+    ArmAndOp:   "ands",
+    ArmOrOp:    "orrs",
+    ArmEorOp:   "eors",
+    ArmLslOp:   "lsls",
+    ArmLsrOp:   "lsrs",
+    ArmAsrOp:   "asrs"
+}
+
+BINARY_IMM_OPS = {
+    ArmAddImmOp:    "adds",
+    ArmSubImmOp:    "subs",
+    ArmAndImmOp:    "ands",
+    ArmOrImmOp:     "orrs",
+    ArmEorImmOp:    "eors",
+    ArmLslImmOp:    "lsls",
+    ArmLsrImmOp:    "lsrs",
+    ArmAsrImmOp:    "asrs",
+    ArmRsbImmOp:    "rsbs",
+    ArmBicImmOp:    "bics"
+}
+
+SHIFTED_OPS = {
+    ArmAddShiftOp:  "adds",
+    ArmSubShiftOp:  "subs",
+    ArmRsbShiftOp:  "rsbs",
+    ArmAndShiftOp:  "ands",
+    ArmOrShiftOp:   "orrs",
+    ArmEorShiftOp:  "eors",
+    ArmBicShiftOp:  "bics"
+}
+
+EXTEND_MNEMONICS = {
+    ArmSxtbOp:  "sxtb",
+    ArmSxthOp:  "sxth",
+    ArmUxtbOp:  "uxtb",
+    ArmUxthOp:  "uxth"
+}
+
+# ldr/str suffix moving a value of each width (i1 is kept in a byte)
+ACCESS_SUFFIXES = {1: "b", 8: "b", 16: "h", 32: ""}
+
+# Thumb-1 two-address ops that may swap their operands
+THUMB1_COMMUTATIVE = ("ands", "orrs", "eors", "muls")
+
+LOW_REG_NAMES = {reg_name(reg) for reg in range(8)}
+
+# ldr rd, label only reaches 1020 bytes forward: a Thumb-1 op prints at most
+# five 16-bit instructions, so after this many ops (or this many entries) the
+# pending pool is placed inline, behind a branch
+POOL_ISLAND_OPS = 80
+POOL_ISLAND_ENTRIES = 32
+
+# sp can be moved by at most this much per Thumb-1 add/sub
+THUMB1_MAX_SP_STEP = 508
+
+# reach of the 16-bit branches, from the address of the branch + 4
+BRANCH_RANGE = (-2048, 2046)
+COND_BRANCH_RANGE = (-256, 254)
+CBZ_RANGE = (0, 126)
+
+
+def file_header(target: str) -> list[str]:
+    return [".syntax unified", f".cpu {CPU_NAMES[target]}", ".thumb"]
+
+# b<cond> / b<cond>.w -> cond (b itself has none)
+def branch_cond(mnemonic: str) -> str | None:
+    cond = mnemonic.removesuffix(".w")[1:]
+    return cond if cond in INVERSE_CONDS else None
+
+
+#
+#   Operands
+#
+# Instructions are emitted as a mnemonic and operands: register names
+# ("r0", "sp", ...), ints for immediates, lists of register names for push/pop,
+# and the classes below. The AsmEmitter prints them, the ObjectEmitter
+# (backend_object) encodes them.
+class Mem:
+    """
+    [base, #offset], or [base, index, lsl #shift] with index a register.
+    """
+
+    def __init__(self, base: str, offset: int = 0, index: str | None = None, shift: int = 0):
+        self.base = base
+        self.offset = offset
+        self.index = index
+        self.shift = shift
+
+class Shift:
+    """
+    Shifted register operand: lsl/lsr/asr #amount.
+    """
+
+    def __init__(self, kind: str, amount: int):
+        self.kind = kind
+        self.amount = amount
+
+class Label:
+    """
+    PC-relative reference to a label of the same function.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+
+def format_item(item: tuple) -> str:
+    kind = item[0]
+    if kind == "instr":
+        mnemonic, operands = item[1], item[2]
+        if operands:
+            mnemonic += " " + ", ".join(format_operand(operand) for operand in operands)
+        return f"    {mnemonic}"
+    if kind == "label":
+        return f"{item[1]}:"
+    if kind == "word":
+        return f"    .word {item[1]}"
+    if kind == "align":
+        return f"    .p2align {item[1]}"
+    return item[1]
+
+def item_size(item: tuple, address: int) -> int:
+    # bytes item takes at address (alignment padding included)
+    kind = item[0]
+    if kind == "instr":
+        return instruction_size(item[1], [format_operand(operand) for operand in item[2]])
+    if kind == "word":
+        return 4
+    if kind == "align":
+        return -address % (1 << item[1])
+    return 0
+
+def format_operand(operand) -> str:
+    if isinstance(operand, int):
+        return f"#{operand}"
+    if isinstance(operand, list):
+        return "{" + ", ".join(operand) + "}"
+    if isinstance(operand, Mem) and operand.index is not None:
+        shift = f", lsl #{operand.shift}" if operand.shift else ""
+        return f"[{operand.base}, {operand.index}{shift}]"
+    if isinstance(operand, Mem):
+        return f"[{operand.base}, #{operand.offset}]"
+    if isinstance(operand, Shift):
+        return f"{operand.kind} #{operand.amount}"
+    if isinstance(operand, Label):
+        return operand.name
+    return operand
+
+
+#
+#   Emitter
+#
+class AsmEmitter:
+    """
+    Prints ARM-dialect modules as assembly for one target. All printing state
+    lives in the emitter, so separate emitters can be used concurrently, and
+    the output is collected as lines and written in one go.
+
+    Without header, the output is just the functions, to be appended to other
+    output that has one (see file_header); labels are named after their
+    function, so that output does not depend on what precedes it.
+    """
+
+    def __init__(self, target: str = DEFAULT_TARGET, header: bool = True):
+        self.target = target
+        self.thumb2 = is_thumb2(target)
+        self.header = header
+        self.items = []             # what was emitted, see format_item
+        self.func_start = None      # index of the current function's first item
+        self.allocation = None
+        self.func_name = None
+        self.funcidx = 0            # functions printed so far
+        self.literal_pool = dict()  # constant -> label index, for the pool not printed yet
+        self.literal_count = 0      # literal labels used so far by the current function
+        self.pool_distance = 0      # ops printed since the first load from the pending pool
+        self.block = None           # block being printed
+        self.layout = []            # blocks of the current function that are printed, in order
+        self.targets = dict()       # block -> the printed block a branch to it goes to
+        self.skip_count = 0         # local labels used so far by the current function
+
+    # Output is kept as items until the function is complete, as the branches
+    # can only be given their final form once the code is laid out
+    def emit(self, line: str):
+        self.items.append(("line", line))
+
+    def instr(self, mnemonic: str, *operands):
+        self.items.append(("instr", mnemonic, operands))
+
+    def label(self, name: str):
+        self.items.append(("label", name))
+
+    def word(self, value: int):
+        self.items.append(("word", value))
+
+    def align(self, power: int):
+        self.items.append(("align", power))
+
+    def emit_symbol(self, name: str):
+        # functions start word-aligned, so their code does not depend on what precedes them
+        self.func_start = len(self.items)
+        self.align(2)
+        self.emit(f".global {name}")
+        self.emit(f".type {name}, %function")
+        self.label(name)
+
+    def finish_function(self):
+        if self.func_start is not None:
+            self.drop_unused_labels(self.func_start)
+            self.relax_branches(self.func_start)
+        self.func_start = None
+
+    def text(self) -> str:
+        return "".join(format_item(item) + "\n" for item in self.items)
+
+    def emit_module(self, module: builtin.ModuleOp):
+        for op in module.walk():
+
+            # a new block starts with its label, unless nothing is printed for it
+            if isinstance(op.parent_op(), func.FuncOp):
+                if op.parent_block() is not self.block:
+                    self.emit_block(op.parent_block())
+                if self.block not in self.layout:
+                    continue
+
+            # keep the pending literal pool within reach of its loads
+            if self.literal_pool:
+                self.pool_distance += 1
+                if self.pool_distance > POOL_ISLAND_OPS or len(self.literal_pool) >= POOL_ISLAND_ENTRIES:
+                    self.emit_literal_pool(island=True)
+
+            handler = HANDLERS.get(type(op))
+            if handler is not None:
+                handler(self, op)
+
+        self.emit_literal_pool()
+        self.finish_function()
+
+    #
+    #   Registers
+    #
+    def use_reg(self, ssa: SSAValue, scratch: int) -> str:
+        """
+        Register holding ssa; spilled values are reloaded into a scratch register first.
+        """
+        allocation = self.allocation
+        if allocation.is_reg(ssa):
+            return reg_name(allocation.regs[ssa])
+
+        reg = reg_name(allocation.scratch_regs[scratch])
+        self.instr("ldr", reg, Mem("sp", allocation.stack_offset(ssa)))
+        return reg
+
+    def def_reg(self, ssa: SSAValue, scratch: int = 0) -> str:
+        """
+        Register an instruction should write ssa into (a scratch register if spilled).
+        """
+        allocation = self.allocation
+        if allocation.is_reg(ssa):
+            return reg_name(allocation.regs[ssa])
+        return reg_name(allocation.scratch_regs[scratch])
+
+    def store_def(self, ssa: SSAValue, scratch: int = 0):
+        """
+        Write a spilled result back to its stack slot.
+        """
+        allocation = self.allocation
+        if not allocation.is_reg(ssa):
+            self.instr("str", reg_name(allocation.scratch_regs[scratch]), Mem("sp", allocation.stack_offset(ssa)))
+
+    #
+    #   Functions
+    #
+    def emit_sp_adjust(self, mnemonic: str, size: int):
+        # Thumb-1 add/sub sp only take a 7-bit word offset
+        step = size if self.thumb2 else THUMB1_MAX_SP_STEP
+        while size > 0:
+            self.instr(mnemonic, "sp", "sp", min(size, step))
+            size -= step
+
+    def emit_prologue(self):
+        if self.allocation.saved_regs:
+            self.instr("push", [reg_name(reg) for reg in self.allocation.saved_regs])
+        self.emit_sp_adjust("sub", self.allocation.frame_size())
+
+    def emit_epilogue(self):
+        self.emit_sp_adjust("add", self.allocation.frame_size())
+
+        # popping the saved lr straight into pc also returns
+        if self.allocation.saved_regs:
+            self.instr("pop", [reg_name(reg) for reg in self.allocation.saved_regs[:-1] + [15]])
+        else:
+            self.instr("bx", "lr")
+
+    def emit_func(self, op: func.FuncOp):
+        # close the previous function, and declare these once
+        self.emit_literal_pool()
+        self.finish_function()
+        if self.funcidx == 0 and self.header:
+            for line in file_header(self.target):
+                self.emit(line)
+
+        self.allocation = allocate(op, self.target)
+        name = str(op.sym_name).replace("\"", "")
+        self.funcidx += 1
+        self.func_name = name
+        self.literal_count = 0
+        self.skip_count = 0
+        self.block = None
+        self.layout_blocks(op)
+
+        # header for each function
+        self.emit("")
+        self.emit_symbol(name)
+        self.emit_prologue()
+
+    def emit_ret(self, op: ArmRetOp):
+        self.emit_epilogue()
+
+    #
+    #   Blocks and branches
+    #
+    def location(self, ssa: SSAValue) -> str | int:
+        # register name, or stack offset of a value kept in memory
+        if self.allocation.is_reg(ssa):
+            return reg_name(self.allocation.regs[ssa])
+        return self.allocation.stack_offset(ssa)
+
+    def branch_moves(self, op: ArmBranchOp) -> list[tuple]:
+        # (destination, source) of the copies into the successor's arguments
+        moves = [(self.location(arg), self.location(operand)) for operand, arg in zip(op.args, op.dest.args)]
+        return [(dst, src) for dst, src in moves if dst != src]
+
+    def layout_blocks(self, func_op: func.FuncOp):
+        """
+        Blocks that only branch on (their arguments got the registers the values
+        passed to them are in) are not printed: branches to them go straight to
+        where they lead.
+        """
+        blocks = list(func_op.body.blocks)
+        forwards = dict()
+        for block in blocks[1:]:
+            op = block.first_op
+            if isinstance(op, ArmBranchOp) and op is block.last_op and not self.branch_moves(op):
+                forwards[block] = op.dest
+
+        self.targets = dict()
+        for block in blocks:
+            target, seen = block, set()
+            while target in forwards and target not in seen:
+                seen.add(target)
+                target = forwards[target]
+            self.targets[block] = target
+        self.layout = [block for block in blocks if block not in forwards or self.targets[block] is block]
+        self.block_names = {block: f".LBB_{self.func_name}_{idx}" for idx, block in enumerate(blocks)}
+
+    def emit_block(self, block):
+        self.block = block
+        if block in self.layout and block is not self.layout[0]:
+            self.label(self.block_names[block])
+
+    def next_block(self):
+        # the block control falls through to from the end of the current one
+        idx = self.layout.index(self.block) + 1
+        return self.layout[idx] if idx < len(self.layout) else None
+
+    def block_label(self, block) -> Label:
+        return Label(self.block_names[self.targets[block]])
+
+    def skip_label(self) -> Label:
+        self.skip_count += 1
+        return Label(f".LSKIP_{self.func_name}_{self.skip_count}")
+
+    def emit_move(self, dst: str | int, src: str | int, scratch: str):
+        if isinstance(src, int) and isinstance(dst, int):
+            self.instr("ldr", scratch, Mem("sp", src))
+            self.instr("str", scratch, Mem("sp", dst))
+        elif isinstance(src, int):
+            self.instr("ldr", dst, Mem("sp", src))
+        elif isinstance(dst, int):
+            self.instr("str", src, Mem("sp", dst))
+        else:
+            self.instr("mov", dst, src)
+
+    def emit_moves(self, moves: list[tuple]):
+        """
+        Parallel copy: every destination gets what its source held before any
+        of them is written. Copies into locations nothing reads any more go
+        first; a cycle is broken through a spare register (ip on Thumb-2, the
+        spill scratch registers on Thumb-1), or by swapping with eors.
+        """
+        scratch_regs = [reg_name(reg) for reg in self.allocation.scratch_regs]
+        temp, scratch = (scratch_regs + [None, None])[:2]
+        if self.thumb2:
+            temp = reg_name(12)
+        while moves:
+            ready = next((move for move in moves if not any(src == move[0] for _, src in moves)), None)
+            if ready is not None:
+                self.emit_move(*ready, scratch)
+                moves.remove(ready)
+            elif temp is not None:
+                dst = moves[0][0]
+                self.emit_move(temp, dst, scratch)
+                moves = [(d, temp if s == dst else s) for d, s in moves]
+            else:
+                # afterwards each of the two holds what the other did
+                dst, src = moves.pop(0)
+                self.instr("eors", dst, src)
+                self.instr("eors", src, dst)
+                self.instr("eors", dst, src)
+                swapped = {dst: src, src: dst}
+                moves = [(d, swapped.get(s, s)) for d, s in moves]
+            moves = [(dst, src) for dst, src in moves if dst != src]
+
+    def emit_branch(self, op: ArmBranchOp):
+        self.emit_moves(self.branch_moves(op))
+        if self.targets[op.dest] is not self.next_block():
+            self.instr("b", self.block_label(op.dest))
+
+    def emit_cond_branch(self, op: ArmCmpBranchOp | ArmCmpImmBranchOp):
+        """
+        cmp and b<cond> to one successor, falling through to the other if it
+        comes next (b to it otherwise). A test of a low register against 0 that
+        jumps forward is a cbz / cbnz on Thumb-2.
+        """
+        cond = op.cond.data
+        then_block, else_block = self.targets[op.then_block], self.targets[op.else_block]
+        following = self.next_block()
+        if then_block is following:
+            cond, then_block, else_block = INVERSE_CONDS[cond], else_block, then_block
+
+        lhs = self.use_reg(op.lhs, 0)
+        forward = self.layout.index(then_block) > self.layout.index(self.block)
+        if (isinstance(op, ArmCmpImmBranchOp) and op.imm.value.data == 0 and cond in ("eq", "ne")
+                and self.thumb2 and lhs in LOW_REG_NAMES and forward):
+            self.instr("cbz" if cond == "eq" else "cbnz", lhs, self.block_label(then_block))
+        else:
+            rhs = op.imm.value.data if isinstance(op, ArmCmpImmBranchOp) else self.use_reg(op.rhs, 1)
+            self.emit_cmp(lhs, rhs)
+            self.instr("b" + cond, self.block_label(then_block))
+        if else_block is not following:
+            self.instr("b", self.block_label(else_block))
+
+    def emit_cmp(self, lhs: str, rhs: str | int):
+        # a negative constant that is no modified immediate is added instead
+        # (the flags are the same), as the assembler does
+        if isinstance(rhs, int) and rhs < 0 and not is_thumb2_imm(rhs):
+            self.instr("cmn", lhs, -rhs)
+        else:
+            self.instr("cmp", lhs, rhs)
+
+    def emit_select(self, op: ArmSelectOp | ArmSelectImmOp):
+        """
+        cmp, then the true value moved into the result under cond and the
+        false one under the inverse: in an IT block on Thumb-2, around a
+        branch on Thumb-1 (mov leaves the flags alone).
+        """
+        cond = op.cond.data
+        lhs = self.use_reg(op.lhs, 0)
+        rhs = op.imm.value.data if isinstance(op, ArmSelectImmOp) else self.use_reg(op.rhs, 1)
+        self.emit_cmp(lhs, rhs)
+        true_reg = self.use_reg(op.true_value, 0)
+        false_reg = self.use_reg(op.false_value, 1)
+        dst = self.def_reg(op.res)
+
+        # moves of the values not already in dst, under their conditions
+        moves = [(cc, src) for cc, src in ((cond, true_reg), (INVERSE_CONDS[cond], false_reg)) if src != dst]
+        if true_reg == false_reg:
+            moves = [(None, true_reg)] if true_reg != dst else []
+        if len(moves) == 1 and moves[0][0] is None:
+            self.instr("mov", dst, moves[0][1])
+        elif self.thumb2 and moves:
+            self.instr("it" + ("e" if len(moves) == 2 else ""), moves[0][0])
+            for cc, src in moves:
+                self.instr("mov" + cc, dst, src)
+        elif moves:
+            skip = self.skip_label()
+            if len(moves) == 2:
+                self.instr("mov", dst, moves[0][1])
+                moves = moves[1:]
+            self.instr("b" + INVERSE_CONDS[moves[0][0]], skip)
+            self.instr("mov", dst, moves[0][1])
+            self.label(skip.name)
+        self.store_def(op.res)
+
+    def drop_unused_labels(self, start: int):
+        # blocks only entered by falling through need no label
+        used = {operand.name for item in self.items[start:] if item[0] == "instr"
+                for operand in item[2] if isinstance(operand, Label)}
+        self.items[start:] = [item for item in self.items[start:]
+                              if item[0] != "label" or not item[1].startswith(".LBB_") or item[1] in used]
+
+    def relax_branches(self, start: int):
+        """
+        Give the branches of the function starting at item start a form that
+        reaches their label: cbz / cbnz becomes cmp and b<cond>, and a 16-bit
+        branch the 32-bit one on Thumb-2. On Thumb-1, b<cond> becomes a b<cond>
+        around a b, and b a bl in functions that save lr. Each change only makes
+        code longer, so this is repeated until all branches reach.
+        """
+        items = self.items
+        changed = True
+        while changed:
+            changed = False
+            labels = dict()
+            addresses = []
+            address = 0
+            for item in items[start:]:
+                addresses.append(address)
+                if item[0] == "label":
+                    labels[item[1]] = address
+                address += item_size(item, address)
+
+            for idx in range(len(items) - 1, start - 1, -1):
+                kind, mnemonic, operands = (items[idx] + (None, None))[:3]
+                if kind != "instr" or not operands or not isinstance(operands[-1], Label):
+                    continue
+                if mnemonic not in ("b", "bl", "cbz", "cbnz") and branch_cond(mnemonic) is None:
+                    continue
+                offset = labels[operands[-1].name] - (addresses[idx - start] + 4)
+                if mnemonic in ("cbz", "cbnz"):
+                    low, high = CBZ_RANGE
+                elif mnemonic == "b":
+                    low, high = BRANCH_RANGE
+                else:
+                    low, high = COND_BRANCH_RANGE
+                if low <= offset <= high or mnemonic.endswith(".w") or mnemonic == "bl":
+                    continue
+
+                if mnemonic in ("cbz", "cbnz"):
+                    cond = "eq" if mnemonic == "cbz" else "ne"
+                    items[idx:idx + 1] = [("instr", "cmp", (operands[0], 0)), ("instr", "b" + cond, operands[1:])]
+                elif self.thumb2:
+                    items[idx] = ("instr", mnemonic + ".w", operands)
+                elif mnemonic != "b":
+                    skip = self.skip_label()
+                    items[idx:idx + 1] = [("instr", "b" + INVERSE_CONDS[branch_cond(mnemonic)], (skip,)),
+                                          ("instr", "b", operands), ("label", skip.name)]
+                elif 14 in self.allocation.saved_regs:
+                    # bl reaches 16MB, and lr is restored on return anyway
+                    items[idx] = ("instr", "bl", operands)
+                else:
+                    raise LoweringError(f"branch to {operands[0].name} out of range")
+                changed = True
+
+    #
+    #   Literal pool
+    #
+    def literal_label(self, imm: int) -> Label:
+        # one pool entry per distinct constant
+        if imm not in self.literal_pool:
+            self.literal_pool[imm] = self.literal_count
+            self.literal_count += 1
+        return Label(f".LCPI_{self.func_name}_{self.literal_pool[imm]}")
+
+    def emit_literal_pool(self, island: bool = False):
+        # placed after the function's return, or branched over in the middle of it
+        if not self.literal_pool:
+            return
+        if island:
+            self.instr("b", Label(f".LPOOL_{self.func_name}_{self.literal_count}"))
+        self.align(2)
+        for imm, idx in self.literal_pool.items():
+            self.label(f".LCPI_{self.func_name}_{idx}")
+            self.word(imm)
+        if island:
+            self.label(f".LPOOL_{self.func_name}_{self.literal_count}")
+        self.literal_pool.clear()
+        self.pool_distance = 0
+
+    #
+    #   Data processing
+    #
+    def emit_binary_form(self, mnemonic: str, dst: str, lhs: str, rhs: str):
+        """
+        dst = lhs op rhs. Thumb-1 only has the two-address forms op rd, rm of
+        everything but adds/subs, so dst is set up to hold lhs first (the allocator
+        keeps rhs out of dst for the non-commutative ones).
+        """
+        if self.thumb2 or mnemonic in ("adds", "subs"):
+            self.instr(mnemonic, dst, lhs, rhs)
+            return
+
+        if mnemonic == "mul":
+            mnemonic = "muls"
+        if dst != lhs and dst == rhs and mnemonic in THUMB1_COMMUTATIVE:
+            lhs, rhs = rhs, lhs
+        if dst != lhs:
+            self.instr("movs", dst, lhs)
+
+        # muls is written with the destination repeated as last operand
+        if mnemonic == "muls":
+            self.instr("muls", dst, rhs, dst)
+        else:
+            self.instr(mnemonic, dst, rhs)
+
+    def emit_binary_imm_form(self, mnemonic: str, dst: str, lhs: str, imm: int):
+        """
+        dst = lhs op #imm. Thumb-1 adds/subs take a 3-bit immediate with distinct
+        registers and an 8-bit one when dst is lhs.
+        """
+        if not self.thumb2 and mnemonic in ("adds", "subs") and imm > 7:
+            if dst != lhs:
+                self.instr("movs", dst, lhs)
+            self.instr(mnemonic, dst, imm)
+            return
+        self.instr(mnemonic, dst, lhs, imm)
+
+    def emit_binary(self, op: Operation):
+        lhs = self.use_reg(op.operands[0], 0)
+        rhs = self.use_reg(op.operands[1], 1)
+        dst = self.def_reg(op.results[0])
+        self.emit_binary_form(BINARY_OPS[type(op)], dst, lhs, rhs)
+        self.store_def(op.results[0])
+
+    def emit_binary_imm(self, op: Operation):
+        lhs = self.use_reg(op.operands[0], 0)
+        dst = self.def_reg(op.results[0])
+        imm = op.attributes["imm"].value.data & 0xFFFFFFFF
+        self.emit_binary_imm_form(BINARY_IMM_OPS[type(op)], dst, lhs, imm)
+        self.store_def(op.results[0])
+
+    def emit_shifted(self, op: Operation):
+        lhs = self.use_reg(op.lhs, 0)
+        rhs = self.use_reg(op.rhs, 1)
+        dst = self.def_reg(op.res)
+        self.instr(SHIFTED_OPS[type(op)], dst, lhs, rhs, Shift(op.shift.data, op.imm.value.data))
+        self.store_def(op.res)
+
+    def emit_mul_acc(self, op: ArmMlaOp | ArmMlsOp):
+        lhs = self.use_reg(op.lhs, 0)
+        rhs = self.use_reg(op.rhs, 1)
+        dst = self.def_reg(op.res)
+
+        # only two scratch registers: with a spilled accumulator, multiply first
+        if self.allocation.is_reg(op.acc):
+            mnemonic = "mla" if isinstance(op, ArmMlaOp) else "mls"
+            self.instr(mnemonic, dst, lhs, rhs, self.use_reg(op.acc, 0))
+        else:
+            product = reg_name(self.allocation.scratch_regs[0])
+            self.instr("mul", product, lhs, rhs)
+            acc = self.use_reg(op.acc, 1)
+            self.instr("adds" if isinstance(op, ArmMlaOp) else "subs", dst, acc, product)
+        self.store_def(op.res)
+
+    def emit_mvn(self, op: ArmMvnOp):
+        src = self.use_reg(op.reg, 0)
+        dst = self.def_reg(op.res)
+        self.instr("mvns", dst, src)
+        self.store_def(op.res)
+
+    def emit_extend(self, op: Operation):
+        src = self.use_reg(op.reg, 0)
+        dst = self.def_reg(op.res)
+        self.instr(EXTEND_MNEMONICS[type(op)], dst, src)
+        self.store_def(op.res)
+
+    # long multiplies write both halves of the product
+    def emit_mul_long(self, op: ArmSmullOp | ArmUmullOp):
+        lhs = self.use_reg(op.operands[0], 0)
+        rhs = self.use_reg(op.operands[1], 1)
+        lo = self.def_reg(op.lo, 0)
+        hi = self.def_reg(op.hi, 1)
+        mnemonic = "smull" if isinstance(op, ArmSmullOp) else "umull"
+        self.instr(mnemonic, lo, hi, lhs, rhs)
+        self.store_def(op.lo, 0)
+        self.store_def(op.hi, 1)
+
+    #
+    #   Moves
+    #
+    def emit_mov(self, op: ArmMovOp):
+        dst = self.def_reg(op.results[0])
+        imm = op.attributes["imm"].value.data & 0xFFFFFFFF
+
+        # movs is the 16-bit encoding, but only reaches low registers and 8 bits;
+        # the other 16-bit values are movw, as assemblers encode mov of them
+        if not self.thumb2 or (imm <= 0xFF and dst in LOW_REG_NAMES):
+            self.instr("movs", dst, imm)
+        elif is_thumb2_imm(imm) and not 0xFF < imm <= 0xFFFF:
+            self.instr("mov", dst, imm)
+        else:
+            self.instr("movw", dst, imm)
+        self.store_def(op.results[0])
+
+    def emit_mvn_imm(self, op: ArmMvnImmOp):
+        dst = self.def_reg(op.res)
+        self.instr("mvn", dst, op.imm.value.data & 0xFFFFFFFF)
+        self.store_def(op.res)
+
+    def emit_ldr_lit(self, op: ArmLdrLitOp):
+        dst = self.def_reg(op.res)
+        self.instr("ldr", dst, self.literal_label(op.imm.value.data & 0xFFFFFFFF))
+        self.store_def(op.res)
+
+    def emit_movw(self, op: ArmMovwOp):
+        dst = self.def_reg(op.results[0])
+        self.instr("movw", dst, op.attributes["imm"].value.data)
+        self.store_def(op.results[0])
+
+    def emit_movt(self, op: ArmMovtOp):
+        dst = self.use_reg(op.operands[0], 0)
+        self.instr("movt", dst, op.attributes["imm"].value.data)
+        self.store_def(op.results[0])
+
+    def emit_movreg(self, op: ArmMovRegOp):
+        dst = reg_name(RET_REG)
+        src = self.use_reg(op.operands[0], 0)
+
+        # usually coalesced away by the allocator's r0 hint
+        if src != dst:
+            self.instr("movs", dst, src)
+
+    #
+    #   Memory
+    #
+    def emit_frame_addr(self, op: ArmFrameAddrOp):
+        dst = self.def_reg(op.res)
+        self.instr("add", dst, "sp", op.offset.value.data)
+        self.store_def(op.res)
+
+    def address(self, op: Operation, scratch: list[int]) -> Mem:
+        # memory operand of a load or store, reloading spilled registers into
+        # the scratch registers listed
+        if isinstance(op, (ArmFrameLoadOp, ArmFrameStoreOp)):
+            return Mem("sp", op.offset.value.data)
+        if not self.allocation.is_reg(op.base):
+            base, scratch = self.use_reg(op.base, scratch[0]), scratch[1:]
+        else:
+            base = self.use_reg(op.base, 0)
+        if isinstance(op, (ArmLoadOp, ArmStoreOp)):
+            return Mem(base, op.offset.value.data)
+        return Mem(base, index=self.use_reg(op.index, scratch[0]), shift=op.shift.value.data)
+
+    def emit_load(self, op: ArmFrameLoadOp | ArmLoadOp | ArmLoadRegOp):
+        mem = self.address(op, [0, 1])
+        dst = self.def_reg(op.res)
+        self.instr("ldr" + ACCESS_SUFFIXES[op.res.type.width.data], dst, mem)
+        self.store_def(op.res)
+
+    def emit_store(self, op: ArmFrameStoreOp | ArmStoreOp | ArmStoreRegOp):
+        mnemonic = "str" + ACCESS_SUFFIXES[op.width.value.data]
+        spilled = [ssa for ssa in op.operands if not self.allocation.is_reg(ssa)]
+        if len(spilled) < 3:
+            value = self.use_reg(op.value, 0)
+            self.instr(mnemonic, value, self.address(op, [1] if op.value in spilled else [0, 1]))
+            return
+
+        # value, base and index all spilled: add up the address first
+        base, index = self.use_reg(op.base, 1), self.use_reg(op.index, 0)
+        if op.shift.value.data:
+            self.instr("adds", base, base, index, Shift("lsl", op.shift.value.data))
+        else:
+            self.instr("adds", base, base, index)
+        self.instr(mnemonic, self.use_reg(op.value, 0), Mem(base, 0))
+
+# op type -> AsmEmitter method printing it; ops not listed print nothing
+HANDLERS = {
+    **{op_type: AsmEmitter.emit_binary for op_type in BINARY_OPS},
+    **{op_type: AsmEmitter.emit_binary_imm for op_type in BINARY_IMM_OPS},
+    **{op_type: AsmEmitter.emit_shifted for op_type in SHIFTED_OPS},
+    ArmMlaOp:       AsmEmitter.emit_mul_acc,
+    ArmMlsOp:       AsmEmitter.emit_mul_acc,
+    ArmMvnOp:       AsmEmitter.emit_mvn,
+    **{op_type: AsmEmitter.emit_extend for op_type in EXTEND_MNEMONICS},
+    ArmSmullOp:     AsmEmitter.emit_mul_long,
+    ArmUmullOp:     AsmEmitter.emit_mul_long,
+    ArmMovOp:       AsmEmitter.emit_mov,
+    ArmMvnImmOp:    AsmEmitter.emit_mvn_imm,
+    ArmLdrLitOp:    AsmEmitter.emit_ldr_lit,
+    ArmMovwOp:      AsmEmitter.emit_movw,
+    ArmMovtOp:      AsmEmitter.emit_movt,
+    ArmMovRegOp:    AsmEmitter.emit_movreg,
+    ArmRetOp:       AsmEmitter.emit_ret,
+    ArmBranchOp:    AsmEmitter.emit_branch,
+    ArmCmpBranchOp: AsmEmitter.emit_cond_branch,
+    ArmCmpImmBranchOp: AsmEmitter.emit_cond_branch,
+    ArmSelectOp:    AsmEmitter.emit_select,
+    ArmSelectImmOp: AsmEmitter.emit_select,
+    ArmFrameAddrOp: AsmEmitter.emit_frame_addr,
+    ArmFrameLoadOp: AsmEmitter.emit_load,
+    ArmLoadOp:      AsmEmitter.emit_load,
+    ArmFrameStoreOp: AsmEmitter.emit_store,
+    ArmStoreOp:     AsmEmitter.emit_store,
+    ArmLoadRegOp:   AsmEmitter.emit_load,
+    ArmStoreRegOp:  AsmEmitter.emit_store,
+    func.FuncOp:    AsmEmitter.emit_func,
+}
+
+
+def print_asm(module: builtin.ModuleOp, out_file, target: str = DEFAULT_TARGET):
+    """
+    Write module as assembly for target to out_file (any object with write()).
+    """
+    emitter = AsmEmitter(target)
+    emitter.emit_module(module)
+    out_file.write(emitter.text())
@@ -0,0 +1,365 @@
+"""
+Linear scan register allocator for ARM MLIR
+"""
+
+from xdsl.dialects import func
+from xdsl.ir import SSAValue
+
+from src.backend_arm_dialect import *
+
+
+#
+#   Register file (AAPCS)
+#
+ARG_REGS = [0, 1, 2, 3]                         # arguments / return value, caller-saved
+CALLEE_SAVED_REGS = [4, 5, 6, 7, 8, 9, 10, 11]  # must be preserved across calls
+ALLOCATABLE_REGS = ARG_REGS + CALLEE_SAVED_REGS
+SCRATCH_REGS = [12, 14]                         # ip, lr: reserved for spill reloads
+RET_REG = 0
+
+# Thumb-1 data processing only reaches r0-r7; r6/r7 become the scratch
+# registers of functions that keep values on the stack
+THUMB1_REGS = [0, 1, 2, 3, 4, 5, 6, 7]
+THUMB1_SCRATCH_REGS = [6, 7]
+THUMB1_SPILL_REGS = [reg for reg in THUMB1_REGS if reg not in THUMB1_SCRATCH_REGS]
+
+# Thumb-1 ops that only exist in the two-address form op rd, rm (rd = rd op rm)
+# and are not commutative, so their result cannot share a register with rm
+THUMB1_TWO_ADDRESS_OPS = (ArmLslOp, ArmLsrOp, ArmAsrOp, ArmBicOp)
+
+REG_NAMES = {13: "sp", 14: "lr", 15: "pc"}
+
+def reg_name(reg: int) -> str:
+    return REG_NAMES.get(reg, f"r{reg}")
+
+
+#
+#   Live intervals
+#
+class Interval:
+    """
+    Live range of one SSA value (or of several values tied to the same location):
+    sorted, disjoint [start, end] ranges, with holes where the value is dead
+    (e.g. in a block of an if that does not need it, or between its last use
+    in a loop body and the branch back that redefines it).
+
+    Ops are numbered in block layout order, so that op i reads its operands at
+    2*i and writes its results at 2*i + 1, which lets a value die and another be
+    born in the same register at the same instruction (e.g. adds r0, r0, r1).
+    The arguments of a block starting with op i are written at 2*i - 1.
+    """
+
+    def __init__(self, value: SSAValue, start: int, end: int):
+        self.value = value
+        self.ranges = [[start, end]]
+        self.fixed = None   # pre-colored register, if any
+        self.stack_arg = None   # index of incoming stack argument, if any
+        self.hint = None    # preferred register, taken if it is free
+        self.partners = []  # values a branch moves into or out of this one
+
+    @property
+    def start(self) -> int:
+        return self.ranges[0][0]
+
+    @property
+    def end(self) -> int:
+        return self.ranges[-1][1]
+
+    def add_range(self, start: int, end: int):
+        # merge with the ranges it overlaps or touches
+        merged = [start, end]
+        ranges = []
+        for other in self.ranges:
+            if other[1] + 1 < merged[0] or merged[1] + 1 < other[0]:
+                ranges.append(other)
+            else:
+                merged = [min(merged[0], other[0]), max(merged[1], other[1])]
+        ranges.append(merged)
+        ranges.sort()
+        self.ranges = ranges
+
+    def define(self, pos: int):
+        # a definition starts the range that reaches its uses (or is all there is)
+        for live_range in self.ranges:
+            if live_range[0] <= pos <= live_range[1]:
+                live_range[0] = pos
+                return
+        self.add_range(pos, pos)
+
+    def overlaps(self, other: "Interval") -> bool:
+        if self.start > other.end or other.start > self.end:
+            return False
+        i = j = 0
+        while i < len(self.ranges) and j < len(other.ranges):
+            a, b = self.ranges[i], other.ranges[j]
+            if a[0] <= b[1] and b[0] <= a[1]:
+                return True
+            if a[1] < b[1]:
+                i += 1
+            else:
+                j += 1
+        return False
+
+
+#
+#   Allocation result
+#
+class Allocation:
+    """
+    Location of every SSA value of a function: either a register or a stack slot.
+    Stack slots are addressed relative to sp after the prologue has run, above
+    the locals the function keeps in memory.
+    """
+
+    def __init__(self):
+        self.regs = dict()          # SSAValue -> register number
+        self.slots = dict()         # SSAValue -> spill slot index
+        self.stack_args = dict()    # SSAValue -> incoming stack argument index
+        self.num_slots = 0
+        self.locals_size = 0        # bytes of memref locals at the bottom of the frame
+        self.saved_regs = []        # callee-saved registers to push (incl. lr)
+        self.scratch_regs = SCRATCH_REGS    # registers spilled values are reloaded into
+
+    def is_reg(self, ssa: SSAValue) -> bool:
+        return ssa in self.regs
+
+    def frame_size(self) -> int:
+        # keep sp 8-byte aligned (AAPCS) across the pushed registers, the locals
+        # and the spill area; without either there is no frame to align, as
+        # functions make no calls
+        size = self.locals_size + 4 * self.num_slots
+        if size and (4 * len(self.saved_regs) + size) % 8 != 0:
+            size += 4
+        return size
+
+    def stack_offset(self, ssa: SSAValue) -> int:
+        if ssa in self.slots:
+            return self.locals_size + 4 * self.slots[ssa]
+
+        # incoming stack arguments sit above the pushed registers and our frame
+        idx = self.stack_args[ssa]
+        return self.frame_size() + 4 * len(self.saved_regs) + 4 * idx
+
+
+#
+#   Liveness analysis
+#
+def successors(block) -> list:
+    return list(block.last_op.successors) if block.last_op is not None else []
+
+def build_intervals(func_op: func.FuncOp, target: str = DEFAULT_TARGET):
+    intervals = dict()  # SSAValue -> Interval
+    tied = dict()       # SSAValue -> SSAValue it must share a location with
+
+    def root(ssa):
+        while ssa in tied:
+            ssa = tied[ssa]
+        return ssa
+
+    # number the ops in layout order, with an (empty) interval per value in
+    # definition order; movt writes into its own operand register, and a cast
+    # is its operand read as another type
+    blocks = list(func_op.body.blocks)
+    first = dict()      # block -> position its arguments are written at
+    last = dict()       # block -> position its terminator reads at
+    positions = dict()  # op -> i
+    i = 0
+    for block in blocks:
+        first[block] = 2 * i + 1
+        values = list(block.args)
+        for op in block.ops:
+            i += 1
+            positions[op] = i
+            if isinstance(op, (ArmMovtOp, ArmCastOp)):
+                tied[op.res] = op.reg
+            else:
+                values += op.results
+        for ssa in values:
+            intervals[ssa] = Interval(ssa, 0, 0)
+            intervals[ssa].ranges = []
+        last[block] = 2 * i
+
+    # values live on entry to each block, until nothing changes (loops)
+    live_in = {block: set() for block in blocks}
+    changed = True
+    while changed:
+        changed = False
+        for block in reversed(blocks):
+            live = set().union(*(live_in[succ] for succ in successors(block)))
+            for op in reversed(list(block.ops)):
+                live -= {root(res) for res in op.results}
+                live |= {root(operand) for operand in op.operands}
+            live -= set(block.args)
+            if live != live_in[block]:
+                live_in[block] = live
+                changed = True
+
+    def interval(ssa) -> Interval:
+        return intervals[ssa]
+
+    for block in reversed(blocks):
+        start = first[block]
+
+        # what a successor needs lives through the whole block ...
+        for ssa in set().union(*(live_in[succ] for succ in successors(block))):
+            interval(ssa).add_range(start, last[block])
+
+        # ... and the rest from the block start (or its definition) to its last use
+        for op in reversed(list(block.ops)):
+            i = positions[op]
+            for res in op.results:
+                if not isinstance(op, (ArmMovtOp, ArmCastOp)):
+                    interval(res).define(2 * i + 1)
+            for operand in op.operands:
+                interval(root(operand)).add_range(start, 2 * i)
+
+            # keep the second operand of a Thumb-1 two-address op alive across its write
+            if not is_thumb2(target) and isinstance(op, THUMB1_TWO_ADDRESS_OPS):
+                interval(root(op.operands[1])).add_range(start, 2 * i + 1)
+            if isinstance(op, ArmMovtOp):
+                interval(root(op.reg)).add_range(start, 2 * i + 1)
+
+            # the returned value is copied into r0, so try to compute it there
+            if isinstance(op, ArmMovRegOp):
+                interval(op.res).fixed = RET_REG
+                interval(root(op.reg)).hint = RET_REG
+
+            # branches move their operands into the arguments of their successor
+            if isinstance(op, ArmBranchOp):
+                for operand, arg in zip(op.args, op.dest.args):
+                    interval(root(operand)).partners.append(arg)
+                    interval(arg).partners.append(root(operand))
+
+        for arg in block.args:
+            interval(arg).define(start)
+
+    # function arguments arrive in r0-r3, then on the stack
+    for idx, arg in enumerate(blocks[0].args):
+        if idx < len(ARG_REGS):
+            intervals[arg].fixed = ARG_REGS[idx]
+        else:
+            intervals[arg].stack_arg = idx - len(ARG_REGS)
+
+    # values moved into one another by branches prefer the same register
+    pending = [iv for iv in intervals.values() if iv.hint is not None]
+    while pending:
+        iv = pending.pop()
+        for partner in iv.partners:
+            if intervals[partner].hint is None:
+                intervals[partner].hint = iv.hint
+                pending.append(intervals[partner])
+
+    return intervals, tied
+
+
+#
+#   Linear scan
+#
+def allocate(func_op: func.FuncOp, target: str = DEFAULT_TARGET) -> Allocation:
+    allocation = allocate_regs(func_op, target)
+    if LOCALS_ATTR in func_op.attributes:
+        allocation.locals_size = func_op.attributes[LOCALS_ATTR].value.data
+    return allocation
+
+def allocate_regs(func_op: func.FuncOp, target: str) -> Allocation:
+    if is_thumb2(target):
+        return linear_scan(func_op, target, ALLOCATABLE_REGS, SCRATCH_REGS)
+
+    # Thumb-1: use all eight low registers unless something lives on the stack,
+    # in which case two of them are set aside to reload it
+    allocation = linear_scan(func_op, target, THUMB1_REGS, [])
+    if allocation.slots or allocation.stack_args:
+        allocation = linear_scan(func_op, target, THUMB1_SPILL_REGS, THUMB1_SCRATCH_REGS)
+    return allocation
+
+def linear_scan(func_op: func.FuncOp, target: str, regs: list[int], scratch_regs: list[int]) -> Allocation:
+    intervals, tied = build_intervals(func_op, target)
+    allocation = Allocation()
+    allocation.scratch_regs = scratch_regs
+
+    fixed = [iv for iv in intervals.values() if iv.fixed is not None]
+    unhandled = sorted((iv for iv in intervals.values() if iv.stack_arg is None),
+                       key=lambda iv: (iv.start, iv.fixed is None))
+    active = []         # intervals currently holding a register
+    slot_users = []     # spill slot index -> intervals stored in it
+
+    def assign_slot(interval):
+        # reuse a slot none of whose users overlap this interval
+        for slot, users in enumerate(slot_users):
+            if not any(iv.overlaps(interval) for iv in users):
+                break
+        else:
+            slot = len(slot_users)
+            slot_users.append([])
+        slot_users[slot].append(interval)
+        allocation.slots[interval.value] = slot
+        allocation.num_slots = len(slot_users)
+
+    for interval in intervals.values():
+        if interval.stack_arg is not None:
+            allocation.stack_args[interval.value] = interval.stack_arg
+
+    for cur in unhandled:
+
+        # expire old intervals (the others may still be in a hole)
+        for iv in [iv for iv in active if iv.end < cur.start]:
+            active.remove(iv)
+
+        if cur.fixed is not None:
+            allocation.regs[cur.value] = cur.fixed
+            active.append(cur)
+            continue
+
+        # registers held by live values or reserved by upcoming fixed intervals
+        live = [iv for iv in active if iv.overlaps(cur)]
+        busy = {allocation.regs[iv.value] for iv in live}
+        reserved = {iv.fixed for iv in fixed if iv.overlaps(cur)}
+        free = [reg for reg in regs if reg not in busy | reserved]
+
+        if free:
+            # the register of a value a branch moves it to or from saves the move
+            preferred = [allocation.regs.get(partner) for partner in cur.partners] + [cur.hint]
+            allocation.regs[cur.value] = next((reg for reg in preferred if reg in free), free[0])
+            active.append(cur)
+            continue
+
+        # no free register: spill the interval that ends furthest away, if it
+        # alone keeps its register from cur
+        holders = dict()
+        for iv in live:
+            holders.setdefault(allocation.regs[iv.value], []).append(iv)
+        candidates = [ivs[0] for reg, ivs in holders.items()
+                      if len(ivs) == 1 and ivs[0].fixed is None and reg not in reserved]
+        victim = max(candidates, key=lambda iv: iv.end, default=None)
+        if victim is not None and victim.end > cur.end:
+            reg = allocation.regs.pop(victim.value)
+            active.remove(victim)
+            assign_slot(victim)
+            allocation.regs[cur.value] = reg
+            active.append(cur)
+        else:
+            assign_slot(cur)
+
+    # values tied to another one share its location
+    for ssa in tied:
+        src = ssa
+        while src in tied:
+            src = tied[src]
+        if src in allocation.regs:
+            allocation.regs[ssa] = allocation.regs[src]
+        elif src in allocation.slots:
+            allocation.slots[ssa] = allocation.slots[src]
+        else:
+            allocation.stack_args[ssa] = allocation.stack_args[src]
+
+    # callee-saved registers that were used (scratch ones included) must be
+    # preserved, and lr is clobbered whenever a spill reload needs a second
+    # scratch register
+    used = set(allocation.regs.values())
+    if allocation.slots or allocation.stack_args:
+        used |= set(scratch_regs)
+    allocation.saved_regs = [reg for reg in CALLEE_SAVED_REGS if reg in used]
+    if allocation.saved_regs or allocation.slots or allocation.stack_args:
+        allocation.saved_regs.append(14)
+
+    return allocation
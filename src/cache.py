@@ -0,0 +1,99 @@
+"""
+Content-addressed on-disk cache for compilation results
+"""
+
+import os, hashlib, shutil, tempfile
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+def default_cache_dir() -> str:
+    if "PCC_CACHE_DIR" in os.environ:
+        return os.environ["PCC_CACHE_DIR"]
+    base = os.environ.get("XDG_CACHE_HOME", os.path.join(os.path.expanduser("~"), ".cache"))
+    return os.path.join(base, "pcc")
+
+def hash_parts(*parts) -> str:
+    h = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, str):
+            part = part.encode()
+        # length prefix so ("ab", "c") and ("a", "bc") hash differently
+        h.update(len(part).to_bytes(8, "little"))
+        h.update(part)
+    return h.hexdigest()
+
+def file_identity(path: str) -> str:
+    """
+    Cheap identity of a file (e.g. the cgeist binary): resolved path, size and mtime.
+    """
+    try:
+        path = os.path.realpath(path)
+        st = os.stat(path)
+    except OSError:
+        return path
+    return f"{path}:{st.st_size}:{st.st_mtime_ns}"
+
+
+class Cache:
+    """
+    Each entry is a directory named after its key, holding one file per artifact.
+    Reading an entry refreshes its mtime, which evict() uses as LRU order.
+    """
+
+    def __init__(self, root: str, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+
+    def entry_dir(self, key: str) -> str:
+        return os.path.join(self.root, key[:2], key)
+
+    def get(self, key: str, name: str) -> str | None:
+        path = os.path.join(self.entry_dir(key), name)
+        try:
+            with open(path, "r") as f:
+                data = f.read()
+        except OSError:
+            return None
+
+        try:
+            os.utime(self.entry_dir(key))
+        except OSError:
+            pass
+        return data
+
+    def put(self, key: str, name: str, data: str):
+        entry = self.entry_dir(key)
+        os.makedirs(entry, exist_ok=True)
+
+        # write to a temporary file first so concurrent readers never see partial data
+        fd, tmp_path = tempfile.mkstemp(dir=entry, prefix=".tmp-")
+        with os.fdopen(fd, "w") as f:
+            f.write(data)
+        os.replace(tmp_path, os.path.join(entry, name))
+
+    def evict(self):
+        """
+        Delete least recently used entries until the cache fits in max_bytes.
+        """
+        entries = []
+        total = 0
+        if not os.path.isdir(self.root):
+            return
+
+        for shard in os.scandir(self.root):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                try:
+                    size = sum(f.stat().st_size for f in os.scandir(entry.path))
+                    entries.append((entry.stat().st_mtime, size, entry.path))
+                except OSError:
+                    continue
+                total += size
+
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
@@ -0,0 +1,447 @@
+"""
+Compilation driver: runs the whole picoC -> ARM assembly pipeline for one file
+"""
+
+import io, os, subprocess, textwrap, multiprocessing
+from typing import Callable
+from xdsl.context import Context
+from xdsl.dialects import builtin, func, arith, memref, scf
+from xdsl.transforms.common_subexpression_elimination import cse
+from xdsl.transforms.dead_code_elimination import dce
+
+from src.backend_optimization import *
+from src.backend_memory import *
+from src.backend_arm_dialect import *
+from src.backend_control_flow import *
+from src.backend_peephole import *
+from src.backend_printer import *
+from src.backend_object import *
+from src.cache import *
+from src.frontend_mlir import *
+from src.frontend_picoc import *
+from src.jobs import *
+from src.passes import *
+from src.simulator import *
+
+
+class CompileError(Exception):
+    pass
+
+def make_context() -> Context:
+    # initialize xDSL Context and load all dialects
+    context = Context()
+    context.load_dialect(builtin.Builtin)
+    context.load_dialect(func.Func)
+    context.load_dialect(arith.Arith)
+    context.load_dialect(memref.MemRef)
+    context.load_dialect(scf.Scf)
+    context.load_dialect(ArmDialect)
+    return context
+
+def get_cgeist_path(options: Options) -> str:
+    if options.cgeist_path is not None:
+        return options.cgeist_path
+
+    # Important: this environment variable must be set to find cgeist!
+    # export CGEIST_PATH=~/Documents/Polygeist/build/bin
+    if "CGEIST_PATH" not in os.environ:
+        raise CompileError("CGEIST_PATH environment variable must be set.")
+    return os.environ.get('CGEIST_PATH')
+
+def run_cgeist(in_file: str, mlir_filepath: str, cgeist_path: str):
+    # convert C to high-level MLIR with a subprocess for Polygeist
+    ret = subprocess.call([cgeist_path + "/cgeist",
+                           in_file, "-S", "-O0",
+                           "-o", mlir_filepath])
+    if ret != 0:
+        raise CompileError(f"cgeist failed to compile file {in_file} with exit code {ret}")
+
+# computed once per process by pipeline_version
+pipeline_hash = None
+
+def pipeline_version() -> str:
+    """
+    Hash of the backend sources, so cached results are invalidated whenever the
+    optimization, lowering or printing code changes.
+    """
+    global pipeline_hash
+    if pipeline_hash is None:
+        src_dir = os.path.dirname(os.path.abspath(__file__))
+        sources = []
+        for name in sorted(os.listdir(src_dir)):
+            if name.endswith(".py"):
+                with open(os.path.join(src_dir, name), "r") as f:
+                    sources.append(f.read())
+        pipeline_hash = hash_parts(*sources)
+    return pipeline_hash
+
+
+def write_file(filename: str, text: str):
+    with open(filename, "w+") as f:
+        f.write(text)
+
+def write_object_file(filename: str, code_text: str, target: str):
+    # the ELF object of the functions in code_text (see dump_code)
+    with open(filename, "wb") as f:
+        f.write(elf_object(load_code(code_text), target))
+
+def run_cgeist_frontend(in_file: str, out_filename: str, options: Options,
+                        cache: Cache | None) -> tuple[Callable[[Context], builtin.ModuleOp], str | None]:
+    """
+    Run cgeist on in_file. Returns a function that ingests its output into a
+    ModuleOp, and the frontend cache key (None without a cache).
+    """
+    mlir_filepath = f"{out_filename}.mlir"
+    cgeist_path = get_cgeist_path(options)
+
+    key = None
+    if cache is not None:
+        with open(in_file, "rb") as f:
+            source = f.read()
+        key = hash_parts("frontend", source, file_identity(cgeist_path + "/cgeist"))
+        if (mlir_text := cache.get(key, "filtered.mlir")) is not None:
+            write_file(mlir_filepath, mlir_text)
+            return lambda context: parse_mlir(context, io.StringIO(mlir_text)), key
+
+    run_cgeist(in_file, mlir_filepath, cgeist_path)
+
+    # the cache needs the filtered text; otherwise stream the file straight into the parser
+    if cache is not None:
+        with open(mlir_filepath, "r") as f:
+            mlir_text = "".join(filter_mlir(f))
+        cache.put(key, "filtered.mlir", mlir_text)
+        return lambda context: parse_mlir(context, io.StringIO(mlir_text)), key
+
+    def load(context: Context) -> builtin.ModuleOp:
+        with open(mlir_filepath, "r") as f:
+            return parse_mlir(context, f)
+    return load, key
+
+def run_frontend(in_file: str, out_filename: str, options: Options,
+                 cache: Cache | None) -> tuple[Callable[[Context], builtin.ModuleOp], str | None]:
+    """
+    Run the selected front-end on in_file. Returns a function producing the
+    ModuleOp (so a backend cache hit never has to parse cgeist's output) and
+    the frontend cache key.
+    """
+    if options.frontend != "cgeist":
+        with open(in_file, "r") as f:
+            source = f.read()
+        try:
+            module = parse_picoc(source)
+        except FrontendError as e:
+            if options.frontend == "native":
+                raise CompileError(f"native front-end: {e}")
+
+            # auto: fall back to cgeist for anything outside the native subset
+            if options.cgeist_path is None and "CGEIST_PATH" not in os.environ:
+                raise CompileError(f"native front-end: {e} (set CGEIST_PATH to fall back to cgeist)")
+        else:
+            if options.emit_all:
+                write_file(f"{out_filename}.mlir", str(module) + "\n")
+            key = hash_parts("native", source) if cache is not None else None
+            return lambda context: module, key
+
+    return run_cgeist_frontend(in_file, out_filename, options, cache)
+
+# the backend pipeline, split where -optimized.mlir is written
+def optimization_passes(target: str = DEFAULT_TARGET) -> list[Pass]:
+    return [
+        Pass("mem2reg", promote_locals),    # memref locals to SSA values
+        Pass("canonicalize", patterns=optimization_patterns(target)),
+        Pass("cse", cse),             # common subexpression elimination
+        Pass("dce", dce),             # dead code elimination
+    ]
+
+def lowering_passes(target: str = DEFAULT_TARGET) -> list[Pass]:
+    return [
+        Pass("frame-layout", lambda module: layout_frame(module, target)),
+        Pass("lower-fused", patterns=frame_lowering_patterns(target) + fused_lowering_patterns(target)),
+        Pass("lower", patterns=lowering_patterns(target)),
+        Pass("peephole", patterns=peephole_patterns(target)),
+        Pass("lower-cf", lambda module: lower_control_flow(module, target)),
+        Pass("constant-reuse", lambda module: reuse_constants(module, target)),
+    ]
+
+def fused_passes(target: str = DEFAULT_TARGET) -> list[Pass]:
+    # the same pipeline, with everything but constant reuse done in a single walk
+    lowering = (frame_lowering_patterns(target) + fused_lowering_patterns(target) + lowering_patterns(target)
+                + peephole_patterns(target))
+    return [
+        Pass("mem2reg", promote_locals),
+        Pass("frame-layout", lambda module: layout_frame(module, target)),
+        Pass("fused", phases=(optimization_patterns(target), lowering)),
+        Pass("lower-cf", lambda module: lower_control_flow(module, target)),
+        Pass("constant-reuse", lambda module: reuse_constants(module, target)),
+    ]
+
+#
+#   Function units: per-function parallelism and reuse
+#
+# functions of the module being compiled, inherited by the forked workers
+split_functions = None
+
+def can_split(module: builtin.ModuleOp) -> bool:
+    """
+    Whether module can be compiled one function at a time: it holds nothing
+    but functions (which never reference each other's values).
+    """
+    ops = list(module.ops)
+    return len(ops) > 0 and all(isinstance(op, func.FuncOp) for op in ops)
+
+def module_text(func_texts: list[str]) -> str:
+    # what str() prints for a module holding these functions
+    body = "\n".join(textwrap.indent(text, "  ") for text in func_texts)
+    return f"builtin.module {{\n{body}\n}}\n"
+
+def compile_function(job: tuple[int, str, bool, bool, bool, bool]) -> tuple[dict[str, str], dict | None]:
+    """
+    Worker entry point: run the backend on function idx alone, as a module of
+    its own. Returns its artifacts (the assembly without file header, plus its
+    optimized and ARM MLIR with emit_all and its machine code with emit_obj)
+    and the pass report.
+    """
+    idx, target, emit_all, collect_stats, fused_walk, emit_obj = job
+    func_op = split_functions[idx]
+    func_op.detach()
+    module = builtin.ModuleOp([func_op])
+    artifacts = dict()
+
+    pass_manager = PassManager(collect=collect_stats)
+    if fused_walk and not emit_all:
+        pass_manager.run(module, fused_passes(target))
+    else:
+        pass_manager.run(module, optimization_passes(target))
+        if emit_all:
+            artifacts["optimized.mlir"] = str(func_op)
+        pass_manager.run(module, lowering_passes(target))
+        if emit_all:
+            artifacts["arm.mlir"] = str(func_op)
+
+    with pass_manager.stage("print-asm"):
+        emitter = (ObjectEmitter if emit_obj else AsmEmitter)(target, header=False)
+        emitter.emit_module(module)
+    artifacts["asm.s"] = emitter.text()
+    if emit_obj:
+        artifacts["code"] = dump_code(emitter.functions)
+    return artifacts, pass_manager.report()
+
+def compile_functions(module: builtin.ModuleOp, options: Options, pass_manager: PassManager,
+                      num_workers: int, cache: Cache | None) -> dict[str, str]:
+    """
+    Compile module one function at a time and stitch the results together in
+    source order; the output is the same as compiling the module as a whole.
+    Functions whose IR was compiled before by the same pipeline are taken from
+    the cache, and the others are spread over num_workers forked processes.
+    Returns the artifacts of the whole module, by cache name.
+    """
+    global split_functions
+    functions = list(module.ops)
+    names = ["asm.s"] + (["optimized.mlir", "arm.mlir"] if options.emit_all else [])
+    names += ["code"] if options.emit_obj else []
+    results = [None] * len(functions)
+    keys = [None] * len(functions)
+
+    # fingerprint every function and reuse what is cached
+    if cache is not None:
+        with pass_manager.stage("function-cache"):
+            for idx, func_op in enumerate(functions):
+                keys[idx] = hash_parts("function", str(func_op), pipeline_version(), options.key())
+                cached = {name: cache.get(keys[idx], name) for name in names}
+                if all(text is not None for text in cached.values()):
+                    results[idx] = cached
+
+    todo = [idx for idx, artifacts in enumerate(results) if artifacts is None]
+    jobs = [(idx, options.target, options.emit_all, options.collect_stats, options.fused_walk,
+             options.emit_obj) for idx in todo]
+    split_functions = functions
+    try:
+        if num_workers > 1 and len(jobs) > 1 and "fork" in multiprocessing.get_all_start_methods():
+            chunksize = max(1, len(jobs) // (4 * num_workers))
+            with multiprocessing.get_context("fork").Pool(num_workers) as pool:
+                compiled = pool.map(compile_function, jobs, chunksize=chunksize)
+        else:
+            compiled = [compile_function(job) for job in jobs]
+    finally:
+        split_functions = None
+
+    for idx, (artifacts, report) in zip(todo, compiled):
+        results[idx] = artifacts
+        pass_manager.merge(report)
+        if cache is not None:
+            for name, text in artifacts.items():
+                cache.put(keys[idx], name, text)
+
+    header = "\n".join(file_header(options.target)) + "\n"
+    stitched = {"asm.s": header + "".join(artifacts["asm.s"] for artifacts in results)}
+    for name in names[1:]:
+        if name == "code":
+            stitched[name] = "".join(artifacts[name] for artifacts in results)
+        else:
+            stitched[name] = module_text([artifacts[name] for artifacts in results])
+    return stitched
+
+
+def compile_file(context: Context, in_file: str, out_filename: str, options: Options,
+                 num_workers: int = 1) -> dict | None:
+    """
+    Compile in_file (a .c file) and write <out_filename>.s, plus the intermediate
+    <out_filename>.mlir (cgeist, or native front-end with emit_all),
+    -optimized.mlir / -arm.mlir with emit_all and the object <out_filename>.o
+    with emit_obj. With num_workers > 1 its
+    functions are compiled in parallel, and with a cache unchanged functions
+    are reused. Returns the pass report when options.collect_stats is set.
+    """
+    emit_all = options.emit_all
+    cache = None
+    if options.cache_dir is not None:
+        cache = Cache(options.cache_dir, options.cache_max_bytes)
+    pass_manager = PassManager(collect=options.collect_stats)
+
+    with pass_manager.stage("frontend"):
+        load_module, frontend_key = run_frontend(in_file, out_filename, options, cache)
+
+    # reuse the outputs of an identical earlier compilation
+    artifacts = ["asm.s"] + (["optimized.mlir", "arm.mlir"] if emit_all else [])
+    artifacts += ["code"] if options.emit_obj else []
+    if cache is not None:
+        key = hash_parts("backend", frontend_key, pipeline_version(), options.key())
+        cached = [cache.get(key, name) for name in artifacts]
+        if all(text is not None for text in cached):
+            write_file(f"{out_filename}.s", cached[0])
+            if emit_all:
+                write_file(f"{out_filename}-optimized.mlir", cached[1])
+                write_file(f"{out_filename}-arm.mlir", cached[2])
+            if options.emit_obj:
+                write_object_file(f"{out_filename}.o", cached[-1], options.target)
+            return pass_manager.report()
+
+    # parse filtered text into ModuleOp
+    with pass_manager.stage("parse"):
+        module = load_module(context)
+
+    # one function at a time, to reuse unchanged functions or spread them over workers
+    if (cache is not None or num_workers > 1) and can_split(module):
+        stitched = compile_functions(module, options, pass_manager, num_workers, cache)
+        write_file(f"{out_filename}.s", stitched["asm.s"])
+        if emit_all:
+            write_file(f"{out_filename}-optimized.mlir", stitched["optimized.mlir"])
+            write_file(f"{out_filename}-arm.mlir", stitched["arm.mlir"])
+        if options.emit_obj:
+            write_object_file(f"{out_filename}.o", stitched["code"], options.target)
+        if cache is not None:
+            for name in artifacts:
+                cache.put(key, name, stitched[name])
+        return pass_manager.report()
+
+    # optimize and lower MLIR to ARM dialect in one walk (there is no optimized
+    # MLIR to write then)
+    if options.fused_walk and not emit_all:
+        pass_manager.run(module, fused_passes(options.target))
+
+    else:
+        # apply optimizations
+        pass_manager.run(module, optimization_passes(options.target))
+        if (emit_all):
+            optimized_text = str(module) + "\n"
+            write_file(f"{out_filename}-optimized.mlir", optimized_text)
+
+        # lower MLIR to ARM dialect
+        pass_manager.run(module, lowering_passes(options.target))
+        if (emit_all):
+            arm_text = str(module) + "\n"
+            write_file(f"{out_filename}-arm.mlir", arm_text)
+
+    # print ARM assembly, encoding it on the way with emit_obj
+    if options.emit_obj:
+        with pass_manager.stage("print-asm"):
+            emitter = ObjectEmitter(options.target)
+            emitter.emit_module(module)
+        asm_text = emitter.text()
+        code_text = dump_code(emitter.functions)
+        write_object_file(f"{out_filename}.o", code_text, options.target)
+    else:
+        buffer = io.StringIO()
+        with pass_manager.stage("print-asm"):
+            print_asm(module, out_file=buffer, target=options.target)
+        asm_text = buffer.getvalue()
+    write_file(f"{out_filename}.s", asm_text)
+
+    if cache is not None:
+        cache.put(key, "asm.s", asm_text)
+        if emit_all:
+            cache.put(key, "optimized.mlir", optimized_text)
+            cache.put(key, "arm.mlir", arm_text)
+        if options.emit_obj:
+            cache.put(key, "code", code_text)
+
+    return pass_manager.report()
+
+
+#
+#   Simulation
+#
+def simulate_file(context: Context, in_file: str, out_filename: str, options: Options,
+                  runs: int, seed: int = 0) -> list[FunctionCheck]:
+    """
+    Run every function of the compiled <out_filename>.s in the simulator on runs
+    seeded argument sets, checking each result against the reference
+    interpreter of in_file's IR before and after optimization. Raises
+    SimulationError on the first mismatch.
+    """
+    cache = None
+    if options.cache_dir is not None:
+        cache = Cache(options.cache_dir, options.cache_max_bytes)
+    load_module, _ = run_frontend(in_file, out_filename, options, cache)
+    source = load_module(context)
+    optimized = source.clone()
+    PassManager().run(optimized, optimization_passes(options.target))
+
+    with open(f"{out_filename}.s", "r") as f:
+        asm_text = f.read()
+    return check_module(source, optimized, asm_text, options.target, runs, seed)
+
+
+#
+#   Batch compilation
+#
+# one Context per worker process, created once by init_worker
+worker_context = None
+
+def init_worker():
+    global worker_context
+    worker_context = make_context()
+
+def compile_job(job: tuple[str, str, Options], num_workers: int = 1) -> tuple[str, str | None, dict | None]:
+    """
+    Worker entry point: returns (input file, error message or None, pass report or None).
+    num_workers > 1 compiles the functions of the file in parallel.
+    """
+    in_file, out_filename, options = job
+    try:
+        os.makedirs(os.path.dirname(out_filename) or ".", exist_ok=True)
+        report = compile_file(worker_context, in_file, out_filename, options, num_workers)
+    except CompileError as e:
+        return in_file, str(e), None
+    except Exception as e:
+        return in_file, f"{type(e).__name__}: {e}", None
+    return in_file, None, report
+
+def compile_batch(jobs: list[tuple[str, str, Options]], num_workers: int,
+                  pool=None) -> list[tuple[str, str | None, dict | None]]:
+    """
+    Compile all jobs, in parallel when num_workers > 1 (reusing pool if given).
+    Results keep the job order.
+    """
+    # with fewer files than workers, compile one file at a time and spread
+    # its functions over the workers instead; those are forked from this
+    # process, as the daemonic workers of a pool cannot start their own
+    if num_workers <= 1 or len(jobs) < num_workers:
+        if worker_context is None:
+            init_worker()
+        return [compile_job(job, num_workers) for job in jobs]
+
+    if pool is not None:
+        return pool.map(compile_job, jobs, chunksize=1)
+    with multiprocessing.Pool(num_workers, initializer=init_worker) as pool:
+        return pool.map(compile_job, jobs, chunksize=1)
@@ -0,0 +1,131 @@
+"""
+Streaming ingestion of cgeist's MLIR output: strips attribute dictionaries
+(brace-aware, so nested dlti specs are handled) and parses the module one
+top-level op at a time, in a single pass over the input lines.
+"""
+
+import re
+from typing import Iterable, Iterator
+from xdsl.context import Context
+from xdsl.dialects import builtin
+from xdsl.parser import Parser
+
+# string literals, the `attributes` keyword and braces are all we care about;
+# MLIR string literals never span lines, so the input can be scanned line by line
+TOKEN_RE = re.compile(r'"(?:[^"\\\n]|\\.)*"|(?<![\w%@#$.!^])attributes\b|[{}]')
+MODULE_RE = re.compile(r"\s*(builtin\.)?module\b")
+
+
+class MLIRFilter:
+    """
+    Line-by-line state machine. feed() takes one input line and returns the
+    filtered text; top-level ops (the children of the module) are collected
+    and can be taken with pop_ops() as soon as they are complete.
+    """
+
+    def __init__(self):
+        self.depth = 0              # brace depth outside attribute dictionaries
+        self.attr_depth = None      # depth at which the dictionary being dropped started
+        self.pending_attr = False   # saw `attributes`, waiting for its `{`
+        self.base_depth = 0         # depth of the module body (1 once `module {` is seen)
+        self.in_module_header = False
+        self.op_lines = []          # text of the top-level op being collected
+        self.ops = []               # completed top-level ops
+
+    def feed(self, line: str) -> str:
+        start_depth = self.depth
+        out = []
+        pos = 0
+
+        # module header: `module attributes {...} {` -> `builtin.module {`
+        if self.depth == 0 and self.attr_depth is None and MODULE_RE.match(line):
+            self.in_module_header = True
+
+        for m in TOKEN_RE.finditer(line):
+            tok = m.group()
+
+            # inside a dropped attribute dictionary: only braces matter
+            if self.attr_depth is not None:
+                if tok == "{":
+                    self.depth += 1
+                elif tok == "}":
+                    self.depth -= 1
+                    if self.depth == self.attr_depth:
+                        self.attr_depth = None
+                pos = m.end()
+                continue
+
+            if self.pending_attr:
+                self.pending_attr = False
+                if tok == "{":
+                    self.attr_depth = self.depth
+                    self.depth += 1
+                    pos = m.end()
+                    continue
+                # not a dictionary after all: keep the keyword
+                out.append("attributes")
+
+            if tok == "attributes":
+                out.append(line[pos:m.start()].rstrip(" "))
+                self.pending_attr = True
+                pos = m.end()
+                continue
+
+            if tok == "{":
+                if self.in_module_header:
+                    out = ["builtin.module {"]
+                    pos = m.end()
+                    self.in_module_header = False
+                    self.base_depth = self.depth + 1
+                self.depth += 1
+            elif tok == "}":
+                self.depth -= 1
+
+        if self.attr_depth is None:
+            rest = line[pos:]
+            if self.pending_attr and rest.strip():
+                out.append("attributes")
+                self.pending_attr = False
+            out.append(rest)
+        text = "".join(out)
+
+        self.collect(text, start_depth)
+        return text
+
+    def collect(self, text: str, start_depth: int):
+        # lines inside the module body belong to the current top-level op,
+        # which is complete once we are back at the module body depth
+        if start_depth < self.base_depth or self.depth < self.base_depth:
+            return
+        if start_depth == self.base_depth and not text.strip():
+            return
+        self.op_lines.append(text)
+        if self.depth == self.base_depth and self.attr_depth is None and not self.pending_attr:
+            self.ops.append("".join(self.op_lines))
+            self.op_lines = []
+
+    def pop_ops(self) -> list[str]:
+        ops, self.ops = self.ops, []
+        return ops
+
+
+def filter_mlir(lines: Iterable[str]) -> Iterator[str]:
+    """
+    Yield the filtered text of each input line.
+    """
+    mlir_filter = MLIRFilter()
+    for line in lines:
+        yield mlir_filter.feed(line)
+
+def parse_mlir(context: Context, lines: Iterable[str]) -> builtin.ModuleOp:
+    """
+    Filter and parse MLIR text into a ModuleOp, parsing each top-level op as soon
+    as its text is complete so only one function's text is held at a time.
+    """
+    mlir_filter = MLIRFilter()
+    module = builtin.ModuleOp([])
+    for line in lines:
+        mlir_filter.feed(line)
+        for op_text in mlir_filter.pop_ops():
+            module.body.block.add_op(Parser(context, op_text).parse_op())
+    return module
@@ -0,0 +1,948 @@
+"""
+Native picoC front-end: lexes and parses picoC and builds func/arith/scf MLIR directly
+"""
+
+import re
+from contextlib import contextmanager
+from xdsl.dialects import arith, builtin, func, scf
+from xdsl.ir import Block, Region, SSAValue
+
+
+class FrontendError(Exception):
+    """
+    Raised for syntax errors and for C constructs outside the picoC subset.
+    """
+    pass
+
+
+#
+#   C types: (width in bits, signed)
+#
+INT = (32, True)
+UINT = (32, False)
+CHAR = (8, True)
+UCHAR = (8, False)
+VOID = (0, True)
+BOOL = (1, False)   # comparisons and logical operators, before they are used as ints
+
+def mlir_type(ctype):
+    return builtin.IntegerType(ctype[0])
+
+def wrap(value: int, ctype) -> int:
+    # two's complement wraparound, kept in the signed range like cgeist prints it
+    width = ctype[0]
+    value &= (1 << width) - 1
+    if value >= 1 << (width - 1):
+        value -= 1 << width
+    return value
+
+
+#
+#   Lexer
+#
+TOKEN_RE = re.compile(r"""
+    (?P<space>\s+|//[^\n]*|/\*.*?\*/)
+  | (?P<number>0[xX][0-9a-fA-F]+[uUlL]*|\d+[uUlL]*)
+  | (?P<char>'(\\.|[^\\'])')
+  | (?P<ident>[A-Za-z_]\w*)
+  | (?P<op><<=|>>=|\+\+|--|<<|>>|<=|>=|==|!=|&&|\|\||[-+*/%&|^]=|[-+*/%&|^~=(){},;<>!?:])
+  | (?P<other>.)
+""", re.VERBOSE | re.DOTALL)
+
+CHAR_ESCAPES = {"n": 10, "t": 9, "r": 13, "0": 0, "\\": 92, "'": 39, "\"": 34}
+
+class Token:
+
+    def __init__(self, kind: str, text: str, line: int):
+        self.kind = kind
+        self.text = text
+        self.line = line
+
+def tokenize(source: str) -> list[Token]:
+    tokens = []
+    line = 1
+    for m in TOKEN_RE.finditer(source):
+        kind, text = m.lastgroup, m.group()
+        if kind == "other":
+            if text == "#":
+                raise FrontendError(f"line {line}: preprocessor directives are not supported")
+            raise FrontendError(f"line {line}: unexpected character '{text}'")
+        if kind != "space":
+            tokens.append(Token(kind, text, line))
+        line += text.count("\n")
+    tokens.append(Token("eof", "", line))
+    return tokens
+
+
+#
+#   Parser / IR builder
+#
+class Branch:
+    """
+    One region of an scf.if being built: its block, the values of the visible
+    variables before and after it, and what its parse function returned.
+    """
+
+    def __init__(self, block: Block, before: list, after: list, result, ret_value):
+        self.block = block
+        self.before = before
+        self.after = after
+        self.result = result
+        self.ret_value = ret_value  # returned value, if the branch returns
+        self.extra = []             # values yielded after the variables
+
+class PicoCParser:
+    """
+    Recursive descent parser that emits ops into the current block while
+    parsing. Local variables are tracked as SSA values, so assignments just
+    rebind names (the same form cgeist produces after mem2reg); control flow
+    becomes scf ops whose regions yield the variables they assign.
+    """
+
+    def __init__(self, source: str):
+        self.tokens = tokenize(source)
+        self.pos = 0
+        self.block = None       # block ops are emitted into
+        self.ret_type = None
+        self.scopes = []        # list of dicts: name -> [SSAValue | None, ctype]
+        self.level = 0          # compound statements entered (1 in the function body)
+        self.depth = 0          # scf regions entered
+        self.loops = 0          # loops entered
+        self.ret_value = None   # value returned by the region being parsed
+
+    # token helpers
+    def peek(self, offset: int = 0) -> Token:
+        return self.tokens[min(self.pos + offset, len(self.tokens) - 1)]
+
+    def next(self) -> Token:
+        tok = self.peek()
+        self.pos += 1
+        return tok
+
+    def accept(self, text: str) -> bool:
+        if self.peek().text == text and self.peek().kind != "eof":
+            self.pos += 1
+            return True
+        return False
+
+    def expect(self, text: str) -> Token:
+        tok = self.next()
+        if tok.text != text:
+            self.error(f"expected '{text}' but found '{tok.text}'", tok)
+        return tok
+
+    def error(self, msg: str, tok: Token | None = None):
+        tok = tok or self.peek()
+        raise FrontendError(f"line {tok.line}: {msg}")
+
+    # IR helpers
+    def emit(self, op):
+        self.block.add_op(op)
+        return op
+
+    def constant(self, value: int, ctype) -> SSAValue:
+        op = arith.ConstantOp.from_int_and_width(wrap(value, ctype), ctype[0])
+        return self.emit(op).result
+
+    def convert(self, value: SSAValue, from_type, to_type) -> SSAValue:
+        if from_type[0] == to_type[0]:
+            return value
+        if from_type[0] > to_type[0]:
+            return self.emit(arith.TruncIOp(value, mlir_type(to_type))).result
+        if from_type[1]:
+            return self.emit(arith.ExtSIOp(value, mlir_type(to_type))).result
+        return self.emit(arith.ExtUIOp(value, mlir_type(to_type))).result
+
+    def lookup(self, name: str):
+        if (var := self.find_variable(name)) is None:
+            self.error(f"use of undeclared identifier '{name}'")
+        return var
+
+    def find_variable(self, name: str):
+        for scope in reversed(self.scopes):
+            if name in scope:
+                return scope[name]
+        return None
+
+    def condition(self, value: SSAValue, ctype) -> SSAValue:
+        # i1 truth value of a C scalar: x != 0
+        if ctype == BOOL:
+            return value
+        ctype_p = promote(ctype)
+        value = self.convert(value, ctype, ctype_p)
+        return self.emit(arith.CmpiOp(value, self.constant(0, ctype_p), "ne")).result
+
+    @contextmanager
+    def inside(self, block: Block):
+        # emit into block for the duration
+        outer, self.block = self.block, block
+        try:
+            yield
+        finally:
+            self.block = outer
+
+    # variables across regions
+    def variables(self) -> list:
+        return [var for scope in self.scopes for var in scope.values()]
+
+    def parse_branch(self, variables: list, parse) -> Branch:
+        """
+        Run parse (if given) into a new block, in its own scope. The variables
+        get their values back afterwards; the branch records both.
+        """
+        before = [var[0] for var in variables]
+        block = Block()
+        outer_ret = self.ret_value
+        self.ret_value = None
+        self.depth += 1
+        self.scopes.append(dict())
+        with self.inside(block):
+            result = parse() if parse is not None else None
+        self.scopes.pop()
+        self.depth -= 1
+        branch = Branch(block, before, [var[0] for var in variables], result, self.ret_value)
+        self.ret_value = outer_ret
+        for var, value in zip(variables, before):
+            var[0] = value
+        return branch
+
+    def continue_branch(self, branch: Branch, variables: list):
+        """
+        Parse the rest of the enclosing block into branch: it only runs when
+        the other branch does not return.
+        """
+        for var, value in zip(variables, branch.after):
+            var[0] = value
+        self.ret_value = None
+        self.depth += 1
+        self.scopes.append(dict())
+        with self.inside(branch.block):
+            returned = self.parse_items()
+        self.scopes.pop()
+        self.depth -= 1
+
+        # falling off the end of a void function returns as well
+        branch.result = returned or (self.level == 1 and self.ret_type == VOID)
+        branch.ret_value = self.ret_value
+        branch.after = [var[0] for var in variables]
+        for var, value in zip(variables, branch.before):
+            var[0] = value
+
+    def finish_if(self, cond: SSAValue, variables: list, then_branch: Branch, else_branch: Branch,
+                  extra_types: list) -> list[SSAValue]:
+        """
+        Emit the scf.if of two parsed branches. Variables either branch
+        assigned become its results (followed by the extra values), and are
+        rebound to them; returns the extra results.
+        """
+        changed = [idx for idx in range(len(variables))
+                   if any(branch.after[idx] is not branch.before[idx] for branch in (then_branch, else_branch))]
+        for branch in (then_branch, else_branch):
+            with self.inside(branch.block):
+                # a variable left uninitialized on this path reads as 0
+                values = [branch.after[idx] if branch.after[idx] is not None
+                          else self.constant(0, variables[idx][1]) for idx in changed]
+                self.emit(scf.YieldOp(*values, *branch.extra))
+
+        result_types = [mlir_type(variables[idx][1]) for idx in changed] + extra_types
+        else_region = Region(else_branch.block)
+        if not result_types and len(else_branch.block.ops) == 1:
+            else_region = Region()
+        if_op = self.emit(scf.IfOp(cond, result_types, Region(then_branch.block), else_region))
+        for idx, result in zip(changed, if_op.results):
+            variables[idx][0] = result
+        return list(if_op.results[len(changed):])
+
+    # loops: the variables a loop assigns are found by scanning its tokens
+    def skip_balanced(self, pos: int, close: str) -> int:
+        # index after the token closing the bracket at pos
+        open_text, depth = self.tokens[pos].text, 0
+        while self.tokens[pos].kind != "eof":
+            if self.tokens[pos].text == open_text:
+                depth += 1
+            elif self.tokens[pos].text == close:
+                depth -= 1
+                if depth == 0:
+                    return pos + 1
+            pos += 1
+        return pos
+
+    def skip_statement(self, pos: int) -> int:
+        # index after the statement starting at pos
+        text = self.tokens[pos].text
+        if text == "{":
+            return self.skip_balanced(pos, "}")
+        if text in ("if", "while", "for"):
+            pos = self.skip_statement(self.skip_balanced(pos + 1, ")"))
+            if text == "if" and self.tokens[pos].text == "else":
+                pos = self.skip_statement(pos + 1)
+            return pos
+        if text == "do":
+            pos = self.skip_statement(pos + 1)
+            return self.skip_balanced(pos + 1, ")") + 1
+        while self.tokens[pos].text != ";" and self.tokens[pos].kind != "eof":
+            pos += 1
+        return pos + 1
+
+    def assigned_variables(self, start: int, end: int) -> list:
+        """
+        Visible variables assigned by the tokens from start to end.
+        """
+        found = []
+        for idx in range(start, end):
+            tok = self.tokens[idx]
+            if tok.kind != "ident":
+                continue
+            after = self.tokens[idx + 1].text
+            before = self.tokens[idx - 1].text
+            if after not in ASSIGN_OPS and "++" not in (before, after) and "--" not in (before, after):
+                continue
+            var = self.find_variable(tok.text)
+            if var is not None and not any(var is known for known in found):
+                found.append(var)
+        return found
+
+    # declarations
+    def parse_type(self):
+        """
+        Parse a type specifier, or return None if the next token does not start one.
+        """
+        words = []
+        while self.peek().text in TYPE_WORDS:
+            words.append(self.next().text)
+        if not words:
+            return None
+        if "long" in words or "short" in words:
+            self.error("only int and char types are supported")
+        if "void" in words:
+            return VOID
+        signed = "unsigned" not in words
+        if "char" in words:
+            return CHAR if signed else UCHAR
+        return INT if signed else UINT
+
+    def parse_module(self) -> builtin.ModuleOp:
+        funcs = []
+        while self.peek().kind != "eof":
+            funcs.append(self.parse_function())
+        return builtin.ModuleOp(funcs)
+
+    def parse_function(self) -> func.FuncOp:
+        ret_type = self.parse_type()
+        if ret_type is None:
+            self.error(f"expected a function definition but found '{self.peek().text}'")
+        name = self.next()
+        if name.kind != "ident":
+            self.error("expected a function name", name)
+
+        # parameters
+        params = []
+        self.expect("(")
+        if self.peek().text == "void" and self.peek(1).text == ")":
+            self.next()
+        while not self.accept(")"):
+            if params:
+                self.expect(",")
+            ptype = self.parse_type()
+            pname = self.next()
+            if ptype in (None, VOID) or pname.kind != "ident":
+                self.error("expected a parameter declaration", pname)
+            params.append((pname.text, ptype))
+
+        if self.accept(";"):
+            self.error("function declarations without a body are not supported")
+
+        self.block = Block(arg_types=[mlir_type(ptype) for _, ptype in params])
+        for idx, arg in enumerate(self.block.args):
+            arg.name_hint = f"arg{idx}"
+        self.ret_type = ret_type
+        self.scopes = [{pname: [arg, ptype] for (pname, ptype), arg in zip(params, self.block.args)}]
+        body = self.block
+
+        returned = self.parse_compound()
+        if not returned:
+            if ret_type != VOID:
+                self.error(f"function '{name.text}' must end with a return statement")
+            self.emit(func.ReturnOp())
+
+        result_types = [] if ret_type == VOID else [mlir_type(ret_type)]
+        function_type = ([mlir_type(ptype) for _, ptype in params], result_types)
+        return func.FuncOp(name.text, function_type, Region(body))
+
+    # statements
+    def parse_compound(self) -> bool:
+        """
+        Parse a { ... } block. Returns True if it ended with a return statement.
+        """
+        self.expect("{")
+        self.scopes.append(dict())
+        self.level += 1
+        returned = self.parse_items()
+        self.level -= 1
+        self.scopes.pop()
+        self.expect("}")
+        return returned
+
+    def parse_items(self) -> bool:
+        # the statements of a block, up to its closing brace
+        returned = False
+        while self.peek().text != "}":
+            if returned:
+                self.error("code after a return statement is not supported")
+            returned = self.parse_statement()
+        return returned
+
+    def parse_statement(self) -> bool:
+        """
+        Parse a statement. Returns True if every path through it returns.
+        """
+        tok = self.peek()
+
+        if tok.text == "{":
+            return self.parse_compound()
+
+        if tok.text == "return":
+            self.next()
+            if self.loops:
+                self.error("return inside a loop is not supported", tok)
+            value = None
+            if self.ret_type == VOID:
+                self.expect(";")
+            else:
+                value, ctype = self.parse_expr()
+                self.expect(";")
+                value = self.convert(value, ctype, self.ret_type)
+            self.finish_return(value)
+            return True
+
+        if tok.text == "if":
+            return self.parse_if()
+        if tok.text == "while":
+            self.parse_while()
+            return False
+        if tok.text == "do":
+            self.parse_do()
+            return False
+        if tok.text == "for":
+            self.parse_for()
+            return False
+
+        if tok.text == "else":
+            self.error("'else' without a matching 'if'")
+        if tok.text in ("switch", "goto", "break", "continue"):
+            self.error(f"'{tok.text}' statements are not supported")
+
+        if (ctype := self.parse_type()) is not None:
+            self.parse_declaration(ctype)
+            return False
+
+        if not self.accept(";"):
+            self.parse_expr()
+            self.expect(";")
+        return False
+
+    def finish_return(self, value: SSAValue | None):
+        # in the function's block this is the return; inside a region the
+        # region yields the value to the scf.if that returns it
+        if self.depth == 0:
+            self.emit(func.ReturnOp(value) if value is not None else func.ReturnOp())
+        else:
+            self.ret_value = value
+
+    def parse_if(self) -> bool:
+        self.expect("if")
+        self.expect("(")
+        cond = self.condition(*self.parse_expr())
+        self.expect(")")
+
+        variables = self.variables()
+        then_branch = self.parse_branch(variables, self.parse_statement)
+        else_branch = self.parse_branch(variables, self.parse_statement if self.accept("else") else None)
+
+        # if only one branch returns, the rest of the block belongs to the other
+        if bool(then_branch.result) != bool(else_branch.result):
+            self.continue_branch(else_branch if then_branch.result else then_branch, variables)
+            if not (then_branch.result and else_branch.result):
+                self.error("a return that only some paths of a nested block take is not supported")
+
+        if not then_branch.result:
+            self.finish_if(cond, variables, then_branch, else_branch, [])
+            return False
+
+        # both return: the scf.if yields the returned value
+        extra_types = []
+        if self.ret_type != VOID:
+            extra_types = [mlir_type(self.ret_type)]
+            then_branch.extra = [then_branch.ret_value]
+            else_branch.extra = [else_branch.ret_value]
+        results = self.finish_if(cond, [], then_branch, else_branch, extra_types)
+        self.finish_return(results[0] if results else None)
+        return True
+
+    def bind(self, variables: list, values):
+        for var, value in zip(variables, values):
+            var[0] = value
+
+    def build_while(self, carried: list, parse_before, parse_after):
+        """
+        Emit an scf.while carrying the variables in carried: parse_before
+        parses into the before region and returns the condition, parse_after
+        into the after region.
+        """
+        inits = [self.read(var) for var in carried]
+        types = [mlir_type(var[1]) for var in carried]
+        self.loops += 1
+        self.depth += 1
+
+        before = Block(arg_types=types)
+        self.bind(carried, before.args)
+        with self.inside(before):
+            cond = parse_before()
+            self.emit(scf.ConditionOp(cond, *[var[0] for var in carried]))
+
+        after = Block(arg_types=types)
+        self.bind(carried, after.args)
+        with self.inside(after):
+            parse_after()
+            self.emit(scf.YieldOp(*[var[0] for var in carried]))
+
+        self.loops -= 1
+        self.depth -= 1
+        while_op = self.emit(scf.WhileOp(inits, types, Region(before), Region(after)))
+        self.bind(carried, while_op.results)
+
+    def parse_substatement(self):
+        # loop bodies get their own scope, like branches
+        self.scopes.append(dict())
+        self.parse_statement()
+        self.scopes.pop()
+
+    def parse_while(self):
+        carried = self.assigned_variables(self.pos, self.skip_statement(self.pos))
+        self.expect("while")
+        self.expect("(")
+
+        def parse_before():
+            cond = self.condition(*self.parse_expr())
+            self.expect(")")
+            return cond
+
+        self.build_while(carried, parse_before, self.parse_substatement)
+
+    def parse_do(self):
+        carried = self.assigned_variables(self.pos, self.skip_statement(self.pos))
+        self.expect("do")
+
+        # the body runs before the test, so all of it is the before region
+        def parse_before():
+            self.parse_substatement()
+            self.expect("while")
+            self.expect("(")
+            cond = self.condition(*self.parse_expr())
+            self.expect(")")
+            self.expect(";")
+            return cond
+
+        self.build_while(carried, parse_before, lambda: None)
+
+    def parse_for(self):
+        end = self.skip_statement(self.pos)
+        self.expect("for")
+        self.expect("(")
+        self.scopes.append(dict())
+        if (ctype := self.parse_type()) is not None:
+            self.parse_declaration(ctype)
+        elif not self.accept(";"):
+            self.parse_expr()
+            self.expect(";")
+
+        carried = self.assigned_variables(self.pos, end)
+        if not self.parse_counted_for(carried, end):
+            self.parse_general_for(carried, end)
+        self.scopes.pop()
+
+    def counted_loop(self, carried: list, end: int):
+        """
+        (counter, inclusive, step) of a loop for (int i = ...; i < n; i += c),
+        c > 0, in which only the increment assigns i and nothing assigns the
+        variables of n; None for any other loop.
+        """
+        tok, comparison = self.peek(), self.peek(1).text
+        counter = self.scopes[-1].get(tok.text)
+        if tok.kind != "ident" or counter is None or counter[1] != INT or comparison not in ("<", "<="):
+            return None
+
+        cond_end = self.pos
+        while self.tokens[cond_end].text != ";" and self.tokens[cond_end].kind != "eof":
+            cond_end += 1
+        step_end = cond_end + 1
+        while self.tokens[step_end].text != ")" and self.tokens[step_end].kind != "eof":
+            step_end += 1
+        for bound_tok in self.tokens[self.pos + 2:cond_end]:
+            if bound_tok.kind == "ident" and any(self.find_variable(bound_tok.text) is var for var in carried):
+                return None
+        if any(var is counter for var in self.assigned_variables(step_end + 1, end)):
+            return None
+
+        step = [t.text for t in self.tokens[cond_end + 1:step_end]]
+        if step in ([tok.text, "++"], ["++", tok.text]):
+            return counter, comparison == "<=", 1
+        number = self.tokens[step_end - 1]
+        if number.kind == "number" and step[:-1] in ([tok.text, "+="], [tok.text, "=", tok.text, "+"]):
+            value, _ = self.number_value(number)
+            if 0 < value < 1 << 31:
+                return counter, comparison == "<=", value
+        return None
+
+    def parse_counted_for(self, carried: list, end: int) -> bool:
+        """
+        Emit a counted loop as an scf.for. Returns False, having emitted
+        nothing that is used, if the loop does not have that form.
+        """
+        if (loop := self.counted_loop(carried, end)) is None:
+            return False
+        counter, inclusive, step = loop
+        start = self.pos
+
+        # the bound is invariant, so it is evaluated once, before the loop
+        self.pos += 2
+        bound, bound_type = self.parse_expr()
+        if common_type(INT, bound_type) != INT:
+            # an unsigned comparison
+            self.pos = start
+            return False
+        self.expect(";")
+        bound = self.convert(bound, bound_type, INT)
+        if inclusive:
+            bound = self.emit(arith.AddiOp(bound, self.constant(1, INT))).result
+        while not self.accept(")"):
+            self.next()
+
+        carried = [var for var in carried if var is not counter]
+        lower = self.read(counter)
+        inits = [self.read(var) for var in carried]
+        body = Block(arg_types=[mlir_type(INT)] + [mlir_type(var[1]) for var in carried])
+        self.loops += 1
+        self.depth += 1
+        self.bind([counter] + carried, body.args)
+        with self.inside(body):
+            self.parse_substatement()
+            self.emit(scf.YieldOp(*[var[0] for var in carried]))
+        self.loops -= 1
+        self.depth -= 1
+
+        for_op = self.emit(scf.ForOp(lower, bound, self.constant(step, INT), inits, body))
+        self.bind(carried, for_op.results)
+        self.pos = end
+        return True
+
+    def parse_general_for(self, carried: list, end: int):
+        # for (init; cond; step) body is init; while (cond) { body; step }
+        step_start = self.pos
+        while self.tokens[step_start].text != ";" and self.tokens[step_start].kind != "eof":
+            step_start += 1
+        step_start += 1
+        body_start = step_start
+        while self.tokens[body_start].text != ")" and self.tokens[body_start].kind != "eof":
+            body_start += 1
+        body_start += 1
+
+        def parse_before():
+            if self.accept(";"):
+                return self.constant(1, BOOL)
+            cond = self.condition(*self.parse_expr())
+            self.expect(";")
+            return cond
+
+        def parse_after():
+            self.pos = body_start
+            self.parse_substatement()
+            self.pos = step_start
+            if not self.accept(")"):
+                self.parse_expr()
+                self.expect(")")
+            self.pos = end
+
+        self.build_while(carried, parse_before, parse_after)
+
+    def parse_declaration(self, ctype):
+        if ctype == VOID:
+            self.error("variables cannot have type void")
+        while True:
+            name = self.next()
+            if name.kind != "ident":
+                self.error("expected a variable name", name)
+            if name.text in self.scopes[-1]:
+                self.error(f"redefinition of '{name.text}'", name)
+            value = None
+            if self.accept("="):
+                init, init_type = self.parse_assignment()
+                value = self.convert(init, init_type, ctype)
+            self.scopes[-1][name.text] = [value, ctype]
+            if not self.accept(","):
+                break
+        self.expect(";")
+
+    # expressions, from lowest to highest precedence
+    def parse_expr(self):
+        value = self.parse_assignment()
+        while self.accept(","):
+            value = self.parse_assignment()
+        return value
+
+    def parse_assignment(self):
+        tok = self.peek()
+        if tok.kind == "ident" and self.peek(1).text in ASSIGN_OPS:
+            var = self.lookup(tok.text)
+            self.next()
+            op_text = ASSIGN_OPS[self.next().text]
+            rhs, rhs_type = self.parse_assignment()
+            return self.assign(var, op_text, rhs, rhs_type)
+        return self.parse_conditional()
+
+    def parse_conditional(self):
+        value, ctype = self.parse_binary(0)
+        if not self.accept("?"):
+            return value, ctype
+        cond = self.condition(value, ctype)
+
+        # only the chosen operand is evaluated
+        variables = self.variables()
+        then_branch = self.parse_branch(variables, self.parse_expr)
+        self.expect(":")
+        else_branch = self.parse_branch(variables, self.parse_conditional)
+        then_type, else_type = then_branch.result[1], else_branch.result[1]
+        ctype = then_type if then_type == else_type else common_type(then_type, else_type)
+        for branch in (then_branch, else_branch):
+            with self.inside(branch.block):
+                branch.extra = [self.convert(*branch.result, ctype)]
+        return self.finish_if(cond, variables, then_branch, else_branch, [mlir_type(ctype)])[0], ctype
+
+    def assign(self, var, op_text: str | None, rhs: SSAValue, rhs_type):
+        value, ctype = var
+        if op_text is not None:
+            rhs, rhs_type = self.binary(op_text, self.read(var), ctype, rhs, rhs_type)
+        var[0] = self.convert(rhs, rhs_type, ctype)
+        return var[0], ctype
+
+    def read(self, var) -> SSAValue:
+        # reading an uninitialized local is undefined behavior; use 0 (not
+        # bound to the variable, which may be read in a nested region first)
+        if var[0] is None:
+            return self.constant(0, var[1])
+        return var[0]
+
+    def parse_binary(self, min_prec: int):
+        lhs, lhs_type = self.parse_unary()
+        while (prec := BINARY_PREC.get(self.peek().text)) is not None and prec >= min_prec:
+            op_text = self.next().text
+            if op_text in ("&&", "||"):
+                lhs, lhs_type = self.logical(op_text, lhs, lhs_type, prec)
+                continue
+            rhs, rhs_type = self.parse_binary(prec + 1)
+            lhs, lhs_type = self.binary(op_text, lhs, lhs_type, rhs, rhs_type)
+        return lhs, lhs_type
+
+    def logical(self, op_text: str, lhs: SSAValue, lhs_type, prec: int):
+        # the right operand is only evaluated when the left one does not decide
+        cond = self.condition(lhs, lhs_type)
+        variables = self.variables()
+        rhs_branch = self.parse_branch(variables, lambda: self.parse_binary(prec + 1))
+        const_branch = self.parse_branch(variables, None)
+        with self.inside(rhs_branch.block):
+            rhs_branch.extra = [self.condition(*rhs_branch.result)]
+        with self.inside(const_branch.block):
+            const_branch.extra = [self.constant(int(op_text == "||"), BOOL)]
+
+        if op_text == "&&":
+            then_branch, else_branch = rhs_branch, const_branch
+        else:
+            then_branch, else_branch = const_branch, rhs_branch
+        return self.finish_if(cond, variables, then_branch, else_branch, [mlir_type(BOOL)])[0], BOOL
+
+    def binary(self, op_text: str, lhs: SSAValue, lhs_type, rhs: SSAValue, rhs_type):
+        # shifts take the promoted type of their left operand, everything
+        # else the usual arithmetic conversions
+        if op_text in ("<<", ">>"):
+            ctype = promote(lhs_type)
+        else:
+            ctype = common_type(lhs_type, rhs_type)
+        lhs = self.convert(lhs, lhs_type, ctype)
+        rhs = self.convert(rhs, rhs_type, ctype)
+
+        if op_text in COMPARISONS:
+            predicate = COMPARISONS[op_text][0 if ctype[1] else 1]
+            return self.emit(arith.CmpiOp(lhs, rhs, predicate)).result, BOOL
+
+        op_class = BINARY_OPS[op_text]
+        if isinstance(op_class, tuple):
+            op_class = op_class[0] if ctype[1] else op_class[1]
+        return self.emit(op_class(lhs, rhs)).result, ctype
+
+    def parse_unary(self):
+        tok = self.peek()
+
+        if tok.text in ("-", "~", "+"):
+            self.next()
+            value, ctype = self.parse_unary()
+            ctype_p = promote(ctype)
+            value = self.convert(value, ctype, ctype_p)
+            if tok.text == "-":
+                zero = self.constant(0, ctype_p)
+                return self.emit(arith.SubiOp(zero, value)).result, ctype_p
+            if tok.text == "~":
+                ones = self.constant(-1, ctype_p)
+                return self.emit(arith.XOrIOp(value, ones)).result, ctype_p
+            return value, ctype_p
+
+        if tok.text == "!":
+            self.next()
+            return self.negate(*self.parse_unary()), BOOL
+
+        if tok.text in ("++", "--"):
+            self.next()
+            name = self.next()
+            if name.kind != "ident":
+                self.error(f"expected a variable after '{tok.text}'", name)
+            var = self.lookup(name.text)
+            return self.assign(var, tok.text[0], self.constant(1, INT), INT)
+
+        # casts
+        if tok.text == "(" and self.peek(1).text in TYPE_WORDS:
+            self.next()
+            ctype = self.parse_type()
+            self.expect(")")
+            value, from_type = self.parse_unary()
+            if ctype == VOID:
+                self.error("casts to void are not supported")
+            return self.convert(value, from_type, ctype), ctype
+
+        return self.parse_postfix()
+
+    def negate(self, value: SSAValue, ctype) -> SSAValue:
+        # !x: a comparison is inverted, anything else compared with 0
+        if ctype == BOOL and isinstance(cmp_op := value.owner, arith.CmpiOp):
+            predicate = INVERSE_PREDICATES[cmp_op.predicate.value.data]
+            return self.emit(arith.CmpiOp(cmp_op.lhs, cmp_op.rhs, predicate)).result
+        if ctype == BOOL:
+            return self.emit(arith.XOrIOp(value, self.constant(1, BOOL))).result
+        ctype_p = promote(ctype)
+        value = self.convert(value, ctype, ctype_p)
+        return self.emit(arith.CmpiOp(value, self.constant(0, ctype_p), "eq")).result
+
+    def parse_postfix(self):
+        tok = self.next()
+
+        if tok.text == "(":
+            value = self.parse_expr()
+            self.expect(")")
+            return value
+
+        if tok.kind == "number":
+            return self.parse_number(tok)
+
+        if tok.kind == "char":
+            body = tok.text[1:-1]
+            code = CHAR_ESCAPES.get(body[1]) if body.startswith("\\") else ord(body)
+            if code is None:
+                self.error(f"unsupported character escape {tok.text}", tok)
+            return self.constant(code, INT), INT
+
+        if tok.kind == "ident":
+            if self.peek().text == "(":
+                self.error("function calls are not supported", tok)
+            var = self.lookup(tok.text)
+            if self.peek().text in ("++", "--"):
+                old = self.read(var)
+                op_text = self.next().text[0]
+                self.assign(var, op_text, self.constant(1, INT), INT)
+                return old, var[1]
+            return self.read(var), var[1]
+
+        self.error(f"expected an expression but found '{tok.text}'", tok)
+
+    def parse_number(self, tok: Token):
+        value, ctype = self.number_value(tok)
+        return self.constant(value, ctype), ctype
+
+    def number_value(self, tok: Token):
+        text = tok.text.rstrip("uUlL")
+        suffix = tok.text[len(text):].lower()
+        if "l" in suffix:
+            self.error("long constants are not supported", tok)
+        if len(text) > 1 and text[0] == "0" and text[1] not in "xX":
+            value = int(text, 8)
+        else:
+            value = int(text, 0)
+
+        # decimal constants that do not fit in int would be long; hex ones become unsigned
+        if value >= 1 << 32 or (value >= 1 << 31 and "u" not in suffix and text[:2] not in ("0x", "0X")):
+            self.error(f"constant {tok.text} does not fit in an int", tok)
+        ctype = UINT if ("u" in suffix or value >= 1 << 31) else INT
+        return value, ctype
+
+
+def promote(ctype):
+    # integer promotion: anything narrower than int becomes int
+    return ctype if ctype[0] >= 32 else INT
+
+def common_type(lhs, rhs):
+    lhs, rhs = promote(lhs), promote(rhs)
+    return UINT if UINT in (lhs, rhs) else INT
+
+
+TYPE_WORDS = ("int", "char", "void", "signed", "unsigned", "long", "short")
+
+ASSIGN_OPS = {
+    "=": None, "+=": "+", "-=": "-", "*=": "*", "/=": "/", "%=": "%",
+    "&=": "&", "|=": "|", "^=": "^", "<<=": "<<", ">>=": ">>",
+}
+
+BINARY_PREC = {
+    "||": 0, "&&": 1,
+    "|": 2, "^": 3, "&": 4,
+    "==": 5, "!=": 5,
+    "<": 6, ">": 6, "<=": 6, ">=": 6,
+    "<<": 7, ">>": 7,
+    "+": 8, "-": 8,
+    "*": 9, "/": 9, "%": 9,
+}
+
+# cmpi predicates: (signed, unsigned)
+COMPARISONS = {
+    "==": ("eq", "eq"),
+    "!=": ("ne", "ne"),
+    "<":  ("slt", "ult"),
+    "<=": ("sle", "ule"),
+    ">":  ("sgt", "ugt"),
+    ">=": ("sge", "uge"),
+}
+
+# cmpi predicate number -> the predicate of the negated comparison
+INVERSE_PREDICATES = {
+    0: "ne", 1: "eq",
+    2: "sge", 3: "sgt", 4: "sle", 5: "slt",
+    6: "uge", 7: "ugt", 8: "ule", 9: "ult",
+}
+
+# (signed, unsigned) where the two differ
+BINARY_OPS = {
+    "+":  arith.AddiOp,
+    "-":  arith.SubiOp,
+    "*":  arith.MuliOp,
+    "/":  (arith.DivSIOp, arith.DivUIOp),
+    "%":  (arith.RemSIOp, arith.RemUIOp),
+    "&":  arith.AndIOp,
+    "|":  arith.OrIOp,
+    "^":  arith.XOrIOp,
+    "<<": arith.ShLIOp,
+    ">>": (arith.ShRSIOp, arith.ShRUIOp),
+}
+
+
+def parse_picoc(source: str) -> builtin.ModuleOp:
+    """
+    Build a ModuleOp of func/arith ops for a picoC translation unit.
+    Raises FrontendError for anything outside the supported subset.
+    """
+    return PicoCParser(source).parse_module()
@@ -0,0 +1,263 @@
+"""
+Reference interpreter for func/arith/scf/memref MLIR, the ground truth the simulated
+machine code is checked against
+"""
+
+from xdsl.dialects import builtin, func, arith, memref, scf
+
+
+class InterpreterError(Exception):
+    pass
+
+class UndefinedBehavior(InterpreterError):
+    """
+    The arguments make the function undefined (division by zero, signed
+    division overflow, shift by the width or more, a read of a local that was
+    never written or an access out of its bounds): any result is correct.
+    """
+    pass
+
+
+#
+#   Values: integers of each width are kept as their unsigned bit pattern
+#
+# index values (memref subscripts) are as wide as a pointer of the target
+INDEX_WIDTH = 32
+
+def mask(value: int, width: int) -> int:
+    return value & ((1 << width) - 1)
+
+def signed(value: int, width: int) -> int:
+    value = mask(value, width)
+    return value - (1 << width) if value >> (width - 1) else value
+
+def width_of(ssa) -> int:
+    if isinstance(ssa.type, builtin.IndexType):
+        return INDEX_WIDTH
+    if not isinstance(ssa.type, builtin.IntegerType):
+        raise InterpreterError(f"unsupported type {ssa.type}")
+    return ssa.type.width.data
+
+def check_shift(amount: int, width: int):
+    if amount >= width:
+        raise UndefinedBehavior(f"shift by {amount} of an i{width}")
+
+def check_division(lhs: int, rhs: int, width: int, is_signed: bool):
+    if rhs == 0:
+        raise UndefinedBehavior("division by zero")
+    if is_signed and signed(lhs, width) == -(1 << (width - 1)) and signed(rhs, width) == -1:
+        raise UndefinedBehavior("signed division overflow")
+
+def truncating_div(lhs: int, rhs: int) -> int:
+    # C division: rounds towards zero
+    quotient = abs(lhs) // abs(rhs)
+    return quotient if (lhs < 0) == (rhs < 0) else -quotient
+
+
+#
+#   Semantics: op -> its result values, given the op and its operand values
+#
+def eval_constant(op, operands, width):
+    return [mask(op.value.value.data, width)]
+
+def eval_divsi(op, operands, width):
+    lhs, rhs = operands
+    check_division(lhs, rhs, width, True)
+    return [mask(truncating_div(signed(lhs, width), signed(rhs, width)), width)]
+
+def eval_remsi(op, operands, width):
+    lhs, rhs = operands
+    check_division(lhs, rhs, width, True)
+    a, b = signed(lhs, width), signed(rhs, width)
+    return [mask(a - truncating_div(a, b) * b, width)]
+
+def eval_divui(op, operands, width):
+    check_division(*operands, width, False)
+    return [operands[0] // operands[1]]
+
+def eval_remui(op, operands, width):
+    check_division(*operands, width, False)
+    return [operands[0] % operands[1]]
+
+def eval_shift(op, operands, width):
+    value, amount = operands
+    check_shift(amount, width)
+    if isinstance(op, arith.ShLIOp):
+        return [mask(value << amount, width)]
+    if isinstance(op, arith.ShRUIOp):
+        return [value >> amount]
+    return [mask(signed(value, width) >> amount, width)]
+
+def eval_mul_extended(op, operands, width):
+    # low and high halves of the double-width product
+    lhs, rhs = operands
+    if isinstance(op, arith.MulSIExtendedOp):
+        lhs, rhs = signed(lhs, width), signed(rhs, width)
+    product = lhs * rhs
+    return [mask(product, width), mask(product >> width, width)]
+
+# cmpi predicate number -> comparison of the operands' (signed, if it is) values
+PREDICATES = {
+    0: (False, lambda a, b: a == b),
+    1: (False, lambda a, b: a != b),
+    2: (True,  lambda a, b: a < b),
+    3: (True,  lambda a, b: a <= b),
+    4: (True,  lambda a, b: a > b),
+    5: (True,  lambda a, b: a >= b),
+    6: (False, lambda a, b: a < b),
+    7: (False, lambda a, b: a <= b),
+    8: (False, lambda a, b: a > b),
+    9: (False, lambda a, b: a >= b),
+}
+
+def eval_cmpi(op, operands, width):
+    is_signed, compare = PREDICATES[op.predicate.value.data]
+    lhs, rhs = operands
+    if is_signed:
+        in_width = width_of(op.lhs)
+        lhs, rhs = signed(lhs, in_width), signed(rhs, in_width)
+    return [int(compare(lhs, rhs))]
+
+def eval_cast(op, operands, width):
+    in_width = width_of(op.input)
+    if isinstance(op, arith.ExtSIOp):
+        return [mask(signed(operands[0], in_width), width)]
+    return [mask(operands[0], width)]
+
+SEMANTICS = {
+    arith.ConstantOp:       eval_constant,
+    arith.AddiOp:           lambda op, operands, width: [mask(operands[0] + operands[1], width)],
+    arith.SubiOp:           lambda op, operands, width: [mask(operands[0] - operands[1], width)],
+    arith.MuliOp:           lambda op, operands, width: [mask(operands[0] * operands[1], width)],
+    arith.AndIOp:           lambda op, operands, width: [operands[0] & operands[1]],
+    arith.OrIOp:            lambda op, operands, width: [operands[0] | operands[1]],
+    arith.XOrIOp:           lambda op, operands, width: [operands[0] ^ operands[1]],
+    arith.DivSIOp:          eval_divsi,
+    arith.RemSIOp:          eval_remsi,
+    arith.DivUIOp:          eval_divui,
+    arith.RemUIOp:          eval_remui,
+    arith.ShLIOp:           eval_shift,
+    arith.ShRUIOp:          eval_shift,
+    arith.ShRSIOp:          eval_shift,
+    arith.MulSIExtendedOp:  eval_mul_extended,
+    arith.MulUIExtendedOp:  eval_mul_extended,
+    arith.ExtSIOp:          eval_cast,
+    arith.ExtUIOp:          eval_cast,
+    arith.TruncIOp:         eval_cast,
+    arith.IndexCastOp:      eval_cast,
+    arith.CmpiOp:           eval_cmpi,
+    arith.SelectOp:         lambda op, operands, width: [operands[1] if operands[0] else operands[2]],
+}
+
+
+#
+#   Interpreter
+#
+# operations executed before a call counts as not terminating
+MAX_STEPS = 100000
+
+class Execution:
+    """
+    Values of one call's SSA values, and the operations left to execute.
+    """
+
+    def __init__(self, max_steps: int):
+        self.values = dict()
+        self.max_steps = max_steps
+        self.steps = max_steps
+
+    def run_block(self, block, args: list[int]) -> list[int]:
+        # the values the block's terminator (return, yield or condition) passes on
+        self.values.update(zip(block.args, args))
+        for op in block.ops:
+            if isinstance(op, (func.ReturnOp, scf.YieldOp, scf.ConditionOp)):
+                return [self.values[operand] for operand in op.operands]
+
+            self.steps -= 1
+            if self.steps < 0:
+                raise UndefinedBehavior(f"no return after {self.max_steps} operations (an endless loop)")
+            if (control := CONTROL.get(type(op))) is not None:
+                results = control(self, op)
+            elif (semantics := SEMANTICS.get(type(op))) is not None:
+                width = width_of(op.results[0])
+                results = semantics(op, [self.values[operand] for operand in op.operands], width)
+            else:
+                raise InterpreterError(f"cannot interpret {op.name}")
+            self.values.update(zip(op.results, results))
+        raise InterpreterError("block without a terminator")
+
+    def run_if(self, op: scf.IfOp) -> list[int]:
+        region = op.true_region if self.values[op.cond] else op.false_region
+        return self.run_block(region.blocks[0], []) if region.blocks else []
+
+    def run_for(self, op: scf.ForOp) -> list[int]:
+        width = width_of(op.lb)
+        iv, upper, step = (self.values[operand] for operand in (op.lb, op.ub, op.step))
+        results = [self.values[operand] for operand in op.iter_args]
+        while signed(iv, width) < signed(upper, width):
+            results = self.run_block(op.body.blocks[0], [iv] + results)
+            iv = mask(iv + step, width)
+        return results
+
+    def run_while(self, op: scf.WhileOp) -> list[int]:
+        args = [self.values[operand] for operand in op.arguments]
+        while True:
+            cond, *forwarded = self.run_block(op.before_region.blocks[0], args)
+            if not cond:
+                return forwarded
+            args = self.run_block(op.after_region.blocks[0], forwarded)
+
+    # a memref local is a list of its elements in row-major order, None until written
+    def run_alloca(self, op: memref.AllocaOp) -> list:
+        shape = op.memref.type.get_shape()
+        if op.dynamic_sizes or any(size < 0 for size in shape):
+            raise InterpreterError("memref.alloca with a dynamic size")
+        elements = 1
+        for size in shape:
+            elements *= size
+        return [[None] * elements]
+
+    def element(self, ref, indices) -> tuple[list, int]:
+        # the elements of the memref and the position of [indices] in them
+        elements = self.values[ref]
+        position = 0
+        for size, index in zip(ref.type.get_shape(), indices):
+            index = self.values[index]
+            if index >= size:
+                raise UndefinedBehavior(f"index {index} out of bounds of {ref.type}")
+            position = position * size + index
+        return elements, position
+
+    def run_load(self, op: memref.LoadOp) -> list[int]:
+        elements, position = self.element(op.memref, op.indices)
+        if elements[position] is None:
+            raise UndefinedBehavior("read of a local that was never written")
+        return [elements[position]]
+
+    def run_store(self, op: memref.StoreOp) -> list[int]:
+        elements, position = self.element(op.memref, op.indices)
+        elements[position] = self.values[op.value]
+        return []
+
+CONTROL = {
+    scf.IfOp:           Execution.run_if,
+    scf.ForOp:          Execution.run_for,
+    scf.WhileOp:        Execution.run_while,
+    memref.AllocaOp:    Execution.run_alloca,
+    memref.LoadOp:      Execution.run_load,
+    memref.StoreOp:     Execution.run_store,
+}
+
+def interpret_function(func_op: func.FuncOp, args: list[int], max_steps: int = MAX_STEPS) -> int | None:
+    """
+    Run func_op on args (taken modulo 2^width of each parameter). Returns the
+    returned value as an unsigned bit pattern, or None for a void function.
+    Raises UndefinedBehavior when the arguments have no defined result, which
+    includes running more than max_steps operations.
+    """
+    block = func_op.body.blocks[0]
+    if len(args) != len(block.args):
+        raise InterpreterError(f"{func_op.sym_name.data} takes {len(block.args)} arguments, got {len(args)}")
+    args = [mask(value, width_of(arg)) for arg, value in zip(block.args, args)]
+    returned = Execution(max_steps).run_block(block, args)
+    return returned[0] if returned else None
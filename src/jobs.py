@@ -0,0 +1,69 @@
+"""
+Compilation jobs: options and input discovery (kept free of xDSL imports so the
+server client can use them without paying for the compiler start-up)
+"""
+
+import os
+
+from src.backend_cost import DEFAULT_TARGET
+from src.cache import DEFAULT_MAX_BYTES
+
+
+class Options:
+    """
+    Settings shared by every file of a compilation.
+    """
+
+    def __init__(self, emit_all: bool = False, cache_dir: str | None = None,
+                 cache_max_bytes: int = DEFAULT_MAX_BYTES, cgeist_path: str | None = None,
+                 frontend: str = "auto", collect_stats: bool = False,
+                 target: str = DEFAULT_TARGET, fused_walk: bool = False,
+                 emit_obj: bool = False):
+        self.emit_all = emit_all
+        self.cache_dir = cache_dir      # None disables the cache
+        self.cache_max_bytes = cache_max_bytes
+        self.cgeist_path = cgeist_path  # None: read CGEIST_PATH when needed
+        self.frontend = frontend        # "native", "cgeist" or "auto" (native, else cgeist)
+        self.collect_stats = collect_stats  # time passes and count pattern fires
+        self.target = target            # core the code is generated for (see TARGETS)
+        self.fused_walk = fused_walk    # optimize and lower each block in one walk (same code)
+        self.emit_obj = emit_obj        # also write an ELF object, encoded without an assembler
+
+    def key(self) -> str:
+        # everything besides the input that changes the generated code, or may:
+        # the two pipelines are only checked to agree, so they are cached apart
+        return f"emit_all={self.emit_all},target={self.target},fused_walk={self.fused_walk}"
+
+
+def collect_inputs(args: list[str]) -> list[tuple[str, str]]:
+    """
+    Expand command line inputs into (path, output stem) pairs, in a stable order.
+    Arguments can be .c files, directories (searched recursively for .c files)
+    or @manifest files listing one input per line.
+    """
+    inputs = []
+    for arg in args:
+        if arg.startswith("@"):
+            with open(arg[1:], "r") as f:
+                entries = [line.strip() for line in f]
+            base = os.path.dirname(arg[1:])
+            inputs += collect_inputs([os.path.join(base, entry) for entry in entries
+                                      if entry and not entry.startswith("#")])
+
+        elif os.path.isdir(arg):
+            found = []
+            for root, dirs, files in os.walk(arg):
+                dirs.sort()
+                found += [os.path.join(root, name) for name in files if name.endswith(".c")]
+            inputs += [(path, os.path.relpath(path, arg)[:-2]) for path in sorted(found)]
+
+        else:
+            inputs.append((arg, os.path.basename(arg)[:-2]))  # assume .c
+
+    return inputs
+
+def output_stem(in_file: str, rel_stem: str, out_dir: str | None) -> str:
+    # without an output directory, outputs go next to the input file
+    if out_dir is None:
+        return in_file[:len(in_file) - 2]
+    return os.path.join(out_dir, rel_stem)
@@ -0,0 +1,316 @@
+"""
+Pass manager: runs the pipeline as named passes and, when asked to, records
+the wall time and op counts of each pass and how often each pattern fired
+"""
+
+import time
+from collections import deque
+from contextlib import contextmanager
+from xdsl.dialects import builtin
+from xdsl.ir import Block, Operation
+from xdsl.pattern_rewriter import (
+    PatternRewriter,
+    PatternRewriterListener,
+    PatternRewriteWalker,
+    RewritePattern
+)
+from xdsl.rewriter import Rewriter
+from xdsl.traits import is_side_effect_free
+from xdsl.transforms.common_subexpression_elimination import KnownOps
+from xdsl.transforms.dead_code_elimination import is_trivially_dead
+
+
+class TypedPatternApplier(RewritePattern):
+    """
+    Applies the first pattern that rewrites an op, after erasing it if it is
+    trivially dead, like GreedyRewritePatternApplier; but each op is only
+    offered the patterns whose op_types include its class (patterns without
+    op_types are offered every op).
+    """
+
+    def __init__(self, patterns: list[RewritePattern]):
+        self.patterns = patterns
+        self.by_type = dict()   # op class -> patterns offered its ops, in order
+
+    def patterns_for(self, op_type: type) -> list[RewritePattern]:
+        if (patterns := self.by_type.get(op_type)) is None:
+            patterns = [pattern for pattern in self.patterns
+                        if (op_types := getattr(pattern, "op_types", None)) is None
+                        or issubclass(op_type, op_types)]
+            self.by_type[op_type] = patterns
+        return patterns
+
+    def match_and_rewrite(self, op, rewriter):
+        if is_trivially_dead(op):
+            rewriter.erase_op(op)
+            return
+
+        for pattern in self.patterns_for(type(op)):
+            pattern.match_and_rewrite(op, rewriter)
+            if rewriter.has_done_action:
+                return
+
+
+class FusedWalk:
+    """
+    Canonicalization, dead code elimination, CSE and lowering in a single
+    traversal. Every function goes through the same stages as in the staged
+    pipeline: its ops are canonicalized in order, so operands are simplified
+    before their users, then dead ops are dropped and common subexpressions
+    merged, then the ops are lowered in reverse order, so patterns matching a DAG
+    from its root see the operands before those are lowered themselves (and dead
+    ops are erased before their operands are looked at). Both rewrite phases are
+    driven by a worklist holding the ops created or affected by each rewrite, and
+    run to a fixed point. The blocks of scf ops are canonicalized and cleaned of
+    dead ops after their op, which is offered the patterns again in another round
+    if they changed, as the staged walk does; they go through CSE knowing the ops
+    before their op, and are lowered before the block holding them.
+    """
+
+    def __init__(self, canonicalize: list[RewritePattern], lower: list[RewritePattern]):
+        self.canonicalize = TypedPatternApplier(canonicalize)
+        self.lower = TypedPatternApplier(lower)
+        self.touched = []   # ops created or whose operands changed in the last rewrite
+        self.simplified = []    # blocks simplified so far, nested ones before their parent
+        self.nested_changed = False     # a nested block changed in this canonicalization round
+        self.settled = set()    # nested blocks at a fixed point, unchanged since
+        self.listener = PatternRewriterListener(
+            operation_insertion_handler=[self.touched.append],
+            operation_modification_handler=[self.touched.append],
+            operation_replacement_handler=[
+                lambda op, new_results: self.touched.extend(use.operation for res in op.results
+                                                            for use in res.uses)],
+        )
+
+    def apply(self, applier: TypedPatternApplier, op: Operation) -> bool:
+        self.touched.clear()
+        rewriter = PatternRewriter(op)
+        rewriter.extend_from_listener(self.listener)
+        applier.match_and_rewrite(op, rewriter)
+        return rewriter.has_done_action
+
+    def revisit(self, block: Block, pending: set[Operation]) -> list[Operation]:
+        # ops the last rewrite affected that are not going to be visited anyway:
+        # ops it created and the ones visited before, which now need another look
+        ops = []
+        for op in self.touched:
+            if op.parent is block and op not in pending:
+                pending.add(op)
+                ops.append(op)
+        return ops
+
+    def unsettle(self):
+        # the blocks holding ops the last rewrite affected, and the ones around
+        # them, need another look
+        for op in self.touched:
+            block = op.parent
+            while block is not None and block in self.settled:
+                self.settled.discard(block)
+                block = block.parent_block()
+
+    def canonicalize_block(self, block: Block) -> bool:
+        worklist = deque(block.ops)
+        pending = set(worklist)
+        changed = False
+        while worklist:
+            op = worklist.popleft()
+            pending.discard(op)
+            if op.parent is not block:
+                continue
+
+            # new ops (inserted before op), users already visited and op itself,
+            # if it survived, go next
+            if self.apply(self.canonicalize, op):
+                worklist.extendleft(reversed(self.revisit(block, pending)))
+                self.unsettle()
+                changed = True
+                continue
+
+            # then the blocks of an scf op, after it like in the staged walk; if
+            # they change, the op is offered the patterns again in the next round
+            for region in op.regions:
+                for inner in region.blocks:
+                    if inner in self.settled:
+                        continue
+                    if self.canonicalize_block(inner) | self.eliminate_dead(inner):
+                        self.nested_changed = changed = True
+                    else:
+                        self.settled.add(inner)
+        return changed
+
+    def eliminate_dead(self, block: Block) -> bool:
+        # users come after their operands, so one backward sweep finds all dead
+        # ops; nested blocks were swept when their op was canonicalized, so an
+        # scf op whose dead body held the only ops with unknown effects goes too
+        erased = False
+        for op in reversed(list(block.ops)):
+            if is_trivially_dead(op):
+                Rewriter.erase_op(op)
+                erased = True
+        return erased
+
+    def eliminate_common(self, block: Block, known: KnownOps):
+        # an identical side-effect free op earlier in the block, or before it in
+        # an enclosing one, replaces op; an scf op is compared once its blocks
+        # are, and they are not lowered if it goes
+        for op in list(block.ops):
+            nested = len(self.simplified)
+            for region in op.regions:
+                for inner in region.blocks:
+                    self.eliminate_common(inner, KnownOps(known))
+            if not op.results or not is_side_effect_free(op):
+                continue
+            if any(len(region.blocks) > 1 for region in op.regions):
+                continue
+            if (existing := known.get(op)) is None:
+                known[op] = op
+                continue
+            Rewriter.replace_op(op, [], existing.results)
+            del self.simplified[nested:]
+        self.simplified.append(block)
+
+    def simplify_block(self, block: Block, known: KnownOps):
+        # the staged walk goes over the whole function again until nothing
+        # changes, enclosing ops before the blocks they hold, so this one does
+        # too while nested blocks change; nested blocks go through CSE knowing
+        # the ops before their op
+        self.nested_changed = True
+        while self.nested_changed:
+            self.nested_changed = False
+            self.canonicalize_block(block)
+        self.eliminate_dead(block)
+        self.eliminate_common(block, known)
+
+    def lower_block(self, block: Block):
+        worklist = list(block.ops)    # a stack: the last op is visited first
+        pending = set(worklist)
+        while worklist:
+            op = worklist.pop()
+            pending.discard(op)
+            if op.parent is not block:
+                continue
+            if self.apply(self.lower, op):
+                worklist += self.revisit(block, pending)
+
+    def rewrite_module(self, module: builtin.ModuleOp):
+        # nested blocks are lowered first, so the ops of an enclosing block are
+        # still unlowered when patterns rooted inside look at them
+        self.simplified = []
+        for op in module.ops:
+            for region in op.regions:
+                for block in region.blocks:
+                    self.simplify_block(block, KnownOps())
+        for block in self.simplified:
+            self.lower_block(block)
+
+
+class Pass:
+    """
+    A named pipeline step: a function taking the module, a list of rewrite
+    patterns applied with a TypedPatternApplier like apply_all_optimizations
+    does, or a pair of canonicalization and lowering pattern lists run by a
+    FusedWalk.
+    """
+
+    def __init__(self, name: str, run=None, patterns: list[RewritePattern] | None = None,
+                 phases: tuple[list[RewritePattern], list[RewritePattern]] | None = None):
+        self.name = name
+        self.run = run
+        self.patterns = patterns
+        self.phases = phases
+
+
+class CountingPattern(RewritePattern):
+    """
+    Wraps a pattern and counts the rewrites it performs.
+    """
+
+    def __init__(self, pattern: RewritePattern, counts: dict[str, int]):
+        self.pattern = pattern
+        self.counts = counts
+        self.op_types = getattr(pattern, "op_types", None)
+
+    def match_and_rewrite(self, op, rewriter):
+        self.pattern.match_and_rewrite(op, rewriter)
+
+        # the walker resets has_done_action for every op, and the applier stops
+        # at the first pattern that rewrites, so this is our rewrite
+        if rewriter.has_done_action:
+            name = type(self.pattern).__name__
+            self.counts[name] = self.counts.get(name, 0) + 1
+
+
+def count_ops(module: builtin.ModuleOp) -> int:
+    return sum(1 for _ in module.walk())
+
+
+class PassManager:
+    """
+    Runs passes over a module. With collect set, every pass and stage is timed
+    and op counts / pattern fires are recorded for report().
+    """
+
+    def __init__(self, collect: bool = False):
+        self.collect = collect
+        self.timings = []       # [name, seconds, ops before, ops after], in run order
+        self.pattern_counts = dict()
+
+    @contextmanager
+    def stage(self, name: str, module: builtin.ModuleOp | None = None):
+        """
+        Time a block of work that is not a pass (e.g. the front-end), counting
+        the ops of module before and after it if given.
+        """
+        if not self.collect:
+            yield
+            return
+        ops_before = count_ops(module) if module is not None else 0
+        start = time.perf_counter()
+        yield
+        elapsed = time.perf_counter() - start
+        ops_after = count_ops(module) if module is not None else 0
+        self.timings.append([name, elapsed, ops_before, ops_after])
+
+    def run(self, module: builtin.ModuleOp, passes: list[Pass]):
+        for p in passes:
+            with self.stage(p.name, module):
+                if p.run is not None:
+                    p.run(module)
+                elif p.phases is not None:
+                    FusedWalk(*[self.counting(patterns) for patterns in p.phases]).rewrite_module(module)
+                else:
+                    walker = PatternRewriteWalker(TypedPatternApplier(self.counting(p.patterns)))
+                    walker.rewrite_module(module)
+
+    def counting(self, patterns: list[RewritePattern]) -> list[RewritePattern]:
+        # wrapped to count their rewrites when collecting
+        if not self.collect:
+            return patterns
+        return [CountingPattern(pattern, self.pattern_counts) for pattern in patterns]
+
+    def merge(self, report: dict | None):
+        """
+        Add the timings and pattern fires of another run's report (e.g. of a
+        function compiled in a worker process) to this one's, by name.
+        """
+        if not self.collect or report is None:
+            return
+        by_name = {timing[0]: timing for timing in self.timings}
+        for name, seconds, ops_before, ops_after in report["passes"]:
+            if name not in by_name:
+                by_name[name] = [name, 0.0, 0, 0]
+                self.timings.append(by_name[name])
+            by_name[name][1] += seconds
+            by_name[name][2] += ops_before
+            by_name[name][3] += ops_after
+        for name, count in report["patterns"].items():
+            self.pattern_counts[name] = self.pattern_counts.get(name, 0) + count
+
+    def report(self) -> dict | None:
+        if not self.collect:
+            return None
+        return {
+            "files": 1,
+            "passes": [list(timing) for timing in self.timings],
+            "patterns": dict(self.pattern_counts),
+        }
@@ -0,0 +1,159 @@
+"""
+Compile server: a long-lived process that keeps xDSL, the dialects and the
+Context loaded, and compiles files on behalf of thin pcc.py clients.
+
+The protocol is one JSON request line and one JSON response line per
+connection, over a Unix socket that only the current user can access.
+"""
+
+import os, sys, json, socket, socketserver, tempfile
+
+from src.cache import *
+from src.jobs import *
+
+
+def default_socket_path() -> str:
+    if "PCC_SERVER_SOCKET" in os.environ:
+        return os.environ["PCC_SERVER_SOCKET"]
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR") or tempfile.gettempdir()
+    return os.path.join(runtime_dir, f"pcc-{os.getuid()}.sock")
+
+def use_server_default() -> bool:
+    # PCC_USE_SERVER=0 or =false (any case) turns the server off like leaving it unset
+    value = os.environ.get("PCC_USE_SERVER", "").strip().lower()
+    return value not in ("", "0", "false")
+
+
+#
+#   Client
+#
+def send_request(socket_path: str, request: dict) -> dict | None:
+    """
+    Send one request to the server. Returns None if no server is listening.
+    """
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.connect(socket_path)
+            sock.sendall(json.dumps(request).encode() + b"\n")
+            with sock.makefile("rb") as f:
+                line = f.readline()
+    except (FileNotFoundError, ConnectionRefusedError):
+        return None
+    if not line:
+        return None
+    return json.loads(line)
+
+def remote_compile(socket_path: str, jobs: list[tuple[str, str, Options]],
+                   num_workers: int) -> list[tuple[str, str | None, dict | None]] | None:
+    """
+    Compile jobs on the server, returning results like compile_batch, or None
+    if no server is running. Paths are made absolute since the server does not
+    share our working directory.
+    """
+    if not jobs:
+        return []
+    options = jobs[0][2]
+    request = {
+        "jobs": [[os.path.abspath(in_file), os.path.abspath(out_filename)]
+                 for in_file, out_filename, _ in jobs],
+        "options": vars(options),
+        "num_workers": num_workers,
+    }
+    response = send_request(socket_path, request)
+    if response is None:
+        return None
+
+    # report errors with the paths the user gave us
+    return [(in_file, error, report)
+            for (in_file, _, _), (_, error, report) in zip(jobs, response["results"])]
+
+def stop_server(socket_path: str) -> bool:
+    return send_request(socket_path, {"shutdown": True}) is not None
+
+
+#
+#   Server
+#
+class CompileHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        from src.driver import compile_batch
+
+        request = json.loads(self.rfile.readline())
+        if request.get("shutdown"):
+            self.server.running = False
+            self.reply({"results": []})
+            return
+        if request.get("ping"):
+            self.reply({"results": []})
+            return
+
+        options = Options(**request["options"])
+        jobs = [(in_file, out_filename, options) for in_file, out_filename in request["jobs"]]
+        num_workers = request.get("num_workers", 1)
+
+        # fewer files than workers are split into functions by compile_batch
+        # itself, in forked workers of this process; no pool needed for that
+        pool = self.server.get_pool(num_workers) if len(jobs) >= num_workers else None
+        results = compile_batch(jobs, num_workers, pool=pool)
+        self.reply({"results": results})
+
+        if options.cache_dir is not None:
+            Cache(options.cache_dir, options.cache_max_bytes).evict()
+
+    def reply(self, response: dict):
+        self.wfile.write(json.dumps(response).encode() + b"\n")
+
+
+class CompileServer(socketserver.UnixStreamServer):
+
+    def __init__(self, socket_path: str):
+        self.running = True
+        self.pools = dict()     # worker count -> warm multiprocessing pool
+        super().__init__(socket_path, CompileHandler)
+
+    def get_pool(self, num_workers: int):
+        if num_workers <= 1:
+            return None
+        if num_workers not in self.pools:
+            import multiprocessing
+            from src.driver import init_worker
+            self.pools[num_workers] = multiprocessing.Pool(num_workers, initializer=init_worker)
+        return self.pools[num_workers]
+
+    def server_close(self):
+        for pool in self.pools.values():
+            pool.terminate()
+        super().server_close()
+
+def serve(socket_path: str):
+    """
+    Run the compile server in the foreground until a client asks it to stop.
+    """
+    from src.driver import init_worker
+
+    # refuse to start twice, but clean up a socket left behind by a dead server
+    if os.path.exists(socket_path):
+        if send_request(socket_path, {"ping": True}) is not None:
+            sys.exit(f"Error: a pcc server is already listening on {socket_path}")
+        os.unlink(socket_path)
+
+    # warm up the Context used for in-process compilation
+    init_worker()
+
+    # local only: the socket is created accessible to the current user alone
+    old_umask = os.umask(0o077)
+    try:
+        server = CompileServer(socket_path)
+    finally:
+        os.umask(old_umask)
+
+    print(f"pcc server listening on {socket_path}", file=sys.stderr)
+    try:
+        while server.running:
+            server.handle_request()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        os.unlink(socket_path)
@@ -0,0 +1,571 @@
+"""
+Thumb instruction-set simulator for the assembly pcc emits: runs a function on
+given arguments, counts its cycles with the per-core tables, and checks the
+results against the reference interpreter
+"""
+
+import random
+from xdsl.dialects import builtin, func
+
+from src.backend_cost import *
+from src.interpreter import *
+
+
+class SimulationError(Exception):
+    pass
+
+
+#
+#   Programs
+#
+class Program:
+    """
+    One function of the assembly: its instructions, the instruction index each
+    label points to, and the value of each literal pool word.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.instructions = []  # (mnemonic, operands)
+        self.labels = dict()
+        self.words = dict()
+
+def parse_asm(asm_text: str) -> dict[str, Program]:
+    """
+    Functions of Thumb assembly as printed by backend_printer, by name.
+    """
+    programs = dict()
+    program = None
+    pending = []    # labels not yet followed by an instruction or word
+    for line in asm_text.splitlines():
+        line = line.split("@")[0].split("//")[0].strip()
+        if not line:
+            continue
+
+        if line.endswith(":"):
+            name = line[:-1]
+            if not name.startswith("."):
+                program = programs[name] = Program(name)
+                pending = []
+            elif program is not None:
+                program.labels[name] = len(program.instructions)
+                pending.append(name)
+            continue
+        if program is None:
+            continue
+        if line.startswith("."):
+            if line.startswith(".word"):
+                for label in pending:
+                    program.words[label] = int(line[len(".word"):].strip(), 0) & 0xFFFFFFFF
+                pending = []
+            continue
+
+        mnemonic, _, rest = line.partition(" ")
+        program.instructions.append((mnemonic, split_operands(rest)))
+        pending = []
+    return programs
+
+
+#
+#   Machine
+#
+MASK = 0xFFFFFFFF
+
+# lr on entry: returning branches here
+RETURN_ADDRESS = 0xFFFFFFF1
+STACK_TOP = 0x20042000
+
+# what the caller leaves in registers that hold no argument, so reading one is noticed
+GARBAGE = 0xDEAD0000
+
+# registers a function must preserve (AAPCS)
+CALLEE_SAVED = ["r4", "r5", "r6", "r7", "r8", "r9", "r10", "r11"]
+
+# ldr/str suffix -> bytes accessed
+ACCESS_SIZES = {"": 4, "b": 1, "h": 2}
+
+def add_with_carry(x: int, y: int, carry: int) -> tuple[int, bool, bool]:
+    # result, carry out and signed overflow of x + y + carry
+    unsigned_sum = x + y + carry
+    result = unsigned_sum & MASK
+    signed_sum = signed(x, 32) + signed(y, 32) + carry
+    return result, unsigned_sum > MASK, signed(result, 32) != signed_sum
+
+def shift_c(value: int, kind: str, amount: int, carry: bool) -> tuple[int, bool]:
+    # value shifted by amount (any size), and the last bit shifted out
+    if amount == 0:
+        return value, carry
+    if kind == "lsl":
+        return (value << amount) & MASK, amount <= 32 and bool(value >> (32 - amount) & 1)
+    if kind == "lsr":
+        return value >> amount if amount < 32 else 0, amount <= 32 and bool(value >> (amount - 1) & 1)
+    amount = min(amount, 32)
+    return (signed(value, 32) >> amount) & MASK, bool(signed(value, 32) >> (amount - 1) & 1)
+
+class Run:
+    """
+    Outcome of one simulated call.
+    """
+
+    def __init__(self, result: int, cycles: int, instructions: int):
+        self.result = result            # r0 on return
+        self.cycles = cycles
+        self.instructions = instructions
+
+class Machine:
+    """
+    Registers, flags and stack of a Cortex-M core executing one function at a
+    time. Every instruction costs its cycles from the target's table.
+    """
+
+    def __init__(self, target: str = DEFAULT_TARGET, max_steps: int = 1000000):
+        self.target = target
+        self.max_steps = max_steps
+        self.regs = dict()
+        self.n = self.z = self.c = self.v = False
+        self.memory = dict()    # word address -> value
+        self.program = None
+        self.pc = 0             # index of the next instruction
+        self.returned = False
+        self.it_conds = []      # conditions of the instructions left in the IT block
+
+        self.handlers = {
+            "adds":     self.exec_add_sub,
+            "subs":     self.exec_add_sub,
+            "rsbs":     self.exec_add_sub,
+            "ands":     self.exec_logic,
+            "orrs":     self.exec_logic,
+            "eors":     self.exec_logic,
+            "bics":     self.exec_logic,
+            "lsls":     self.exec_shift,
+            "lsrs":     self.exec_shift,
+            "asrs":     self.exec_shift,
+            "movs":     self.exec_mov,
+            "mvns":     self.exec_mov,
+            "mov":      self.exec_mov,
+            "mvn":      self.exec_mov,
+            "movw":     self.exec_movw_movt,
+            "movt":     self.exec_movw_movt,
+            "muls":     self.exec_multiply,
+            "mul":      self.exec_multiply,
+            "mla":      self.exec_multiply,
+            "mls":      self.exec_multiply,
+            "smull":    self.exec_long_multiply,
+            "umull":    self.exec_long_multiply,
+            "sdiv":     self.exec_divide,
+            "udiv":     self.exec_divide,
+            "sxtb":     self.exec_extend,
+            "sxth":     self.exec_extend,
+            "uxtb":     self.exec_extend,
+            "uxth":     self.exec_extend,
+            "ldr":      self.exec_load_store,
+            "str":      self.exec_load_store,
+            "ldrb":     self.exec_load_store,
+            "strb":     self.exec_load_store,
+            "ldrh":     self.exec_load_store,
+            "strh":     self.exec_load_store,
+            "add":      self.exec_sp_adjust,
+            "sub":      self.exec_sp_adjust,
+            "push":     self.exec_push,
+            "pop":      self.exec_pop,
+            "cmp":      self.exec_cmp,
+            "cmn":      self.exec_cmp,
+            "b":        self.exec_branch,
+            "b.w":      self.exec_branch,
+            "bl":       self.exec_branch,
+            "cbz":      self.exec_branch,
+            "cbnz":     self.exec_branch,
+            "bx":       self.exec_bx,
+            "it":       self.exec_it,
+            "itt":      self.exec_it,
+            "ite":      self.exec_it,
+            **{"b" + cond: self.exec_branch for cond in CONDITIONS},
+            **{"b" + cond + ".w": self.exec_branch for cond in CONDITIONS},
+            **{"mov" + cond: self.exec_conditional for cond in CONDITIONS},
+        }
+
+    #
+    #   Operands
+    #
+    def error(self, message: str) -> SimulationError:
+        mnemonic, operands = self.program.instructions[self.pc]
+        return SimulationError(f"{self.program.name}: {mnemonic} {', '.join(operands)}: {message}")
+
+    def read(self, operand: str) -> int:
+        if (imm := parse_imm(operand)) is not None:
+            return imm & MASK
+        if operand not in self.regs:
+            raise self.error(f"unknown register {operand}")
+        return self.regs[operand]
+
+    def write(self, operand: str, value: int):
+        if operand == "pc":
+            self.branch_to(value)
+        else:
+            self.regs[operand] = value & MASK
+
+    def set_nz(self, value: int):
+        self.n = bool(value >> 31)
+        self.z = value == 0
+
+    def holds(self, cond: str) -> bool:
+        return {
+            "eq": self.z, "ne": not self.z, "hs": self.c, "lo": not self.c,
+            "mi": self.n, "pl": not self.n, "vs": self.v, "vc": not self.v,
+            "hi": self.c and not self.z, "ls": not self.c or self.z,
+            "ge": self.n == self.v, "lt": self.n != self.v,
+            "gt": not self.z and self.n == self.v, "le": self.z or self.n != self.v,
+        }[cond]
+
+    def shifted(self, operands: list[str]) -> tuple[int, bool]:
+        # last operand value, with an optional trailing "lsl #n" applied
+        if operands[-1].split(" ")[0] in ("lsl", "lsr", "asr"):
+            kind, amount = operands[-1].split(" ")
+            return shift_c(self.read(operands[-2]), kind, parse_imm(amount), self.c)
+        return self.read(operands[-1]), self.c
+
+    def three_address(self, operands: list[str]) -> tuple[str, int]:
+        # destination and first source of op rd, rn, ... or op rdn, ...
+        if len(operands) == 2 or operands[-1].split(" ")[0] in ("lsl", "lsr", "asr") and len(operands) == 3:
+            return operands[0], self.read(operands[0])
+        return operands[0], self.read(operands[1])
+
+    def address(self, operand: str, size: int = 4) -> int:
+        # [base, #offset] or [base, index{, lsl #shift}] of an access of size bytes
+        parts = split_operands(operand.strip("[]"))
+        offset = self.read(parts[1]) if len(parts) > 1 else 0
+        if len(parts) > 2:
+            offset <<= parse_imm(parts[2].split(" ")[1])
+        address = (self.read(parts[0]) + offset) & MASK
+        if address % size:
+            raise self.error(f"unaligned {size}-byte access at {address:#x}")
+        return address
+
+    def load(self, address: int) -> int:
+        if address not in self.memory:
+            raise self.error(f"read of uninitialized memory at {address:#x}")
+        return self.memory[address]
+
+    def branch_to(self, address: int):
+        if address != RETURN_ADDRESS:
+            raise self.error(f"branch to {address:#x} outside the function")
+        self.returned = True
+
+    #
+    #   Instructions
+    #
+    def exec_add_sub(self, mnemonic: str, operands: list[str]):
+        rd, x = self.three_address(operands)
+        y, _ = self.shifted(operands)
+        if mnemonic == "adds":
+            result, self.c, self.v = add_with_carry(x, y, 0)
+        elif mnemonic == "subs":
+            result, self.c, self.v = add_with_carry(x, ~y & MASK, 1)
+        else:
+            result, self.c, self.v = add_with_carry(~x & MASK, y, 1)
+        self.write(rd, result)
+        self.set_nz(result)
+
+    def exec_logic(self, mnemonic: str, operands: list[str]):
+        rd, x = self.three_address(operands)
+        y, self.c = self.shifted(operands)
+        result = {"ands": x & y, "orrs": x | y, "eors": x ^ y, "bics": x & ~y & MASK}[mnemonic]
+        self.write(rd, result)
+        self.set_nz(result)
+
+    def exec_shift(self, mnemonic: str, operands: list[str]):
+        rd, x = self.three_address(operands)
+        amount = self.read(operands[-1]) & 0xFF
+        result, self.c = shift_c(x, mnemonic[:3], amount, self.c)
+        self.write(rd, result)
+        self.set_nz(result)
+
+    def exec_mov(self, mnemonic: str, operands: list[str]):
+        value, carry = self.shifted(operands)
+        if mnemonic.startswith("mvn"):
+            value = ~value & MASK
+        self.write(operands[0], value)
+        if mnemonic.endswith("s"):
+            self.c = carry
+            self.set_nz(value)
+
+    def exec_movw_movt(self, mnemonic: str, operands: list[str]):
+        imm = self.read(operands[1]) & 0xFFFF
+        if mnemonic == "movw":
+            self.write(operands[0], imm)
+        else:
+            self.write(operands[0], self.read(operands[0]) & 0xFFFF | imm << 16)
+
+    def exec_multiply(self, mnemonic: str, operands: list[str]):
+        values = [self.read(operand) for operand in operands[1:]]
+        product = values[0] * values[1]
+        if mnemonic == "mla":
+            product += values[2]
+        elif mnemonic == "mls":
+            product = values[2] - product
+        self.write(operands[0], product)
+        if mnemonic == "muls":
+            self.set_nz(product & MASK)
+
+    def exec_long_multiply(self, mnemonic: str, operands: list[str]):
+        lo, hi, rn, rm = operands
+        x, y = self.read(rn), self.read(rm)
+        if mnemonic == "smull":
+            x, y = signed(x, 32), signed(y, 32)
+        product = (x * y) & 0xFFFFFFFFFFFFFFFF
+        self.write(lo, product)
+        self.write(hi, product >> 32)
+
+    def exec_divide(self, mnemonic: str, operands: list[str]):
+        # the result of division by zero is 0 (the divide-by-zero trap is off by default)
+        x, y = self.read(operands[1]), self.read(operands[2])
+        if y == 0:
+            quotient = 0
+        elif mnemonic == "sdiv":
+            quotient = truncating_div(signed(x, 32), signed(y, 32))
+        else:
+            quotient = x // y
+        self.write(operands[0], quotient)
+
+    def exec_extend(self, mnemonic: str, operands: list[str]):
+        width = 8 if mnemonic.endswith("b") else 16
+        value = self.read(operands[1])
+        self.write(operands[0], signed(value, width) if mnemonic.startswith("s") else mask(value, width))
+
+    def exec_load_store(self, mnemonic: str, operands: list[str]):
+        if mnemonic == "ldr" and not operands[1].startswith("["):
+            if operands[1] not in self.program.words:
+                raise self.error(f"no literal {operands[1]}")
+            self.write(operands[0], self.program.words[operands[1]])
+            return
+
+        # bytes and halfwords are read out of / merged into their word
+        size = ACCESS_SIZES[mnemonic[3:]]
+        address = self.address(operands[1], size)
+        word, shift = address & ~3, 8 * (address & 3)
+        field = (1 << 8 * size) - 1
+        if mnemonic.startswith("ldr"):
+            self.write(operands[0], self.load(word) >> shift & field)
+        elif size == 4:
+            self.memory[word] = self.read(operands[0])
+        else:
+            old = self.memory.get(word, 0)
+            self.memory[word] = old & ~(field << shift) & MASK | (self.read(operands[0]) & field) << shift
+
+    def exec_sp_adjust(self, mnemonic: str, operands: list[str]):
+        # add / sub sp, sp, #imm, or add rd, sp, #imm
+        if operands[1] != "sp" or operands[0] != "sp" and mnemonic != "add":
+            raise self.error("add / sub without flags only adjust sp or take its address")
+        imm = self.read(operands[-1])
+        self.write(operands[0], self.read("sp") + (imm if mnemonic == "add" else -imm))
+
+    def exec_push(self, mnemonic: str, operands: list[str]):
+        regs = register_list(operands[0])
+        sp = self.read("sp") - 4 * len(regs)
+        for idx, reg in enumerate(sorted(regs, key=reg_index)):
+            self.memory[sp + 4 * idx] = self.read(reg)
+        self.write("sp", sp)
+
+    def exec_pop(self, mnemonic: str, operands: list[str]):
+        regs = sorted(register_list(operands[0]), key=reg_index)
+        sp = self.read("sp")
+        values = [self.load(sp + 4 * idx) for idx in range(len(regs))]
+        self.write("sp", sp + 4 * len(regs))
+        for reg, value in zip(regs, values):
+            self.write(reg, value)
+
+    def exec_cmp(self, mnemonic: str, operands: list[str]):
+        # cmp subtracts, cmn adds
+        if mnemonic == "cmp":
+            result, self.c, self.v = add_with_carry(self.read(operands[0]), ~self.read(operands[1]) & MASK, 1)
+        else:
+            result, self.c, self.v = add_with_carry(self.read(operands[0]), self.read(operands[1]), 0)
+        self.set_nz(result)
+
+    def exec_branch(self, mnemonic: str, operands: list[str]) -> bool | None:
+        # conditional branches return whether they were taken
+        label = operands[-1]
+        if label not in self.program.labels:
+            raise self.error(f"no label {label}")
+        mnemonic = mnemonic.removesuffix(".w")
+        if mnemonic in ("cbz", "cbnz"):
+            taken = (self.read(operands[0]) == 0) == (mnemonic == "cbz")
+        elif mnemonic != "b":
+            taken = self.holds(mnemonic[1:])
+        else:
+            taken = None
+            if mnemonic == "bl":
+                self.regs["lr"] = GARBAGE | 14
+        if taken is not False:
+            self.pc = self.program.labels[label] - 1
+        return taken
+
+    def exec_it(self, mnemonic: str, operands: list[str]):
+        inverse = {"eq": "ne", "hs": "lo", "mi": "pl", "vs": "vc", "hi": "ls", "ge": "lt", "gt": "le"}
+        inverse.update({value: key for key, value in inverse.items()})
+        cond = operands[0]
+        self.it_conds = [cond] + [cond if kind == "t" else inverse[cond] for kind in mnemonic[2:]]
+
+    def exec_conditional(self, mnemonic: str, operands: list[str]):
+        # mov<cond>, only valid as the next instruction of an IT block
+        cond = mnemonic[3:]
+        if not self.it_conds or self.it_conds.pop(0) != cond:
+            raise self.error("not the next instruction of an IT block")
+        if self.holds(cond):
+            self.exec_mov("mov", operands)
+
+    def exec_bx(self, mnemonic: str, operands: list[str]):
+        self.branch_to(self.read(operands[0]))
+
+    #
+    #   Calls
+    #
+    def call(self, program: Program, args: list[int]) -> Run:
+        """
+        Call program with args following the AAPCS (r0-r3, then the stack),
+        and check that it returns with sp and the callee-saved registers intact.
+        """
+        self.program = program
+        self.regs = {f"r{idx}": GARBAGE | idx for idx in range(13)}
+        for reg, value in zip(["r0", "r1", "r2", "r3"], args):
+            self.regs[reg] = value & MASK
+        self.memory = dict()
+        sp = STACK_TOP - 4 * len(args[4:])
+        for idx, value in enumerate(args[4:]):
+            self.memory[sp + 4 * idx] = value & MASK
+        self.regs["sp"] = sp
+        self.regs["lr"] = RETURN_ADDRESS
+        saved = {reg: self.regs[reg] for reg in CALLEE_SAVED}
+
+        self.pc = 0
+        self.returned = False
+        self.it_conds = []
+        cycles = steps = 0
+        while not self.returned:
+            if not 0 <= self.pc < len(program.instructions):
+                raise SimulationError(f"{program.name}: ran off the end of the function")
+            if steps == self.max_steps:
+                raise SimulationError(f"{program.name}: no return after {steps} instructions")
+            mnemonic, operands = program.instructions[self.pc]
+            if (handler := self.handlers.get(mnemonic)) is None:
+                raise self.error("unsupported instruction")
+            if self.it_conds and handler != self.exec_conditional:
+                raise self.error("IT block not followed by its conditional instructions")
+
+            # a conditional branch not taken costs one cycle
+            if handler(mnemonic, operands) is False:
+                cycles += cost(self.target, "alu")
+            else:
+                cycles += instruction_cycles(self.target, mnemonic, operands)
+            steps += 1
+            self.pc += 1
+
+        if self.regs["sp"] != sp:
+            raise SimulationError(f"{program.name}: sp is {self.regs['sp']:#x} on return, not {sp:#x}")
+        for reg, value in saved.items():
+            if self.regs[reg] != value:
+                raise SimulationError(f"{program.name}: callee-saved {reg} is not preserved")
+        return Run(self.regs["r0"], cycles, steps)
+
+def reg_index(reg: str) -> int:
+    # register lists are stored lowest register at the lowest address
+    return {"sp": 13, "lr": 14, "pc": 15}.get(reg) or int(reg[1:])
+
+
+#
+#   Checking against the reference interpreter
+#
+class FunctionCheck:
+    """
+    Simulated runs of one function that matched the reference.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.runs = 0
+        self.undefined = 0      # argument sets without a defined result, not run
+        self.cycles = []
+
+# argument values that tend to expose wrong code
+EDGE_VALUES = [0, 1, 2, 0x7F, 0x80, 0xFF, 0x7FFFFFFF, 0x80000000, 0xFFFFFFFF, 0xFFFFFFFE]
+
+def random_args(rng: random.Random, func_op: func.FuncOp) -> list[int]:
+    args = []
+    for arg in func_op.body.blocks[0].args:
+        kind = rng.random()
+        if kind < 0.3:
+            value = rng.choice(EDGE_VALUES)
+        elif kind < 0.6:
+            value = rng.randint(-1000, 1000)
+        else:
+            value = rng.getrandbits(32)
+        # narrower arguments arrive sign-extended to 32 bits
+        args.append(signed(value, width_of(arg)) & MASK)
+    return args
+
+def check_function(source_op: func.FuncOp, optimized_op: func.FuncOp, program: Program,
+                   target: str, runs: int, seed: int = 0) -> FunctionCheck:
+    """
+    Run program on runs seeded argument sets. Each result must match the
+    reference interpreter on the source IR; the optimized IR is interpreted as
+    well, so a mismatch is pinned on the optimizations or on the backend.
+    """
+    name = source_op.sym_name.data
+    function_type = source_op.function_type
+    width = function_type.outputs.data[0].width.data if function_type.outputs.data else None
+    rng = random.Random(f"{seed}:{name}")
+    machine = Machine(target)
+    check = FunctionCheck(name)
+
+    for _ in range(runs):
+        args = random_args(rng, source_op)
+        call = f"{name}({', '.join(str(signed(arg, 32)) for arg in args)})"
+        try:
+            expected = interpret_function(source_op, args)
+        except UndefinedBehavior:
+            check.undefined += 1
+            continue
+        try:
+            optimized = interpret_function(optimized_op, args)
+        except UndefinedBehavior as e:
+            raise SimulationError(f"{call}: the optimized IR is undefined ({e})")
+        if optimized != expected:
+            raise SimulationError(f"{call}: the optimized IR returns {optimized}, expected {expected}")
+
+        run = machine.call(program, args)
+        if width is not None and mask(run.result, width) != expected:
+            raise SimulationError(f"{call}: the machine code returns {mask(run.result, width)}, "
+                                  f"expected {expected}")
+        check.runs += 1
+        check.cycles.append(run.cycles)
+    return check
+
+def check_module(source: builtin.ModuleOp, optimized: builtin.ModuleOp, asm_text: str,
+                 target: str = DEFAULT_TARGET, runs: int = 100, seed: int = 0) -> list[FunctionCheck]:
+    """
+    check_function for every function of source, with its optimized IR and its
+    code in asm_text.
+    """
+    programs = parse_asm(asm_text)
+    optimized_ops = {op.sym_name.data: op for op in optimized.ops if isinstance(op, func.FuncOp)}
+    checks = []
+    for op in source.ops:
+        if not isinstance(op, func.FuncOp):
+            continue
+        name = op.sym_name.data
+        if name not in programs or name not in optimized_ops:
+            raise SimulationError(f"{name} is missing from the generated code")
+        checks.append(check_function(op, optimized_ops[name], programs[name], target, runs, seed))
+    return checks
+
+def format_simulation(filename: str, checks: list[FunctionCheck], target: str) -> str:
+    lines = [f"{filename} ({target}, simulated):",
+             f"  {'function':<24} {'runs':>5} {'min':>7} {'avg':>9} {'max':>7}"]
+    for check in checks:
+        if check.cycles:
+            average = sum(check.cycles) / len(check.cycles)
+            lines.append(f"  {check.name:<24} {check.runs:5} {min(check.cycles):7} "
+                         f"{average:9.1f} {max(check.cycles):7}")
+        else:
+            lines.append(f"  {check.name:<24} {0:5} {'-':>7} {'-':>9} {'-':>7}")
+    return "\n".join(lines)
@@ -0,0 +1,56 @@
+"""
+Pass statistics reports: merging the per-file reports of the pass manager and
+printing them (kept free of xDSL imports, like jobs.py, for the server client)
+"""
+
+import json
+
+
+# reports are plain dicts, so they survive pickling and the server's JSON:
+#   {"files": n, "passes": [[name, seconds, ops before, ops after], ...],
+#    "patterns": {pattern class name: rewrites}}
+def merge_reports(reports: list[dict | None]) -> dict:
+    """
+    Sum per-file reports: times and op counts by pass name (in first-seen
+    order) and fires by pattern.
+    """
+    merged = {"files": 0, "passes": [], "patterns": dict()}
+    by_name = dict()
+    for report in reports:
+        if report is None:
+            continue
+        merged["files"] += report["files"]
+        for name, seconds, ops_before, ops_after in report["passes"]:
+            if name not in by_name:
+                by_name[name] = [name, 0.0, 0, 0]
+                merged["passes"].append(by_name[name])
+            by_name[name][1] += seconds
+            by_name[name][2] += ops_before
+            by_name[name][3] += ops_after
+        for name, count in report["patterns"].items():
+            merged["patterns"][name] = merged["patterns"].get(name, 0) + count
+    return merged
+
+def format_time_passes(report: dict) -> str:
+    total = sum(seconds for _, seconds, _, _ in report["passes"]) or 1.0
+    lines = [f"===== Pass execution timing report ({report['files']} file(s)) =====",
+             f"{'Wall time (s)':>14} {'%':>6} {'Ops before':>11} {'Ops after':>10}  Pass"]
+    for name, seconds, ops_before, ops_after in report["passes"]:
+        lines.append(f"{seconds:14.4f} {100 * seconds / total:6.1f} {ops_before:11} {ops_after:10}  {name}")
+    lines.append(f"{total:14.4f} {100.0:6.1f} {'':11} {'':10}  total")
+    return "\n".join(lines)
+
+def format_stats(report: dict) -> str:
+    lines = [f"===== Pattern statistics ({report['files']} file(s)) ====="]
+    for name, count in sorted(report["patterns"].items(), key=lambda item: (-item[1], item[0])):
+        lines.append(f"{count:10}  {name}")
+    if not report["patterns"]:
+        lines.append("  (no patterns fired)")
+    return "\n".join(lines)
+
+def write_report(filename: str, report: dict):
+    passes = [{"name": name, "seconds": seconds, "ops_before": ops_before, "ops_after": ops_after}
+              for name, seconds, ops_before, ops_after in report["passes"]]
+    with open(filename, "w") as f:
+        json.dump({**report, "passes": passes}, f, indent=2)
+        f.write("\n")
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# the compiler is imported as src.*, the way pcc.py does from the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
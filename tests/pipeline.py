@@ -0,0 +1,134 @@
+"""
+Helpers shared by the tests: compile picoC sources or MLIR text for a target,
+and check the generated code in the simulator against the reference interpreter
+"""
+
+import io
+import os
+import random
+
+from src.driver import (
+    Options,
+    PassManager,
+    check_module,
+    compile_file,
+    fused_passes,
+    lowering_passes,
+    make_context,
+    optimization_passes,
+    parse_mlir,
+    print_asm,
+    simulate_file,
+)
+
+TARGETS = ["cortex-m33", "cortex-m0plus", "cortex-m0plus-smallmul"]
+
+# simulated calls per function, on seeded arguments (edge values included)
+RUNS = 25
+
+
+def compile_c(tmp_path, source: str, target: str, fused_walk: bool = False,
+              emit_obj: bool = False, name: str = "prog") -> tuple[str, Options]:
+    """
+    Compile source with the native front-end and no cache. Returns the stem of
+    the outputs (<stem>.s, and <stem>.o with emit_obj) and the options used.
+    """
+    in_file = os.path.join(tmp_path, f"{name}.c")
+    with open(in_file, "w") as f:
+        f.write(source)
+    stem = os.path.join(tmp_path, f"{name}-{target}{'-fused' if fused_walk else ''}")
+    options = Options(frontend="native", target=target, fused_walk=fused_walk, emit_obj=emit_obj)
+    compile_file(make_context(), in_file, stem, options)
+    return stem, options
+
+def read_asm(stem: str) -> str:
+    with open(f"{stem}.s", "r") as f:
+        return f.read()
+
+def simulate_c(tmp_path, source: str, target: str, fused_walk: bool = False, runs: int = RUNS) -> list:
+    """
+    Compile source and run every function in the simulator; raises
+    SimulationError when the code disagrees with the interpreter.
+    """
+    stem, options = compile_c(tmp_path, source, target, fused_walk)
+    return simulate_file(make_context(), os.path.join(tmp_path, "prog.c"), stem, options, runs)
+
+def compile_mlir(text: str, target: str, fused_walk: bool = False) -> str:
+    # the backend alone, on MLIR as cgeist emits it
+    module = parse_mlir(make_context(), io.StringIO(text))
+    if fused_walk:
+        PassManager().run(module, fused_passes(target))
+    else:
+        PassManager().run(module, optimization_passes(target))
+        PassManager().run(module, lowering_passes(target))
+    buffer = io.StringIO()
+    print_asm(module, out_file=buffer, target=target)
+    return buffer.getvalue()
+
+def simulate_mlir(text: str, target: str, fused_walk: bool = False, runs: int = RUNS) -> list:
+    asm_text = compile_mlir(text, target, fused_walk)
+    source = parse_mlir(make_context(), io.StringIO(text))
+    optimized = source.clone()
+    PassManager().run(optimized, optimization_passes(target))
+    return check_module(source, optimized, asm_text, target, runs)
+
+#
+#   Generated programs
+#
+BINARY_OPS = ["+", "-", "*", "&", "|", "^", "<", "==", "!=", "&&", "||"]
+
+def random_expr(rng: random.Random, names: list[str], depth: int) -> str:
+    if depth == 0 or rng.random() < 0.3:
+        return rng.choice(names) if rng.random() < 0.7 else str(rng.randrange(10))
+    op = rng.choice(BINARY_OPS + ["<<", ">>", "/", "%"])
+    lhs = random_expr(rng, names, depth - 1)
+    # constant shift amounts and divisors, so every target compiles it
+    if op in ("<<", ">>"):
+        return f"({lhs} {op} {rng.randrange(8)})"
+    if op in ("/", "%"):
+        return f"({lhs} {op} {rng.choice([2, 3, 4, 5, 7, 10])})"
+    return f"({lhs} {op} {random_expr(rng, names, depth - 1)})"
+
+def random_statements(rng: random.Random, names: list[str], local_vars: list[str],
+                      depth: int, count: int) -> list[str]:
+    lines = []
+    for _ in range(count):
+        kind = rng.random()
+        if depth and kind < 0.2:
+            then = random_statements(rng, names, local_vars, depth - 1, rng.randrange(1, 3))
+            line = f"if ({random_expr(rng, names, 2)}) {{ {' '.join(then)} }}"
+            if rng.random() < 0.5:
+                line += f" else {{ {' '.join(random_statements(rng, names, local_vars, depth - 1, 1))} }}"
+            lines.append(line)
+        elif depth and kind < 0.35:
+            # a constant trip count, or one bounded by a local
+            iv = f"i{depth}"
+            bound = rng.choice(["8", "5", f"({rng.choice(local_vars)} & 7)"])
+            body = random_statements(rng, names + [iv], local_vars, depth - 1, rng.randrange(1, 3))
+            lines.append(f"for (int {iv} = {rng.randrange(3)}; {iv} < {bound}; {iv} += {rng.randrange(1, 3)}) "
+                         f"{{ {' '.join(body)} }}")
+        else:
+            op = rng.choice(["=", "+=", "-=", "^="])
+            lines.append(f"{rng.choice(local_vars)} {op} {random_expr(rng, names, 2)};")
+    return lines
+
+def random_program(seed: int, functions: int = 4) -> str:
+    """
+    Deterministic (for a given seed) picoC functions with nested branches and
+    loops, on int and char values of either signedness.
+    """
+    rng = random.Random(seed)
+    lines = []
+    for idx in range(functions):
+        param_type = rng.choice(["int", "unsigned", "char", "unsigned char"])
+        params = [f"p{i}" for i in range(rng.randrange(1, 4))]
+        local_vars = [f"v{i}" for i in range(rng.randrange(1, 4))]
+        local_type = "unsigned" if "unsigned" in param_type else "int"
+        body = [f"{local_type} {var} = {rng.choice(params)};" for var in local_vars]
+        body += random_statements(rng, params + local_vars, local_vars, 2, rng.randrange(2, 6))
+        result = rng.choice([rng.choice(local_vars), str(rng.randrange(300)),
+                             random_expr(rng, params + local_vars, 2)])
+        lines.append(f"unsigned f{idx}({', '.join(param_type + ' ' + p for p in params)}) {{")
+        lines += [f"    {line}" for line in body]
+        lines += [f"    return {result};", "}"]
+    return "\n".join(lines) + "\n"
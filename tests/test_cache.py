@@ -0,0 +1,80 @@
+"""
+The compilation cache: whole-file hits, per-function reuse and LRU eviction
+"""
+
+import os
+
+import pytest
+
+import src.driver as driver
+from src.cache import Cache
+from src.driver import Options, compile_file, make_context
+
+SOURCE = """
+int add(int a, int b) { return a + b; }
+int scale(int a) { return a * 10 - 3; }
+int pick(int a, int b) { if (a < b) return a; return b; }
+"""
+
+
+@pytest.fixture
+def compiled(monkeypatch):
+    # indices of the functions the backend compiled, rather than took from the cache
+    calls = []
+    compile_function = driver.compile_function
+
+    def counting(job):
+        calls.append(job[0])
+        return compile_function(job)
+
+    monkeypatch.setattr(driver, "compile_function", counting)
+    return calls
+
+def compile_source(tmp_path, source: str, cache_dir: str | None, emit_obj: bool = False) -> str:
+    in_file = os.path.join(tmp_path, "prog.c")
+    with open(in_file, "w") as f:
+        f.write(source)
+    stem = os.path.join(tmp_path, "out", "cached" if cache_dir else "uncached")
+    os.makedirs(os.path.dirname(stem), exist_ok=True)
+    options = Options(frontend="native", cache_dir=cache_dir, emit_obj=emit_obj)
+    compile_file(make_context(), in_file, stem, options)
+    return stem
+
+def read(path: str, mode: str = "r"):
+    with open(path, mode) as f:
+        return f.read()
+
+
+def test_second_run_hits(tmp_path, compiled):
+    cache_dir = os.path.join(tmp_path, "cache")
+    stem = compile_source(tmp_path, SOURCE, cache_dir, emit_obj=True)
+    assert compiled == [0, 1, 2]
+    first = read(f"{stem}.s"), read(f"{stem}.o", "rb")
+
+    os.remove(f"{stem}.s")
+    os.remove(f"{stem}.o")
+    compile_source(tmp_path, SOURCE, cache_dir, emit_obj=True)
+    assert compiled == [0, 1, 2]
+    assert (read(f"{stem}.s"), read(f"{stem}.o", "rb")) == first
+
+def test_edit_recompiles_only_that_function(tmp_path, compiled):
+    cache_dir = os.path.join(tmp_path, "cache")
+    compile_source(tmp_path, SOURCE, cache_dir)
+    compiled.clear()
+
+    edited = SOURCE.replace("a * 10 - 3", "a * 10 - 4")
+    stem = compile_source(tmp_path, edited, cache_dir)
+    assert compiled == [1]
+    assert read(f"{stem}.s") == read(f"{compile_source(tmp_path, edited, None)}.s")
+
+def test_evict_removes_least_recently_used(tmp_path):
+    cache = Cache(os.path.join(tmp_path, "cache"), max_bytes=2500)
+    keys = ["aa" + str(idx) * 62 for idx in range(4)]
+    for age, key in enumerate(keys):
+        cache.put(key, "asm.s", "x" * 1000)
+        os.utime(cache.entry_dir(key), (1000 + age, 1000 + age))
+
+    # reading the oldest entry makes it the most recently used
+    assert cache.get(keys[0], "asm.s") is not None
+    cache.evict()
+    assert [cache.get(key, "asm.s") is not None for key in keys] == [True, False, False, True]
@@ -0,0 +1,45 @@
+"""
+The object files the encoder writes, checked byte for byte against llvm-mc
+assembling the same .s
+"""
+
+import os
+import shutil
+import subprocess
+
+import pytest
+
+from pipeline import compile_c
+
+TRIPLES = {"cortex-m33": "thumbv8m.main-none-eabi", "cortex-m0plus": "thumbv6m-none-eabi"}
+
+PROGRAMS = {
+    "constants": """
+        int small(int a) { return a + 255; }
+        int wide(int a) { int x = 65535; if (a > 3) x = 256; else if (a < -3) x = 1000; return x; }
+        int modified(int a) { int x = 0xFF00; if (a > 3) x = 0x10001; return x; }
+        int large(int a) { return (a ^ 0x10001) + (a & 0x12345678) - 0x7F000000; }
+    """,
+    "compares": """
+        int cmps(int a) { return (a > -1) + (a == -5) * 2 + (a < -256) * 4 + (a != 255) * 8 + (a >= 1000) * 16; }
+        int loop(int n) { int s = 0; for (int i = -300; i < n; i += 7) s += i; return s; }
+    """,
+}
+
+
+def text_section(obj: str) -> bytes:
+    out = f"{obj}.text"
+    subprocess.run(["llvm-objcopy", "-O", "binary", "--only-section=.text", obj, out], check=True)
+    with open(out, "rb") as f:
+        return f.read()
+
+
+@pytest.mark.skipif(shutil.which("llvm-mc") is None or shutil.which("llvm-objcopy") is None,
+                    reason="no llvm-mc or llvm-objcopy")
+@pytest.mark.parametrize("target", TRIPLES)
+@pytest.mark.parametrize("name", PROGRAMS)
+def test_matches_llvm_mc(tmp_path, name, target):
+    stem, _ = compile_c(tmp_path, PROGRAMS[name], target, emit_obj=True)
+    reference = os.path.join(tmp_path, "reference.o")
+    subprocess.run(["llvm-mc", f"-triple={TRIPLES[target]}", "-filetype=obj", f"{stem}.s", "-o", reference], check=True)
+    assert text_section(f"{stem}.o") == text_section(reference)
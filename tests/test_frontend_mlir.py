@@ -0,0 +1,68 @@
+"""
+Ingestion of cgeist's output: attribute dictionaries dropped by the
+brace-aware filter, and the module parsed one function at a time
+"""
+
+import io
+
+from src.driver import make_context, parse_mlir
+from src.frontend_mlir import MLIRFilter, filter_mlir
+
+# as cgeist writes it: a dlti spec on the module, linkage on every function,
+# dictionaries nested and split over lines, and braces inside string literals
+CGEIST_OUTPUT = """\
+module attributes {dlti.dl_spec = #dlti.dl_spec<#dlti.dl_entry<"dlti.endianness", "little">, #dlti.dl_entry<i64, dense<64> : vector<2xi32>>>, llvm.data_layout = "e-m:e-p:32:32-Fi8-i64:64-v128:64:64-a:0:32-n32-S64", llvm.target_triple = "thumbv6m-none-unknown-eabi", "polygeist.target-cpu" = "cortex-m0plus"} {
+  func.func @add(%arg0: i32, %arg1: i32) -> i32 attributes {llvm.linkage = #llvm.linkage<external>} {
+    %0 = arith.addi %arg0, %arg1 : i32
+    return %0 : i32
+  }
+  func.func @attributes(%attributes: i32) -> i32 attributes {llvm.linkage = #llvm.linkage<external>,
+      passthrough = [{name = "}", value = {depth = {n = 2 : i32}}}], note = "attributes { \\" } {"} {
+    %c3_i32 = arith.constant 3 : i32
+    %0 = arith.muli %attributes, %c3_i32 : i32
+    return %0 : i32
+  }
+}
+"""
+
+FILTERED = """\
+builtin.module {
+  func.func @add(%arg0: i32, %arg1: i32) -> i32 {
+    %0 = arith.addi %arg0, %arg1 : i32
+    return %0 : i32
+  }
+  func.func @attributes(%attributes: i32) -> i32 {
+    %c3_i32 = arith.constant 3 : i32
+    %0 = arith.muli %attributes, %c3_i32 : i32
+    return %0 : i32
+  }
+}
+"""
+
+
+def test_filter_drops_attribute_dictionaries():
+    assert "".join(filter_mlir(io.StringIO(CGEIST_OUTPUT))) == FILTERED
+
+def test_filter_keeps_other_dictionaries():
+    # an op's own attribute dictionary is not preceded by `attributes`
+    line = '    "test.op"() {label = "}", inner = {a = 1 : i32}} : () -> ()\n'
+    assert "".join(filter_mlir([line])) == line
+
+def test_filter_completes_ops_as_they_end():
+    mlir_filter = MLIRFilter()
+    lines = CGEIST_OUTPUT.splitlines(keepends=True)
+    ops = []
+    for idx, line in enumerate(lines):
+        mlir_filter.feed(line)
+        ops += [(idx, text) for text in mlir_filter.pop_ops()]
+
+    # @add is ready on its closing line, long before the module ends
+    assert [idx for idx, _ in ops] == [4, 10]
+    assert ops[0][1].lstrip().startswith("func.func @add(") and "attributes" not in ops[0][1]
+    assert ops[1][1].lstrip().startswith("func.func @attributes(%attributes: i32) -> i32 {")
+
+def test_parse_mlir():
+    module = parse_mlir(make_context(), io.StringIO(CGEIST_OUTPUT))
+    assert [op.sym_name.data for op in module.ops] == ["add", "attributes"]
+    assert not any(op.attributes.keys() - {"sym_name", "function_type"} for op in module.ops)
+    assert str(module) == str(parse_mlir(make_context(), io.StringIO(FILTERED)))
@@ -0,0 +1,69 @@
+"""
+Programs whose results are checked against the host C compiler rather than the
+reference interpreter, on fixed arguments: the regressions of casts between
+compare results and wider or narrower integers
+"""
+
+import os
+import random
+import shutil
+import subprocess
+
+import pytest
+
+from pipeline import TARGETS, compile_c, read_asm
+from src.driver import parse_picoc
+from src.interpreter import mask, signed, width_of
+from src.simulator import Machine, parse_asm
+
+# picoC: 32-bit int, signed char, wrapping arithmetic
+GCC_FLAGS = ["-O0", "-fsigned-char", "-fwrapv", "-w"]
+
+PROGRAMS = {
+    "bool_plus_char": "char f(int a, int b) { char c = (a < b) + 5; return c; }",
+    "bool_compared_signed": "int f(int a, int b) { return (a <= b) >= (b >> 1); }",
+    "bool_compared_char": "int f(char a, int b) { char c = a < b; return c > (char)(b - 1); }",
+    "bool_negated": "int f(int a, int b) { int t = (a < b) == (b < 3); return -(a > b) + t; }",
+}
+
+# arguments the regressions were found with, then seeded ones
+FIXED_ARGS = [(951361512, 2147483647), (0, 1), (1, 0), (-1, 0), (5, -2147483648)]
+
+
+def arguments(count: int = 24) -> list[tuple[int, int]]:
+    rng = random.Random(0)
+    args = list(FIXED_ARGS)
+    while len(args) < count:
+        args.append((rng.randint(-2**31, 2**31 - 1), rng.choice([0, 1, -1, 3, 127, 128, rng.randint(-300, 300)])))
+    return args
+
+def gcc_results(tmp_path, source: str, args: list[tuple[int, int]]) -> list[int]:
+    # f compiled for the host, called on each argument pair
+    calls = "\n".join(f"    printf(\"%d\\n\", (int)f({a}, {b}));" for a, b in args)
+    harness = os.path.join(tmp_path, "harness.c")
+    with open(harness, "w") as out:
+        out.write(f"#include <stdio.h>\n{source}\nint main(void) {{\n{calls}\n    return 0;\n}}\n")
+    binary = os.path.join(tmp_path, "harness")
+    subprocess.run(["gcc", *GCC_FLAGS, harness, "-o", binary], check=True)
+    output = subprocess.run([binary], check=True, capture_output=True, text=True).stdout
+    return [int(line) for line in output.split()]
+
+
+@pytest.mark.skipif(shutil.which("gcc") is None, reason="no host gcc")
+@pytest.mark.parametrize("target", TARGETS)
+@pytest.mark.parametrize("name", PROGRAMS)
+def test_matches_gcc(tmp_path, name, target):
+    source = PROGRAMS[name]
+    func_op = parse_picoc(source).ops.first
+    params = [width_of(arg) for arg in func_op.body.blocks[0].args]
+    width = func_op.function_type.outputs.data[0].width.data
+
+    args = arguments()
+    expected = gcc_results(tmp_path, source, args)
+    stem, _ = compile_c(tmp_path, source, target)
+    program = parse_asm(read_asm(stem))["f"]
+    machine = Machine(target)
+    for (a, b), result in zip(args, expected):
+        # narrower arguments arrive sign-extended, like the host passes them
+        run = machine.call(program, [signed(mask(a, params[0]), params[0]), signed(mask(b, params[1]), params[1])])
+        assert signed(mask(run.result, width), width) == result, f"f({a}, {b}) on {target}"
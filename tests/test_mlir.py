@@ -0,0 +1,189 @@
+"""
+The backend on MLIR as cgeist emits it (memref locals, index-typed loops),
+for every target, checked in the simulator against the reference interpreter
+"""
+
+import pytest
+
+from pipeline import TARGETS, compile_mlir, simulate_mlir
+
+LOCALS = """
+module {
+  func.func @loop(%arg0: i32) -> i32 {
+    %c0 = arith.constant 0 : index
+    %c0_i32 = arith.constant 0 : i32
+    %c1_i32 = arith.constant 1 : i32
+    %c100_i32 = arith.constant 100 : i32
+    %0 = memref.alloca() : memref<1xi32>
+    %1 = memref.alloca() : memref<1xi32>
+    memref.store %c0_i32, %0[%c0] : memref<1xi32>
+    memref.store %c0_i32, %1[%c0] : memref<1xi32>
+    %n = arith.andi %arg0, %c100_i32 : i32
+    scf.while () : () -> () {
+      %2 = memref.load %1[%c0] : memref<1xi32>
+      %3 = arith.cmpi slt, %2, %n : i32
+      scf.condition(%3)
+    } do {
+      %4 = memref.load %0[%c0] : memref<1xi32>
+      %5 = memref.load %1[%c0] : memref<1xi32>
+      %6 = arith.addi %4, %5 : i32
+      memref.store %6, %0[%c0] : memref<1xi32>
+      %7 = arith.addi %5, %c1_i32 : i32
+      memref.store %7, %1[%c0] : memref<1xi32>
+      scf.yield
+    }
+    %8 = memref.load %0[%c0] : memref<1xi32>
+    return %8 : i32
+  }
+  func.func @array(%arg0: i32, %arg1: i32) -> i32 {
+    %c1 = arith.constant 1 : index
+    %c2 = arith.constant 2 : index
+    %c0_i32 = arith.constant 0 : i32
+    %c1_i32 = arith.constant 1 : i32
+    %c7_i32 = arith.constant 7 : i32
+    %c8_i32 = arith.constant 8 : i32
+    %a = memref.alloca() : memref<8xi32>
+    scf.for %i = %c0_i32 to %c8_i32 step %c1_i32 : i32 {
+      %1 = arith.muli %i, %arg0 : i32
+      %2 = arith.index_cast %i : i32 to index
+      memref.store %1, %a[%2] : memref<8xi32>
+    }
+    memref.store %arg1, %a[%c2] : memref<8xi32>
+    %3 = memref.load %a[%c2] : memref<8xi32>
+    %4 = arith.andi %arg1, %c7_i32 : i32
+    %5 = arith.index_cast %4 : i32 to index
+    %6 = memref.load %a[%5] : memref<8xi32>
+    %7 = memref.load %a[%c1] : memref<8xi32>
+    %8 = arith.addi %3, %6 : i32
+    %9 = arith.addi %8, %7 : i32
+    return %9 : i32
+  }
+  func.func @bytes(%arg0: i32, %arg1: i32) -> i32 {
+    %c0 = arith.constant 0 : index
+    %c1 = arith.constant 1 : index
+    %c2 = arith.constant 2 : index
+    %c2_i32 = arith.constant 2 : i32
+    %b = memref.alloca() : memref<3xi8>
+    %h = memref.alloca() : memref<2x3xi16>
+    %0 = arith.trunci %arg0 : i32 to i8
+    %1 = arith.trunci %arg1 : i32 to i16
+    memref.store %0, %b[%c0] : memref<3xi8>
+    memref.store %0, %b[%c1] : memref<3xi8>
+    memref.store %0, %b[%c2] : memref<3xi8>
+    memref.store %1, %h[%c1, %c1] : memref<2x3xi16>
+    memref.store %1, %h[%c0, %c1] : memref<2x3xi16>
+    %2 = arith.remui %arg1, %c2_i32 : i32
+    %m = arith.index_cast %2 : i32 to index
+    %4 = memref.load %h[%m, %c1] : memref<2x3xi16>
+    %6 = memref.load %b[%m] : memref<3xi8>
+    %8 = arith.extsi %4 : i16 to i32
+    %9 = arith.extui %6 : i8 to i32
+    %10 = arith.addi %8, %9 : i32
+    return %10 : i32
+  }
+  func.func @overwritten(%arg0: i32, %arg1: i32) -> i32 {
+    %c0 = arith.constant 0 : index
+    %c1 = arith.constant 1 : index
+    %c4 = arith.constant 4 : index
+    %a = memref.alloca() : memref<4xi32>
+    memref.store %arg0, %a[%c0] : memref<4xi32>
+    memref.store %arg1, %a[%c0] : memref<4xi32>
+    memref.store %arg0, %a[%c1] : memref<4xi32>
+    scf.for %i = %c1 to %c4 step %c1 {
+      %p = arith.subi %i, %c1 : index
+      %v = memref.load %a[%p] : memref<4xi32>
+      %w = arith.addi %v, %arg1 : i32
+      memref.store %w, %a[%i] : memref<4xi32>
+      memref.store %v, %a[%i] : memref<4xi32>
+    }
+    %x = memref.load %a[%c0] : memref<4xi32>
+    %y = memref.load %a[%c1] : memref<4xi32>
+    memref.store %x, %a[%c1] : memref<4xi32>
+    %z = arith.addi %x, %y : i32
+    memref.store %z, %a[%c0] : memref<4xi32>
+    return %z : i32
+  }
+}
+"""
+
+INDEX_LOOPS = """
+module {
+  func.func @sum(%arg0: i32) -> i32 {
+    %c0 = arith.constant 0 : index
+    %c1 = arith.constant 1 : index
+    %c0_i32 = arith.constant 0 : i32
+    %0 = arith.index_cast %arg0 : i32 to index
+    %1 = scf.for %i = %c0 to %0 step %c1 iter_args(%s = %c0_i32) -> (i32) {
+      %2 = arith.index_cast %i : index to i32
+      %3 = arith.addi %s, %2 : i32
+      scf.yield %3 : i32
+    }
+    return %1 : i32
+  }
+  func.func @nest(%arg0: i32, %arg1: i32) -> i32 {
+    %c0 = arith.constant 0 : index
+    %c1 = arith.constant 1 : index
+    %c2 = arith.constant 2 : index
+    %c0_i32 = arith.constant 0 : i32
+    %c63_i32 = arith.constant 63 : i32
+    %n0 = arith.andi %arg0, %c63_i32 : i32
+    %m0 = arith.andi %arg1, %c63_i32 : i32
+    %n = arith.index_cast %n0 : i32 to index
+    %m = arith.index_cast %m0 : i32 to index
+    %r = scf.for %i = %c0 to %n step %c2 iter_args(%s = %c0_i32) -> (i32) {
+      %r2 = scf.for %j = %i to %m step %c1 iter_args(%t = %s) -> (i32) {
+        %k = arith.addi %i, %j : index
+        %k1 = arith.addi %k, %c1 : index
+        %c = arith.cmpi slt, %k1, %m : index
+        %v = arith.index_cast %k1 : index to i32
+        %w = arith.select %c, %v, %c0_i32 : i32
+        %u = arith.addi %t, %w : i32
+        scf.yield %u : i32
+      }
+      scf.yield %r2 : i32
+    }
+    return %r : i32
+  }
+  func.func @table(%arg0: i32) -> i32 {
+    %c0 = arith.constant 0 : index
+    %c1 = arith.constant 1 : index
+    %c8 = arith.constant 8 : index
+    %c0_i32 = arith.constant 0 : i32
+    %a = memref.alloca() : memref<8xi32>
+    scf.for %i = %c0 to %c8 step %c1 {
+      %v = arith.index_cast %i : index to i32
+      %w = arith.muli %v, %arg0 : i32
+      memref.store %w, %a[%i] : memref<8xi32>
+    }
+    %r = scf.for %i = %c0 to %c8 step %c1 iter_args(%s = %c0_i32) -> (i32) {
+      %x = memref.load %a[%i] : memref<8xi32>
+      %t = arith.xori %s, %x : i32
+      scf.yield %t : i32
+    }
+    return %r : i32
+  }
+}
+"""
+
+def cases():
+    for name, text in (("locals", LOCALS), ("index-loops", INDEX_LOOPS)):
+        for target in TARGETS:
+            yield pytest.param(text, target, id=f"{name}-{target}")
+
+
+@pytest.mark.parametrize("fused_walk", [False, True], ids=["staged", "fused"])
+@pytest.mark.parametrize("text, target", cases())
+def test_matches_interpreter(text, target, fused_walk):
+    checks = simulate_mlir(text, target, fused_walk)
+    assert all(check.runs > 0 for check in checks)
+
+@pytest.mark.parametrize("text, target", cases())
+def test_fused_walk_matches_staged(text, target):
+    assert compile_mlir(text, target, fused_walk=True) == compile_mlir(text, target)
+
+def test_unread_stores_are_dropped():
+    # of the stores into a in @overwritten, only the second into a[0], the
+    # first into a[1] and the second into a[i] in the loop are ever read
+    asm_text = compile_mlir(LOCALS, "cortex-m0plus")
+    body = asm_text.split("overwritten:")[1].split(".global")[0]
+    assert sum(line.split()[0] == "str" for line in body.splitlines() if line.strip()) == 3
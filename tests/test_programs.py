@@ -0,0 +1,184 @@
+"""
+Sample programs for each part of the backend, compiled for every target
+(staged and with the fused walk) and run in the simulator against the
+reference interpreter
+"""
+
+import pytest
+
+from pipeline import TARGETS, compile_c, random_program, read_asm, simulate_c
+from src.backend_arm_dialect import LoweringError
+
+# what it exercises -> picoC source
+PROGRAMS = {
+    "register_pressure": """
+        int pressure(int a, int b, int c, int d) {
+            int e = a * b; int f = b - c; int g = c ^ d; int h = d + a;
+            int i = e | f; int j = f & g; int k = g - h; int l = h * e;
+            int m = i + j; int n = k - l; int o = a - d; int p = b + c;
+            return m ^ n ^ o ^ p ^ e ^ f ^ g ^ h ^ i ^ j ^ k ^ l;
+        }
+        int stack_args(int a, int b, int c, int d, int e, int f) {
+            return a - b + c - d + e * f;
+        }
+    """,
+    "integer_ops": """
+        int chars(int a, char b) { char c = a + b; unsigned char d = c; return c * 3 + d; }
+        unsigned logic(unsigned a, unsigned b) { return (a >> 3) ^ ~b | (a & 7); }
+        int shifts(int a, int b) { return (a << 4) + (a >> 2) - (b << 31); }
+    """,
+    "immediates": """
+        int imms(int x, unsigned y) {
+            int a = x + 255; int b = a + 256; int c = b - 1000;
+            int d = c & 0xFF00FF00; int e = d | 0x55; int g = e ^ -3;
+            return g + (y >> 3) + (x - -1);
+        }
+    """,
+    "constant_folding": """
+        int fold(int a, int b) {
+            int c = (a + 3) + 4; int d = 2 * 5 + c - c; int e = (a ^ a) | b;
+            return c * 1 + d + e - (b - b) + (a * 0) + b * -1;
+        }
+    """,
+    "constant_multiplies": """
+        int muls(int a) { return a * 3 + a * 10 - a * 255 + a * -9 + a * 1024; }
+    """,
+    "peephole": """
+        int peep(int a, int b) { int c = a - a; int d = b ^ b; return (7 - a) + c + d + (0 - b); }
+    """,
+    "fused_ops": """
+        int fused(int a, int b, int c) {
+            return a * b + c - (b * c) + (a << 3) - (b >> 2) + (a & ~c) + ~b;
+        }
+    """,
+    "wide_constants": """
+        int consts(int a) { return (a ^ 0x12345678) + (a & 0xFFFF) - 0x10001 + (a | 0x7F000000); }
+    """,
+    "control_flow": """
+        int absdiff(int a, int b) { if (a > b) return a - b; return b - a; }
+        int clamp(int x, int lo, int hi) {
+            int r = x;
+            if (x < lo) r = lo;
+            else if (x > hi) r = hi;
+            return r;
+        }
+        int popcount(unsigned x) { int c = 0; do { c += x & 1; x >>= 1; } while (x); return c; }
+        int conds(int a, int b, int c) { return (a < b && b < c) || !(a == c) ? a + b : c; }
+        char narrow(char a, char b) { if (a < b) { return a + 1; } return b; }
+        int negative(int a) { return (a > -1) + (a == -256) * 2 + (a < -1000) * 4; }
+        int bools(int a, int b) { char c = (a < b) + 5; return c + ((a <= b) >= (b >> 1)); }
+    """,
+    "constant_division": """
+        int divs(int a, unsigned b) { return a / 7 + a % 10 + b / 3 + b % 1000 + a / -4; }
+        int wide(int a, unsigned b) { return a / 100000 + a % -3 + b / 0x80000001u + b % 3000000000u; }
+    """,
+    "loops": """
+        int fir(int a, int b, int c) { int s = 0; for (int i = 0; i < 8; i++) s += (a + b) * i + c; return s; }
+        int scale(int n, int k) { int s = 0; for (int i = 0; i < n; i++) s += i * k; return s; }
+        int nest(int n) {
+            int s = 0;
+            for (int i = 0; i < 4; i++)
+                for (int j = 0; j < n; j++)
+                    s += i * j;
+            return s;
+        }
+        int zero(int a) { for (int i = 5; i < 2; i++) a = a * 3; return a; }
+    """,
+}
+
+# division by a variable needs the hardware divider of Thumb-2 cores
+DIVISION_PROGRAMS = {
+    "division": """
+        unsigned gcd(unsigned a, unsigned b) { while (b != 0) { unsigned t = a % b; a = b; b = t; } return a; }
+        int quotient(int a, int b) { return b ? a / b : 0; }
+    """,
+}
+
+
+def cases():
+    for name, source in PROGRAMS.items():
+        for target in TARGETS:
+            yield pytest.param(source, target, id=f"{name}-{target}")
+    for name, source in DIVISION_PROGRAMS.items():
+        yield pytest.param(source, "cortex-m33", id=f"{name}-cortex-m33")
+
+
+@pytest.mark.parametrize("fused_walk", [False, True], ids=["staged", "fused"])
+@pytest.mark.parametrize("source, target", cases())
+def test_matches_interpreter(tmp_path, source, target, fused_walk):
+    checks = simulate_c(tmp_path, source, target, fused_walk)
+    assert all(check.runs > 0 for check in checks)
+
+@pytest.mark.parametrize("source, target", cases())
+def test_fused_walk_matches_staged(tmp_path, source, target):
+    staged, _ = compile_c(tmp_path, source, target)
+    fused, _ = compile_c(tmp_path, source, target, fused_walk=True)
+    assert read_asm(fused) == read_asm(staged)
+
+def test_fused_walk_lowers_nested_blocks_first(tmp_path):
+    # the truncation inside the if used to be left unlowered by the fused walk
+    source = "int f(int p0) { char v0 = p0; if (v0) { v0 += 1; } return v0; }"
+    staged, _ = compile_c(tmp_path, source, "cortex-m33")
+    fused, _ = compile_c(tmp_path, source, "cortex-m33", fused_walk=True)
+    assert read_asm(fused) == read_asm(staged)
+    simulate_c(tmp_path, source, "cortex-m33", fused_walk=True)
+
+def test_fused_walk_drops_dead_loops(tmp_path):
+    # the remainder (an op of unknown effects) kept the loop until the dead if
+    # holding it went, which the fused walk only did after looking at the loop
+    source = """
+        unsigned f(unsigned char p0) {
+            unsigned v0 = p0;
+            for (int i0 = 2; i0 < (v0 & 7); i0 += 2) { if ((v0 % 4) & v0) { v0 -= (p0 != 3); } v0 = p0; }
+            return 256;
+        }
+    """
+    staged, _ = compile_c(tmp_path, source, "cortex-m33")
+    fused, _ = compile_c(tmp_path, source, "cortex-m33", fused_walk=True)
+    assert read_asm(fused) == read_asm(staged)
+    assert "cmp" not in read_asm(fused)
+
+@pytest.mark.parametrize("target", TARGETS)
+def test_fused_walk_matches_staged_on_generated_programs(tmp_path, target):
+    for seed in range(20):
+        source = random_program(seed)
+        staged, _ = compile_c(tmp_path, source, target)
+        fused, _ = compile_c(tmp_path, source, target, fused_walk=True)
+        assert read_asm(fused) == read_asm(staged), f"seed {seed}"
+
+def test_no_frame_without_spills_or_locals(tmp_path):
+    # the stack arguments take two callee-saved registers (three pushed with lr),
+    # and nothing is kept in the frame, so sp needs no padding
+    source = "int f(int a, int b, int c, int d, int e, int g) { return a * b + c - (d ^ e) + g * 3; }"
+    stem, _ = compile_c(tmp_path, source, "cortex-m0plus")
+    asm_text = read_asm(stem)
+    assert "push {r6, r7, lr}" in asm_text and "sub sp" not in asm_text
+    simulate_c(tmp_path, source, "cortex-m0plus")
+
+def test_unrolled_products_fold(tmp_path):
+    # the first iterations multiply by 0 and 1 once the loop is unrolled
+    source = "int f(int a) { int s = 0; for (int i = 0; i < 8; i += 1) s += i * a; return s; }"
+    for fused_walk in (False, True):
+        stem, _ = compile_c(tmp_path, source, "cortex-m0plus-smallmul", fused_walk)
+        asm_text = read_asm(stem)
+        assert "muls" not in asm_text and "#0" not in asm_text
+        simulate_c(tmp_path, source, "cortex-m0plus-smallmul", fused_walk)
+
+def test_shifted_operands_replace_multiplies(tmp_path):
+    # x * 5 is x + (x << 2), a single add with a shifted operand on Thumb-2
+    source = "int f(int a) { return a * 5; } int g(int a) { return a * 7; }"
+    stem, _ = compile_c(tmp_path, source, "cortex-m33")
+    asm_text = read_asm(stem)
+    assert "adds r0, r0, r0, lsl #2" in asm_text and "rsbs r0, r0, r0, lsl #3" in asm_text
+    assert "mul" not in asm_text
+    simulate_c(tmp_path, source, "cortex-m33")
+
+def test_thumb1_divides_by_constants_without_a_long_multiply(tmp_path):
+    # the multiply-high is four 16x16-bit products; a variable divisor is still an error
+    source = "int f(int a) { return a / 3; }"
+    stem, _ = compile_c(tmp_path, source, "cortex-m0plus")
+    asm_text = read_asm(stem)
+    assert asm_text.count("muls") == 4 and "uxth" in asm_text
+    simulate_c(tmp_path, source, "cortex-m0plus")
+    with pytest.raises(LoweringError, match="division is not supported on cortex-m0plus"):
+        compile_c(tmp_path, "int f(int a, int b) { return a / b; }", "cortex-m0plus")
@@ -0,0 +1,82 @@
+"""
+The compile server and how clients decide to use it
+"""
+
+import multiprocessing
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+
+import src.driver as driver
+from src.driver import Options, compile_batch, init_worker
+from src.server import send_request, use_server_default
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SOURCE = """
+int add(int a, int b) { return a + b; }
+int scale(int a) { return a * 10 - 3; }
+int pick(int a, int b) { if (a < b) return a; return b; }
+"""
+
+
+def write_source(tmp_path) -> str:
+    in_file = os.path.join(tmp_path, "prog.c")
+    with open(in_file, "w") as f:
+        f.write(SOURCE)
+    return in_file
+
+def read(path: str) -> str:
+    with open(path, "r") as f:
+        return f.read()
+
+
+@pytest.mark.parametrize("value, expected", [
+    (None, False), ("", False), ("0", False), ("false", False), ("False", False),
+    ("1", True), ("true", True), ("yes", True),
+])
+def test_use_server_default(monkeypatch, value, expected):
+    if value is None:
+        monkeypatch.delenv("PCC_USE_SERVER", raising=False)
+    else:
+        monkeypatch.setenv("PCC_USE_SERVER", value)
+    assert use_server_default() == expected
+
+def test_pool_still_splits_a_single_file(tmp_path, monkeypatch):
+    # as the server calls it: with a pool, a lone file is still split over
+    # the workers, in this process rather than in a (daemonic) pool worker
+    calls = []
+    compile_file = driver.compile_file
+
+    def recording(context, in_file, out_filename, options, num_workers=1):
+        calls.append(num_workers)
+        return compile_file(context, in_file, out_filename, options, num_workers)
+
+    monkeypatch.setattr(driver, "compile_file", recording)
+    job = (write_source(tmp_path), os.path.join(tmp_path, "prog"), Options(frontend="native"))
+    with multiprocessing.get_context("fork").Pool(2, initializer=init_worker) as pool:
+        results = compile_batch([job], 2, pool=pool)
+    assert [error for _, error, _ in results] == [None]
+    assert calls == [2]
+
+def test_server_matches_in_process(tmp_path):
+    in_file = write_source(tmp_path)
+    socket_path = os.path.join(tmp_path, "pcc.sock")
+    pcc = [sys.executable, os.path.join(ROOT, "pcc.py")]
+    server = subprocess.Popen(pcc + ["--server", "--socket", socket_path], cwd=ROOT, stderr=subprocess.DEVNULL)
+    try:
+        deadline = time.monotonic() + 60
+        while send_request(socket_path, {"ping": True}) is None:
+            assert server.poll() is None and time.monotonic() < deadline, "server did not start"
+            time.sleep(0.1)
+
+        for out_dir, extra in (("remote", ["--use-server", "--socket", socket_path]), ("local", [])):
+            subprocess.run(pcc + ["--no-cache", "--frontend", "native", "-j", "2", "-o",
+                                  os.path.join(tmp_path, out_dir), in_file] + extra, cwd=ROOT, check=True)
+    finally:
+        subprocess.run(pcc + ["--stop-server", "--socket", socket_path], cwd=ROOT)
+        server.wait(timeout=60)
+    assert read(os.path.join(tmp_path, "remote", "prog.s")) == read(os.path.join(tmp_path, "local", "prog.s"))